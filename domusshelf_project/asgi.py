@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Com ASGI, as páginas de consulta usam as views async de
+pharmacy/views_async.py (PHARMACY_VIEWS_ASSINCRONAS), a não ser que
+DOMUSSHELF_VIEWS_ASSINCRONAS=0 esteja definida no ambiente.
+Ex: uvicorn domusshelf_project.asgi:application --workers 2
 """
 
 import os
@@ -12,5 +17,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'domusshelf_project.settings')
+os.environ.setdefault('DOMUSSHELF_VIEWS_ASSINCRONAS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,11 +42,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro, para medir o pedido inteiro (ver pharmacy/middleware.py)
+    'pharmacy.middleware.InstrumentacaoMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Ficheiros estáticos, antes da sessão (ver pharmacy/middleware.py)
+    'pharmacy.middleware.EstaticosMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Depois da autenticação: a partição é a do utilizador do pedido
+    'pharmacy.middleware.ParticaoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +71,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'pharmacy.context_processors.alertas_count',
+                'pharmacy.context_processors.bibliotecas',
             ],
         },
     },
@@ -82,6 +90,29 @@ DATABASES = {
     }
 }
 
+# Dados de cada utilizador na sua partição, se houver partições (ver
+# pharmacy/particoes.py). Escritas na 'default'; as páginas de consulta
+# lêem da base de dados "leitura" quando existir (ver pharmacy/leitura.py
+# e settings_producao.py)
+DATABASE_ROUTERS = [
+    'pharmacy.routers.ParticaoRouter',
+    'pharmacy.routers.LeituraEscritaRouter',
+]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Usada para o resumo de alertas por utilizador (sino da navbar).
+# Em produção com vários processos deve ser partilhada (ex: Redis/Memcached),
+# para que a invalidação feita por um processo seja vista pelos outros.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'domusshelf',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,6 +159,15 @@ DATE_INPUT_FORMATS = [
 
 STATIC_URL = 'static/'
 
+# static/vendor/ (Bootstrap, ícones, flatpickr e a fonte Inter) é gerada
+# por "manage.py vendor_assets" a partir de vendor/ (ver
+# pharmacy/estaticos.py). Sem ela, os templates usam as mesmas versões
+# nos CDNs.
+STATICFILES_DIRS = [BASE_DIR / 'static'] if (BASE_DIR / 'static').is_dir() else []
+
+# Destino do "manage.py collectstatic"
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -136,4 +176,68 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Configuração de autenticação
 LOGIN_URL = '/accounts/login/'  # Página de login da aplicação
 LOGIN_REDIRECT_URL = '/'  # Para onde ir após login (será o dashboard)
-LOGOUT_REDIRECT_URL = '/accounts/login/'  # Para onde ir após logout
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/accounts/login/'  # Para onde ir após logout
+
+# Paginação das listagens (stock, catálogo e alertas)
+# O utilizador pode pedir outro tamanho com ?tamanho=, até ao máximo
+PHARMACY_TAMANHO_PAGINA = 50
+PHARMACY_TAMANHO_PAGINA_MAXIMO = 200
+
+# Histórico de consumos: dias que os registos individuais são mantidos
+# antes de "manage.py compact_consumos" os apagar (os totais diários ficam).
+# None = nunca apagar.
+PHARMACY_RETENCAO_CONSUMOS_DIAS = None
+
+# Cópia só de leitura (base de dados "leitura", se existir): atraso máximo,
+# em segundos, em relação à 'default'. 0 = o mesmo ficheiro, sempre em dia.
+# Os dados de um utilizador alterados há menos tempo são lidos da 'default'.
+PHARMACY_LEITURA_ATRASO_MAXIMO = 0
+
+# Partições: aliases de DATABASES onde ficam os dados dos utilizadores
+# (ver pharmacy/particoes.py). Vazia = tudo na 'default'. Só se podem
+# acrescentar aliases no fim da lista.
+PHARMACY_PARTICOES = []
+
+# Métricas por pedido (queries, tempos): cabeçalho Server-Timing e uma
+# linha JSON por pedido no logger "pharmacy.pedidos"
+PHARMACY_INSTRUMENTACAO = True
+
+# Páginas de consulta (dashboard, catálogo, stock, alertas) servidas pelas
+# views async de pharmacy/views_async.py. Ligado por asgi.py (servidores
+# ASGI); em WSGI ficam as síncronas de views.py.
+PHARMACY_VIEWS_ASSINCRONAS = os.environ.get('DOMUSSHELF_VIEWS_ASSINCRONAS') == '1'
+
+# Compilar todos os templates no arranque de cada processo (ver
+# pharmacy/aquecimento.py). Só faz sentido com o loader com cache, ligado
+# em settings_producao.py; em desenvolvimento os templates são relidos.
+PHARMACY_AQUECER_TEMPLATES = False
+
+# Servir os ficheiros do STATIC_ROOT pela aplicação (EstaticosMiddleware),
+# comprimidos e com cache longa. Em desenvolvimento o runserver serve-os
+# directamente de static/ e das aplicações.
+PHARMACY_SERVIR_ESTATICOS = False
+
+# A linha JSON de cada pedido vai para a consola só com DEBUG (não enche
+# a saída dos testes); settings_producao.py escreve-a sempre.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'so_em_debug': {
+            '()': 'django.utils.log.RequireDebugTrue',
+        },
+    },
+    'handlers': {
+        'consola': {
+            'class': 'logging.StreamHandler',
+            'filters': ['so_em_debug'],
+        },
+    },
+    'loggers': {
+        'pharmacy.pedidos': {
+            'handlers': ['consola'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,202 @@
+"""
+Definições de produção do DomusShelf.
+
+Usar com:
+    DJANGO_SETTINGS_MODULE=domusshelf_project.settings_producao
+
+Parte de settings.py e muda o que não serve em produção: DEBUG
+desligado, chave secreta e hosts lidos do ambiente, e a base de dados
+SQLite com o motor pharmacy.sqlite (WAL, PRAGMAs de produção e
+transacções BEGIN IMMEDIATE, ver pharmacy/sqlite/base.py), e os
+templates compilados uma vez por processo, logo no arranque. Os
+ficheiros estáticos são servidos pela aplicação, com o hash do conteúdo
+no nome e comprimidos no collectstatic (ver pharmacy/estaticos.py),
+incluindo Bootstrap, ícones, flatpickr e a fonte Inter se static/vendor/
+existir ("manage.py check --deploy" avisa quando falta).
+
+Variáveis de ambiente:
+    DOMUSSHELF_SECRET_KEY     obrigatória
+    DOMUSSHELF_ALLOWED_HOSTS  separados por vírgulas (por defeito localhost)
+    DOMUSSHELF_BD             caminho do ficheiro SQLite (por defeito db.sqlite3)
+    DOMUSSHELF_BD_LEITURA     cópia só de leitura (por defeito o próprio ficheiro)
+    DOMUSSHELF_LEITURA_ATRASO segundos de atraso admitidos na cópia (por defeito 180)
+    DOMUSSHELF_PARTICOES      ficheiros SQLite das partições, separados por vírgulas
+    DOMUSSHELF_VIEWS_ASSINCRONAS  1 = views async (o asgi.py liga-a por defeito)
+    DOMUSSHELF_SERVIR_ESTATICOS   0 = o servidor web serve o STATIC_ROOT (por defeito 1)
+    DOMUSSHELF_LOG_PEDIDOS    ficheiro das métricas por pedido (por defeito o stderr)
+    DOMUSSHELF_CACHE          pasta da cache partilhada (por defeito cache/)
+"""
+
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, LOGGING, TEMPLATES
+
+
+DEBUG = False
+
+try:
+    SECRET_KEY = os.environ['DOMUSSHELF_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Defina a variável de ambiente DOMUSSHELF_SECRET_KEY.')
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('DOMUSSHELF_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+    if host.strip()
+]
+
+
+# Templates
+# Loader com cache explícito: cada template é lido e compilado uma vez por
+# processo (alterações aos ficheiros só contam depois de reiniciar), e
+# todos são compilados no arranque (ver pharmacy/aquecimento.py). Antes de
+# um deploy, "manage.py check_templates" renderiza-os todos.
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+PHARMACY_AQUECER_TEMPLATES = True
+
+
+# Database
+# O modo WAL fica gravado no próprio ficheiro: depois de a aplicação
+# correr com este perfil, a base de dados passa a ter os ficheiros
+# -wal e -shm ao lado (não devem ser apagados nem copiados à parte).
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'pharmacy.sqlite',
+        'NAME': os.environ.get('DOMUSSHELF_BD', BASE_DIR / 'db.sqlite3'),
+        # Ligações reutilizadas entre pedidos: os PRAGMAs só são
+        # aplicados quando é aberta uma nova
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'busy_timeout': 5000,
+                'cache_size': -20000,
+            },
+        },
+    }
+}
+
+# Páginas de consulta lidas da base de dados "leitura" (ver pharmacy/leitura.py).
+# Sem DOMUSSHELF_BD_LEITURA é o mesmo ficheiro, aberto com mode=ro. Com ela
+# é uma cópia feita por "manage.py refresh_read_replica" (ex: cron a cada
+# minuto), aberta sem locks (immutable); o atraso tem de cobrir o intervalo
+# entre actualizações.
+PHARMACY_COPIA_LEITURA = os.environ.get('DOMUSSHELF_BD_LEITURA')
+
+if PHARMACY_COPIA_LEITURA:
+    _nome_leitura = f'file:{PHARMACY_COPIA_LEITURA}?mode=ro&immutable=1'
+    PHARMACY_LEITURA_ATRASO_MAXIMO = int(os.environ.get('DOMUSSHELF_LEITURA_ATRASO', 180))
+else:
+    _nome_leitura = f"file:{DATABASES['default']['NAME']}?mode=ro"
+    PHARMACY_LEITURA_ATRASO_MAXIMO = 0
+
+DATABASES['leitura'] = {
+    'ENGINE': 'pharmacy.sqlite',
+    'NAME': _nome_leitura,
+    # Sem ligações persistentes: depois de cada actualização da cópia,
+    # o próximo pedido já abre o ficheiro novo
+    'CONN_MAX_AGE': 0,
+    'TEST': {'MIRROR': 'default'},
+}
+
+# Partições (ver pharmacy/particoes.py): um ficheiro SQLite por partição,
+# com as mesmas opções da 'default'. Depois de acrescentar ficheiros (sempre
+# no fim): "manage.py migrate --database particao_N" para cada um e
+# "manage.py rebalance_partitions".
+PHARMACY_PARTICOES = []
+
+for _numero, _ficheiro in enumerate(os.environ.get('DOMUSSHELF_PARTICOES', '').split(','), start=1):
+    if _ficheiro.strip():
+        _alias = f'particao_{_numero}'
+        DATABASES[_alias] = {**DATABASES['default'], 'NAME': _ficheiro.strip()}
+        PHARMACY_PARTICOES.append(_alias)
+
+
+# Cache
+# Partilhada por todos os processos: o carimbo de versão dos dados de cada
+# utilizador (ETags da API, escolha da cópia de leitura, cache das linhas
+# das listas) e as invalidações feitas pelos signals têm de ser vistos por
+# todos (ver pharmacy/checks.py). Os carimbos não expiram: MAX_ENTRIES
+# alto para não serem descartados (se forem, o próximo pedido lê da
+# 'default' e os clientes pedem tudo de novo, mas nada fica errado).
+# As linhas das listas ({% cache %}) vão para 'template_fragments', à
+# parte: muitas páginas em cache não fazem descartar os carimbos.
+
+_pasta_cache = Path(os.environ.get('DOMUSSHELF_CACHE', BASE_DIR / 'cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': _pasta_cache,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': _pasta_cache / 'fragmentos',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+
+# Ficheiros estáticos
+# "manage.py collectstatic" grava os ficheiros com o hash do conteúdo no
+# nome e as versões .gz/.br; o EstaticosMiddleware serve-os com cache de
+# um ano. Com um servidor web à frente (nginx), DOMUSSHELF_SERVIR_ESTATICOS=0
+# e o STATIC_ROOT servido por ele.
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'pharmacy.estaticos.ArmazenamentoEstaticos'},
+}
+
+PHARMACY_SERVIR_ESTATICOS = os.environ.get('DOMUSSHELF_SERVIR_ESTATICOS', '1') == '1'
+
+
+# Registo dos pedidos
+# Em desenvolvimento a linha JSON de cada pedido só aparece com DEBUG;
+# aqui vai sempre para o stderr (apanhado pelo gestor de processos) ou,
+# com DOMUSSHELF_LOG_PEDIDOS, para esse ficheiro (WatchedFileHandler:
+# reaberto depois de uma rotação pelo logrotate).
+
+_log_pedidos = os.environ.get('DOMUSSHELF_LOG_PEDIDOS')
+
+LOGGING = {
+    **LOGGING,
+    'handlers': {
+        **LOGGING['handlers'],
+        'pedidos': (
+            {'class': 'logging.handlers.WatchedFileHandler', 'filename': _log_pedidos}
+            if _log_pedidos else
+            {'class': 'logging.StreamHandler'}
+        ),
+    },
+    'loggers': {
+        **LOGGING['loggers'],
+        'pharmacy.pedidos': {
+            **LOGGING['loggers']['pharmacy.pedidos'],
+            'handlers': ['pedidos'],
+        },
+    },
+}
@@ -8,11 +8,15 @@ Autor: Miguel Ângelo Ascensão Real
 Data: 3 de Fevereiro de 2026
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 from pharmacy.views import dashboard, registo
 
+if settings.PHARMACY_VIEWS_ASSINCRONAS:
+    from pharmacy.views_async import dashboard
+
 urlpatterns = [
     # Painel de administração do Django
     path('admin/', admin.site.urls),
@@ -23,6 +27,9 @@ urlpatterns = [
      # URLs da aplicação pharmacy (medicamentos)
     path('medicamentos/', include('pharmacy.urls')),
 
+    # API JSON (só de leitura) para clientes móveis e quiosques
+    path('api/', include('pharmacy.urls_api')),
+
     # Página de registo
     path('registo/', registo, name='registo'),
 
@@ -10,11 +10,111 @@ Data: 3 de Fevereiro de 2026
 """
 
 from django.contrib import admin
-from .models import Medicamento, Embalagem, Consumo, Preferencias
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import QueryDict
+from .models import (
+    Medicamento, Embalagem, Consumo, ConsumoDiario, Preferencias, AlertSnapshot,
+    MovimentoStock, SnapshotStock, ParticaoUtilizador,
+)
+from .movimentos import registar_movimento
+from .particoes import bases_dos_dados, particao_actual, particoes_activas, usar_particao
+from .pesquisa import filtrar_medicamentos, filtrar_embalagens
+from .services import abater_embalagens
+
+
+class ParticaoListFilter(admin.SimpleListFilter):
+    """
+    Com partições (ver particoes.py), cada listagem mostra os dados de
+    uma base de dados de cada vez, escolhida neste filtro. Não há opção
+    "Todas": as bases de dados não se juntam numa query.
+    """
+    
+    title = 'partição'
+    parameter_name = 'particao'
+    
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in bases_dos_dados()]
+    
+    def value(self):
+        alias = super().value()
+        return alias if alias in bases_dos_dados() else DEFAULT_DB_ALIAS
+    
+    def queryset(self, request, queryset):
+        # Explícito: a listagem só é lida quando o template é renderizado
+        return queryset.using(self.value())
+    
+    def choices(self, changelist):
+        for alias, titulo in self.lookup_choices:
+            yield {
+                'selected': self.value() == alias,
+                'query_string': changelist.get_query_string({self.parameter_name: alias}),
+                'display': titulo,
+            }
+
+
+class ParticaoAdminMixin:
+    """
+    Com partições, as páginas do admin trabalham na partição escolhida no
+    filtro (ou na que tem o objecto aberto) em vez da do administrador.
+    """
+    
+    def get_list_filter(self, request):
+        filtros = super().get_list_filter(request)
+        if particoes_activas():
+            return [ParticaoListFilter, *filtros]
+        return filtros
+    
+    def particao_do_pedido(self, request, object_id=None):
+        """A do filtro (também nos links que saem da listagem), ou a que tem o objecto."""
+        filtros = QueryDict(request.GET.get('_changelist_filters', ''))
+        alias = request.GET.get('particao') or filtros.get('particao')
+        if alias in bases_dos_dados():
+            return alias
+        if object_id is not None:
+            # Os ids são únicos em todas as bases de dados
+            for alias in bases_dos_dados():
+                try:
+                    if self.model._default_manager.using(alias).filter(pk=unquote(object_id)).exists():
+                        return alias
+                except (ValueError, ValidationError):
+                    break
+        return DEFAULT_DB_ALIAS
+    
+    def na_particao(self, request, vista, object_id=None):
+        if not particoes_activas():
+            return vista()
+        with usar_particao(self.particao_do_pedido(request, object_id)):
+            resposta = vista()
+            # O template lê os dados: tem de ser renderizado ainda na partição
+            if hasattr(resposta, 'render') and not resposta.is_rendered:
+                resposta.render()
+        return resposta
+    
+    def changelist_view(self, request, extra_context=None):
+        return self.na_particao(request, lambda: super(ParticaoAdminMixin, self).changelist_view(
+            request, extra_context,
+        ))
+    
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return self.na_particao(request, lambda: super(ParticaoAdminMixin, self).changeform_view(
+            request, object_id, form_url, extra_context,
+        ), object_id)
+    
+    def delete_view(self, request, object_id, extra_context=None):
+        return self.na_particao(request, lambda: super(ParticaoAdminMixin, self).delete_view(
+            request, object_id, extra_context,
+        ), object_id)
+    
+    def history_view(self, request, object_id, extra_context=None):
+        return self.na_particao(request, lambda: super(ParticaoAdminMixin, self).history_view(
+            request, object_id, extra_context,
+        ), object_id)
 
 
 @admin.register(Medicamento)
-class MedicamentoAdmin(admin.ModelAdmin):
+class MedicamentoAdmin(ParticaoAdminMixin, admin.ModelAdmin):
     """
     Configuração da página de administração de Medicamentos.
     """
@@ -42,10 +142,33 @@ class MedicamentoAdmin(admin.ModelAdmin):
     
     # Ordenação padrão
     ordering = ['nome_comercial']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Pesquisa pelo índice FTS5 (ver pesquisa.py) em vez de LIKE '%termo%'
+        sobre os search_fields, que lia a tabela inteira.
+        """
+        if not search_term:
+            return queryset, False
+        return filtrar_medicamentos(queryset, search_term), False
+    
+    def delete_model(self, request, obj):
+        """Regista o abate do stock das embalagens antes de as apagar."""
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(obj.embalagens.all(), observacoes='Medicamento eliminado (admin).')
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(
+                Embalagem.objects.filter(medicamento__in=queryset),
+                observacoes='Medicamento eliminado (admin).',
+            )
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(Embalagem)
-class EmbalagemAdmin(admin.ModelAdmin):
+class EmbalagemAdmin(ParticaoAdminMixin, admin.ModelAdmin):
     """
     Configuração da página de administração de Embalagens.
     """
@@ -67,12 +190,50 @@ class EmbalagemAdmin(admin.ModelAdmin):
     
     list_filter = [
         'data_validade',
-        'medicamento__utilizador'
+        'utilizador'
     ]
     
+    # Carregar o medicamento na mesma query (usado no __str__ e na coluna)
+    list_select_related = ['medicamento']
+    
     # Ordenar por validade (FEFO)
     ordering = ['data_validade']
     
+    def get_search_results(self, request, queryset, search_term):
+        """Pesquisa por lote ou medicamento através dos índices FTS5."""
+        if not search_term:
+            return queryset, False
+        return filtrar_embalagens(queryset, search_term), False
+    
+    def save_model(self, request, obj, form, change):
+        """
+        No admin a quantidade actual pode ser editada directamente: a
+        diferença fica registada como entrada (embalagem nova) ou ajuste.
+        """
+        with transaction.atomic(using=particao_actual()):
+            anterior = 0
+            if change:
+                anterior = Embalagem.objects.filter(pk=obj.pk).values_list(
+                    'quantidade_actual', flat=True
+                ).get()
+            super().save_model(request, obj, form, change)
+            
+            diferenca = obj.quantidade_actual - anterior
+            if not change:
+                registar_movimento(obj, MovimentoStock.ENTRADA, diferenca)
+            elif diferenca:
+                registar_movimento(obj, MovimentoStock.AJUSTE, diferenca, observacoes='Alterado no admin.')
+    
+    def delete_model(self, request, obj):
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(Embalagem.objects.filter(pk=obj.pk), observacoes='Embalagem eliminada (admin).')
+            super().delete_model(request, obj)
+    
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(queryset, observacoes='Embalagem eliminada (admin).')
+            super().delete_queryset(request, queryset)
+    
     # Método personalizado para mostrar o estado da validade
     @admin.display(description='Estado')
     def estado_validade(self, obj):
@@ -88,7 +249,7 @@ class EmbalagemAdmin(admin.ModelAdmin):
 
 
 @admin.register(Consumo)
-class ConsumoAdmin(admin.ModelAdmin):
+class ConsumoAdmin(ParticaoAdminMixin, admin.ModelAdmin):
     """
     Configuração da página de administração de Consumos.
     """
@@ -107,15 +268,50 @@ class ConsumoAdmin(admin.ModelAdmin):
     
     list_filter = [
         'data_hora',
-        'embalagem__medicamento__utilizador'
+        'embalagem__utilizador'
     ]
     
+    # O __str__ da embalagem mostra o nome do medicamento
+    list_select_related = ['embalagem__medicamento']
+    
     # Ordenar por data, mais recentes primeiro
     ordering = ['-data_hora']
 
 
+@admin.register(ConsumoDiario)
+class ConsumoDiarioAdmin(ParticaoAdminMixin, admin.ModelAdmin):
+    """
+    Totais diários de consumo (só de leitura: mantidos pelos signals e
+    pelo comando backfill_consumo_diario).
+    """
+    
+    list_display = [
+        'medicamento',
+        'dia',
+        'quantidade',
+        'numero_consumos',
+        'utilizador'
+    ]
+    
+    list_filter = [
+        'dia',
+        'utilizador'
+    ]
+    
+    list_select_related = ['medicamento', 'utilizador']
+    
+    # Mais recentes primeiro
+    ordering = ['-dia']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Preferencias)
-class PreferenciasAdmin(admin.ModelAdmin):
+class PreferenciasAdmin(ParticaoAdminMixin, admin.ModelAdmin):
     """
     Configuração da página de administração de Preferências.
     """
@@ -127,4 +323,129 @@ class PreferenciasAdmin(admin.ModelAdmin):
     
     search_fields = [
         'utilizador__username'
-    ]
\ No newline at end of file
+    ]
+
+
+@admin.register(AlertSnapshot)
+class AlertSnapshotAdmin(ParticaoAdminMixin, admin.ModelAdmin):
+    """
+    Resumos de alertas pré-calculados (só de leitura: são mantidos pelo
+    comando refresh_expiry_state e pelos signals).
+    """
+    
+    list_display = [
+        'utilizador',
+        'data_referencia',
+        'expiradas',
+        'a_expirar',
+        'proxima_mudanca',
+        'desactualizado',
+        'actualizado_em'
+    ]
+    
+    list_filter = [
+        'desactualizado'
+    ]
+    
+    list_select_related = ['utilizador']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MovimentoStock)
+class MovimentoStockAdmin(ParticaoAdminMixin, admin.ModelAdmin):
+    """
+    Registo de movimentos de stock (só de leitura: os movimentos são
+    escritos pelas operações de stock e nunca alterados).
+    """
+    
+    list_display = [
+        'data_hora',
+        'tipo',
+        'quantidade',
+        'embalagem_id',
+        'consumo_id',
+        'observacoes',
+        'utilizador'
+    ]
+    
+    list_filter = [
+        'tipo',
+        'data_hora',
+        'utilizador'
+    ]
+    
+    list_select_related = ['utilizador']
+    
+    # Mais recentes primeiro
+    ordering = ['-id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SnapshotStock)
+class SnapshotStockAdmin(ParticaoAdminMixin, admin.ModelAdmin):
+    """
+    Snapshots do stock por embalagem (só de leitura: criados pelo
+    comando snapshot_stock).
+    """
+    
+    list_display = [
+        'embalagem_id',
+        'data_hora',
+        'quantidade',
+        'ultimo_movimento_id'
+    ]
+    
+    list_filter = [
+        'data_hora'
+    ]
+    
+    ordering = ['-data_hora']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ParticaoUtilizador)
+class ParticaoUtilizadorAdmin(admin.ModelAdmin):
+    """
+    Partição de cada utilizador (só de leitura: mudar de partição é mover
+    os dados, com o comando rebalance_partitions).
+    """
+    
+    list_display = [
+        'utilizador',
+        'base_de_dados',
+        'actualizado_em'
+    ]
+    
+    list_filter = [
+        'base_de_dados'
+    ]
+    
+    search_fields = [
+        'utilizador__username'
+    ]
+    
+    list_select_related = ['utilizador']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
\ No newline at end of file
@@ -0,0 +1,237 @@
+'''
+DomusShelf - Resumo de Alertas Pré-calculado
+============================================
+
+O estado de validade do stock (expiradas / a expirar) só muda por dois
+motivos: o stock muda, ou muda o dia. Em vez de o recalcular em cada
+pedido com consultas por intervalo de datas, guardamo-lo numa linha
+por utilizador (AlertSnapshot) com as contagens de cada grupo.
+
+Quando é recalculado:
+- Stock ou preferências mudam: os signals marcam o resumo como
+  desactualizado (um UPDATE simples) e o próximo pedido recalcula-o.
+- Muda o dia: cada resumo guarda a "próxima mudança", o primeiro dia em
+  que alguma embalagem expira ou entra no período de alerta. O comando
+  "manage.py refresh_expiry_state", corrido à meia-noite, recalcula só
+  os resumos desactualizados ou cuja próxima mudança já chegou; nos
+  outros basta avançar a data de referência.
+
+Se o comando não correr, nada fica errado: a leitura (obter_snapshot)
+verifica as mesmas condições e recalcula o resumo desse utilizador.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import timedelta
+
+from django.db import router, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Embalagem, Preferencias, AlertSnapshot
+from .services import DIAS_ALERTA_POR_DEFEITO
+
+
+# Número de utilizadores recalculados de cada vez pelo comando
+TAMANHO_LOTE = 500
+
+CAMPOS_CALCULADOS = [
+    'data_referencia', 'dias_alerta', 'expiradas', 'a_expirar',
+    'proxima_mudanca', 'desactualizado', 'actualizado_em',
+]
+
+
+def calcular_snapshots(utilizadores_ids, hoje=None):
+    """
+    Recalcula e grava os resumos de um lote de utilizadores.
+
+    Usa poucas queries para o lote inteiro, seja qual for o seu tamanho:
+    uma para as preferências, uma para as embalagens em alerta, uma por
+    cada valor diferente de dias de alerta (para a próxima mudança) e
+    uma para gravar (INSERT ... ON CONFLICT UPDATE).
+    Devolve um dicionário utilizador_id -> AlertSnapshot.
+
+    As leituras e a gravação são feitas numa só transacção, na base de
+    dados onde o resumo é gravado: um marcar_desactualizado() de um
+    consumo gravado entretanto não pode ser apagado pelo
+    desactualizado=False deste cálculo (com o motor de produção, a
+    transacção começa com BEGIN IMMEDIATE e o consumo espera por ela).
+    """
+    hoje = hoje or timezone.localdate()
+    utilizadores_ids = list(utilizadores_ids)
+    if not utilizadores_ids:
+        return {}
+
+    bd = router.db_for_write(AlertSnapshot)
+    with transaction.atomic(using=bd):
+        return _calcular_snapshots(utilizadores_ids, hoje, bd)
+
+
+def _calcular_snapshots(utilizadores_ids, hoje, bd):
+    """O cálculo de calcular_snapshots, com todas as queries na base de dados 'bd'."""
+
+    dias = dict.fromkeys(utilizadores_ids, DIAS_ALERTA_POR_DEFEITO)
+    dias.update(Preferencias.objects.using(bd).filter(
+        utilizador_id__in=utilizadores_ids
+    ).values_list('utilizador_id', 'dias_alerta_antes'))
+
+    agora = timezone.now()
+    snapshots = {
+        utilizador_id: AlertSnapshot(
+            utilizador_id=utilizador_id,
+            data_referencia=hoje,
+            dias_alerta=dias[utilizador_id],
+            actualizado_em=agora,
+        )
+        for utilizador_id in utilizadores_ids
+    }
+
+    # 1. Embalagens com stock até ao maior período de alerta do lote,
+    #    contadas por grupo de acordo com os dias de cada utilizador
+    primeira_a_expirar = {}
+    linhas = Embalagem.objects.using(bd).filter(
+        utilizador_id__in=utilizadores_ids,
+        quantidade_actual__gt=0,
+        data_validade__lte=hoje + timedelta(days=max(dias.values())),
+    ).order_by('data_validade', 'id').values_list('utilizador_id', 'data_validade')
+
+    for utilizador_id, data_validade in linhas.iterator(chunk_size=2000):
+        snapshot = snapshots[utilizador_id]
+        if data_validade < hoje:
+            snapshot.expiradas += 1
+        elif data_validade <= hoje + timedelta(days=snapshot.dias_alerta):
+            snapshot.a_expirar += 1
+            # Ordenado por validade: a primeira é a que expira mais cedo
+            primeira_a_expirar.setdefault(utilizador_id, data_validade)
+
+    # 2. Próxima embalagem a entrar no período de alerta, por utilizador
+    #    (uma query por cada valor de dias de alerta, normalmente só um)
+    primeira_fora = {}
+    for valor in set(dias.values()):
+        ids = [utilizador_id for utilizador_id, d in dias.items() if d == valor]
+        primeira_fora.update(Embalagem.objects.using(bd).filter(
+            utilizador_id__in=ids,
+            quantidade_actual__gt=0,
+            data_validade__gt=hoje + timedelta(days=valor),
+        ).values('utilizador_id').annotate(
+            primeira=Min('data_validade')
+        ).values_list('utilizador_id', 'primeira'))
+
+    for utilizador_id, snapshot in snapshots.items():
+        mudancas = []
+        if utilizador_id in primeira_a_expirar:
+            # Passa a expirada no dia a seguir à validade
+            mudancas.append(primeira_a_expirar[utilizador_id] + timedelta(days=1))
+        if utilizador_id in primeira_fora:
+            # Entra no período de alerta quando faltarem dias_alerta dias
+            mudancas.append(primeira_fora[utilizador_id] - timedelta(days=snapshot.dias_alerta))
+        snapshot.proxima_mudanca = min(mudancas, default=None)
+
+    AlertSnapshot.objects.using(bd).bulk_create(
+        snapshots.values(),
+        update_conflicts=True,
+        unique_fields=['utilizador'],
+        update_fields=CAMPOS_CALCULADOS,
+    )
+    return snapshots
+
+
+def precisa_recalcular(snapshot, hoje):
+    """O resumo já não corresponde ao stock ou ao dia de hoje?"""
+    return (
+        snapshot.desactualizado
+        or snapshot.data_referencia > hoje
+        or (snapshot.proxima_mudanca is not None and snapshot.proxima_mudanca <= hoje)
+    )
+
+
+def obter_snapshot(user, hoje=None):
+    """
+    Devolve o AlertSnapshot do utilizador, recalculando-o primeiro se
+    estiver desactualizado (ou ainda não existir). Normalmente é só uma
+    query: ler a linha.
+    """
+    hoje = hoje or timezone.localdate()
+    snapshot = AlertSnapshot.objects.filter(utilizador=user).first()
+
+    if snapshot is None or precisa_recalcular(snapshot, hoje):
+        return calcular_snapshots([user.pk], hoje=hoje)[user.pk]
+
+    # Mudou o dia mas nenhuma embalagem mudou de grupo: as contagens servem
+    snapshot.data_referencia = hoje
+    return snapshot
+
+
+def filtro_expiradas(snapshot):
+    """
+    Filtro das embalagens expiradas de um resumo (com o filtro por
+    utilizador): com stock e validade antes da data de referência.
+    """
+    return Q(quantidade_actual__gt=0, data_validade__lt=snapshot.data_referencia)
+
+
+def filtro_a_expirar(snapshot):
+    """Filtro das embalagens com stock no período de alerta do resumo."""
+    return Q(
+        quantidade_actual__gt=0,
+        data_validade__gte=snapshot.data_referencia,
+        data_validade__lte=snapshot.data_referencia + timedelta(days=snapshot.dias_alerta),
+    )
+
+
+def filtro_em_alerta(snapshot):
+    """Filtro das expiradas e das a expirar de um resumo, juntas."""
+    return Q(
+        quantidade_actual__gt=0,
+        data_validade__lte=snapshot.data_referencia + timedelta(days=snapshot.dias_alerta),
+    )
+
+
+def marcar_desactualizado(utilizador_id):
+    """Chamada pelos signals quando o stock ou as preferências mudam."""
+    if utilizador_id is not None:
+        AlertSnapshot.objects.filter(
+            utilizador_id=utilizador_id,
+            desactualizado=False,
+        ).update(desactualizado=True)
+
+
+def utilizadores_a_recalcular(hoje, todos=False):
+    """
+    Ids dos utilizadores cujo resumo tem de ser recalculado: os marcados
+    como desactualizados, os que chegaram à próxima mudança e os que têm
+    stock mas ainda não têm resumo. Com todos=True, todos os que têm stock
+    ou resumo.
+    """
+    com_snapshot = AlertSnapshot.objects.values_list('utilizador_id', flat=True)
+    sem_snapshot = Embalagem.objects.filter(
+        quantidade_actual__gt=0,
+    ).exclude(
+        utilizador_id__in=com_snapshot,
+    ).values_list('utilizador_id', flat=True).distinct()
+
+    if todos:
+        ids = set(com_snapshot)
+    else:
+        ids = set(AlertSnapshot.objects.filter(
+            Q(desactualizado=True)
+            | Q(proxima_mudanca__lte=hoje)
+            | Q(data_referencia__gt=hoje)
+        ).values_list('utilizador_id', flat=True))
+
+    ids.update(sem_snapshot)
+    return sorted(ids)
+
+
+def avancar_data_referencia(hoje):
+    """
+    Nos resumos que não precisam de ser recalculados, só a data de
+    referência muda. Um único UPDATE para todos.
+    """
+    return AlertSnapshot.objects.filter(
+        data_referencia__lt=hoje,
+        desactualizado=False,
+    ).filter(
+        Q(proxima_mudanca__isnull=True) | Q(proxima_mudanca__gt=hoje)
+    ).update(data_referencia=hoje)
@@ -0,0 +1,292 @@
+'''
+DomusShelf - API JSON (só de leitura)
+=====================================
+
+API leve para os clientes móveis e quiosques, que até agora liam as
+páginas HTML. Cada endpoint devolve JSON construído com .values()
+(dicionários simples, sem instanciar modelos nem renderizar templates).
+
+Pedidos condicionais (ETag / If-None-Match):
+    Cada resposta leva um ETag calculado a partir do carimbo de versão
+    dos dados do utilizador (ver caches.versao_dados), da data de hoje
+    (os estados de validade mudam à meia-noite) e do URL pedido.
+    Se o cliente voltar a pedir com o mesmo ETag e nada tiver mudado,
+    recebe um 304 sem que a query da listagem chegue a ser executada.
+
+Autenticação: a mesma sessão das páginas (login). Sem sessão, 401.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import hashlib
+from datetime import date, timedelta
+from functools import wraps
+
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_GET
+
+from .alertas import filtro_em_alerta, obter_snapshot
+from .caches import versao_dados
+from .historico import serie_diaria
+from .leitura import ler_da_copia
+from .models import Medicamento, Embalagem
+from .paginacao import CursorInvalido, obter_tamanho_pagina, paginar_keyset
+from .pesquisa import LIMITE_SUGESTOES, pesquisar_medicamentos
+from .previsao import prever_utilizador
+from .services import StockSummary
+
+
+CAMPOS_MEDICAMENTO = ('id', 'nome_comercial', 'principio_activo', 'forma_farmaceutica', 'observacoes')
+
+CAMPOS_EMBALAGEM = (
+    'id', 'medicamento_id', 'medicamento__nome_comercial', 'quantidade_inicial',
+    'quantidade_actual', 'unidade', 'data_validade', 'lote',
+)
+
+
+def _nao_encontrado():
+    """Resposta 404 em JSON (o get_object_or_404 devolveria uma página HTML)."""
+    return JsonResponse({'erro': 'Não encontrado.'}, status=404)
+
+
+def api_login_required(view):
+    """
+    Como o @login_required, mas responde 401 em JSON em vez de
+    redireccionar para a página de login (que um cliente da API não segue).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'erro': 'Autenticação necessária.'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def etag_utilizador(request, *args, **kwargs):
+    """
+    ETag de uma resposta da API. Só depende de dados em cache, por isso
+    é calculado sem nenhuma query à base de dados.
+    """
+    if not request.user.is_authenticated:
+        return None
+
+    assinatura = '|'.join([
+        str(request.user.pk),
+        str(versao_dados(request.user.pk)),
+        timezone.localdate().isoformat(),
+        request.get_full_path(),
+    ])
+    return hashlib.sha1(assinatura.encode()).hexdigest()
+
+
+def endpoint(view):
+    """Decorators comuns a todos os endpoints: login, só GET, ETag e leitura da cópia."""
+    return api_login_required(require_GET(condition(etag_func=etag_utilizador)(ler_da_copia(view))))
+
+
+def _embalagem_json(linha, hoje):
+    """Converte uma linha de .values() de Embalagem no formato da API."""
+    dados = dict(linha)
+    dados['medicamento'] = dados.pop('medicamento__nome_comercial')
+    dados['dias_para_expirar'] = (dados['data_validade'] - hoje).days
+    return dados
+
+
+def _pagina(request, queryset, campos):
+    """Pagina por cursor e devolve (pagina, None) ou (None, resposta de erro)."""
+    try:
+        pagina = paginar_keyset(
+            queryset,
+            campos,
+            cursor=request.GET.get('cursor'),
+            tamanho=obter_tamanho_pagina(request),
+        )
+    except CursorInvalido:
+        return None, JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+    return pagina, None
+
+
+@endpoint
+def resumo(request):
+    """GET /api/resumo/ — os números do dashboard."""
+    stock = StockSummary.para_utilizador(request.user)
+    return JsonResponse({
+        'total_medicamentos': stock.total_medicamentos,
+        'total_embalagens': stock.total_embalagens,
+        'expiradas': stock.expiradas,
+        'a_expirar': stock.a_expirar,
+        'dias_alerta': stock.dias_alerta,
+        'hoje': stock.hoje,
+    })
+
+
+@endpoint
+def medicamento_lista(request):
+    """GET /api/medicamentos/?cursor=&tamanho= — catálogo, por nome."""
+    queryset = Medicamento.objects.filter(
+        utilizador=request.user
+    ).values(*CAMPOS_MEDICAMENTO)
+
+    pagina, erro = _pagina(request, queryset, ('nome_comercial', 'id'))
+    if erro:
+        return erro
+
+    return JsonResponse({
+        'resultados': pagina.objectos,
+        'proximo_cursor': pagina.proximo_cursor,
+    })
+
+
+@endpoint
+def pesquisa(request):
+    """
+    GET /api/pesquisa/?q=&limite= — sugestões para a pesquisa enquanto se
+    escreve: medicamentos cujo nome ou princípio activo começa pelas
+    palavras escritas, ordenados por relevância (BM25).
+    """
+    try:
+        limite = max(1, min(int(request.GET.get('limite', LIMITE_SUGESTOES)), 50))
+    except ValueError:
+        limite = LIMITE_SUGESTOES
+
+    return JsonResponse({
+        'resultados': pesquisar_medicamentos(request.user, request.GET.get('q', ''), limite),
+    })
+
+
+@endpoint
+def medicamento_detalhe(request, pk):
+    """GET /api/medicamentos/<id>/ — um medicamento e as suas embalagens com stock."""
+    medicamento = Medicamento.objects.filter(
+        pk=pk,
+        utilizador=request.user,
+    ).values(*CAMPOS_MEDICAMENTO).first()
+    if medicamento is None:
+        return _nao_encontrado()
+
+    hoje = timezone.localdate()
+    embalagens = Embalagem.objects.filter(
+        utilizador=request.user,
+        medicamento_id=pk,
+        quantidade_actual__gt=0,
+    ).order_by('data_validade', 'id').values(*CAMPOS_EMBALAGEM)
+
+    medicamento['embalagens'] = [_embalagem_json(linha, hoje) for linha in embalagens]
+    return JsonResponse(medicamento)
+
+
+@endpoint
+def embalagem_lista(request):
+    """
+    GET /api/embalagens/?medicamento=&cursor=&tamanho= — stock por validade
+    (FEFO). Com ?medicamento=<id> mostra apenas as desse medicamento.
+    """
+    queryset = Embalagem.objects.filter(utilizador=request.user)
+
+    medicamento = request.GET.get('medicamento')
+    if medicamento:
+        if not medicamento.isdigit():
+            return JsonResponse({'erro': 'Medicamento inválido.'}, status=400)
+        queryset = queryset.filter(medicamento_id=medicamento)
+
+    pagina, erro = _pagina(request, queryset.values(*CAMPOS_EMBALAGEM), ('data_validade', 'id'))
+    if erro:
+        return erro
+
+    hoje = timezone.localdate()
+    return JsonResponse({
+        'resultados': [_embalagem_json(linha, hoje) for linha in pagina],
+        'proximo_cursor': pagina.proximo_cursor,
+    })
+
+
+@endpoint
+def embalagem_detalhe(request, pk):
+    """GET /api/embalagens/<id>/ — uma embalagem."""
+    embalagem = Embalagem.objects.filter(
+        pk=pk,
+        utilizador=request.user,
+    ).values(*CAMPOS_EMBALAGEM).first()
+    if embalagem is None:
+        return _nao_encontrado()
+
+    return JsonResponse(_embalagem_json(embalagem, timezone.localdate()))
+
+
+@endpoint
+def historico(request):
+    """
+    GET /api/historico/?desde=&ate=&medicamento= — consumo por dia de cada
+    medicamento (por defeito, os últimos 30 dias). Lido dos totais diários
+    (ConsumoDiario), não dos consumos individuais.
+    """
+    try:
+        ate = date.fromisoformat(request.GET['ate']) if request.GET.get('ate') else timezone.localdate()
+        desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else ate - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'erro': 'Datas inválidas (use AAAA-MM-DD).'}, status=400)
+    if desde > ate:
+        return JsonResponse({'erro': 'A data inicial é posterior à final.'}, status=400)
+
+    medicamento = request.GET.get('medicamento')
+    if medicamento and not medicamento.isdigit():
+        return JsonResponse({'erro': 'Medicamento inválido.'}, status=400)
+
+    medicamentos = {}
+    for medicamento_id, dia, quantidade, numero in serie_diaria(request.user, desde, ate, medicamento or None):
+        medicamentos.setdefault(medicamento_id, []).append(
+            {'dia': dia, 'quantidade': quantidade, 'consumos': numero}
+        )
+
+    return JsonResponse({
+        'desde': desde,
+        'ate': ate,
+        'resultados': [
+            {'medicamento_id': medicamento_id, 'dias': dias}
+            for medicamento_id, dias in medicamentos.items()
+        ],
+    })
+
+
+@endpoint
+def previsao(request):
+    """
+    GET /api/previsao/ — para cada medicamento, a taxa de consumo, o dia
+    em que o stock acaba e as embalagens que vão expirar antes de gastas.
+    Ordenado pelo dia de fim de stock (os sem consumo no fim).
+    """
+    return JsonResponse({
+        'resultados': [previsao.como_dict() for previsao in prever_utilizador(request.user)],
+    })
+
+
+@endpoint
+def alertas(request):
+    """
+    GET /api/alertas/?cursor=&tamanho= — embalagens com stock expiradas ou
+    a expirar no período de alerta, por validade. Cada uma traz o campo
+    'estado' ('expirada' ou 'a_expirar'). Lidas do resumo pré-calculado.
+    """
+    snapshot = obter_snapshot(request.user)
+    queryset = Embalagem.objects.filter(
+        filtro_em_alerta(snapshot),
+        utilizador=request.user,
+    ).values(*CAMPOS_EMBALAGEM)
+
+    pagina, erro = _pagina(request, queryset, ('data_validade', 'id'))
+    if erro:
+        return erro
+
+    resultados = []
+    for linha in pagina:
+        dados = _embalagem_json(linha, snapshot.data_referencia)
+        dados['estado'] = 'expirada' if dados['dias_para_expirar'] < 0 else 'a_expirar'
+        resultados.append(dados)
+
+    return JsonResponse({
+        'dias_alerta': snapshot.dias_alerta,
+        'resultados': resultados,
+        'proximo_cursor': pagina.proximo_cursor,
+    })
@@ -1,6 +1,39 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
+
+
+def reinstalar_fts(sender, using, **kwargs):
+    """
+    Depois de cada migrate, repõe os triggers da pesquisa FTS5 que se
+    tenham perdido (o SQLite recria a tabela em algumas alterações).
+    """
+    from django.db import connections
+    from .pesquisa import instalar_fts
+    instalar_fts(connections[using])
+
+
+def preparar_particao(sender, using, **kwargs):
+    """Numa partição, os ids começam no intervalo dessa partição (ver particoes.py)."""
+    from .particoes import particoes, preparar_sequencias
+    if using in particoes():
+        preparar_sequencias(using)
 
 
 class PharmacyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pharmacy'
+
+    def ready(self):
+        # Importar os signals para que os receivers fiquem registados
+        from . import signals  # noqa: F401
+        # e as verificações do "check --deploy"
+        from . import checks  # noqa: F401
+
+        post_migrate.connect(reinstalar_fts, sender=self)
+        post_migrate.connect(preparar_particao, sender=self)
+
+        # Com o loader com cache (produção), compilar já todos os templates
+        if getattr(settings, 'PHARMACY_AQUECER_TEMPLATES', False):
+            from .aquecimento import aquecer_templates
+            aquecer_templates()
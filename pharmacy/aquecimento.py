@@ -0,0 +1,138 @@
+'''
+DomusShelf - Aquecimento e Verificação dos Templates
+====================================================
+
+Com o loader com cache (perfil de produção, settings_producao.py), cada
+template é lido e compilado uma vez por processo, no primeiro pedido
+que o usa. aquecer_templates() compila-os todos logo no arranque (ver
+PharmacyConfig.ready), para que os primeiros pedidos de cada processo
+não paguem a compilação de base.html e da cadeia pharmacy/*.html.
+
+exemplos() devolve, para cada template, um contexto feito de objectos
+de exemplo em memória (nada é gravado nem lido da base de dados, além
+das opções vazias dos formulários), usado pelo comando
+"manage.py check_templates" para renderizar todos os templates antes
+de um deploy e medir os tempos de compilação e de renderização.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.contrib.auth.models import User
+from django.template import engines
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .forms import (
+    ConsumoForm, ConsumoMedicamentoForm, EmbalagemForm, ImportacaoForm, MedicamentoForm, PreferenciasForm,
+)
+from .models import Embalagem, Medicamento, Preferencias
+from .paginacao import PaginaKeyset
+
+
+def motor():
+    """O Engine do backend de templates do Django (o de settings.TEMPLATES)."""
+    return engines['django'].engine
+
+
+def nomes_dos_templates():
+    """
+    Os templates do projecto (DIRS: base.html e registration/) e da
+    aplicação pharmacy, pelo nome com que são pedidos.
+    """
+    pastas = [Path(pasta) for pasta in motor().dirs]
+    pastas.append(Path(apps.get_app_config('pharmacy').path) / 'templates')
+    return sorted({
+        ficheiro.relative_to(pasta).as_posix()
+        for pasta in pastas
+        for ficheiro in pasta.rglob('*.html')
+    })
+
+
+def aquecer_templates():
+    """Compila todos os templates (ficam na cache do loader). Devolve quantos."""
+    nomes = nomes_dos_templates()
+    for nome in nomes:
+        motor().get_template(nome)
+    return len(nomes)
+
+
+def pedido_de_exemplo(user):
+    """Um GET autenticado, com o resumo do sino já lido (sem queries)."""
+    request = RequestFactory().get('/')
+    request.user = user
+    request.resumo_alertas = {'expiradas': 1, 'a_expirar': 1, 'total': 2}
+    return request
+
+
+def _pagina(objectos):
+    pagina = PaginaKeyset(objectos, proximo_cursor='exemplo', primeira=False)
+    pagina.url_seguinte = '?cursor=exemplo'
+    pagina.url_primeira = '?'
+    return pagina
+
+
+def exemplos():
+    """
+    {nome do template: contexto} com objectos de exemplo. O utilizador
+    tem o id 0, que não existe: os formulários não encontram opções.
+    Devolve (user, contextos).
+    """
+    hoje = timezone.localdate()
+    user = User(pk=0, username='exemplo')
+    medicamento = Medicamento(
+        pk=1, utilizador=user, nome_comercial='Ben-u-ron',
+        principio_activo='Paracetamol', forma_farmaceutica='Comprimido',
+    )
+    embalagens = [
+        Embalagem(
+            pk=numero, medicamento=medicamento, utilizador=user,
+            quantidade_inicial=20, quantidade_actual=12, unidade='comprimidos',
+            data_validade=hoje + timedelta(days=dias), lote=f'L{numero:04d}',
+        )
+        for numero, dias in ((1, -5), (2, 10), (3, 400))
+    ]
+    expirada, a_expirar, _ = embalagens
+
+    contextos = {
+        'base.html': {},
+        'pharmacy/dashboard.html': {
+            'total_medicamentos': 1, 'total_embalagens': 3,
+            'expiradas': 1, 'a_expirar': 1, 'dias_alerta': 30,
+        },
+        'pharmacy/medicamento_lista.html': {
+            'medicamentos': _pagina([medicamento]), 'pesquisa': '', 'versao_dados': 'exemplo',
+        },
+        'pharmacy/medicamento_form.html': {
+            'form': MedicamentoForm(instance=medicamento), 'titulo': 'Editar Medicamento',
+            'medicamento': medicamento,
+        },
+        'pharmacy/medicamento_confirmar_eliminar.html': {'medicamento': medicamento},
+        'pharmacy/embalagem_lista.html': {
+            'embalagens': _pagina(embalagens), 'hoje': hoje, 'versao_dados': 'exemplo',
+        },
+        'pharmacy/embalagem_form.html': {
+            'form': EmbalagemForm(instance=a_expirar, user=user), 'titulo': 'Editar Embalagem',
+            'embalagem': a_expirar,
+        },
+        'pharmacy/embalagem_confirmar_eliminar.html': {'embalagem': a_expirar},
+        'pharmacy/consumo_form.html': {'form': ConsumoForm(user=user)},
+        'pharmacy/consumo_medicamento_form.html': {'form': ConsumoMedicamentoForm(user=user)},
+        'pharmacy/importar_form.html': {'form': ImportacaoForm()},
+        'pharmacy/alertas_lista.html': {
+            'expiradas': _pagina([expirada]), 'a_expirar': _pagina([a_expirar]),
+            'total_expiradas': 1, 'total_a_expirar': 1, 'dias_alerta': 30, 'hoje': hoje,
+        },
+        'pharmacy/preferencias_form.html': {
+            'form': PreferenciasForm(instance=Preferencias(utilizador=user, dias_alerta_antes=30)),
+        },
+        'pharmacy/paginacao.html': {'pagina': _pagina([])},
+        'registration/login.html': {'form': AuthenticationForm(), 'next': '/'},
+        'registration/registo.html': {'form': UserCreationForm()},
+    }
+    return user, contextos
@@ -0,0 +1,169 @@
+'''
+DomusShelf - Benchmarks das Páginas Principais
+==============================================
+
+Mede o desempenho das páginas mais usadas com volumes de dados
+crescentes (escalas = número de agregados gerados por sintetico.py):
+
+    dashboard, stock, alertas, registo de consumo (POST)
+    e as listagens do admin (medicamentos, embalagens, consumos, movimentos)
+
+Os pedidos são feitos com o cliente de testes do Django (sem servidor
+nem rede), autenticado como o primeiro utilizador sintético, que tem
+sempre os mesmos dados: numa página por utilizador, o tempo não deve
+crescer com a escala. As listagens do admin vêem os dados de todos.
+
+Para cada cenário e escala:
+- p50 / p95 do tempo de resposta (ms), em N repetições;
+- queries por pedido (instrumentacao.medir);
+- pico de memória alocada num pedido (tracemalloc, numa execução à
+  parte, porque o tracemalloc torna tudo mais lento).
+
+Usado pelo comando "manage.py run_benchmarks", que corre numa base de
+dados temporária e grava os resultados em JSON para comparar execuções.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import statistics
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client
+from django.utils import timezone
+
+from .instrumentacao import medir
+from .models import Embalagem
+from .services import criar_embalagem
+from .sintetico import gerar
+
+
+# Pedidos feitos antes de medir (caches, imports, templates compilados)
+AQUECIMENTO = 2
+
+# (nome, método, URL)
+CENARIOS = [
+    ('dashboard', 'get', '/'),
+    ('embalagem_lista', 'get', '/medicamentos/stock/'),
+    ('alertas_lista', 'get', '/medicamentos/alertas/'),
+    ('consumo_criar', 'post', '/medicamentos/consumo/novo/'),
+    ('admin_medicamentos', 'get', '/admin/pharmacy/medicamento/'),
+    ('admin_embalagens', 'get', '/admin/pharmacy/embalagem/'),
+    ('admin_consumos', 'get', '/admin/pharmacy/consumo/'),
+    ('admin_movimentos', 'get', '/admin/pharmacy/movimentostock/'),
+]
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de uma lista de valores, com interpolação."""
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def preparar_utilizador(user_id):
+    """
+    Prepara o utilizador dos benchmarks: acesso ao admin e uma embalagem
+    com stock suficiente para todos os consumos do cenário consumo_criar.
+    Devolve (user, embalagem).
+    """
+    user = User.objects.get(pk=user_id)
+    user.is_staff = user.is_superuser = True
+    user.save(update_fields=['is_staff', 'is_superuser'])
+
+    medicamento = user.medicamentos.order_by('id').first()
+    embalagem = criar_embalagem(Embalagem(
+        medicamento=medicamento,
+        quantidade_inicial=1_000_000,
+        unidade='comprimidos',
+        data_validade=timezone.localdate() + timedelta(days=365),
+    ))
+    return user, embalagem
+
+
+def medir_cenario(cliente, metodo, url, dados, repeticoes):
+    """Mede um cenário e devolve o dicionário de resultados."""
+    def pedido():
+        resposta = getattr(cliente, metodo)(url, dados)
+        if resposta.status_code not in (200, 302):
+            raise RuntimeError(f'{metodo.upper()} {url} devolveu {resposta.status_code}')
+        return resposta
+
+    for _ in range(AQUECIMENTO):
+        pedido()
+
+    tempos = []
+    queries = []
+    for _ in range(repeticoes):
+        with medir() as metricas:
+            pedido()
+        tempos.append(metricas.tempo_total * 1000)
+        queries.append(metricas.queries)
+
+    tracemalloc.start()
+    try:
+        pedido()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'pedidos': repeticoes,
+        'p50_ms': round(percentil(tempos, 50), 3),
+        'p95_ms': round(percentil(tempos, 95), 3),
+        'queries': max(queries),
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+def executar(escalas, repeticoes=20, semente=0, progresso=None, **parametros):
+    """
+    Corre todos os cenários em cada escala (número total de agregados),
+    gerando os dados que faltam entre uma escala e a seguinte.
+    'parametros' são passados a sintetico.gerar (medicamentos por
+    utilizador, etc.). Devolve a lista de resultados.
+    """
+    resultados = []
+    gerados = []
+    user = embalagem = None
+
+    for escala in sorted(escalas):
+        if escala > len(gerados):
+            gerados += gerar(escala - len(gerados), semente=semente, **parametros)
+        if user is None:
+            user, embalagem = preparar_utilizador(gerados[0])
+
+        cache.clear()
+        cliente = Client()
+        cliente.force_login(user)
+
+        for nome, metodo, url in CENARIOS:
+            dados = {'embalagem': embalagem.pk, 'quantidade': 1} if metodo == 'post' else {}
+            resultado = {'escala': escala, 'cenario': nome}
+            resultado.update(medir_cenario(cliente, metodo, url, dados, repeticoes))
+            resultados.append(resultado)
+            if progresso:
+                progresso(resultado)
+
+    return resultados
+
+
+def comparar(anteriores, actuais):
+    """
+    Junta duas listas de resultados por (escala, cenário). Devolve
+    [(escala, cenario, p50 antes, p50 agora, p95 antes, p95 agora)].
+    """
+    antes = {(r['escala'], r['cenario']): r for r in anteriores}
+    linhas = []
+    for resultado in actuais:
+        anterior = antes.get((resultado['escala'], resultado['cenario']))
+        if anterior:
+            linhas.append((
+                resultado['escala'], resultado['cenario'],
+                anterior['p50_ms'], resultado['p50_ms'],
+                anterior['p95_ms'], resultado['p95_ms'],
+            ))
+    return linhas
@@ -0,0 +1,138 @@
+'''
+DomusShelf - Cache por Utilizador
+=================================
+
+Este ficheiro guarda em cache dados calculados por utilizador que são
+lidos em quase todos os pedidos, como o resumo de alertas do sino.
+
+As entradas expiram à meia-noite local (TIME_ZONE, Europe/Lisbon),
+porque é a essa hora que embalagens passam a "expiradas" ou entram no
+período de alerta. Entre meias-noites, a cache é invalidada pelos
+signals (ver signals.py) sempre que o stock do utilizador muda.
+
+Requisito: com mais de um processo a servir pedidos, a cache 'default'
+tem de ser partilhada entre eles (ficheiros, base de dados, memcached).
+O carimbo de versão (ETags da API, cópia de leitura, cache das linhas)
+e as invalidações só funcionam se todos os processos os virem; a
+LocMemCache de desenvolvimento é local a cada processo. O "manage.py
+check --deploy" falha se não for o caso (ver checks.py).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time as relogio
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.utils import timezone
+
+from .alertas import obter_snapshot
+
+
+def segundos_ate_meia_noite():
+    """
+    Calcula quantos segundos faltam até à próxima meia-noite local.
+    Usado como TTL para que nenhuma entrada sobreviva à mudança de dia.
+    """
+    agora = timezone.localtime()
+    amanha = datetime.combine(
+        agora.date() + timedelta(days=1), time.min, tzinfo=agora.tzinfo
+    )
+    # Por timestamps: a subtracção de datetimes com o mesmo tzinfo ignora
+    # a mudança de hora (o dia local pode ter 23 ou 25 horas)
+    return max(int(amanha.timestamp() - agora.timestamp()), 1)
+
+
+def chave_alertas(utilizador_id):
+    """Chave da cache do resumo de alertas de um utilizador."""
+    return f'pharmacy:alertas:{utilizador_id}'
+
+
+def obter_resumo_alertas(user):
+    """
+    Devolve um dicionário com 'expiradas', 'a_expirar' e 'total' para o
+    utilizador, lendo da cache sempre que possível.
+
+    A data de referência é guardada junto com os valores: se a entrada
+    for de outro dia (por exemplo, um backend de cache que não respeite
+    o TTL ao segundo), é recalculada.
+
+    Sem cache, os números vêm do resumo pré-calculado (AlertSnapshot,
+    ver alertas.py): uma linha lida em vez das consultas por validade.
+    """
+    hoje = timezone.localdate()
+    chave = chave_alertas(user.pk)
+
+    resumo = cache.get(chave)
+    if resumo is not None and resumo.get('dia') == hoje.isoformat():
+        return resumo
+
+    snapshot = obter_snapshot(user, hoje=hoje)
+
+    resumo = {
+        'dia': hoje.isoformat(),
+        'expiradas': snapshot.expiradas,
+        'a_expirar': snapshot.a_expirar,
+        'total': snapshot.total,
+    }
+    cache.set(chave, resumo, segundos_ate_meia_noite())
+    return resumo
+
+
+async def aobter_resumo_alertas(user):
+    """
+    Versão async de obter_resumo_alertas: a leitura da cache é async;
+    quando é preciso recalcular (pode gravar o resumo), corre numa thread.
+    """
+    resumo = await cache.aget(chave_alertas(user.pk))
+    if resumo is not None and resumo.get('dia') == timezone.localdate().isoformat():
+        return resumo
+    return await sync_to_async(obter_resumo_alertas)(user)
+
+
+def chave_versao(utilizador_id):
+    """Chave da cache do carimbo de versão dos dados de um utilizador."""
+    return f'pharmacy:versao:{utilizador_id}'
+
+
+def versao_dados(utilizador_id):
+    """
+    Devolve o carimbo de versão dos dados do utilizador: um número que
+    muda sempre que o catálogo, o stock ou as preferências mudam.
+
+    Serve de "data da última modificação" barata: comparar carimbos
+    permite saber se algo mudou sem consultar a base de dados (usado nos
+    ETags da API). Se o carimbo não existir (cache limpa ou reiniciada),
+    é criado um novo, o que apenas obriga os clientes a pedir tudo de novo.
+    """
+    chave = chave_versao(utilizador_id)
+    versao = cache.get(chave)
+    if versao is None:
+        # add() não substitui um valor que outro pedido tenha acabado de criar
+        cache.add(chave, relogio.time_ns(), None)
+        versao = cache.get(chave)
+    return versao
+
+
+async def aversao_dados(utilizador_id):
+    """Versão async de versao_dados (cache.aget / cache.aadd)."""
+    chave = chave_versao(utilizador_id)
+    versao = await cache.aget(chave)
+    if versao is None:
+        await cache.aadd(chave, relogio.time_ns(), None)
+        versao = await cache.aget(chave)
+    return versao
+
+
+def incrementar_versao(utilizador_id):
+    """Marca os dados do utilizador como alterados (novo carimbo de versão)."""
+    if utilizador_id is not None:
+        cache.set(chave_versao(utilizador_id), relogio.time_ns(), None)
+
+
+def invalidar_alertas(utilizador_id):
+    """Remove da cache o resumo de alertas de um utilizador."""
+    if utilizador_id is not None:
+        cache.delete(chave_alertas(utilizador_id))
@@ -0,0 +1,72 @@
+'''
+DomusShelf - Verificações de Deploy
+===================================
+
+Verificações do "manage.py check --deploy" próprias da aplicação.
+
+O carimbo de versão dos dados (caches.versao_dados), a cache do sino e
+as invalidações feitas pelos signals vivem na cache 'default', e as
+linhas das listas ({% cache %}) na 'template_fragments', se existir. Com
+mais de um processo a servir pedidos, estas caches têm de ser
+partilhadas por todos (ficheiros, base de dados, memcached, redis): numa
+cache local a cada processo, uma alteração feita num processo não chega
+aos outros, que continuam a responder 304 aos ETags da API e a mostrar
+dados antigos.
+
+Também avisa quando static/vendor/ está incompleta: as páginas carregam
+então Bootstrap, ícones, flatpickr e a fonte Inter dos CDNs, o que não
+funciona numa rede sem acesso à Internet.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from .estaticos import ficheiros_gerados, pasta_gerados
+
+
+# Backends em que cada processo tem a sua própria cache (ou nenhuma)
+CACHES_POR_PROCESSO = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Caches que todos os processos têm de ver (a segunda só se existir)
+CACHES_PARTILHADAS = ('default', 'template_fragments')
+
+
+@register(Tags.caches, deploy=True)
+def verificar_cache_partilhada(app_configs, **kwargs):
+    """As caches 'default' e 'template_fragments' têm de ser partilhadas entre processos."""
+    erros = []
+    for alias in CACHES_PARTILHADAS:
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend not in CACHES_POR_PROCESSO:
+            continue
+        erros.append(Error(
+            f"A cache '{alias}' ({backend}) não é partilhada entre processos.",
+            hint=(
+                'Os carimbos de versão (ETags da API, cópia de leitura), a cache '
+                'do sino e as linhas das listas têm de ser vistos por todos os '
+                'processos: configure uma cache partilhada (FileBasedCache, '
+                'DatabaseCache, memcached ou redis).'
+            ),
+            id='pharmacy.E001',
+        ))
+    return erros
+
+
+@register(Tags.staticfiles, deploy=True)
+def verificar_bibliotecas_locais(app_configs, **kwargs):
+    """Sem static/vendor/ completa, os templates dependem dos CDNs."""
+    em_falta = [nome for nome in ficheiros_gerados() if not (pasta_gerados() / nome).is_file()]
+    if not em_falta:
+        return []
+    return [Warning(
+        f'Faltam {len(em_falta)} ficheiro(s) em {pasta_gerados()} (ex: {em_falta[0]}): '
+        'as páginas carregam as bibliotecas de front-end dos CDNs.',
+        hint='Correr "manage.py vendor_assets --descarregar" numa máquina com Internet e acrescentar vendor/ e static/vendor/ ao repositório.',
+        id='pharmacy.W001',
+    )]
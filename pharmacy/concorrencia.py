@@ -0,0 +1,194 @@
+'''
+DomusShelf - Benchmark de Concorrência na Base de Dados
+=======================================================
+
+Compara o débito (pedidos por segundo) de leituras e escritas com
+vários pedidos em paralelo, em cada perfil de base de dados:
+
+    simples:           motor sqlite3 do Django, sem opções (o de settings.py)
+    producao:          motor pharmacy.sqlite (WAL, PRAGMAs, BEGIN IMMEDIATE)
+    producao_leitura:  o anterior, com as páginas de consulta a ler do
+                       mesmo ficheiro aberto só para leitura (leitura.py)
+
+Cada trabalhador é uma thread com o seu cliente de testes e a sua
+ligação, autenticado como um agregado sintético diferente, e faz
+pedidos às páginas durante um tempo fixo:
+
+    escritas: registo de consumo e nova embalagem (POST)
+    leituras: dashboard e lista de stock (GET)
+
+Para cada perfil é criada uma base de dados nova num ficheiro
+temporário (o modo WAL fica gravado no ficheiro, por isso os perfis
+não podem partilhar um), migrada e com dados sintéticos. Os erros
+("database is locked") são contados à parte.
+
+Usado pelo comando "manage.py benchmark_concurrency".
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, suppress
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.test import Client
+from django.utils import timezone
+
+from .benchmarks import percentil, preparar_utilizador
+from .leitura import ALIAS_LEITURA
+from .sintetico import gerar
+
+
+PERFIS = {
+    'simples': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}},
+    'producao': {'ENGINE': 'pharmacy.sqlite', 'OPTIONS': {}},
+    'producao_leitura': {'ENGINE': 'pharmacy.sqlite', 'OPTIONS': {}},
+}
+
+# Perfis com a base de dados "leitura" (mode=ro sobre o mesmo ficheiro)
+PERFIS_COM_COPIA = {'producao_leitura'}
+
+
+def _pedidos(embalagem):
+    """(tipo, nome, método, URL, dados) dos pedidos feitos por um trabalhador."""
+    nova_embalagem = {
+        'medicamento': embalagem.medicamento_id,
+        'quantidade_inicial': 10,
+        'unidade': 'comprimidos',
+        'data_validade': (timezone.localdate() + timedelta(days=365)).strftime('%d/%m/%Y'),
+    }
+    return {
+        'escrita': [
+            ('consumo_criar', 'post', '/medicamentos/consumo/novo/', {'embalagem': embalagem.pk, 'quantidade': 1}),
+            ('embalagem_criar', 'post', '/medicamentos/stock/nova/', nova_embalagem),
+        ],
+        'leitura': [
+            ('dashboard', 'get', '/', {}),
+            ('embalagem_lista', 'get', '/medicamentos/stock/', {}),
+        ],
+    }
+
+
+def _trocar_bases(configuracoes):
+    """Fecha as ligações e passa a usar outras bases de dados (alias -> configuração)."""
+    connections.close_all()
+    for alias in set(connections.settings) | set(configuracoes):
+        # A ligação desta thread é recriada com a nova configuração no próximo acesso
+        with suppress(AttributeError):
+            del connections[alias]
+    connections.settings.clear()
+    connections.settings.update(configuracoes)
+
+
+@contextmanager
+def base_de_dados_temporaria(perfil, pasta):
+    """
+    Instala como 'default' uma base de dados nova, num ficheiro dentro de
+    'pasta', com o motor e as opções do perfil (e a "leitura", se o
+    perfil a tiver). No fim repõe as originais.
+    """
+    originais = dict(connections.settings)
+    nome = os.path.join(pasta, f'{perfil}.sqlite3')
+    configuracao = dict(originais[DEFAULT_DB_ALIAS], NAME=nome, **PERFIS[perfil])
+    configuracoes = {DEFAULT_DB_ALIAS: configuracao}
+    if perfil in PERFIS_COM_COPIA:
+        configuracoes[ALIAS_LEITURA] = dict(configuracao, NAME=f'file:{nome}?mode=ro')
+
+    _trocar_bases(configuracoes)
+    try:
+        call_command('migrate', verbosity=0, interactive=False)
+        yield configuracao
+    finally:
+        _trocar_bases(originais)
+
+
+def _trabalhador(user, pedidos, proporcao_escrita, semente, partida, duracao, resultados):
+    """Faz pedidos até acabar o tempo e junta as contagens a 'resultados'."""
+    aleatorio = random.Random(semente)
+    cliente = Client()
+    cliente.force_login(user)
+    tempos = {'escrita': [], 'leitura': []}
+    erros = 0
+    try:
+        partida.wait()
+        fim = time.perf_counter() + duracao
+        while time.perf_counter() < fim:
+            tipo = 'escrita' if aleatorio.random() < proporcao_escrita else 'leitura'
+            _, metodo, url, dados = aleatorio.choice(pedidos[tipo])
+            inicio = time.perf_counter()
+            try:
+                resposta = getattr(cliente, metodo)(url, dados)
+            except OperationalError:
+                erros += 1
+                continue
+            if resposta.status_code not in (200, 302):
+                erros += 1
+                continue
+            tempos[tipo].append((time.perf_counter() - inicio) * 1000)
+    finally:
+        # Cada thread tem a sua ligação: fechada aqui, não no fim do benchmark
+        connection.close()
+        resultados.append((tempos, erros))
+
+
+def medir_concorrencia(utilizadores, trabalhadores, duracao, proporcao_escrita, semente=0):
+    """
+    Corre 'trabalhadores' threads durante 'duracao' segundos, cada uma com
+    o seu (user, embalagem). Devolve o dicionário de resultados.
+    """
+    partida = threading.Barrier(trabalhadores)
+    resultados = []
+    threads = [
+        threading.Thread(target=_trabalhador, args=(
+            user, _pedidos(embalagem), proporcao_escrita, f'{semente}-{numero}',
+            partida, duracao, resultados,
+        ))
+        for numero, (user, embalagem) in enumerate(utilizadores[:trabalhadores])
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    escritas = [t for tempos, _ in resultados for t in tempos['escrita']]
+    leituras = [t for tempos, _ in resultados for t in tempos['leitura']]
+    return {
+        'trabalhadores': trabalhadores,
+        'escritas_s': round(len(escritas) / duracao, 1),
+        'leituras_s': round(len(leituras) / duracao, 1),
+        'escrita_p95_ms': round(percentil(escritas, 95), 1) if escritas else None,
+        'leitura_p95_ms': round(percentil(leituras, 95), 1) if leituras else None,
+        'erros': sum(erros for _, erros in resultados),
+    }
+
+
+def executar(trabalhadores, perfis=tuple(PERFIS), duracao=5.0, proporcao_escrita=0.3,
+             semente=0, progresso=None, **parametros):
+    """
+    Mede cada perfil com cada número de trabalhadores (lista). 'parametros'
+    são passados a sintetico.gerar. Devolve a lista de resultados.
+    """
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix='domusshelf-') as pasta:
+        for perfil in perfis:
+            with base_de_dados_temporaria(perfil, pasta):
+                ids = gerar(max(trabalhadores), semente=semente, **parametros)
+                utilizadores = [preparar_utilizador(user_id) for user_id in ids]
+                connections.close_all()
+
+                for quantos in sorted(trabalhadores):
+                    resultado = {'perfil': perfil}
+                    resultado.update(medir_concorrencia(
+                        utilizadores, quantos, duracao, proporcao_escrita, semente=semente,
+                    ))
+                    resultados.append(resultado)
+                    if progresso:
+                        progresso(resultado)
+    return resultados
@@ -10,8 +10,10 @@ Autor: Miguel Ângelo Ascensão Real
 Data: 4 de Fevereiro de 2026
 '''
 
-from datetime import date, timedelta
-from .models import Embalagem, Preferencias
+from django.utils.functional import SimpleLazyObject
+
+from .caches import obter_resumo_alertas
+from .estaticos import urls_bibliotecas
 
 
 def alertas_count(request):
@@ -22,28 +24,37 @@ def alertas_count(request):
     - Embalagens já expiradas
     - Embalagens a expirar dentro dos próximos X dias (configurável)
     
+    O valor vem da cache por utilizador (ver caches.py), que só é
+    recalculada quando o stock muda ou à meia-noite. Além disso é
+    "preguiçoso" (SimpleLazyObject): só é calculado se o template usar
+    a variável, por isso páginas sem o sino não fazem nenhuma query.
+    As views async (views_async.py) lêem o resumo antes de renderizar e
+    deixam-no em request.resumo_alertas.
+    
     Retorna um dicionário que é adicionado ao contexto de cada template.
     """
+    # Views async: o resumo já foi lido antes de renderizar (durante a
+    # renderização não se pode consultar a base de dados)
+    resumo = getattr(request, 'resumo_alertas', None)
+    if resumo is not None:
+        return {'alertas_count': resumo['total']}
+    
     if not request.user.is_authenticated:
         return {'alertas_count': 0}
     
-    hoje = date.today()
-    
-    # Obter preferências do utilizador (dias de antecedência para alertas)
-    try:
-        prefs = Preferencias.objects.get(utilizador=request.user)
-        dias_alerta = prefs.dias_alerta_antes
-    except Preferencias.DoesNotExist:
-        dias_alerta = 30  # Valor por defeito
-    
-    data_limite = hoje + timedelta(days=dias_alerta)
+    user = request.user
     
-    # Contar embalagens problemáticas (expiradas OU a expirar em breve)
-    # Filtramos apenas embalagens com stock > 0 (não faz sentido alertar sobre vazias)
-    count = Embalagem.objects.filter(
-        medicamento__utilizador=request.user,
-        quantidade_actual__gt=0,
-        data_validade__lte=data_limite
-    ).count()
-    
-    return {'alertas_count': count}
\ No newline at end of file
+    return {
+        'alertas_count': SimpleLazyObject(
+            lambda: obter_resumo_alertas(user)['total']
+        ),
+    }
+
+
+def bibliotecas(request):
+    """
+    Endereços de Bootstrap, Bootstrap Icons, flatpickr e da fonte Inter
+    ({{ bibliotecas.bootstrap_css }}, ...): os ficheiros de static/vendor/
+    quando existem, senão as mesmas versões nos CDNs (ver estaticos.py).
+    """
+    return {'bibliotecas': urls_bibliotecas()}
\ No newline at end of file
@@ -0,0 +1,352 @@
+'''
+DomusShelf - Ficheiros Estáticos (sem CDN)
+==========================================
+
+Bootstrap, Bootstrap Icons, flatpickr e a fonte Inter são servidos pela
+própria aplicação, sem pedidos a cdn.jsdelivr.net nem a Google Fonts:
+funciona numa rede sem acesso à Internet e a primeira página não
+espera por servidores de terceiros.
+
+Os templates não têm os endereços escritos: usam {{ bibliotecas.* }}
+(context processor bibliotecas). Com static/vendor/ completa, são os
+ficheiros locais; sem ela, os mesmos ficheiros nos CDNs, nas versões
+fixadas, para as páginas nunca ficarem sem estilos nem o manifesto do
+collectstatic apontar para ficheiros que não existem.
+
+O caminho dos ficheiros:
+- vendor/ (na raiz do projecto) tem os originais, nas versões fixadas
+  em FICHEIROS_EXTERNOS. São descarregados uma vez, numa máquina com
+  Internet, com "manage.py vendor_assets --descarregar", e ficam no
+  repositório.
+- "manage.py vendor_assets" gera static/vendor/ a partir de vendor/
+  (também no repositório, para o deploy não precisar deste passo):
+  tira as referências aos source maps, deixa no CSS dos ícones só os
+  que os templates usam (icones_usados) e escreve o CSS da fonte Inter.
+  Com o fontTools instalado, as fontes dos ícones também ficam só com
+  esses glifos.
+- "manage.py collectstatic" (perfil de produção) copia tudo para
+  STATIC_ROOT com o ArmazenamentoEstaticos: nomes com o hash do
+  conteúdo (ManifestStaticFilesStorage) e, ao lado de cada ficheiro de
+  texto, as versões .gz e .br (esta só com o módulo brotli instalado).
+- O EstaticosMiddleware (middleware.py) serve-os, com a versão
+  comprimida que o browser aceitar e cache de um ano nos nomes com hash.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.templatetags.static import static
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele, só há versões .gz
+    brotli = None
+
+
+# Pesos da fonte Inter usados no CSS
+PESOS_INTER = (400, 500, 600, 700)
+
+# Originais em vendor/, descarregados de ORIGEM_PACOTES
+ORIGEM_PACOTES = 'https://cdn.jsdelivr.net/npm'
+
+FICHEIROS_EXTERNOS = [
+    ('bootstrap/bootstrap.min.css', 'bootstrap@5.3.2/dist/css/bootstrap.min.css'),
+    ('bootstrap/bootstrap.bundle.min.js', 'bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js'),
+    ('bootstrap-icons/bootstrap-icons.css', 'bootstrap-icons@1.11.1/font/bootstrap-icons.css'),
+    ('bootstrap-icons/fonts/bootstrap-icons.woff2', 'bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff2'),
+    ('bootstrap-icons/fonts/bootstrap-icons.woff', 'bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff'),
+    ('flatpickr/flatpickr.min.css', 'flatpickr@4.6.13/dist/flatpickr.min.css'),
+    ('flatpickr/flatpickr.min.js', 'flatpickr@4.6.13/dist/flatpickr.min.js'),
+    ('flatpickr/l10n/pt.js', 'flatpickr@4.6.13/dist/l10n/pt.js'),
+] + [
+    (f'inter/inter-latin-{peso}-normal.woff2', f'@fontsource/inter@5.0.16/files/inter-latin-{peso}-normal.woff2')
+    for peso in PESOS_INTER
+]
+
+CSS_ICONES = 'bootstrap-icons/bootstrap-icons.css'
+
+# @font-face da Inter, escrito por gerar() (no CDN vem do Google Fonts)
+CSS_INTER = 'inter/inter.css'
+CSS_INTER_CDN = 'https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap'
+
+# Nome no contexto dos templates ({{ bibliotecas.<nome> }}) -> ficheiro em static/vendor/
+BIBLIOTECAS = {
+    'bootstrap_css': 'bootstrap/bootstrap.min.css',
+    'bootstrap_js': 'bootstrap/bootstrap.bundle.min.js',
+    'icones_css': CSS_ICONES,
+    'inter_css': CSS_INTER,
+    'flatpickr_css': 'flatpickr/flatpickr.min.css',
+    'flatpickr_js': 'flatpickr/flatpickr.min.js',
+    'flatpickr_pt_js': 'flatpickr/l10n/pt.js',
+}
+
+# Ficheiros que vale a pena comprimir (as fontes woff/woff2 já vêm comprimidas)
+EXTENSOES_COMPRIMIVEIS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico'}
+
+# Abaixo disto, a versão comprimida não compensa o pedido
+TAMANHO_MINIMO = 256
+
+_ICONE = re.compile(r'\bbi-([a-z0-9]+(?:-[a-z0-9]+)*)')
+_REGRA_ICONE = re.compile(r'\.bi-([a-z0-9-]+)::before\s*\{\s*content:\s*"\\([0-9a-f]+)";?\s*\}\s*')
+_SOURCE_MAP = re.compile(r'^\s*(?://|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+_VERSAO_FONTE = re.compile(r'(\.woff2?)\?[0-9a-f]+')
+
+
+def pasta_originais():
+    """vendor/, com os ficheiros descarregados."""
+    return Path(settings.BASE_DIR) / 'vendor'
+
+
+def pasta_gerados():
+    """static/vendor/, gerada por vendor_assets a partir de vendor/."""
+    return Path(settings.BASE_DIR) / 'static' / 'vendor'
+
+
+def ficheiros_gerados():
+    """Caminhos (relativos a static/vendor/) de tudo o que gerar() escreve."""
+    return [nome for nome, _ in FICHEIROS_EXTERNOS] + [CSS_INTER]
+
+
+@lru_cache(maxsize=None)
+def urls_bibliotecas():
+    """
+    {nome: URL} das bibliotecas de BIBLIOTECAS. Locais ({% static %})
+    se static/vendor/ estiver completa; senão, as mesmas versões nos
+    CDNs. Decidido uma vez por processo.
+    """
+    if all((pasta_gerados() / nome).is_file() for nome in ficheiros_gerados()):
+        return {chave: static(f'vendor/{nome}') for chave, nome in BIBLIOTECAS.items()}
+
+    cdn = {nome: f'{ORIGEM_PACOTES}/{pacote}' for nome, pacote in FICHEIROS_EXTERNOS}
+    cdn[CSS_INTER] = CSS_INTER_CDN
+    return {chave: cdn[nome] for chave, nome in BIBLIOTECAS.items()}
+
+
+# ==============================================================================
+# ÍCONES
+# ==============================================================================
+
+def icones_usados():
+    """Nomes dos ícones (sem o prefixo bi-) usados nos templates e no CSS/JS do projecto."""
+    from .aquecimento import motor, nomes_dos_templates
+
+    textos = []
+    for nome in nomes_dos_templates():
+        _, origem = motor().find_template(nome)
+        textos.append(origem.loader.get_contents(origem))
+    for pasta in settings.STATICFILES_DIRS:
+        for ficheiro in Path(pasta).rglob('*'):
+            if ficheiro.suffix in ('.css', '.js') and pasta_gerados() not in ficheiro.parents:
+                textos.append(ficheiro.read_text(encoding='utf-8'))
+    return {nome for texto in textos for nome in _ICONE.findall(texto)}
+
+
+def recortar_css_icones(css, usados):
+    """
+    O CSS do Bootstrap Icons só com as regras dos ícones 'usados'.
+    Devolve (css, pontos de código desses ícones).
+    """
+    pontos = set()
+
+    def regra(correspondencia):
+        nome, codigo = correspondencia.groups()
+        if nome not in usados:
+            return ''
+        pontos.add(int(codigo, 16))
+        return correspondencia.group(0)
+
+    return _REGRA_ICONE.sub(regra, css), pontos
+
+
+def recortar_fonte(origem, destino, pontos):
+    """
+    Grava em 'destino' a fonte só com os glifos de 'pontos'. Precisa do
+    fontTools (e do brotli, para woff2): sem eles copia a fonte inteira
+    e devolve False.
+    """
+    try:
+        from fontTools import subset
+        if origem.suffix == '.woff2' and brotli is None:
+            raise ImportError('brotli')
+    except ImportError:
+        shutil.copyfile(origem, destino)
+        return False
+
+    opcoes = subset.Options()
+    opcoes.flavor = origem.suffix.lstrip('.')
+    fonte = subset.load_font(str(origem), opcoes)
+    recorte = subset.Subsetter(opcoes)
+    recorte.populate(unicodes=pontos)
+    recorte.subset(fonte)
+    subset.save_font(fonte, str(destino), opcoes)
+    return True
+
+
+def gerar(origem=None, destino=None):
+    """
+    Gera static/vendor/ a partir de vendor/. Devolve um dicionário com
+    os ícones usados, os guardados no CSS e se as fontes foram recortadas.
+    """
+    origem = Path(origem or pasta_originais())
+    destino = Path(destino or pasta_gerados())
+    em_falta = [nome for nome, _ in FICHEIROS_EXTERNOS if not (origem / nome).is_file()]
+    if em_falta:
+        raise FileNotFoundError(f'Faltam em {origem}: {", ".join(em_falta)}')
+
+    shutil.rmtree(destino, ignore_errors=True)
+    usados = icones_usados()
+    pontos = set()
+    for nome, _ in FICHEIROS_EXTERNOS:
+        ficheiro = destino / nome
+        ficheiro.parent.mkdir(parents=True, exist_ok=True)
+        if Path(nome).suffix in ('.css', '.js'):
+            texto = _SOURCE_MAP.sub('', (origem / nome).read_text(encoding='utf-8'))
+            if nome == CSS_ICONES:
+                texto, pontos = recortar_css_icones(_VERSAO_FONTE.sub(r'\1', texto), usados)
+            ficheiro.write_text(texto, encoding='utf-8')
+
+    fontes_recortadas = True
+    for nome, _ in FICHEIROS_EXTERNOS:
+        if Path(nome).suffix in ('.woff', '.woff2'):
+            if nome.startswith('bootstrap-icons/'):
+                fontes_recortadas &= recortar_fonte(origem / nome, destino / nome, pontos)
+            else:
+                shutil.copyfile(origem / nome, destino / nome)
+
+    (destino / CSS_INTER).write_text(css_inter(), encoding='utf-8')
+    urls_bibliotecas.cache_clear()
+    return {'usados': usados, 'guardados': len(pontos), 'fontes_recortadas': fontes_recortadas}
+
+
+def css_inter():
+    """@font-face da Inter (alfabeto latino), com as fontes ao lado do CSS."""
+    return ''.join(
+        "@font-face {\n"
+        "    font-family: 'Inter';\n"
+        "    font-style: normal;\n"
+        f"    font-weight: {peso};\n"
+        "    font-display: swap;\n"
+        f"    src: url('./inter-latin-{peso}-normal.woff2') format('woff2');\n"
+        "}\n\n"
+        for peso in PESOS_INTER
+    )
+
+
+# ==============================================================================
+# COMPRESSÃO E ARMAZENAMENTO
+# ==============================================================================
+
+def comprimir(caminho):
+    """
+    Grava ao lado de 'caminho' as versões .gz e .br (se houver brotli),
+    quando ficam mais pequenas. Devolve as extensões gravadas.
+    """
+    conteudo = Path(caminho).read_bytes()
+    if len(conteudo) < TAMANHO_MINIMO:
+        return []
+
+    # mtime=0: o mesmo ficheiro dá sempre o mesmo .gz
+    versoes = [('.gz', gzip.compress(conteudo, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        versoes.append(('.br', brotli.compress(conteudo, quality=11)))
+
+    gravadas = []
+    for extensao, comprimido in versoes:
+        if len(comprimido) < len(conteudo) * 0.95:
+            Path(f'{caminho}{extensao}').write_bytes(comprimido)
+            gravadas.append(extensao)
+    return gravadas
+
+
+class ArmazenamentoEstaticos(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage que, no fim do collectstatic, grava as
+    versões comprimidas dos ficheiros de texto (originais e com hash).
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        nomes = set(paths) | set(self.hashed_files.values())
+        for nome in sorted(nomes):
+            if Path(nome).suffix in EXTENSOES_COMPRIMIVEIS and self.exists(nome):
+                comprimir(self.path(nome))
+
+
+# ==============================================================================
+# SERVIR OS FICHEIROS (usado pelo EstaticosMiddleware)
+# ==============================================================================
+
+# Cache dos ficheiros com hash no nome (nunca mudam) e dos restantes
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+CACHE_CURTA = 'public, max-age=60'
+
+# Por ordem de preferência: Content-Encoding e extensão
+CODIFICACOES = [('br', '.br'), ('gzip', '.gz')]
+
+
+class Estatico:
+    """Um ficheiro de STATIC_ROOT e as suas versões comprimidas."""
+
+    __slots__ = ('caminho', 'tipo', 'codificacao_texto', 'versoes', 'cache_control')
+
+    def __init__(self, caminho, imutavel):
+        self.caminho = caminho
+        self.tipo, _ = mimetypes.guess_type(caminho)
+        self.tipo = self.tipo or 'application/octet-stream'
+        if self.tipo.startswith('text/') or self.tipo in ('application/javascript', 'image/svg+xml'):
+            self.tipo += '; charset=utf-8'
+        self.versoes = {
+            codificacao: f'{caminho}{extensao}'
+            for codificacao, extensao in CODIFICACOES
+            if os.path.isfile(f'{caminho}{extensao}')
+        }
+        self.cache_control = CACHE_IMUTAVEL if imutavel else CACHE_CURTA
+
+    def escolher(self, accept_encoding):
+        """(caminho, Content-Encoding ou None) da melhor versão aceite."""
+        aceites = set()
+        for parte in accept_encoding.split(','):
+            codificacao, _, parametros = parte.partition(';')
+            nome, _, valor = parametros.strip().partition('=')
+            try:
+                peso = float(valor) if nome.strip() == 'q' else 1.0
+            except ValueError:
+                peso = 1.0
+            if peso > 0:
+                aceites.add(codificacao.strip().lower())
+        for codificacao, caminho in self.versoes.items():
+            if codificacao in aceites:
+                return caminho, codificacao
+        return self.caminho, None
+
+
+def indexar(raiz, imutaveis=()):
+    """
+    {caminho relativo ao STATIC_URL: Estatico} de tudo o que está em
+    'raiz' (o STATIC_ROOT). Só o que está no índice é servido.
+    'imutaveis' são os nomes com hash (os valores do manifesto).
+    """
+    imutaveis = set(imutaveis)
+    ficheiros = {}
+    if not raiz or not os.path.isdir(raiz):
+        return ficheiros
+    for pasta, _, nomes in os.walk(raiz):
+        for nome in nomes:
+            if nome.endswith(('.gz', '.br')):
+                continue
+            caminho = os.path.join(pasta, nome)
+            relativo = Path(os.path.relpath(caminho, raiz)).as_posix()
+            ficheiros[relativo] = Estatico(caminho, relativo in imutaveis)
+    return ficheiros
@@ -0,0 +1,302 @@
+'''
+DomusShelf - Eventos em Tempo Real (Server-Sent Events)
+=======================================================
+
+Em vez de recarregar as páginas para ver se o sino mudou, o browser
+abre uma ligação longa a /medicamentos/eventos/ (EventSource) e recebe
+as alterações aos dados do seu utilizador à medida que acontecem:
+
+    stock                  uma embalagem ganhou ou perdeu unidades
+                           (consumo, ajuste, abate)
+    embalagem_adicionada   uma embalagem nova entrou no stock
+    embalagem_removida     uma embalagem foi eliminada
+    alertas                o número de alertas do sino mudou
+    reiniciar              perderam-se eventos: o cliente volta a pedir o
+                           número de alertas (/api/resumo/)
+
+Como funciona:
+- Os signals (signals.py) publicam os eventos no Canal deste processo
+  quando a transacção é confirmada (on_commit): um rollback não avisa
+  ninguém. A importação em massa (bulk_create) publica os das suas
+  embalagens à parte, com publicar_embalagens_adicionadas().
+- Cada ligação (views_async.eventos) subscreve o canal do seu
+  utilizador e recebe os eventos numa fila asyncio; quem publica está
+  numa thread (uma view síncrona, o ORM), por isso a entrega é feita
+  com call_soon_threadsafe no ciclo de eventos de cada ligação.
+- O canal guarda os últimos eventos de cada utilizador: ao voltar a
+  ligar, o browser manda o cabeçalho Last-Event-ID e recebe só os que
+  lhe faltam. Se já não estiverem guardados (ou o id for de outro
+  processo), recebe "reiniciar".
+- O número de alertas não é publicado por quem escreve: cada ligação
+  volta a lê-lo (da cache, normalmente) depois de um aviso de alteração,
+  e só o envia se mudou.
+- Sem eventos, a ligação manda um comentário (batimento) a cada
+  BATIMENTO_SEGUNDOS, para os proxies não a fecharem.
+
+O canal é só deste processo: com vários processos (workers), cada
+ligação recebe os eventos das escritas feitas no seu processo e, ao
+mudar de processo, recebe "reiniciar".
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import asyncio
+import itertools
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+
+from .caches import obter_resumo_alertas
+from .particoes import particao_actual, usar_particao
+
+
+# Segundos sem eventos até mandar um batimento
+BATIMENTO_SEGUNDOS = 15
+
+# Segundos até o servidor fechar a ligação (o browser volta a ligar,
+# com o Last-Event-ID): limita as ligações esquecidas por clientes que
+# desapareceram sem avisar
+DURACAO_MAXIMA_SEGUNDOS = 300
+
+# Espera pedida ao browser antes de voltar a ligar (milissegundos). Em
+# WSGI a resposta acaba logo (não há ligação longa) e isto faz de intervalo
+# entre pedidos
+RETRY_ASGI_MS = 3000
+RETRY_WSGI_MS = 30000
+
+# Eventos guardados por utilizador, e utilizadores com eventos guardados
+HISTORICO_POR_UTILIZADOR = 50
+MAXIMO_UTILIZADORES = 5000
+
+# Eventos por entregar numa ligação lenta antes de a mandar reiniciar
+TAMANHO_FILA = 200
+
+# Marca na fila de uma ligação: os dados do utilizador mudaram
+ALTERACAO = 'alteracao'
+
+
+class Evento:
+    """Um evento de um utilizador, com o seu número neste processo."""
+
+    __slots__ = ('numero', 'tipo', 'dados')
+
+    def __init__(self, numero, tipo, dados):
+        self.numero = numero
+        self.tipo = tipo
+        self.dados = dados
+
+    def formatar(self, instancia):
+        """O evento no formato text/event-stream."""
+        return formatar(self.tipo, self.dados, f'{instancia}-{self.numero}')
+
+
+def formatar(tipo, dados, identificador=None):
+    """Uma mensagem SSE (sem id, o browser mantém o último que recebeu)."""
+    linhas = [f'id: {identificador}'] if identificador else []
+    linhas += [f'event: {tipo}', f'data: {json.dumps(dados, ensure_ascii=False)}']
+    return '\n'.join(linhas) + '\n\n'
+
+
+class Subscricao:
+    """Fila de uma ligação, preenchida a partir de qualquer thread."""
+
+    def __init__(self, loop, fila):
+        self.loop = loop
+        self.fila = fila
+        self.transbordou = False
+
+    def entregar(self, item):
+        """Chamada na thread do ciclo de eventos (call_soon_threadsafe)."""
+        if self.transbordou:
+            return
+        try:
+            self.fila.put_nowait(item)
+        except asyncio.QueueFull:
+            # Fila cheia: o cliente não acompanha, recomeça do zero
+            self.transbordou = True
+
+
+class Canal:
+    """Publicação e subscrição de eventos por utilizador, neste processo."""
+
+    def __init__(self):
+        # Identifica o processo nos ids dos eventos
+        self.instancia = secrets.token_hex(4)
+        self._numeros = itertools.count(1)
+        self._trinco = threading.Lock()
+        self._historico = OrderedDict()
+        self._perdidos = {}
+        # Maior número esquecido ao descartar o histórico de um utilizador
+        # inteiro: ids anteriores já não se sabe se estão completos
+        self._esquecido = 0
+        self._subscricoes = {}
+
+    def publicar(self, utilizador_id, tipo, dados):
+        """Guarda o evento e entrega-o às ligações do utilizador."""
+        with self._trinco:
+            evento = Evento(next(self._numeros), tipo, dados)
+            historico = self._historico.get(utilizador_id)
+            if historico is None:
+                historico = self._historico[utilizador_id] = deque(maxlen=HISTORICO_POR_UTILIZADOR)
+                if len(self._historico) > MAXIMO_UTILIZADORES:
+                    antigo_id, antigo = self._historico.popitem(last=False)
+                    self._perdidos.pop(antigo_id, None)
+                    if antigo:
+                        self._esquecido = max(self._esquecido, antigo[-1].numero)
+            else:
+                self._historico.move_to_end(utilizador_id)
+            if len(historico) == historico.maxlen:
+                self._perdidos[utilizador_id] = historico[0].numero
+            historico.append(evento)
+            subscricoes = list(self._subscricoes.get(utilizador_id, ()))
+        self._entregar(subscricoes, evento)
+        return evento
+
+    def avisar(self, utilizador_id):
+        """Acorda as ligações do utilizador (os seus dados mudaram)."""
+        with self._trinco:
+            subscricoes = list(self._subscricoes.get(utilizador_id, ()))
+        self._entregar(subscricoes, ALTERACAO)
+
+    def _entregar(self, subscricoes, item):
+        for subscricao in subscricoes:
+            try:
+                subscricao.loop.call_soon_threadsafe(subscricao.entregar, item)
+            except RuntimeError:
+                # O ciclo de eventos da ligação já fechou
+                pass
+
+    @contextmanager
+    def subscrever(self, utilizador_id, loop, fila):
+        """Dentro do bloco, os eventos do utilizador chegam à 'fila'."""
+        subscricao = Subscricao(loop, fila)
+        with self._trinco:
+            self._subscricoes.setdefault(utilizador_id, set()).add(subscricao)
+        try:
+            yield subscricao
+        finally:
+            with self._trinco:
+                restantes = self._subscricoes.get(utilizador_id, set())
+                restantes.discard(subscricao)
+                if not restantes:
+                    self._subscricoes.pop(utilizador_id, None)
+
+    def desde(self, utilizador_id, ultimo_id):
+        """
+        Eventos guardados do utilizador depois de 'ultimo_id' (o
+        Last-Event-ID). Devolve (eventos, completo): completo é False se
+        algum evento em falta já não está guardado.
+        """
+        with self._trinco:
+            historico = list(self._historico.get(utilizador_id, ()))
+            perdido = self._perdidos.get(utilizador_id, 0)
+            esquecido = self._esquecido
+        if not ultimo_id:
+            return [], True
+
+        instancia, _, numero = ultimo_id.partition('-')
+        if instancia != self.instancia or not numero.isdigit():
+            return historico, False
+        numero = int(numero)
+        completo = numero >= max(perdido, esquecido)
+        return [evento for evento in historico if evento.numero > numero], completo
+
+
+canal = Canal()
+
+
+def publicar(utilizador_id, tipo, dados, using=None):
+    """Publica o evento quando a transacção em curso for confirmada."""
+    if utilizador_id is None:
+        return
+    transaction.on_commit(
+        lambda: canal.publicar(utilizador_id, tipo, dados),
+        using=using or particao_actual(),
+    )
+
+
+def avisar_alteracao(utilizador_id, using=None):
+    """Avisa as ligações do utilizador quando a transacção for confirmada."""
+    if utilizador_id is None:
+        return
+    transaction.on_commit(
+        lambda: canal.avisar(utilizador_id),
+        using=using or particao_actual(),
+    )
+
+
+def _resumo_alertas(user, particao):
+    """O resumo do sino, lido na partição do utilizador (fora do pedido)."""
+    with usar_particao(particao):
+        resumo = obter_resumo_alertas(user)
+    return {campo: resumo[campo] for campo in ('expiradas', 'a_expirar', 'total')}
+
+
+async def fluxo(user, ultimo_id, particao, continuo=True):
+    """
+    As mensagens text/event-stream de uma ligação: os eventos em falta
+    desde 'ultimo_id', o resumo do sino e, se 'continuo', os eventos
+    seguintes até DURACAO_MAXIMA_SEGUNDOS. 'particao' é a base de dados
+    dos dados do utilizador: o corpo da resposta é gerado depois de a
+    view (e o ParticaoMiddleware) terminar.
+    """
+    loop = asyncio.get_running_loop()
+    fila = asyncio.Queue(maxsize=TAMANHO_FILA)
+    ler_resumo = sync_to_async(_resumo_alertas)
+
+    # Subscreve antes de ler o histórico, para não perder nada entre os dois
+    with canal.subscrever(user.pk, loop, fila) as subscricao:
+        yield f'retry: {RETRY_ASGI_MS if continuo else RETRY_WSGI_MS}\n\n'
+
+        eventos, completo = canal.desde(user.pk, ultimo_id)
+        if not completo:
+            yield formatar('reiniciar', {})
+        ultimo = 0
+        for evento in eventos:
+            yield evento.formatar(canal.instancia)
+            ultimo = evento.numero
+
+        resumo = await ler_resumo(user, particao)
+        yield formatar('alertas', resumo)
+        if not continuo:
+            return
+
+        fim = time.monotonic() + DURACAO_MAXIMA_SEGUNDOS
+        while True:
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                return
+            try:
+                item = await asyncio.wait_for(fila.get(), min(BATIMENTO_SEGUNDOS, restante))
+            except asyncio.TimeoutError:
+                yield ': batimento\n\n'
+                continue
+
+            # Junta o que chegou entretanto: um só resumo por rajada
+            itens = [item]
+            while not fila.empty():
+                itens.append(fila.get_nowait())
+            if subscricao.transbordou:
+                yield formatar('reiniciar', {})
+                return
+
+            alterado = False
+            for item in itens:
+                if item is ALTERACAO:
+                    alterado = True
+                elif item.numero > ultimo:
+                    yield item.formatar(canal.instancia)
+                    ultimo = item.numero
+
+            if alterado:
+                novo = await ler_resumo(user, particao)
+                if novo != resumo:
+                    resumo = novo
+                    yield formatar('alertas', resumo)
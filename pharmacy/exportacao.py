@@ -0,0 +1,152 @@
+'''
+DomusShelf - Exportação de Dados (CSV / JSON Lines)
+===================================================
+
+Exporta medicamentos, embalagens e consumos sem passar pelo admin.
+
+Para aguentar exportações grandes (anos de histórico de consumos):
+- usamos values_list(), que devolve tuplos simples em vez de objectos
+  do modelo (muito mais rápido e leve);
+- percorremos o resultado com .iterator(chunk_size=...), que vai buscando
+  as linhas aos blocos em vez de carregar tudo em memória;
+- as linhas são geradas uma a uma (geradores), para serem enviadas ao
+  cliente por um StreamingHttpResponse ou escritas para um ficheiro.
+
+Usado pelas views de exportação e pelo comando "manage.py export_stock".
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Medicamento, Embalagem, Consumo
+
+
+# Número de linhas pedidas à base de dados de cada vez
+TAMANHO_BLOCO = 2000
+
+FORMATOS = ('csv', 'jsonl')
+
+
+# Para cada tipo de exportação: colunas (nomes no ficheiro) e campos do values_list
+EXPORTACOES = {
+    'medicamentos': {
+        'colunas': [
+            'id', 'nome_comercial', 'principio_activo', 'forma_farmaceutica',
+            'observacoes', 'criado_em',
+        ],
+        'campos': [
+            'id', 'nome_comercial', 'principio_activo', 'forma_farmaceutica',
+            'observacoes', 'criado_em',
+        ],
+    },
+    'embalagens': {
+        'colunas': [
+            'id', 'medicamento_id', 'medicamento', 'quantidade_inicial',
+            'quantidade_actual', 'unidade', 'data_validade', 'lote', 'criado_em',
+        ],
+        'campos': [
+            'id', 'medicamento_id', 'medicamento__nome_comercial', 'quantidade_inicial',
+            'quantidade_actual', 'unidade', 'data_validade', 'lote', 'criado_em',
+        ],
+    },
+    'consumos': {
+        'colunas': [
+            'id', 'data_hora', 'embalagem_id', 'medicamento_id', 'medicamento',
+            'quantidade', 'unidade', 'observacoes',
+        ],
+        'campos': [
+            'id', 'data_hora', 'embalagem_id', 'embalagem__medicamento_id',
+            'embalagem__medicamento__nome_comercial', 'quantidade',
+            'embalagem__unidade', 'observacoes',
+        ],
+    },
+}
+
+
+def _inicio_do_dia(dia):
+    """Converte uma data no primeiro instante desse dia (hora local)."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def obter_queryset(tipo, user=None, desde=None, ate=None, medicamento=None):
+    """
+    Constrói o queryset (já com values_list) de uma exportação.
+
+    Parâmetros:
+        tipo: 'medicamentos', 'embalagens' ou 'consumos'
+        user: dono dos dados (None = todos os utilizadores, para o comando)
+        desde / ate: intervalo de datas (inclusive). Aplica-se a criado_em
+            nos medicamentos, a data_validade nas embalagens e a data_hora
+            nos consumos.
+        medicamento: id de um medicamento para filtrar
+    """
+    if tipo == 'medicamentos':
+        queryset = Medicamento.objects.all()
+        campo_dono, campo_medicamento, campo_data = 'utilizador', 'pk', 'criado_em'
+        ordem = ('id',)
+    elif tipo == 'embalagens':
+        queryset = Embalagem.objects.all()
+        campo_dono, campo_medicamento, campo_data = 'utilizador', 'medicamento', 'data_validade'
+        ordem = ('data_validade', 'id')
+    elif tipo == 'consumos':
+        queryset = Consumo.objects.all()
+        campo_dono, campo_medicamento, campo_data = 'embalagem__utilizador', 'embalagem__medicamento', 'data_hora'
+        ordem = ('data_hora', 'id')
+    else:
+        raise ValueError(f'Exportação desconhecida: {tipo}')
+
+    if user is not None:
+        queryset = queryset.filter(**{campo_dono: user})
+    if medicamento is not None:
+        queryset = queryset.filter(**{campo_medicamento: medicamento})
+
+    # Datas: nas colunas DateTime comparamos com instantes (mantém o índice usável)
+    if campo_data == 'data_validade':
+        if desde:
+            queryset = queryset.filter(data_validade__gte=desde)
+        if ate:
+            queryset = queryset.filter(data_validade__lte=ate)
+    else:
+        if desde:
+            queryset = queryset.filter(**{f'{campo_data}__gte': _inicio_do_dia(desde)})
+        if ate:
+            queryset = queryset.filter(**{f'{campo_data}__lt': _inicio_do_dia(ate + timedelta(days=1))})
+
+    return queryset.order_by(*ordem).values_list(*EXPORTACOES[tipo]['campos'])
+
+
+class _Eco:
+    """
+    Pseudo-ficheiro para o csv.writer: em vez de guardar o texto,
+    devolve-o logo, para o podermos enviar linha a linha.
+    """
+
+    def write(self, valor):
+        return valor
+
+
+def gerar_linhas(tipo, formato, queryset):
+    """
+    Gera o conteúdo do ficheiro, uma linha de cada vez.
+    CSV começa com o cabeçalho; JSON Lines tem um objecto por linha.
+    """
+    colunas = EXPORTACOES[tipo]['colunas']
+    linhas = queryset.iterator(chunk_size=TAMANHO_BLOCO)
+
+    if formato == 'csv':
+        escritor = csv.writer(_Eco())
+        yield escritor.writerow(colunas)
+        for linha in linhas:
+            yield escritor.writerow(linha)
+    elif formato == 'jsonl':
+        for linha in linhas:
+            yield json.dumps(dict(zip(colunas, linha)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Formato desconhecido: {formato}')
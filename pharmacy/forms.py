@@ -179,7 +179,7 @@ class ConsumoForm(forms.ModelForm):
         # Filtra embalagens: apenas as do utilizador E com stock > 0
         if self.user:
             self.fields['embalagem'].queryset = Embalagem.objects.filter(
-                medicamento__utilizador=self.user,
+                utilizador=self.user,
                 quantidade_actual__gt=0  # Só mostra embalagens com stock
             ).select_related('medicamento').order_by('data_validade')
         # Adiciona classes Bootstrap aos campos
@@ -207,6 +207,85 @@ class ConsumoForm(forms.ModelForm):
         
         return cleaned_data
     
+class ConsumoMedicamentoForm(forms.Form):
+    """
+    Formulário para registar um consumo escolhendo apenas o medicamento.
+    
+    Ao contrário do ConsumoForm, o utilizador não escolhe a embalagem:
+    a quantidade é repartida automaticamente pelas embalagens dentro da
+    validade, das que expiram mais cedo para as mais tardias (FEFO).
+    Por isso pode pedir-se mais do que uma só embalagem contém.
+    """
+    
+    medicamento = forms.ModelChoiceField(
+        queryset=Medicamento.objects.none(),
+        label='Medicamento',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    
+    quantidade = forms.IntegerField(
+        min_value=1,
+        label='Quantidade',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': '1'}),
+    )
+    
+    observacoes = forms.CharField(
+        required=False,
+        label='Observações',
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+    )
+    
+    def __init__(self, *args, **kwargs):
+        # Extrai o user antes de chamar o __init__ pai
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        
+        # Só medicamentos do utilizador actual
+        if user:
+            self.fields['medicamento'].queryset = Medicamento.objects.filter(
+                utilizador=user
+            ).order_by('nome_comercial')
+    
+class ImportacaoForm(forms.Form):
+    """
+    Formulário para carregar um ficheiro de inventário (CSV ou JSON Lines).
+    O processamento é feito pelo ImportadorStock (importacao.py).
+    """
+    
+    ficheiro = forms.FileField(
+        label='Ficheiro',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control'}),
+        help_text='CSV com cabeçalho, ou JSON Lines (um objecto por linha)',
+    )
+    
+    formato = forms.ChoiceField(
+        label='Formato',
+        choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')],
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    
+class ExportacaoForm(forms.Form):
+    """
+    Filtros de uma exportação, lidos dos parâmetros do URL (GET).
+    Todos são opcionais: sem filtros exporta tudo o que é do utilizador.
+    """
+    
+    formato = forms.ChoiceField(
+        choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')],
+        required=False,
+    )
+    desde = forms.DateField(required=False)
+    ate = forms.DateField(required=False)
+    medicamento = forms.IntegerField(required=False, min_value=1)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        desde = cleaned_data.get('desde')
+        ate = cleaned_data.get('ate')
+        if desde and ate and desde > ate:
+            raise forms.ValidationError('A data inicial tem de ser anterior à data final.')
+        return cleaned_data
+    
 class PreferenciasForm(forms.ModelForm):
     """
     Formulário para editar as preferências do utilizador.
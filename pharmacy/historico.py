@@ -0,0 +1,294 @@
+'''
+DomusShelf - Histórico de Consumos (Totais Diários)
+===================================================
+
+A tabela Consumo cresce sem parar (um registo por toma) e qualquer
+relatório sobre ela — por medicamento, por dia, por utilizador — tem de
+a percorrer com dois JOINs (embalagem -> medicamento -> utilizador).
+
+A tabela ConsumoDiario guarda o total de cada (utilizador, medicamento,
+dia) e é mantida de forma incremental:
+- cada Consumo criado, alterado ou apagado soma ou subtrai a sua
+  quantidade ao dia respectivo (receivers em signals.py), na mesma
+  transacção do registo;
+- o comando "manage.py backfill_consumo_diario" recalcula os totais a
+  partir dos consumos existentes, aos blocos (para o histórico anterior
+  à criação da tabela, ou para corrigir diferenças);
+- opcionalmente, o mesmo comando apaga ("compacta") os consumos mais
+  antigos do que um período de retenção: os totais diários ficam.
+
+Os dias são os da hora local (TIME_ZONE), como no resto da aplicação.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Consumo, ConsumoDiario
+from .particoes import particao_actual
+
+
+# Número de consumos lidos de cada vez pelo backfill e pela compactação
+TAMANHO_LOTE = 5000
+
+# Quando True, os signals não mexem nos totais (ver suspender_actualizacao)
+_suspenso = ContextVar('pharmacy_historico_suspenso', default=False)
+
+
+@contextmanager
+def suspender_actualizacao():
+    """
+    Dentro deste bloco, criar ou apagar consumos não altera os totais
+    diários. Usado pela compactação, que apaga consumos antigos cujos
+    totais devem ficar.
+    """
+    token = _suspenso.set(True)
+    try:
+        yield
+    finally:
+        _suspenso.reset(token)
+
+
+def actualizacao_suspensa():
+    """True dentro de um bloco suspender_actualizacao()."""
+    return _suspenso.get()
+
+
+def inicio_do_dia(dia):
+    """Converte uma data no primeiro instante desse dia (hora local)."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+# ==================== ACTUALIZAÇÃO INCREMENTAL ====================
+
+def aplicar(utilizador_id, medicamento_id, dia, quantidade, numero):
+    """
+    Soma 'quantidade' e 'numero' (podem ser negativos) ao total do dia.
+
+    Um UPDATE com F() (atómico, sem ler o valor antes); se a linha ainda
+    não existir, é criada. Se outro pedido a criar entretanto, o INSERT
+    falha pela restrição única e volta-se a tentar o UPDATE.
+    Os dias que ficam sem consumos são apagados.
+    """
+    chave = {'utilizador_id': utilizador_id, 'medicamento_id': medicamento_id, 'dia': dia}
+
+    actualizadas = ConsumoDiario.objects.filter(**chave).update(
+        quantidade=F('quantidade') + quantidade,
+        numero_consumos=F('numero_consumos') + numero,
+    )
+
+    if numero < 0:
+        ConsumoDiario.objects.filter(**chave, numero_consumos__lte=0).delete()
+    elif not actualizadas and numero > 0:
+        try:
+            with transaction.atomic(using=particao_actual()):
+                ConsumoDiario.objects.create(**chave, quantidade=quantidade, numero_consumos=numero)
+        except IntegrityError:
+            aplicar(utilizador_id, medicamento_id, dia, quantidade, numero)
+
+
+def aplicar_consumo(utilizador_id, medicamento_id, data_hora, quantidade, sinal=1):
+    """Soma (sinal=1) ou subtrai (sinal=-1) um consumo ao seu dia."""
+    aplicar(
+        utilizador_id,
+        medicamento_id,
+        timezone.localdate(data_hora),
+        sinal * quantidade,
+        sinal,
+    )
+
+
+def retirar_embalagem(embalagem):
+    """
+    A embalagem vai ser apagada, e os seus consumos com ela: retira-os
+    dos totais diários com uma query agregada por dia, em vez de um
+    UPDATE por cada consumo apagado em cascata.
+    """
+    totais = Consumo.objects.filter(
+        embalagem_id=embalagem.pk,
+    ).annotate(
+        dia=TruncDate('data_hora'),
+    ).values('dia').annotate(
+        total=Sum('quantidade'), numero=Count('id'),
+    ).values_list('dia', 'total', 'numero').order_by()
+
+    for dia, total, numero in totais:
+        aplicar(embalagem.utilizador_id, embalagem.medicamento_id, dia, -total, -numero)
+
+
+def mover_embalagem(embalagem_id, origem, destino):
+    """
+    Uma embalagem mudou de medicamento (ou de dono): os seus consumos
+    passam dos totais de 'origem' para os de 'destino', ambos tuplos
+    (utilizador_id, medicamento_id).
+    """
+    por_dia = {}
+    consumos = Consumo.objects.filter(
+        embalagem_id=embalagem_id
+    ).values_list('data_hora', 'quantidade')
+
+    for data_hora, quantidade in consumos.iterator():
+        dia = timezone.localdate(data_hora)
+        total, numero = por_dia.get(dia, (0, 0))
+        por_dia[dia] = (total + quantidade, numero + 1)
+
+    for dia, (total, numero) in por_dia.items():
+        aplicar(*origem, dia, -total, -numero)
+        aplicar(*destino, dia, total, numero)
+
+
+# ==================== BACKFILL E COMPACTAÇÃO ====================
+
+def reconstruir(desde=None, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Recalcula os totais diários a partir dos consumos existentes.
+
+    Apaga os totais a partir de 'desde' (por defeito, o dia do consumo
+    mais antigo) e volta a somá-los, lendo os consumos por blocos de ids.
+    Os dias anteriores não são tocados: se os consumos antigos já tiverem
+    sido compactados, os seus totais continuam lá.
+
+    Os consumos registados enquanto corre (ids maiores do que o último
+    lido no início) são contados pelos signals, não pelo backfill.
+    Devolve o número de consumos processados.
+    """
+    limites = Consumo.objects.aggregate(primeiro=Min('data_hora'), ultimo_id=Max('id'))
+    if limites['ultimo_id'] is None:
+        return 0
+    desde = desde or timezone.localdate(limites['primeiro'])
+
+    consumos = Consumo.objects.filter(
+        data_hora__gte=inicio_do_dia(desde),
+        id__lte=limites['ultimo_id'],
+    )
+    ConsumoDiario.objects.filter(dia__gte=desde).delete()
+
+    processados = 0
+    ultimo_id = 0
+    while True:
+        ids = list(consumos.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+
+        totais = consumos.filter(
+            id__gte=ids[0], id__lte=ultimo_id,
+        ).annotate(
+            dia=TruncDate('data_hora'),
+        ).values(
+            'embalagem__utilizador_id', 'embalagem__medicamento_id', 'dia',
+        ).annotate(
+            total=Sum('quantidade'), numero=Count('id'),
+        ).values_list(
+            'embalagem__utilizador_id', 'embalagem__medicamento_id', 'dia', 'total', 'numero',
+        ).order_by()
+
+        _somar_em_lote(totais)
+
+        processados += len(ids)
+        if progresso:
+            progresso(processados)
+
+    return processados
+
+
+def _somar_em_lote(totais):
+    """
+    Soma um bloco de totais (utilizador_id, medicamento_id, dia, total,
+    numero) à tabela, numa transacção: as linhas que já existem (de
+    blocos anteriores ou dos signals) são lidas de uma vez e actualizadas
+    com bulk_update; as restantes são criadas com bulk_create.
+    """
+    novos = {
+        (utilizador_id, medicamento_id, dia): (total, numero)
+        for utilizador_id, medicamento_id, dia, total, numero in totais
+    }
+    if not novos:
+        return
+
+    with transaction.atomic(using=particao_actual()):
+        existentes = ConsumoDiario.objects.filter(
+            utilizador_id__in={chave[0] for chave in novos},
+            medicamento_id__in={chave[1] for chave in novos},
+            dia__gte=min(chave[2] for chave in novos),
+            dia__lte=max(chave[2] for chave in novos),
+        )
+
+        alterados = []
+        for linha in existentes:
+            chave = (linha.utilizador_id, linha.medicamento_id, linha.dia)
+            if chave in novos:
+                total, numero = novos.pop(chave)
+                linha.quantidade += total
+                linha.numero_consumos += numero
+                alterados.append(linha)
+
+        ConsumoDiario.objects.bulk_update(alterados, ['quantidade', 'numero_consumos'], batch_size=1000)
+        ConsumoDiario.objects.bulk_create([
+            ConsumoDiario(
+                utilizador_id=utilizador_id, medicamento_id=medicamento_id, dia=dia,
+                quantidade=total, numero_consumos=numero,
+            )
+            for (utilizador_id, medicamento_id, dia), (total, numero) in novos.items()
+        ], batch_size=1000)
+
+
+def compactar(antes_de, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Apaga os consumos anteriores ao dia 'antes_de' (hora local), aos
+    blocos, sem mexer nos totais diários. Devolve o número apagado.
+    """
+    antigos = Consumo.objects.filter(data_hora__lt=inicio_do_dia(antes_de))
+
+    apagados = 0
+    with suspender_actualizacao():
+        while True:
+            ids = list(antigos.order_by('id').values_list('id', flat=True)[:tamanho_lote])
+            if not ids:
+                break
+            Consumo.objects.filter(id__in=ids).delete()
+            apagados += len(ids)
+            if progresso:
+                progresso(apagados)
+
+    return apagados
+
+
+# ==================== LEITURA ====================
+
+def serie_diaria(user, desde, ate, medicamento=None):
+    """
+    Totais diários do utilizador entre 'desde' e 'ate' (inclusive),
+    por medicamento: lista de (medicamento_id, dia, quantidade, numero).
+    """
+    linhas = ConsumoDiario.objects.filter(
+        utilizador=user,
+        dia__gte=desde,
+        dia__lte=ate,
+    )
+    if medicamento is not None:
+        linhas = linhas.filter(medicamento=medicamento)
+
+    return list(linhas.order_by('medicamento_id', 'dia').values_list(
+        'medicamento_id', 'dia', 'quantidade', 'numero_consumos'
+    ))
+
+
+def totais_por_dia(utilizadores_ids, desde, ate):
+    """
+    (medicamento_id, utilizador_id, dia, quantidade) de vários utilizadores,
+    para cálculos em lote (ver previsao.py).
+    """
+    return ConsumoDiario.objects.filter(
+        utilizador_id__in=utilizadores_ids,
+        dia__gte=desde,
+        dia__lte=ate,
+    ).values_list('medicamento_id', 'utilizador_id', 'dia', 'quantidade').order_by()
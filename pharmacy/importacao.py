@@ -0,0 +1,284 @@
+'''
+DomusShelf - Importação em Massa de Medicamentos e Embalagens
+=============================================================
+
+Permite carregar um inventário inteiro de uma vez, a partir de um
+ficheiro CSV ou JSON Lines (um objecto JSON por linha), em vez de criar
+cada medicamento e embalagem num formulário.
+
+Colunas reconhecidas (as de embalagem são opcionais):
+    nome_comercial, principio_activo, forma_farmaceutica, observacoes,
+    quantidade_inicial, quantidade_actual, unidade, data_validade, lote
+
+Como funciona:
+- O ficheiro é lido linha a linha (nunca é carregado todo em memória).
+- Cada linha é validada com as mesmas regras dos formulários
+  (MedicamentoForm e EmbalagemForm).
+- Os medicamentos são identificados por (nome_comercial, principio_activo)
+  através de um dicionário em memória, carregado uma vez no início;
+  os que não existem são criados.
+- As linhas válidas são gravadas com bulk_create, em lotes de tamanho
+  configurável, cada lote na sua transacção (com as entradas no registo
+  de movimentos de stock, os eventos em tempo real das embalagens e a
+  invalidação da cache do utilizador).
+
+Usado pelo comando "manage.py import_stock" e pela view importar_stock.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import csv
+import json
+import time
+
+from django.db import transaction
+
+from .forms import MedicamentoForm, EmbalagemForm
+from .models import Medicamento, Embalagem
+from .movimentos import registar_entradas
+from .particoes import particao_actual
+from .signals import invalidar_utilizador, publicar_embalagens_adicionadas
+
+
+FORMATOS = ('csv', 'jsonl')
+
+# Quantos erros se guardam para mostrar no fim (os restantes só são contados)
+MAXIMO_ERROS_GUARDADOS = 100
+
+
+class EmbalagemImportacaoForm(EmbalagemForm):
+    """
+    As mesmas regras do EmbalagemForm, mas sem o campo 'medicamento':
+    na importação o medicamento é resolvido pelo nome, não por um dropdown.
+    """
+
+    class Meta(EmbalagemForm.Meta):
+        fields = ['quantidade_inicial', 'unidade', 'data_validade', 'lote']
+
+
+class ResultadoImportacao:
+    """Resumo de uma importação: contagens, erros e velocidade."""
+
+    def __init__(self):
+        self.linhas = 0
+        self.medicamentos_criados = 0
+        self.embalagens_criadas = 0
+        self.total_erros = 0
+        self.erros = []
+        self.segundos = 0.0
+
+    @property
+    def linhas_por_segundo(self):
+        if not self.segundos:
+            return 0.0
+        return self.linhas / self.segundos
+
+    def registar_erro(self, numero_linha, mensagem):
+        self.total_erros += 1
+        if len(self.erros) < MAXIMO_ERROS_GUARDADOS:
+            self.erros.append((numero_linha, mensagem))
+
+
+class LinhaInvalida:
+    """Uma linha JSON que não foi possível ler (fica registada como erro)."""
+
+    def __init__(self, mensagem):
+        self.mensagem = mensagem
+
+
+def ler_linhas(ficheiro, formato):
+    """
+    Gera um dicionário por linha do ficheiro (já aberto em modo texto).
+    É um gerador: lê o ficheiro à medida que as linhas são pedidas.
+    Uma linha com JSON inválido dá uma LinhaInvalida, para a importação
+    continuar nas seguintes.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato desconhecido: {formato}')
+
+    if formato == 'csv':
+        yield from csv.DictReader(ficheiro)
+        return
+
+    for texto in ficheiro:
+        texto = texto.strip()
+        if not texto:
+            continue
+        try:
+            yield json.loads(texto)
+        except ValueError as erro:
+            yield LinhaInvalida(f'JSON inválido: {erro}')
+
+
+def _texto(valor):
+    """Normaliza um valor lido do ficheiro (None, números, espaços)."""
+    if valor is None:
+        return ''
+    return str(valor).strip()
+
+
+def _erros_do_form(form):
+    """Junta os erros de um formulário numa só frase."""
+    return '; '.join(
+        f'{campo}: {" ".join(mensagens)}'
+        for campo, mensagens in form.errors.items()
+    )
+
+
+class ImportadorStock:
+    """
+    Importa linhas para o catálogo e stock de um utilizador.
+
+    Uso:
+        importador = ImportadorStock(user, tamanho_lote=1000)
+        resultado = importador.importar(ler_linhas(ficheiro, 'csv'))
+    """
+
+    def __init__(self, user, tamanho_lote=1000, progresso=None):
+        self.user = user
+        self.tamanho_lote = tamanho_lote
+        # Função opcional chamada depois de cada lote (ex: para imprimir progresso)
+        self.progresso = progresso
+
+        # (nome_comercial, principio_activo) normalizados -> id ou Medicamento por gravar
+        self.medicamentos = {}
+        self.novos_medicamentos = []
+        self.novas_embalagens = []
+
+    def chave(self, nome_comercial, principio_activo):
+        return (nome_comercial.casefold(), principio_activo.casefold())
+
+    def carregar_medicamentos(self):
+        """Carrega o catálogo existente do utilizador para o dicionário."""
+        existentes = Medicamento.objects.filter(
+            utilizador=self.user
+        ).values_list('nome_comercial', 'principio_activo', 'id').order_by('-id')
+
+        for nome, principio, pk in existentes.iterator(chunk_size=2000):
+            # order_by('-id'): se houver repetidos, fica o mais antigo
+            self.medicamentos[self.chave(nome, principio)] = pk
+
+    def importar(self, linhas):
+        """Processa todas as linhas e devolve um ResultadoImportacao."""
+        resultado = ResultadoImportacao()
+        inicio = time.perf_counter()
+
+        self.carregar_medicamentos()
+
+        for numero, linha in enumerate(linhas, start=1):
+            resultado.linhas += 1
+            self.processar_linha(numero, linha, resultado)
+
+            if len(self.novas_embalagens) + len(self.novos_medicamentos) >= self.tamanho_lote:
+                self.gravar_lote(resultado)
+                resultado.segundos = time.perf_counter() - inicio
+                if self.progresso:
+                    self.progresso(resultado)
+
+        self.gravar_lote(resultado)
+        resultado.segundos = time.perf_counter() - inicio
+        return resultado
+
+    def processar_linha(self, numero, linha, resultado):
+        """Valida uma linha e junta-a ao lote actual (ou regista o erro)."""
+        if isinstance(linha, LinhaInvalida):
+            resultado.registar_erro(numero, linha.mensagem)
+            return
+        if not isinstance(linha, dict):
+            resultado.registar_erro(numero, 'A linha não é um objecto.')
+            return
+
+        dados = {campo: _texto(valor) for campo, valor in linha.items() if campo}
+        chave = self.chave(dados.get('nome_comercial', ''), dados.get('principio_activo', ''))
+        medicamento = self.medicamentos.get(chave)
+
+        # 1. Validar tudo primeiro: uma linha com erros não cria nada
+        novo_medicamento = None
+        if medicamento is None:
+            form = MedicamentoForm(data=dados)
+            if not form.is_valid():
+                resultado.registar_erro(numero, _erros_do_form(form))
+                return
+            novo_medicamento = form.save(commit=False)
+            novo_medicamento.utilizador = self.user
+
+        embalagem = None
+        # Linha só com dados do medicamento: não há embalagem a criar
+        if dados.get('quantidade_inicial'):
+            embalagem = self.validar_embalagem(numero, dados, resultado)
+            if embalagem is None:
+                return
+
+        # 2. Juntar ao lote actual
+        if novo_medicamento is not None:
+            medicamento = novo_medicamento
+            self.medicamentos[chave] = medicamento
+            self.novos_medicamentos.append(medicamento)
+
+        if embalagem is not None:
+            self.novas_embalagens.append((embalagem, medicamento))
+
+    def validar_embalagem(self, numero, dados, resultado):
+        """
+        Valida os campos de embalagem de uma linha com o EmbalagemForm.
+        Devolve a Embalagem (ainda não gravada) ou None se houver erros.
+        """
+        if not dados.get('unidade'):
+            dados['unidade'] = Embalagem._meta.get_field('unidade').default
+
+        form = EmbalagemImportacaoForm(data=dados)
+        if not form.is_valid():
+            resultado.registar_erro(numero, _erros_do_form(form))
+            return None
+
+        embalagem = form.save(commit=False)
+        embalagem.quantidade_actual = embalagem.quantidade_inicial
+
+        if dados.get('quantidade_actual'):
+            try:
+                actual = int(dados['quantidade_actual'])
+            except ValueError:
+                actual = -1
+            if not 0 <= actual <= embalagem.quantidade_inicial:
+                resultado.registar_erro(
+                    numero,
+                    'quantidade_actual: tem de estar entre 0 e a quantidade inicial.'
+                )
+                return None
+            embalagem.quantidade_actual = actual
+
+        return embalagem
+
+    def gravar_lote(self, resultado):
+        """Grava o lote actual numa transacção, com bulk_create."""
+        if not self.novos_medicamentos and not self.novas_embalagens:
+            return
+
+        bd = particao_actual()
+        with transaction.atomic(using=bd):
+            # Primeiro os medicamentos novos, para obter os seus ids
+            Medicamento.objects.bulk_create(self.novos_medicamentos)
+            for medicamento in self.novos_medicamentos:
+                chave = self.chave(medicamento.nome_comercial, medicamento.principio_activo)
+                self.medicamentos[chave] = medicamento.pk
+
+            # bulk_create não chama Embalagem.save(): preencher o dono à mão
+            embalagens = []
+            for embalagem, medicamento in self.novas_embalagens:
+                embalagem.medicamento_id = getattr(medicamento, 'pk', medicamento)
+                embalagem.utilizador_id = self.user.pk
+                embalagens.append(embalagem)
+            Embalagem.objects.bulk_create(embalagens)
+            # Uma entrada no registo de movimentos por embalagem, no mesmo lote
+            registar_entradas(embalagens, observacoes='Importação.')
+            # E os eventos em tempo real, publicados quando o lote é confirmado
+            publicar_embalagens_adicionadas(embalagens)
+            # bulk_create não dispara signals: invalidar a cache à mão, em
+            # cada lote (se um lote seguinte falhar, os anteriores já estão gravados)
+            invalidar_utilizador(self.user.pk, using=bd)
+
+        resultado.medicamentos_criados += len(self.novos_medicamentos)
+        resultado.embalagens_criadas += len(self.novas_embalagens)
+        self.novos_medicamentos = []
+        self.novas_embalagens = []
@@ -0,0 +1,213 @@
+'''
+DomusShelf - Métricas por Pedido (Queries e Tempos)
+===================================================
+
+Mede, em cada pedido, quantas queries foram feitas, quanto tempo
+demoraram, quais se repetiram (o sinal típico de um problema N+1),
+quanto tempo levou a renderização dos templates e quanto sobrou para o
+código Python das views.
+
+Como funciona:
+- As queries são observadas com os execute_wrappers das ligações, o
+  gancho oficial do Django à volta de cada execução na base de dados.
+  O observador é instalado uma vez em cada ligação (também nas que são
+  abertas depois, noutras threads) e só conta quando há uma medição em
+  curso no contexto da query.
+- Cada query é reduzida a uma "impressão digital": o SQL com os valores
+  (números, textos, listas de IN) trocados por '?'. Duas queries com a
+  mesma impressão digital no mesmo pedido são a mesma consulta repetida.
+- A renderização dos templates é medida envolvendo Template.render
+  (uma vez, quando o middleware é carregado). Só conta o template de
+  topo: os {% include %} já estão dentro do seu tempo.
+
+As métricas do pedido em curso ficam numa ContextVar, por isso também
+funcionam com vários pedidos em paralelo (threads ou async). Numa view
+async, as queries correm noutra thread (sync_to_async), que recebe uma
+cópia do contexto: continuam a ser contadas no pedido certo.
+
+Usado pelo InstrumentacaoMiddleware (middleware.py) e pelos testes de
+orçamento de queries.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+
+
+# Número de queries repetidas listadas no registo de cada pedido
+MAXIMO_REPETIDAS = 5
+
+# Medições em curso, da mais exterior para a mais interior (podem encaixar)
+_metricas = ContextVar('pharmacy_metricas_pedido', default=())
+
+_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LISTA = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+
+def impressao_digital(sql):
+    """
+    SQL sem os valores concretos, para agrupar queries iguais.
+    Ex: 'SELECT ... WHERE id = 7' -> 'SELECT ... WHERE id = ?'
+    """
+    sql = _TEXTO.sub('?', sql)
+    sql = _NUMERO.sub('?', sql.replace('%s', '?'))
+    sql = _LISTA.sub('(...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+class MetricasPedido:
+    """
+    Contadores de um pedido. Todos os tempos em segundos.
+
+    Atributos:
+        queries: número de queries executadas
+        tempo_sql: tempo total nas queries
+        tempo_templates: tempo a renderizar templates (inclui as queries
+            feitas durante a renderização, contadas em tempo_sql_templates)
+        impressoes: Counter impressão digital -> número de execuções
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tempo_total = 0.0
+        self.queries = 0
+        self.tempo_sql = 0.0
+        self.tempo_templates = 0.0
+        self.tempo_sql_templates = 0.0
+        self.impressoes = Counter()
+        self._profundidade_template = 0
+
+    def terminar(self):
+        self.tempo_total = time.perf_counter() - self.inicio
+        return self
+
+    @property
+    def tempo_python(self):
+        """O que sobra: views, middleware, forms (sem SQL nem templates)."""
+        templates_sem_sql = self.tempo_templates - self.tempo_sql_templates
+        return max(0.0, self.tempo_total - self.tempo_sql - templates_sem_sql)
+
+    @property
+    def repetidas(self):
+        """[(impressão digital, vezes)] das queries executadas mais de uma vez."""
+        return [(sql, vezes) for sql, vezes in self.impressoes.most_common() if vezes > 1]
+
+    def observar_query(self, execute, sql, params, many, context):
+        """Função passada a execute_wrapper(): cronometra e conta a query."""
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao = time.perf_counter() - inicio
+            self.queries += 1
+            self.tempo_sql += duracao
+            if self._profundidade_template:
+                self.tempo_sql_templates += duracao
+            self.impressoes[impressao_digital(sql)] += 1
+
+    def como_dict(self):
+        """Representação para o registo em JSON (tempos em milissegundos)."""
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.tempo_sql * 1000, 2),
+            'templates_ms': round(self.tempo_templates * 1000, 2),
+            'python_ms': round(self.tempo_python * 1000, 2),
+            'total_ms': round(self.tempo_total * 1000, 2),
+            'repetidas': [
+                {'sql': sql, 'vezes': vezes}
+                for sql, vezes in self.repetidas[:MAXIMO_REPETIDAS]
+            ],
+        }
+
+    def server_timing(self):
+        """Valor do cabeçalho Server-Timing (visível nas ferramentas do browser)."""
+        return ', '.join([
+            f'sql;dur={self.tempo_sql * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={(self.tempo_templates - self.tempo_sql_templates) * 1000:.1f};desc="Templates"',
+            f'py;dur={self.tempo_python * 1000:.1f};desc="Python"',
+            f'total;dur={self.tempo_total * 1000:.1f}',
+        ])
+
+
+def _observar(execute, sql, params, many, context):
+    """Observador instalado em cada ligação: conta para as medições em curso."""
+    execucao = execute
+    for metricas in _metricas.get():
+        execucao = partial(metricas.observar_query, execucao)
+    return execucao(sql, params, many, context)
+
+
+def _instalar_observador(connection, **kwargs):
+    if _observar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observar)
+
+
+# Ligações abertas a partir de agora, em qualquer thread
+connection_created.connect(_instalar_observador)
+
+
+@contextmanager
+def medir():
+    """
+    Mede tudo o que corre dentro do bloco e devolve as MetricasPedido:
+
+        with medir() as metricas:
+            ...
+        metricas.queries
+    """
+    # Ligações desta thread que já existiam (ainda sem o observador)
+    for alias in connections:
+        _instalar_observador(connections[alias])
+    metricas = MetricasPedido()
+    token = _metricas.set(_metricas.get() + (metricas,))
+    try:
+        yield metricas
+    finally:
+        _metricas.reset(token)
+        metricas.terminar()
+
+
+def metricas_actuais():
+    """As métricas do pedido em curso (None fora de um bloco medir())."""
+    activas = _metricas.get()
+    return activas[-1] if activas else None
+
+
+# ==================== TEMPLATES ====================
+
+_render_original = Template.render
+
+
+def _render_medido(self, context):
+    activas = _metricas.get()
+    if not activas:
+        return _render_original(self, context)
+
+    for metricas in activas:
+        metricas._profundidade_template += 1
+    inicio = time.perf_counter()
+    try:
+        return _render_original(self, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        for metricas in activas:
+            metricas._profundidade_template -= 1
+            if not metricas._profundidade_template:
+                metricas.tempo_templates += duracao
+
+
+def instalar_medicao_templates():
+    """Passa a medir Template.render (pode ser chamada várias vezes)."""
+    Template.render = _render_medido
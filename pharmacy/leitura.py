@@ -0,0 +1,184 @@
+'''
+DomusShelf - Leituras numa Cópia Só de Leitura
+==============================================
+
+As páginas de consulta (dashboard, listagens, alertas, exportações e a
+API) só lêem. Quando existe a base de dados "leitura" em DATABASES,
+essas views passam a ler dela, e as escritas continuam todas na
+'default'. Há duas formas de a configurar (ver settings_producao.py):
+
+- o mesmo ficheiro aberto com mode=ro: em WAL, as leituras vêem sempre
+  o último commit e nunca pedem o lock de escrita;
+- uma cópia do ficheiro, actualizada periodicamente com a API de
+  backup do SQLite (comando "manage.py refresh_read_replica"): os
+  leitores nem partilham ficheiro com quem escreve, mas os dados podem
+  estar atrasados até PHARMACY_LEITURA_ATRASO_MAXIMO segundos.
+
+Quando é usada a cópia:
+- só nas views marcadas com @ler_da_copia, em pedidos GET/HEAD;
+- só se os dados do utilizador não mudaram nos últimos
+  PHARMACY_LEITURA_ATRASO_MAXIMO segundos. O carimbo de versão dos
+  dados (caches.versao_dados) é a hora da última alteração, por isso
+  quem acabou de registar um consumo e volta à lista de stock lê da
+  'default' e vê-o logo, em qualquer dispositivo, sem queries extra.
+  O carimbo está na cache 'default', que por isso tem de ser partilhada
+  por todos os processos (settings_producao.py usa uma em ficheiros);
+- deixa de ser usada a partir da primeira escrita do pedido e dentro
+  de transacções abertas pela view (ler e escrever na mesma ligação).
+
+O encaminhamento é feito pelo LeituraEscritaRouter (routers.py), que
+consulta o estado do pedido em curso guardado numa ContextVar.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import os
+import sqlite3
+import time
+from contextlib import closing
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .caches import aversao_dados, versao_dados
+
+
+ALIAS_LEITURA = 'leitura'
+
+# Estado do pedido em curso ({'escreveu', 'profundidade'}), ou None fora das views marcadas
+_pedido = ContextVar('pharmacy_leitura_pedido', default=None)
+
+
+def copia_configurada():
+    """Existe a base de dados "leitura" em DATABASES?"""
+    return ALIAS_LEITURA in connections.settings
+
+
+def dados_estaveis(utilizador_id):
+    """
+    Os dados do utilizador já estão na cópia? Sim se a última alteração
+    foi há mais de PHARMACY_LEITURA_ATRASO_MAXIMO segundos (com 0, a
+    cópia é o próprio ficheiro e está sempre em dia).
+    """
+    atraso = getattr(settings, 'PHARMACY_LEITURA_ATRASO_MAXIMO', 0)
+    if not atraso:
+        return True
+    return time.time_ns() - versao_dados(utilizador_id) > atraso * 1_000_000_000
+
+
+async def adados_estaveis(utilizador_id):
+    """Versão async de dados_estaveis: o carimbo é lido com cache.aget."""
+    atraso = getattr(settings, 'PHARMACY_LEITURA_ATRASO_MAXIMO', 0)
+    if not atraso:
+        return True
+    return time.time_ns() - await aversao_dados(utilizador_id) > atraso * 1_000_000_000
+
+
+def ler_da_copia(view):
+    """
+    Marca uma view só de leitura: as queries feitas durante a view vão
+    para a cópia, nas condições descritas no cabeçalho. Sem cópia
+    configurada não faz nada (nem consulta o utilizador).
+
+    Deve ficar por baixo do @login_required. As respostas em streaming
+    são geradas depois de a view terminar: a view deve fixar a base de
+    dados do queryset com .using(queryset.db).
+
+    Também serve para views async (views_async.py), que já chegam aqui
+    com request.user lido; o carimbo de versão é lido com a API async da
+    cache, sem bloquear o ciclo de eventos.
+    """
+    def pode_usar_copia(request):
+        return (
+            copia_configurada()
+            and request.method in ('GET', 'HEAD')
+            and request.user.is_authenticated
+        )
+
+    def usar_copia(request):
+        return pode_usar_copia(request) and dados_estaveis(request.user.pk)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper_async(request, *args, **kwargs):
+            if not (pode_usar_copia(request) and await adados_estaveis(request.user.pk)):
+                return await view(request, *args, **kwargs)
+            # As queries correm na thread do sync_to_async, com as suas ligações
+            profundidade = await sync_to_async(_profundidade)()
+            token = _pedido.set({'escreveu': False, 'profundidade': profundidade})
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _pedido.reset(token)
+        return wrapper_async
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not usar_copia(request):
+            return view(request, *args, **kwargs)
+
+        token = _pedido.set({'escreveu': False, 'profundidade': _profundidade()})
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _pedido.reset(token)
+    return wrapper
+
+
+def _profundidade():
+    """
+    Transacções já abertas antes da view (ATOMIC_REQUESTS, testes): não
+    contam, só as abertas pela própria view.
+    """
+    return len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+
+def alias_para_leitura():
+    """A base de dados de onde ler agora (usada pelo router)."""
+    estado = _pedido.get()
+    if estado is None or estado['escreveu']:
+        return DEFAULT_DB_ALIAS
+    if len(connections[DEFAULT_DB_ALIAS].atomic_blocks) > estado['profundidade']:
+        return DEFAULT_DB_ALIAS
+    return ALIAS_LEITURA
+
+
+def registar_escrita():
+    """Chamada pelo router em cada escrita: o resto do pedido lê da 'default'."""
+    estado = _pedido.get()
+    if estado is not None:
+        estado['escreveu'] = True
+
+
+# ==================== CÓPIA COM A API DE BACKUP ====================
+
+def actualizar_copia(destino):
+    """
+    Copia a base de dados 'default' para o ficheiro 'destino' com a API
+    de backup do SQLite e troca-o de uma vez (os leitores com o ficheiro
+    antigo aberto continuam a lê-lo até fecharem a ligação).
+
+    A cópia fica em modo de diário DELETE, para poder ser aberta com
+    mode=ro&immutable=1 (sem locks nem ficheiros -wal/-shm).
+    """
+    origem = connections[DEFAULT_DB_ALIAS]
+    if origem.in_atomic_block:
+        # A cópia ficaria à espera do fim da própria transacção
+        raise RuntimeError('actualizar_copia não pode correr dentro de uma transacção.')
+    origem.ensure_connection()
+    temporario = f'{destino}.tmp'
+    if os.path.exists(temporario):
+        os.remove(temporario)
+
+    with closing(sqlite3.connect(temporario)) as copia:
+        # De uma só vez: em WAL, uma única transacção de leitura que não
+        # bloqueia quem escreve (aos passos, recomeçaria a cada escrita)
+        origem.connection.backup(copia)
+        copia.execute('PRAGMA journal_mode = DELETE')
+
+    os.replace(temporario, destino)
+    return os.path.getsize(destino)
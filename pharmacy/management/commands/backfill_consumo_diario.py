@@ -0,0 +1,61 @@
+'''
+DomusShelf - Backfill dos Totais Diários de Consumo
+===================================================
+
+Comando: python manage.py backfill_consumo_diario [--desde AAAA-MM-DD]
+                                                  [--tamanho-lote N]
+
+Recalcula a tabela ConsumoDiario a partir dos consumos registados, a
+partir do dia --desde (por defeito, o do consumo mais antigo). Os
+consumos são lidos por blocos de ids, cada bloco na sua transacção.
+
+Correr uma vez depois da migração que cria a tabela (a partir daí os
+totais são mantidos pelos signals) ou para corrigir diferenças.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.historico import TAMANHO_LOTE, reconstruir
+from pharmacy.particoes import em_cada_base
+
+
+def _data(texto):
+    """Converte AAAA-MM-DD numa data (usado pelo argparse)."""
+    return date.fromisoformat(texto)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os totais diários de consumo (ConsumoDiario) a partir dos consumos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=_data, help='Primeiro dia a recalcular, AAAA-MM-DD.')
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=TAMANHO_LOTE,
+            help=f'Consumos lidos de cada vez (por defeito {TAMANHO_LOTE}).',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progresso(processados):
+            self.stdout.write(f'  {processados} consumos processados...')
+
+        processados = sum(
+            reconstruir(
+                desde=options['desde'],
+                tamanho_lote=max(1, options['tamanho_lote']),
+                progresso=progresso if options['verbosity'] > 1 else None,
+            )
+            for _ in em_cada_base()
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{processados} consumos somados aos totais diários '
+            f'({time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,146 @@
+'''
+DomusShelf - Benchmark WSGI vs ASGI
+===================================
+
+Comando: python manage.py benchmark_asgi [--concorrencia 8,32,128]
+                                         [--modos wsgi,asgi,asgi_async]
+                                         [--duracao SEGUNDOS]
+                                         [--semente N]
+                                         [--saida resultados.json]
+
+Mede pedidos por segundo e latência (p50 / p95) das páginas de consulta
+com vários clientes em paralelo, servidas por WSGI (threads) e por ASGI
+com as views síncronas e com as async (ver pharmacy/servidores.py), e
+mostra o ganho de cada modo ASGI sobre o WSGI. Usa uma base de dados
+nova num ficheiro temporário (a base de dados da aplicação não é tocada).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import argparse
+import json
+import platform
+import sqlite3
+import sys
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from pharmacy.servidores import MODOS, executar, medir_modo
+
+
+def _inteiros(texto):
+    """Converte '8,32,128' numa lista de inteiros (usado pelo argparse)."""
+    return [int(parte) for parte in texto.split(',') if parte.strip()]
+
+
+def _modos(texto):
+    """Converte 'wsgi,asgi' numa lista de nomes (usado pelo argparse)."""
+    return [parte.strip() for parte in texto.split(',') if parte.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Compara o débito das páginas de consulta servidas por WSGI e por ASGI (views síncronas e async).'
+
+    # Os processos filhos não carregam os URLs antes de tempo
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concorrencia', type=_inteiros, default=[8, 32, 128], help='Números de clientes em paralelo, separados por vírgulas (por defeito 8,32,128).')
+        parser.add_argument('--modos', type=_modos, default=list(MODOS), help=f'Modos a medir (por defeito {",".join(MODOS)}).')
+        parser.add_argument('--duracao', type=float, default=5.0, help='Segundos de medição em cada caso (por defeito 5).')
+        parser.add_argument('--semente', type=int, default=0, help='Semente dos dados sintéticos (por defeito 0).')
+        parser.add_argument('--saida', help='Ficheiro JSON onde gravar os resultados.')
+        # Uso interno: um modo, com a tarefa em JSON no stdin e os resultados no stdout
+        parser.add_argument('--filho', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['filho']:
+            return self.correr_filho()
+
+        if not options['concorrencia'] or min(options['concorrencia']) < 1:
+            raise CommandError('Os números de clientes têm de ser positivos.')
+        desconhecidos = set(options['modos']) - set(MODOS)
+        if desconhecidos or not options['modos']:
+            raise CommandError(f'Modos válidos: {", ".join(MODOS)}.')
+        if options['duracao'] <= 0:
+            raise CommandError('--duracao tem de ser positiva.')
+
+        self.stdout.write(
+            f'{"modo":<11} {"clientes":>8} {"pedidos/s":>10} {"p50 ms":>8} {"p95 ms":>8} {"erros":>6}'
+        )
+
+        def progresso(resultado):
+            self.stdout.write(
+                f'{resultado["modo"]:<11} {resultado["concorrencia"]:>8} {resultado["pedidos_s"]:>10.1f} '
+                f'{resultado["p50_ms"] or 0:>8.1f} {resultado["p95_ms"] or 0:>8.1f} {resultado["erros"]:>6}'
+            )
+
+        setup_test_environment(debug=False)
+        try:
+            resultados = executar(
+                options['concorrencia'],
+                modos=options['modos'],
+                duracao=options['duracao'],
+                semente=options['semente'],
+                progresso=progresso,
+            )
+        except RuntimeError as erro:
+            raise CommandError(str(erro))
+        finally:
+            teardown_test_environment()
+
+        self.mostrar_ganho(resultados)
+
+        if options['saida']:
+            documento = {
+                'data': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'parametros': {
+                    campo: options[campo]
+                    for campo in ('concorrencia', 'modos', 'duracao', 'semente')
+                },
+                'resultados': resultados,
+            }
+            with open(options['saida'], 'w', encoding='utf-8') as ficheiro:
+                json.dump(documento, ficheiro, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {options["saida"]}.'))
+
+    def correr_filho(self):
+        """Mede um modo (chamado por servidores.executar, num processo à parte)."""
+        tarefa = json.load(sys.stdin)
+        # ALLOWED_HOSTS com "testserver" e DEBUG desligado, como no processo pai
+        setup_test_environment(debug=False)
+        try:
+            resultados = medir_modo(
+                tarefa['modo'], tarefa['configuracao'], tarefa['sessoes'],
+                tarefa['concorrencias'], tarefa['duracao'],
+            )
+        finally:
+            teardown_test_environment()
+        self.stdout.write(json.dumps(resultados))
+
+    def mostrar_ganho(self, resultados):
+        """Ganho de débito de cada modo ASGI sobre o WSGI, por número de clientes."""
+        wsgi = {r['concorrencia']: r for r in resultados if r['modo'] == 'wsgi'}
+        linhas = [r for r in resultados if r['modo'] != 'wsgi' and r['concorrencia'] in wsgi]
+        if not linhas:
+            return
+
+        def ganho(antes, agora):
+            return f'{(agora - antes) / antes * 100:+.0f}%' if antes else 'n/d'
+
+        self.stdout.write('')
+        self.stdout.write(f'{"ganho sobre wsgi":<17} {"clientes":>8} {"pedidos/s":>10} {"p95":>8}')
+        for resultado in linhas:
+            base = wsgi[resultado['concorrencia']]
+            self.stdout.write(
+                f'{resultado["modo"]:<17} {resultado["concorrencia"]:>8} '
+                f'{ganho(base["pedidos_s"], resultado["pedidos_s"]):>10} '
+                f'{ganho(base["p95_ms"] or 0, resultado["p95_ms"] or 0):>8}'
+            )
@@ -0,0 +1,127 @@
+'''
+DomusShelf - Benchmark de Concorrência
+======================================
+
+Comando: python manage.py benchmark_concurrency [--trabalhadores 8,16,32]
+                                                [--perfis simples,producao]
+                                                [--duracao SEGUNDOS]
+                                                [--escritas PROPORCAO]
+                                                [--semente N]
+                                                [--saida resultados.json]
+
+Mede leituras e escritas por segundo com vários pedidos em paralelo
+(threads), em cada perfil de base de dados (ver pharmacy/concorrencia.py),
+e mostra o ganho dos perfis de produção sobre o simples. Cada perfil
+usa uma base de dados nova num ficheiro temporário (a base de dados da
+aplicação não é tocada).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import json
+import platform
+import sqlite3
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from pharmacy.concorrencia import PERFIS, executar
+
+
+def _inteiros(texto):
+    """Converte '8,16,32' numa lista de inteiros (usado pelo argparse)."""
+    return [int(parte) for parte in texto.split(',') if parte.strip()]
+
+
+def _perfis(texto):
+    """Converte 'simples,producao' numa lista de nomes (usado pelo argparse)."""
+    return [parte.strip() for parte in texto.split(',') if parte.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Compara o débito de leituras e escritas concorrentes nos perfis de base de dados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trabalhadores', type=_inteiros, default=[8, 16, 32], help='Números de pedidos em paralelo, separados por vírgulas (por defeito 8,16,32).')
+        parser.add_argument('--perfis', type=_perfis, default=list(PERFIS), help=f'Perfis a medir (por defeito {",".join(PERFIS)}).')
+        parser.add_argument('--duracao', type=float, default=5.0, help='Segundos de medição em cada caso (por defeito 5).')
+        parser.add_argument('--escritas', type=float, default=0.3, help='Proporção de pedidos de escrita, entre 0 e 1 (por defeito 0.3).')
+        parser.add_argument('--semente', type=int, default=0, help='Semente dos dados sintéticos (por defeito 0).')
+        parser.add_argument('--saida', help='Ficheiro JSON onde gravar os resultados.')
+
+    def handle(self, *args, **options):
+        if not options['trabalhadores'] or min(options['trabalhadores']) < 1:
+            raise CommandError('Os números de trabalhadores têm de ser positivos.')
+        desconhecidos = set(options['perfis']) - set(PERFIS)
+        if desconhecidos or not options['perfis']:
+            raise CommandError(f'Perfis válidos: {", ".join(PERFIS)}.')
+        if options['duracao'] <= 0:
+            raise CommandError('--duracao tem de ser positiva.')
+        if not 0 <= options['escritas'] <= 1:
+            raise CommandError('--escritas tem de estar entre 0 e 1.')
+
+        self.stdout.write(
+            f'{"perfil":<17} {"threads":>7} {"escritas/s":>11} {"leituras/s":>11} '
+            f'{"p95 esc. ms":>12} {"p95 leit. ms":>13} {"erros":>6}'
+        )
+
+        def progresso(resultado):
+            self.stdout.write(
+                f'{resultado["perfil"]:<17} {resultado["trabalhadores"]:>7} {resultado["escritas_s"]:>11.1f} '
+                f'{resultado["leituras_s"]:>11.1f} {resultado["escrita_p95_ms"] or 0:>12.1f} '
+                f'{resultado["leitura_p95_ms"] or 0:>13.1f} {resultado["erros"]:>6}'
+            )
+
+        setup_test_environment(debug=False)
+        try:
+            resultados = executar(
+                options['trabalhadores'],
+                perfis=options['perfis'],
+                duracao=options['duracao'],
+                proporcao_escrita=options['escritas'],
+                semente=options['semente'],
+                progresso=progresso,
+            )
+        finally:
+            teardown_test_environment()
+
+        self.mostrar_ganho(resultados)
+
+        if options['saida']:
+            documento = {
+                'data': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'parametros': {
+                    campo: options[campo]
+                    for campo in ('trabalhadores', 'perfis', 'duracao', 'escritas', 'semente')
+                },
+                'resultados': resultados,
+            }
+            with open(options['saida'], 'w', encoding='utf-8') as ficheiro:
+                json.dump(documento, ficheiro, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {options["saida"]}.'))
+
+    def mostrar_ganho(self, resultados):
+        """Ganho de débito de cada perfil sobre o simples, por número de threads."""
+        simples = {r['trabalhadores']: r for r in resultados if r['perfil'] == 'simples'}
+        linhas = [r for r in resultados if r['perfil'] != 'simples' and r['trabalhadores'] in simples]
+        if not linhas:
+            return
+
+        def ganho(antes, agora):
+            return f'{(agora - antes) / antes * 100:+.0f}%' if antes else 'n/d'
+
+        self.stdout.write('')
+        self.stdout.write(f'{"ganho sobre simples":<17} {"threads":>7} {"escritas/s":>11} {"leituras/s":>11}')
+        for resultado in linhas:
+            base = simples[resultado['trabalhadores']]
+            self.stdout.write(
+                f'{resultado["perfil"]:<17} {resultado["trabalhadores"]:>7} '
+                f'{ganho(base["escritas_s"], resultado["escritas_s"]):>11} '
+                f'{ganho(base["leituras_s"], resultado["leituras_s"]):>11}'
+            )
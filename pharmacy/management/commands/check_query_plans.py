@@ -0,0 +1,139 @@
+'''
+DomusShelf - Verificação dos Planos de Execução
+===============================================
+
+Comando: python manage.py check_query_plans [--utilizador USERNAME]
+
+Executa as views de leitura da aplicação (com um RequestFactory, sem
+passar pelo servidor), captura as queries SELECT que cada uma faz e corre
+EXPLAIN QUERY PLAN sobre cada uma. Se algum plano fizer uma leitura
+completa de uma tabela (SCAN sem índice), o comando termina com erro.
+
+Útil para correr no CI depois de mexer em views, filtros ou índices.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import re
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from pharmacy import views
+from pharmacy.caches import invalidar_alertas
+from pharmacy.models import Medicamento, Embalagem
+
+
+# Uma linha do plano como "SCAN pharmacy_embalagem" (ou "SCAN TABLE ..."
+# em versões antigas do SQLite) sem "USING ... INDEX" é uma leitura completa
+SCAN_COMPLETO = re.compile(r'^SCAN (?:TABLE )?(?P<tabela>\w+)(?P<resto>.*)$')
+
+
+class Command(BaseCommand):
+    help = 'Corre EXPLAIN QUERY PLAN sobre as queries das views e falha se houver table scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--utilizador',
+            help='Username usado para executar as views (por defeito, o primeiro utilizador).',
+        )
+        parser.add_argument(
+            '--ignorar',
+            action='append',
+            default=[],
+            metavar='TABELA',
+            help='Tabela em que um scan completo é aceitável (pode repetir-se).',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Este comando só suporta SQLite (EXPLAIN QUERY PLAN).')
+
+        user = self.obter_utilizador(options['utilizador'])
+        problemas = []
+
+        for nome, view, kwargs in self.views_a_verificar(user):
+            # Garantir que o sino faz a sua query (e não lê da cache)
+            invalidar_alertas(user.pk)
+
+            request = RequestFactory().get('/')
+            request.user = user
+
+            with CaptureQueriesContext(connection) as queries:
+                view(request, **kwargs)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{nome} ({len(queries)} queries)'))
+
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+
+                for detalhe in self.plano(sql):
+                    scan = SCAN_COMPLETO.match(detalhe)
+                    completo = (
+                        scan is not None
+                        and 'USING' not in scan.group('resto')
+                        and scan.group('tabela') not in options['ignorar']
+                        and scan.group('tabela') != 'CONSTANT'
+                    )
+                    if completo:
+                        problemas.append((nome, detalhe, sql))
+                        self.stdout.write(self.style.ERROR(f'  {detalhe}'))
+                    else:
+                        self.stdout.write(f'  {detalhe}')
+
+        if problemas:
+            for nome, detalhe, sql in problemas:
+                self.stderr.write(f'[{nome}] {detalhe}\n    {sql}')
+            raise CommandError(f'{len(problemas)} leitura(s) completa(s) de tabela encontrada(s).')
+
+        self.stdout.write(self.style.SUCCESS('Nenhuma leitura completa de tabela encontrada.'))
+
+    def obter_utilizador(self, username):
+        """
+        Devolve o utilizador com que as views são executadas.
+        Sem utilizadores na BD, usa um utilizador fictício (pk=0): os planos
+        de execução não dependem de existirem dados.
+        """
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Utilizador "{username}" não existe.')
+
+        return User.objects.order_by('pk').first() or User(pk=0, username='explain')
+
+    def views_a_verificar(self, user):
+        """
+        Lista de (nome, view, kwargs) a verificar.
+        As views de edição só entram se o utilizador tiver dados.
+        """
+        lista = [
+            ('dashboard', views.dashboard, {}),
+            ('medicamento_lista', views.medicamento_lista, {}),
+            ('embalagem_lista', views.embalagem_lista, {}),
+            ('alertas_lista', views.alertas_lista, {}),
+            ('embalagem_criar', views.embalagem_criar, {}),
+            ('consumo_criar', views.consumo_criar, {}),
+        ]
+
+        medicamento = Medicamento.objects.filter(utilizador=user).first()
+        if medicamento:
+            lista.append(('medicamento_editar', views.medicamento_editar, {'pk': medicamento.pk}))
+
+        embalagem = Embalagem.objects.filter(utilizador=user).first()
+        if embalagem:
+            lista.append(('embalagem_editar', views.embalagem_editar, {'pk': embalagem.pk}))
+
+        return lista
+
+    def plano(self, sql):
+        """Devolve as linhas de detalhe do EXPLAIN QUERY PLAN de uma query."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [linha[-1] for linha in cursor.fetchall()]
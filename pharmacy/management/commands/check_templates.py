@@ -0,0 +1,73 @@
+'''
+DomusShelf - Verificar os Templates
+===================================
+
+Comando: python manage.py check_templates [--repeticoes N]
+
+Compila e renderiza todos os templates do projecto e da aplicação
+pharmacy com contextos de exemplo (ver pharmacy/aquecimento.py), para
+apanhar erros de sintaxe, tags desconhecidas ou URLs que já não existem
+antes de um deploy. Para cada template mostra o tempo de compilação
+(sem a cache do loader), a mediana do tempo de renderização e o tamanho
+do HTML. Termina com erro se algum template falhar.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Template
+from django.template.loader import render_to_string
+
+from pharmacy.aquecimento import exemplos, motor, nomes_dos_templates, pedido_de_exemplo
+
+
+class Command(BaseCommand):
+    help = 'Compila e renderiza todos os templates com dados de exemplo e mostra os tempos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help='Renderizações de cada template (por defeito 5).')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes tem de ser positivo.')
+
+        user, contextos = exemplos()
+        request = pedido_de_exemplo(user)
+        falhas = []
+
+        self.stdout.write(f'{"template":<46} {"compilar ms":>12} {"render ms":>10} {"KB":>7}')
+        for nome in nomes_dos_templates():
+            try:
+                compilar, renderizar, html = self.medir(nome, contextos.get(nome, {}), request, options['repeticoes'])
+            except Exception as erro:
+                falhas.append(nome)
+                self.stdout.write(self.style.ERROR(f'{nome:<46} {type(erro).__name__}: {erro}'))
+                continue
+            aviso = '' if nome in contextos else '  (sem contexto de exemplo)'
+            self.stdout.write(
+                f'{nome:<46} {compilar:>12.2f} {renderizar:>10.2f} {len(html.encode()) / 1024:>7.1f}{aviso}'
+            )
+
+        if falhas:
+            raise CommandError(f'{len(falhas)} template(s) com erros: {", ".join(falhas)}.')
+        self.stdout.write(self.style.SUCCESS('Todos os templates foram renderizados sem erros.'))
+
+    def medir(self, nome, contexto, request, repeticoes):
+        """(ms a compilar, mediana dos ms a renderizar, HTML) de um template."""
+        engine = motor()
+        _, origem = engine.find_template(nome)
+        fonte = origem.loader.get_contents(origem)
+        inicio = time.perf_counter()
+        Template(fonte, origem, nome, engine)
+        compilar = (time.perf_counter() - inicio) * 1000
+
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            html = render_to_string(nome, contexto, request)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return compilar, statistics.median(tempos), html
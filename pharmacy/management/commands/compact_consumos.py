@@ -0,0 +1,81 @@
+'''
+DomusShelf - Compactação do Histórico de Consumos
+=================================================
+
+Comando: python manage.py compact_consumos [--dias N] [--tamanho-lote N]
+
+Apaga os consumos individuais com mais de N dias (por defeito, o valor
+de PHARMACY_RETENCAO_CONSUMOS_DIAS em settings.py). Os totais diários
+(ConsumoDiario) desses dias ficam, por isso os gráficos, relatórios e
+previsões continuam iguais; perde-se só o detalhe de cada toma (hora,
+embalagem e observações).
+
+Antes de apagar, confirma que os totais diários do período batem certo
+com os consumos; se não baterem (por exemplo, se o backfill nunca foi
+corrido), não apaga nada.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from pharmacy.historico import TAMANHO_LOTE, compactar, inicio_do_dia
+from pharmacy.models import Consumo, ConsumoDiario
+from pharmacy.particoes import em_cada_base
+
+
+class Command(BaseCommand):
+    help = 'Apaga os consumos mais antigos do que o período de retenção (os totais diários ficam).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, help='Dias de retenção (por defeito, PHARMACY_RETENCAO_CONSUMOS_DIAS).')
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=TAMANHO_LOTE,
+            help=f'Consumos apagados de cada vez (por defeito {TAMANHO_LOTE}).',
+        )
+
+    def handle(self, *args, **options):
+        dias = options['dias']
+        if dias is None:
+            dias = getattr(settings, 'PHARMACY_RETENCAO_CONSUMOS_DIAS', None)
+        if dias is None:
+            raise CommandError('Sem período de retenção: use --dias ou PHARMACY_RETENCAO_CONSUMOS_DIAS.')
+        if dias < 1:
+            raise CommandError('A retenção tem de ser de pelo menos 1 dia.')
+
+        antes_de = timezone.localdate() - timedelta(days=dias)
+        apagados = 0
+        for _ in em_cada_base():
+            self.verificar_totais(antes_de)
+            apagados += compactar(antes_de, tamanho_lote=max(1, options['tamanho_lote']))
+        self.stdout.write(self.style.SUCCESS(
+            f'{apagados} consumos anteriores a {antes_de} apagados.'
+        ))
+
+    def verificar_totais(self, antes_de):
+        """Os totais diários do período a apagar têm de bater com os consumos."""
+        primeiro = Consumo.objects.aggregate(primeiro=Min('data_hora'))['primeiro']
+        if primeiro is None:
+            return
+        desde = timezone.localdate(primeiro)
+        if desde >= antes_de:
+            return
+
+        antigos = Consumo.objects.filter(data_hora__lt=inicio_do_dia(antes_de))
+        total_consumos = antigos.aggregate(total=Sum('quantidade'))['total'] or 0
+        total_diario = ConsumoDiario.objects.filter(
+            dia__gte=desde, dia__lt=antes_de,
+        ).aggregate(total=Sum('quantidade'))['total'] or 0
+
+        if total_consumos != total_diario:
+            raise CommandError(
+                f'Os totais diários ({total_diario}) não batem com os consumos '
+                f'({total_consumos}) antes de {antes_de}. Corra primeiro '
+                f'"manage.py backfill_consumo_diario".'
+            )
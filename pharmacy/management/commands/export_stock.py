@@ -0,0 +1,78 @@
+'''
+DomusShelf - Exportação de Stock e Consumos
+===========================================
+
+Comando: python manage.py export_stock TIPO [--formato csv|jsonl]
+                                       [--utilizador USERNAME]
+                                       [--desde AAAA-MM-DD] [--ate AAAA-MM-DD]
+                                       [--medicamento ID] [--saida FICHEIRO]
+
+TIPO é "medicamentos", "embalagens" ou "consumos". Sem --utilizador
+exporta os dados de todos os utilizadores (útil para auditorias).
+Sem --saida escreve para o stdout.
+
+As linhas são lidas aos blocos e escritas à medida que chegam (ver
+pharmacy/exportacao.py), por isso o consumo de memória não cresce com
+o tamanho do histórico.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.exportacao import EXPORTACOES, FORMATOS, gerar_linhas, obter_queryset
+from pharmacy.particoes import bases_dos_dados, particao_do_utilizador, usar_particao
+
+
+def _data(texto):
+    """Converte AAAA-MM-DD numa data (usado pelo argparse)."""
+    return date.fromisoformat(texto)
+
+
+class Command(BaseCommand):
+    help = 'Exporta medicamentos, embalagens ou consumos em CSV ou JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(EXPORTACOES))
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--utilizador', help='Exportar apenas os dados deste utilizador.')
+        parser.add_argument('--desde', type=_data, help='Data inicial (inclusive), AAAA-MM-DD.')
+        parser.add_argument('--ate', type=_data, help='Data final (inclusive), AAAA-MM-DD.')
+        parser.add_argument('--medicamento', type=int, help='Id do medicamento.')
+        parser.add_argument('--saida', help='Ficheiro de saída (por defeito, o stdout).')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['utilizador']:
+            try:
+                user = User.objects.get(username=options['utilizador'])
+            except User.DoesNotExist:
+                raise CommandError(f'Utilizador "{options["utilizador"]}" não existe.')
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as ficheiro:
+                ficheiro.writelines(self.linhas(user, options))
+        else:
+            for linha in self.linhas(user, options):
+                self.stdout.write(linha, ending='')
+
+    def linhas(self, user, options):
+        """As linhas de todas as bases de dados com dados (a do utilizador, se indicado)."""
+        bases = [particao_do_utilizador(user.pk)] if user else bases_dos_dados()
+        for posicao, alias in enumerate(bases):
+            with usar_particao(alias):
+                queryset = obter_queryset(
+                    options['tipo'],
+                    user=user,
+                    desde=options['desde'],
+                    ate=options['ate'],
+                    medicamento=options['medicamento'],
+                )
+                linhas = gerar_linhas(options['tipo'], options['formato'], queryset)
+                if posicao and options['formato'] == 'csv':
+                    next(linhas)  # o cabeçalho só uma vez
+                yield from linhas
@@ -0,0 +1,92 @@
+'''
+DomusShelf - Previsão de Fim de Stock
+=====================================
+
+Comando: python manage.py forecast_depletion [--utilizador USERNAME]
+                                             [--data AAAA-MM-DD] [--dias N]
+                                             [--tamanho-lote N] [--saida FICHEIRO]
+
+Calcula, para todos os utilizadores (ou só um), quando acaba o stock de
+cada medicamento e que embalagens vão expirar antes de serem gastas
+(ver pharmacy/previsao.py). Escreve uma linha JSON por medicamento.
+Com --dias N só escreve os que acabam nos próximos N dias ou têm
+embalagens em risco.
+
+Os utilizadores são processados em lotes: cada lote são duas queries
+e um cálculo em NumPy, por isso pode correr todas as noites no cron.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import json
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from pharmacy.particoes import agrupar_por_particao, usar_particao
+from pharmacy.previsao import TAMANHO_LOTE, prever
+
+
+def _data(texto):
+    """Converte AAAA-MM-DD numa data (usado pelo argparse)."""
+    return date.fromisoformat(texto)
+
+
+class Command(BaseCommand):
+    help = 'Prevê quando acaba o stock de cada medicamento, a partir do histórico de consumos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilizador', help='Calcular apenas para este utilizador.')
+        parser.add_argument('--data', type=_data, help='Dia de referência (por defeito, hoje).')
+        parser.add_argument('--dias', type=int, help='Só medicamentos que acabam nestes dias ou com embalagens em risco.')
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=TAMANHO_LOTE,
+            help=f'Utilizadores calculados de cada vez (por defeito {TAMANHO_LOTE}).',
+        )
+        parser.add_argument('--saida', help='Ficheiro JSON Lines de saída (por defeito, o stdout).')
+
+    def handle(self, *args, **options):
+        hoje = options['data'] or timezone.localdate()
+        tamanho = max(1, options['tamanho_lote'])
+
+        utilizadores = User.objects.order_by('id')
+        if options['utilizador']:
+            utilizadores = utilizadores.filter(username=options['utilizador'])
+            if not utilizadores.exists():
+                raise CommandError(f'Utilizador "{options["utilizador"]}" não existe.')
+        ids = list(utilizadores.values_list('id', flat=True))
+
+        limite = hoje + timedelta(days=options['dias']) if options['dias'] is not None else None
+        saida = open(options['saida'], 'w', encoding='utf-8') if options['saida'] else self.stdout
+        inicio = time.perf_counter()
+        medicamentos = escritos = 0
+
+        try:
+            for alias, grupo in agrupar_por_particao(ids).items():
+                for posicao in range(0, len(grupo), tamanho):
+                    with usar_particao(alias):
+                        previsoes = prever(grupo[posicao:posicao + tamanho], hoje=hoje)
+                    medicamentos += len(previsoes)
+
+                    for previsao in previsoes.values():
+                        if limite is not None and not previsao.embalagens_em_risco and (
+                            previsao.data_fim is None or previsao.data_fim > limite
+                        ):
+                            continue
+                        dados = {'utilizador_id': previsao.utilizador_id, **previsao.como_dict()}
+                        saida.write(json.dumps(dados, cls=DjangoJSONEncoder) + '\n')
+                        escritos += 1
+        finally:
+            if options['saida']:
+                saida.close()
+
+        # O resumo vai para o stderr, para não se misturar com o JSON no stdout
+        self.stderr.write(self.style.SUCCESS(
+            f'{hoje}: {len(ids)} utilizadores, {medicamentos} medicamentos, '
+            f'{escritos} linhas escritas ({time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,91 @@
+'''
+DomusShelf - Importação de Stock
+================================
+
+Comando: python manage.py import_stock FICHEIRO --utilizador USERNAME
+                                       [--formato csv|jsonl] [--lote 1000]
+
+Importa medicamentos e embalagens a partir de um ficheiro CSV ou JSON
+Lines (use "-" para ler do stdin). Ver pharmacy/importacao.py para as
+colunas aceites e para os detalhes da validação.
+
+No fim mostra quantas linhas foram processadas e a velocidade (linhas/s).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.importacao import FORMATOS, ImportadorStock, ler_linhas
+from pharmacy.particoes import particao_do_utilizador, usar_particao
+
+
+class Command(BaseCommand):
+    help = 'Importa medicamentos e embalagens de um ficheiro CSV ou JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ficheiro', help='Caminho do ficheiro, ou "-" para o stdin.')
+        parser.add_argument('--utilizador', required=True, help='Username do dono do stock.')
+        parser.add_argument(
+            '--formato',
+            choices=FORMATOS,
+            help='Formato do ficheiro (por defeito, deduzido da extensão).',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Número de linhas gravadas por transacção (por defeito 1000).',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['utilizador'])
+        except User.DoesNotExist:
+            raise CommandError(f'Utilizador "{options["utilizador"]}" não existe.')
+
+        if options['lote'] < 1:
+            raise CommandError('O tamanho do lote tem de ser pelo menos 1.')
+
+        caminho = options['ficheiro']
+        formato = options['formato'] or ('jsonl' if caminho.endswith(('.jsonl', '.json')) else 'csv')
+
+        importador = ImportadorStock(
+            user,
+            tamanho_lote=options['lote'],
+            progresso=self.mostrar_progresso if options['verbosity'] >= 2 else None,
+        )
+
+        with usar_particao(particao_do_utilizador(user.pk)):
+            if caminho == '-':
+                resultado = importador.importar(ler_linhas(sys.stdin, formato))
+            else:
+                try:
+                    with open(caminho, encoding='utf-8-sig', newline='') as ficheiro:
+                        resultado = importador.importar(ler_linhas(ficheiro, formato))
+                except OSError as erro:
+                    raise CommandError(f'Não foi possível ler o ficheiro: {erro}')
+                except ValueError as erro:
+                    raise CommandError(f'Ficheiro inválido: {erro}')
+
+        for numero, mensagem in resultado.erros:
+            self.stderr.write(f'Linha {numero}: {mensagem}')
+        if resultado.total_erros > len(resultado.erros):
+            self.stderr.write(f'... e mais {resultado.total_erros - len(resultado.erros)} erro(s).')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.linhas} linhas em {resultado.segundos:.1f}s '
+            f'({resultado.linhas_por_segundo:.0f} linhas/s): '
+            f'{resultado.medicamentos_criados} medicamentos e '
+            f'{resultado.embalagens_criadas} embalagens criados, '
+            f'{resultado.total_erros} linha(s) com erros.'
+        ))
+
+    def mostrar_progresso(self, resultado):
+        self.stdout.write(
+            f'  {resultado.linhas} linhas ({resultado.linhas_por_segundo:.0f} linhas/s)'
+        )
@@ -0,0 +1,90 @@
+'''
+DomusShelf - Rebalancear as Partições
+=====================================
+
+Comando: python manage.py rebalance_partitions [--utilizador nome] [--simular] [--juntar]
+
+Move os dados de cada utilizador para a partição onde devem estar
+(hashing de rendez-vous, ver pharmacy/particoes.py): os utilizadores
+que ainda estão na 'default' quando o modo de partições é ligado, e os
+que mudam de destino quando se acrescenta uma partição. Pode ser
+interrompido e repetido.
+
+--juntar faz o contrário: traz todos os utilizadores de volta para a
+'default' (antes de desligar o modo de partições).
+
+Durante a mudança de cada utilizador, as escritas na base de dados de
+origem esperam por ela (ou falham, passado o busy_timeout): correr com
+pouco movimento (ex: de madrugada). Cada mudança confirma que a cópia
+tem as mesmas linhas antes de apagar a origem.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from pharmacy.models import ParticaoUtilizador
+from pharmacy.particoes import (
+    MudancaIncompleta, bases_dos_dados, mover_utilizador, particoes, particoes_activas, planear,
+    preparar_sequencias,
+)
+
+
+class Command(BaseCommand):
+    help = 'Move os dados dos utilizadores para as suas partições (PHARMACY_PARTICOES).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilizador', help='Mover apenas este utilizador.')
+        parser.add_argument('--simular', action='store_true', help='Mostrar o plano sem mover nada.')
+        parser.add_argument('--juntar', action='store_true', help="Trazer todos os utilizadores para a 'default'.")
+
+    def handle(self, *args, **options):
+        if not particoes_activas():
+            raise CommandError('Sem partições: defina PHARMACY_PARTICOES.')
+
+        for alias in particoes():
+            preparar_sequencias(alias)
+
+        plano = planear((lambda utilizador_id: DEFAULT_DB_ALIAS) if options['juntar'] else None)
+        if options['utilizador']:
+            try:
+                user = User.objects.get(username=options['utilizador'])
+            except User.DoesNotExist:
+                raise CommandError(f'Utilizador "{options["utilizador"]}" não existe.')
+            plano = [mudanca for mudanca in plano if mudanca[0] == user.pk]
+
+        self.stdout.write(f'{len(plano)} utilizadores a mover.')
+        for (origem, destino), quantos in sorted(Counter((o, d) for _, o, d in plano).items()):
+            self.stdout.write(f'  {origem} -> {destino}: {quantos}')
+
+        if not options['simular']:
+            inicio = time.perf_counter()
+            linhas = 0
+            for posicao, (utilizador_id, origem, destino) in enumerate(plano, start=1):
+                try:
+                    linhas += mover_utilizador(utilizador_id, destino)
+                except MudancaIncompleta as erro:
+                    raise CommandError(f'{erro} Nada foi apagado; {posicao - 1} utilizadores já movidos.')
+                if options['verbosity'] > 1 or posicao == len(plano):
+                    self.stdout.write(f'  {posicao}/{len(plano)} utilizadores, {linhas} linhas copiadas')
+            self.stdout.write(self.style.SUCCESS(
+                f'{len(plano)} utilizadores movidos ({time.perf_counter() - inicio:.1f}s).'
+            ))
+
+        self.mostrar_distribuicao()
+
+    def mostrar_distribuicao(self):
+        """Utilizadores e tamanho do ficheiro de cada base de dados."""
+        por_base = Counter(ParticaoUtilizador.objects.values_list('base_de_dados', flat=True))
+        por_base[DEFAULT_DB_ALIAS] = User.objects.count() - sum(por_base.values())
+        for alias in bases_dos_dados():
+            nome = str(connections[alias].settings_dict['NAME'])
+            tamanho = os.path.getsize(nome) / 1024 / 1024 if os.path.exists(nome) else 0
+            self.stdout.write(f'  {alias:<15} {por_base[alias]:>8} utilizadores  {tamanho:>8.1f} MB')
@@ -0,0 +1,72 @@
+'''
+DomusShelf - Actualização do Resumo de Alertas
+==============================================
+
+Comando: python manage.py refresh_expiry_state [--todos] [--data AAAA-MM-DD]
+                                               [--tamanho-lote N]
+
+Recalcula os resumos de alertas (AlertSnapshot) que mudaram: os marcados
+como desactualizados pelos signals, os que têm embalagens a mudar de
+grupo hoje e os dos utilizadores com stock que ainda não têm resumo.
+Nos restantes apenas avança a data de referência (um único UPDATE).
+Com --todos recalcula todos.
+
+Deve correr logo a seguir à meia-noite (hora local), por exemplo no cron:
+
+    5 0 * * *  cd /caminho/do/projecto && python manage.py refresh_expiry_state
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pharmacy.alertas import (
+    TAMANHO_LOTE, avancar_data_referencia, calcular_snapshots, utilizadores_a_recalcular,
+)
+from pharmacy.caches import invalidar_alertas
+from pharmacy.particoes import em_cada_base
+
+
+def _data(texto):
+    """Converte AAAA-MM-DD numa data (usado pelo argparse)."""
+    return date.fromisoformat(texto)
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os resumos de alertas (expiradas / a expirar) que mudaram.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', action='store_true', help='Recalcular todos os resumos.')
+        parser.add_argument('--data', type=_data, help='Dia de referência (por defeito, hoje).')
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=TAMANHO_LOTE,
+            help=f'Utilizadores recalculados de cada vez (por defeito {TAMANHO_LOTE}).',
+        )
+
+    def handle(self, *args, **options):
+        hoje = options['data'] or timezone.localdate()
+        tamanho = max(1, options['tamanho_lote'])
+        inicio = time.perf_counter()
+
+        recalculados = avancados = 0
+        # Cada partição (ou só a 'default') com os seus utilizadores
+        for _ in em_cada_base():
+            ids = utilizadores_a_recalcular(hoje, todos=options['todos'])
+            for posicao in range(0, len(ids), tamanho):
+                lote = ids[posicao:posicao + tamanho]
+                calcular_snapshots(lote, hoje=hoje)
+                # O sino guarda em cache os números do resumo
+                for utilizador_id in lote:
+                    invalidar_alertas(utilizador_id)
+            recalculados += len(ids)
+            avancados += avancar_data_referencia(hoje)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{hoje}: {recalculados} resumos recalculados, {avancados} apenas avançados '
+            f'({time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,41 @@
+'''
+DomusShelf - Actualizar a Cópia Só de Leitura
+=============================================
+
+Comando: python manage.py refresh_read_replica [--destino caminho]
+
+Copia a base de dados 'default' com a API de backup do SQLite para o
+ficheiro da cópia só de leitura (PHARMACY_COPIA_LEITURA, ou --destino)
+e troca-o de uma vez (ver pharmacy/leitura.py). Para correr
+periodicamente, com um intervalo menor do que
+PHARMACY_LEITURA_ATRASO_MAXIMO.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.leitura import actualizar_copia
+
+
+class Command(BaseCommand):
+    help = 'Actualiza a cópia só de leitura da base de dados (API de backup do SQLite).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destino', help='Ficheiro da cópia (por defeito PHARMACY_COPIA_LEITURA).')
+
+    def handle(self, *args, **options):
+        destino = options['destino'] or getattr(settings, 'PHARMACY_COPIA_LEITURA', None)
+        if not destino:
+            raise CommandError('Indique --destino ou defina PHARMACY_COPIA_LEITURA.')
+
+        inicio = time.perf_counter()
+        tamanho = actualizar_copia(str(destino))
+        self.stdout.write(self.style.SUCCESS(
+            f'Cópia actualizada em {destino} ({tamanho / 1024 / 1024:.1f} MB, '
+            f'{time.perf_counter() - inicio:.2f} s).'
+        ))
@@ -0,0 +1,123 @@
+'''
+DomusShelf - Benchmarks
+=======================
+
+Comando: python manage.py run_benchmarks [--escalas 10,100,1000]
+                                         [--repeticoes N] [--semente N]
+                                         [--medicamentos N] [--embalagens N]
+                                         [--consumos N]
+                                         [--saida resultados.json]
+                                         [--comparar anteriores.json]
+
+Cria uma base de dados temporária (a base de dados da aplicação não é
+tocada), gera dados sintéticos até cada escala e mede as páginas
+principais (ver pharmacy/benchmarks.py): p50/p95 do tempo de resposta,
+queries por pedido e pico de memória.
+
+Com --saida grava os resultados em JSON (com a versão do Python, do
+Django e do SQLite); com --comparar mostra a diferença para uma
+execução anterior gravada da mesma forma.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import json
+import platform
+import sqlite3
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from pharmacy.benchmarks import comparar, executar
+
+
+def _escalas(texto):
+    """Converte '10,100,1000' numa lista de inteiros (usado pelo argparse)."""
+    return [int(parte) for parte in texto.split(',') if parte.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Mede o desempenho das páginas principais com dados sintéticos de várias escalas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', type=_escalas, default=[10, 100], help='Números de agregados, separados por vírgulas (por defeito 10,100).')
+        parser.add_argument('--repeticoes', type=int, default=20, help='Pedidos medidos por cenário (por defeito 20).')
+        parser.add_argument('--semente', type=int, default=0, help='Semente dos dados sintéticos (por defeito 0).')
+        parser.add_argument('--medicamentos', type=int, default=8, help='Medicamentos por utilizador (por defeito 8).')
+        parser.add_argument('--embalagens', type=int, default=2, help='Embalagens por medicamento (por defeito 2).')
+        parser.add_argument('--consumos', type=int, default=10, help='Consumos por embalagem (por defeito 10).')
+        parser.add_argument('--saida', help='Ficheiro JSON onde gravar os resultados.')
+        parser.add_argument('--comparar', help='Ficheiro JSON de uma execução anterior.')
+
+    def handle(self, *args, **options):
+        if not options['escalas'] or min(options['escalas']) < 1:
+            raise CommandError('As escalas têm de ser números positivos.')
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes tem de ser pelo menos 1.')
+
+        anteriores = None
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as ficheiro:
+                    anteriores = json.load(ficheiro)['resultados']
+            except (OSError, ValueError, KeyError) as erro:
+                raise CommandError(f'Não foi possível ler {options["comparar"]}: {erro}')
+
+        self.stdout.write(f'{"escala":>7}  {"cenário":<20} {"p50 ms":>9} {"p95 ms":>9} {"queries":>7} {"memória KB":>11}')
+
+        def progresso(resultado):
+            self.stdout.write(
+                f'{resultado["escala"]:>7}  {resultado["cenario"]:<20} {resultado["p50_ms"]:>9.2f} '
+                f'{resultado["p95_ms"]:>9.2f} {resultado["queries"]:>7} {resultado["memoria_pico_kb"]:>11.1f}'
+            )
+
+        # Base de dados temporária, como nos testes
+        setup_test_environment(debug=False)
+        nome_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            resultados = executar(
+                options['escalas'],
+                repeticoes=options['repeticoes'],
+                semente=options['semente'],
+                progresso=progresso,
+                medicamentos_por_utilizador=options['medicamentos'],
+                embalagens_por_medicamento=options['embalagens'],
+                consumos_por_embalagem=options['consumos'],
+            )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0)
+            teardown_test_environment()
+
+        if anteriores is not None:
+            self.mostrar_comparacao(comparar(anteriores, resultados))
+
+        if options['saida']:
+            documento = {
+                'data': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'parametros': {
+                    campo: options[campo]
+                    for campo in ('escalas', 'repeticoes', 'semente', 'medicamentos', 'embalagens', 'consumos')
+                },
+                'resultados': resultados,
+            }
+            with open(options['saida'], 'w', encoding='utf-8') as ficheiro:
+                json.dump(documento, ficheiro, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados gravados em {options["saida"]}.'))
+
+    def mostrar_comparacao(self, linhas):
+        self.stdout.write('')
+        self.stdout.write(f'{"escala":>7}  {"cenário":<20} {"p50 antes":>10} {"p50 agora":>10} {"p95 antes":>10} {"p95 agora":>10}')
+        for escala, cenario, p50_antes, p50_agora, p95_antes, p95_agora in linhas:
+            variacao = (p50_agora - p50_antes) / p50_antes * 100 if p50_antes else 0.0
+            self.stdout.write(
+                f'{escala:>7}  {cenario:<20} {p50_antes:>10.2f} {p50_agora:>10.2f} '
+                f'{p95_antes:>10.2f} {p95_agora:>10.2f}  ({variacao:+.0f}% p50)'
+            )
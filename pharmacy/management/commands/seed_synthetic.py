@@ -0,0 +1,68 @@
+'''
+DomusShelf - Geração de Dados Sintéticos
+========================================
+
+Comando: python manage.py seed_synthetic [--utilizadores N] [--medicamentos N]
+                                         [--embalagens N] [--consumos N]
+                                         [--semente N] [--prefixo TEXTO]
+                                         [--palavra-passe TEXTO]
+
+Cria utilizadores fictícios (prefixo_000001, ...) com catálogo, stock e
+histórico de consumos realistas (ver pharmacy/sintetico.py), para testar
+o desempenho com muitos dados. Com a mesma semente gera sempre os
+mesmos dados. Correr outra vez acrescenta novos utilizadores.
+
+Exemplo (1000 agregados, ~16 mil embalagens, ~160 mil consumos):
+
+    python manage.py seed_synthetic --utilizadores 1000
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.sintetico import gerar
+
+
+class Command(BaseCommand):
+    help = 'Gera utilizadores fictícios com medicamentos, embalagens e consumos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilizadores', type=int, default=100, help='Número de utilizadores (por defeito 100).')
+        parser.add_argument('--medicamentos', type=int, default=8, help='Medicamentos por utilizador (por defeito 8).')
+        parser.add_argument('--embalagens', type=int, default=2, help='Embalagens por medicamento (por defeito 2).')
+        parser.add_argument('--consumos', type=int, default=10, help='Consumos por embalagem (por defeito 10).')
+        parser.add_argument('--semente', type=int, default=0, help='Semente do gerador aleatório (por defeito 0).')
+        parser.add_argument('--prefixo', default='sintetico', help='Prefixo dos nomes de utilizador.')
+        parser.add_argument('--palavra-passe', help='Palavra-passe dos utilizadores (por defeito, sem login).')
+
+    def handle(self, *args, **options):
+        for opcao in ('utilizadores', 'medicamentos', 'embalagens'):
+            if options[opcao] < 1:
+                raise CommandError(f'--{opcao} tem de ser pelo menos 1.')
+        if options['consumos'] < 0:
+            raise CommandError('--consumos não pode ser negativo.')
+
+        inicio = time.perf_counter()
+
+        def progresso(criados):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {criados} utilizadores...')
+
+        ids = gerar(
+            options['utilizadores'],
+            medicamentos_por_utilizador=options['medicamentos'],
+            embalagens_por_medicamento=options['embalagens'],
+            consumos_por_embalagem=options['consumos'],
+            semente=options['semente'],
+            prefixo=options['prefixo'],
+            palavra_passe=options['palavra_passe'],
+            progresso=progresso,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(ids)} utilizadores criados ({time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,50 @@
+'''
+DomusShelf - Snapshots do Stock
+===============================
+
+Comando: python manage.py snapshot_stock [--tamanho-lote N]
+
+Grava o stock actual (segundo o registo de movimentos) de cada embalagem
+que teve movimentos desde a execução anterior. Com snapshots recentes,
+o stock numa data passada (movimentos.stock_em) só precisa de somar os
+movimentos registados depois do último snapshot.
+
+Pode correr uma vez por dia, por exemplo no cron:
+
+    15 0 * * *  cd /caminho/do/projecto && python manage.py snapshot_stock
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from pharmacy.movimentos import TAMANHO_LOTE, criar_snapshots
+from pharmacy.particoes import em_cada_base
+
+
+class Command(BaseCommand):
+    help = 'Grava snapshots do stock das embalagens com movimentos novos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamanho-lote', type=int, default=TAMANHO_LOTE,
+            help=f'Embalagens tratadas de cada vez (por defeito {TAMANHO_LOTE}).',
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progresso(criados):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {criados} embalagens...')
+
+        criados = sum(
+            criar_snapshots(tamanho_lote=max(1, options['tamanho_lote']), progresso=progresso)
+            for _ in em_cada_base()
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{criados} snapshots gravados ({time.perf_counter() - inicio:.1f}s).'
+        ))
@@ -0,0 +1,65 @@
+'''
+DomusShelf - Bibliotecas de Front-end Servidas pela Aplicação
+=============================================================
+
+Comando: python manage.py vendor_assets [--descarregar] [--origem URL]
+
+Com --descarregar, obtém de --origem (por defeito o jsDelivr; pode ser
+um espelho interno do npm) as versões fixadas em
+pharmacy/estaticos.py:FICHEIROS_EXTERNOS e grava-as em vendor/. É o
+único passo que precisa de acesso à rede: vendor/ fica no repositório.
+
+Depois (e sempre que os templates passem a usar outros ícones) gera
+static/vendor/ a partir de vendor/, só com os ícones usados. Segue-se o
+"manage.py collectstatic" do deploy.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.estaticos import FICHEIROS_EXTERNOS, ORIGEM_PACOTES, gerar, pasta_gerados, pasta_originais
+
+
+class Command(BaseCommand):
+    help = 'Descarrega (com --descarregar) as bibliotecas de front-end para vendor/ e gera static/vendor/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--descarregar', action='store_true', help='Obter primeiro os ficheiros para vendor/ (precisa de rede).')
+        parser.add_argument('--origem', default=ORIGEM_PACOTES, help=f'Endereço base dos pacotes npm (por defeito {ORIGEM_PACOTES}).')
+
+    def handle(self, *args, **options):
+        if options['descarregar']:
+            self.descarregar(options['origem'].rstrip('/'))
+
+        try:
+            resultado = gerar()
+        except FileNotFoundError as erro:
+            raise CommandError(f'{erro}. Correr primeiro com --descarregar.')
+
+        self.stdout.write(
+            f'Ícones: {len(resultado["usados"])} usados nos templates, '
+            f'{resultado["guardados"]} no CSS gerado.'
+        )
+        if not resultado['fontes_recortadas']:
+            self.stdout.write(self.style.WARNING(
+                'Sem o fontTools (e o brotli, para woff2), as fontes dos ícones ficam completas.'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'{pasta_gerados()} gerada.'))
+
+    def descarregar(self, origem):
+        for nome, pacote in FICHEIROS_EXTERNOS:
+            destino = pasta_originais() / nome
+            url = f'{origem}/{pacote}'
+            try:
+                with urlopen(url, timeout=30) as resposta:
+                    conteudo = resposta.read()
+            except (URLError, OSError) as erro:
+                raise CommandError(f'Não foi possível obter {url}: {erro}')
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            destino.write_bytes(conteudo)
+            self.stdout.write(f'{nome:<45} {len(conteudo) / 1024:>8.1f} KB')
@@ -0,0 +1,59 @@
+'''
+DomusShelf - Verificação do Registo de Movimentos
+=================================================
+
+Comando: python manage.py verify_stock_ledger [--utilizador USERNAME]
+
+Confirma que a quantidade actual de cada embalagem é igual à soma dos
+seus movimentos de stock (MovimentoStock). Lista as embalagens que não
+coincidem e termina com erro se houver alguma, para poder ser usado
+em scripts e no cron.
+
+Uma diferença indica uma alteração de stock feita por fora das funções
+de serviço (por exemplo, um UPDATE à mão na base de dados).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from pharmacy.models import Embalagem
+from pharmacy.movimentos import verificar
+from pharmacy.particoes import em_cada_base, particao_do_utilizador, usar_particao
+
+
+# Número de diferenças mostradas (as restantes só são contadas)
+MAXIMO_MOSTRADAS = 50
+
+
+class Command(BaseCommand):
+    help = 'Compara a quantidade actual das embalagens com o registo de movimentos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--utilizador', help='Verificar só as embalagens deste utilizador.')
+
+    def handle(self, *args, **options):
+        if options['utilizador']:
+            try:
+                user = User.objects.get(username=options['utilizador'])
+            except User.DoesNotExist:
+                raise CommandError(f'Utilizador "{options["utilizador"]}" não existe.')
+            with usar_particao(particao_do_utilizador(user.pk)):
+                diferencas = verificar(Embalagem.objects.filter(utilizador=user))
+        else:
+            diferencas = []
+            for _ in em_cada_base():
+                diferencas += verificar(Embalagem.objects.all())
+
+        for embalagem_id, quantidade_actual, saldo in diferencas[:MAXIMO_MOSTRADAS]:
+            self.stderr.write(
+                f'Embalagem {embalagem_id}: quantidade actual {quantidade_actual}, '
+                f'registo de movimentos {saldo}'
+            )
+
+        if diferencas:
+            raise CommandError(f'{len(diferencas)} embalagens não coincidem com o registo de movimentos.')
+
+        self.stdout.write(self.style.SUCCESS('O stock de todas as embalagens coincide com o registo de movimentos.'))
@@ -0,0 +1,182 @@
+'''
+DomusShelf - Middleware
+=======================
+
+InstrumentacaoMiddleware: mede cada pedido (ver instrumentacao.py) e
+- acrescenta à resposta o cabeçalho Server-Timing, que os browsers
+  mostram no separador de rede das ferramentas de programador;
+- escreve uma linha JSON no logger "pharmacy.pedidos" com o URL, a view,
+  o número de queries, os tempos e as queries repetidas.
+
+Activo quando PHARMACY_INSTRUMENTACAO é True (por defeito). Deve ser o
+primeiro da lista MIDDLEWARE, para que as queries da sessão e da
+autenticação também sejam contadas.
+
+Os dois funcionam em WSGI e em ASGI: com um servidor ASGI e views
+async, o pedido não passa por uma thread só por causa deles.
+
+ParticaoMiddleware: com PHARMACY_PARTICOES, as queries dos dados do
+pedido vão para a partição do utilizador autenticado (ver
+particoes.py). Deve vir depois do AuthenticationMiddleware.
+
+EstaticosMiddleware: com PHARMACY_SERVIR_ESTATICOS (perfil de produção),
+serve os ficheiros do STATIC_ROOT sem passar pelas views: a versão .br
+ou .gz gerada no collectstatic quando o browser a aceita, e cache de um
+ano nos nomes com hash (ver estaticos.py). Deve vir logo depois do
+SecurityMiddleware, para não abrir a sessão por causa de um ficheiro.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import json
+import logging
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+from .estaticos import indexar
+from .instrumentacao import instalar_medicao_templates, medir
+from .particoes import particoes_activas, pedido_em_curso
+
+
+logger = logging.getLogger('pharmacy.pedidos')
+
+
+class InstrumentacaoMiddleware:
+    """Queries, tempo de SQL, de templates e de Python de cada pedido."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PHARMACY_INSTRUMENTACAO', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instalar_medicao_templates()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with medir() as metricas:
+            response = self.get_response(request)
+        return self.registar(request, response, metricas)
+
+    async def __acall__(self, request):
+        with medir() as metricas:
+            response = await self.get_response(request)
+        return self.registar(request, response, metricas)
+
+    def registar(self, request, response, metricas):
+        # medir() só fecha as contas à saída do bloco
+        response['Server-Timing'] = metricas.server_timing()
+
+        if logger.isEnabledFor(logging.INFO):
+            correspondencia = getattr(request, 'resolver_match', None)
+            registo = {
+                'metodo': request.method,
+                'caminho': request.path,
+                'view': correspondencia.view_name if correspondencia else None,
+                'estado': response.status_code,
+                **metricas.como_dict(),
+            }
+            logger.info(json.dumps(registo, ensure_ascii=False))
+
+        return response
+
+
+class ParticaoMiddleware:
+    """Torna o pedido visível ao ParticaoRouter (via particao_actual())."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not particoes_activas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pedido_em_curso(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with pedido_em_curso(request):
+            return await self.get_response(request)
+
+
+class EstaticosMiddleware:
+    """Serve STATIC_URL a partir do STATIC_ROOT, comprimido e com cache longa."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PHARMACY_SERVIR_ESTATICOS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # O índice é feito uma vez: depois de um collectstatic, reiniciar
+        self.prefixo = settings.STATIC_URL
+        self.ficheiros = indexar(
+            settings.STATIC_ROOT,
+            getattr(staticfiles_storage, 'hashed_files', {}).values(),
+        )
+
+    def procurar(self, request):
+        """O Estatico pedido, ou None se o pedido não é de um ficheiro estático."""
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefixo):
+            return None
+        return self.ficheiros.get(request.path[len(self.prefixo):])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estatico = self.procurar(request)
+        if estatico is None:
+            return self.get_response(request)
+        return self.servir(request, estatico)
+
+    async def __acall__(self, request):
+        estatico = self.procurar(request)
+        if estatico is None:
+            return await self.get_response(request)
+        # Em ASGI o ficheiro é lido de uma vez, numa thread (uma FileResponse
+        # seria lida em pedaços síncronos)
+        return await sync_to_async(self.servir)(request, estatico, ler=True)
+
+    def servir(self, request, estatico, ler=False):
+        caminho, codificacao = estatico.escolher(request.headers.get('Accept-Encoding', ''))
+        informacao = os.stat(caminho)
+        modificado = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+
+        if modificado is not None and int(informacao.st_mtime) <= modificado:
+            response = HttpResponseNotModified()
+        elif ler:
+            with open(caminho, 'rb') as ficheiro:
+                response = HttpResponse(ficheiro.read(), content_type=estatico.tipo)
+        else:
+            # Com o tipo indicado, a FileResponse não o adivinha pelo nome (.gz)
+            response = FileResponse(open(caminho, 'rb'), content_type=estatico.tipo)
+
+        response['Last-Modified'] = http_date(informacao.st_mtime)
+        response['Cache-Control'] = estatico.cache_control
+        if estatico.versoes:
+            response['Vary'] = 'Accept-Encoding'
+        if response.status_code == 200:
+            response['Content-Length'] = informacao.st_size
+            if codificacao:
+                response['Content-Encoding'] = codificacao
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consumo',
+            index=models.Index(fields=['embalagem', '-data_hora'], name='consumo_embalagem_data'),
+        ),
+        migrations.AddIndex(
+            model_name='embalagem',
+            index=models.Index(condition=models.Q(('quantidade_actual__gt', 0)), fields=['medicamento', 'data_validade'], name='embalagem_med_validade_stock'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['utilizador', 'nome_comercial'], name='medicamento_utilizador_nome'),
+        ),
+    ]
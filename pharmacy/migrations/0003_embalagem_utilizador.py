@@ -0,0 +1,65 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+# Número de embalagens actualizadas por cada UPDATE durante o backfill
+TAMANHO_LOTE = 1000
+
+
+def preencher_utilizador(apps, schema_editor):
+    """
+    Copia medicamento.utilizador para embalagem.utilizador em lotes de
+    TAMANHO_LOTE embalagens (por intervalo de id), para não bloquear a
+    tabela inteira num único UPDATE em bases de dados grandes.
+    """
+    Embalagem = apps.get_model('pharmacy', 'Embalagem')
+    Medicamento = apps.get_model('pharmacy', 'Medicamento')
+    db_alias = schema_editor.connection.alias
+
+    dono = Subquery(
+        Medicamento.objects.using(db_alias).filter(
+            pk=OuterRef('medicamento_id')
+        ).values('utilizador_id')[:1]
+    )
+
+    embalagens = Embalagem.objects.using(db_alias)
+    ultimo_id = embalagens.aggregate(models.Max('id'))['id__max'] or 0
+
+    for inicio in range(0, ultimo_id, TAMANHO_LOTE):
+        embalagens.filter(
+            id__gt=inicio,
+            id__lte=inicio + TAMANHO_LOTE,
+        ).update(utilizador_id=dono)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        # 1. Adicionar o campo, ainda opcional, para as linhas existentes
+        migrations.AddField(
+            model_name='embalagem',
+            name='utilizador',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='embalagens', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador'),
+        ),
+        # 2. Preencher a partir do medicamento
+        migrations.RunPython(preencher_utilizador, migrations.RunPython.noop),
+        # 3. Tornar o campo obrigatório
+        migrations.AlterField(
+            model_name='embalagem',
+            name='utilizador',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='embalagens', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador'),
+        ),
+        migrations.AddIndex(
+            model_name='embalagem',
+            index=models.Index(condition=models.Q(('quantidade_actual__gt', 0)), fields=['utilizador', 'data_validade'], name='embalagem_user_validade_stock'),
+        ),
+    ]
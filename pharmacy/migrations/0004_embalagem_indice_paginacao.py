@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0003_embalagem_utilizador'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='embalagem',
+            name='embalagem_user_validade_stock',
+        ),
+        migrations.AddIndex(
+            model_name='embalagem',
+            index=models.Index(fields=['utilizador', 'data_validade'], name='embalagem_utilizador_validade'),
+        ),
+    ]
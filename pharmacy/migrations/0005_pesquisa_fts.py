@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+def instalar(apps, schema_editor):
+    from pharmacy.pesquisa import instalar_fts
+    instalar_fts(schema_editor.connection)
+
+
+def remover(apps, schema_editor):
+    from pharmacy.pesquisa import remover_fts
+    remover_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0004_embalagem_indice_paginacao'),
+    ]
+
+    operations = [
+        # Só tem efeito em SQLite com FTS5; noutras bases de dados não faz nada
+        migrations.RunPython(instalar, remover),
+    ]
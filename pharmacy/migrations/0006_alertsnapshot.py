@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0005_pesquisa_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_referencia', models.DateField(verbose_name='Data de Referência')),
+                ('dias_alerta', models.PositiveIntegerField(verbose_name='Dias de Alerta')),
+                ('expiradas', models.PositiveIntegerField(default=0, verbose_name='Expiradas')),
+                ('a_expirar', models.PositiveIntegerField(default=0, verbose_name='A Expirar')),
+                ('ids_expiradas', models.JSONField(default=list, verbose_name='Embalagens Expiradas')),
+                ('ids_a_expirar', models.JSONField(default=list, verbose_name='Embalagens a Expirar')),
+                ('proxima_mudanca', models.DateField(blank=True, null=True, verbose_name='Próxima Mudança')),
+                ('desactualizado', models.BooleanField(default=False, verbose_name='Desactualizado')),
+                ('actualizado_em', models.DateTimeField(auto_now=True, verbose_name='Actualizado em')),
+                ('utilizador', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='alert_snapshot', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Alertas',
+                'verbose_name_plural': 'Resumos de Alertas',
+                'indexes': [models.Index(fields=['proxima_mudanca'], name='alertsnapshot_proxima'), models.Index(condition=models.Q(('desactualizado', True)), fields=['utilizador'], name='alertsnapshot_desactualizado')],
+            },
+        ),
+    ]
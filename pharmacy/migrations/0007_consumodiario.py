@@ -0,0 +1,37 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0006_alertsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField(verbose_name='Dia')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Quantidade')),
+                ('numero_consumos', models.PositiveIntegerField(default=0, verbose_name='Número de Consumos')),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos_diarios', to='pharmacy.medicamento', verbose_name='Medicamento')),
+                ('utilizador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos_diarios', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Consumo Diário',
+                'verbose_name_plural': 'Consumos Diários',
+                'ordering': ['dia'],
+                'indexes': [models.Index(fields=['utilizador', 'dia'], name='consumodiario_utilizador_dia')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='consumodiario',
+            constraint=models.UniqueConstraint(fields=('utilizador', 'medicamento', 'dia'), name='consumodiario_chave'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Número de embalagens lidas de cada vez para o saldo inicial
+TAMANHO_LOTE = 1000
+
+
+def registar_saldo_inicial(apps, schema_editor):
+    """
+    Abre o registo de movimentos com uma entrada por embalagem existente,
+    igual à sua quantidade actual, para que a soma dos movimentos de cada
+    embalagem coincida com o stock desde o primeiro dia.
+    """
+    Embalagem = apps.get_model('pharmacy', 'Embalagem')
+    MovimentoStock = apps.get_model('pharmacy', 'MovimentoStock')
+    db_alias = schema_editor.connection.alias
+
+    agora = django.utils.timezone.now()
+    embalagens = Embalagem.objects.using(db_alias).filter(
+        quantidade_actual__gt=0
+    ).order_by('id').values_list('id', 'utilizador_id', 'quantidade_actual')
+
+    ultimo_id = 0
+    while True:
+        lote = list(embalagens.filter(id__gt=ultimo_id)[:TAMANHO_LOTE])
+        if not lote:
+            break
+        ultimo_id = lote[-1][0]
+        MovimentoStock.objects.using(db_alias).bulk_create([
+            MovimentoStock(
+                embalagem_id=embalagem_id,
+                utilizador_id=utilizador_id,
+                tipo='entrada',
+                quantidade=quantidade,
+                data_hora=agora,
+                observacoes='Saldo inicial.',
+            )
+            for embalagem_id, utilizador_id, quantidade in lote
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0007_consumodiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_hora', models.DateTimeField(verbose_name='Data e Hora')),
+                ('quantidade', models.IntegerField(verbose_name='Quantidade')),
+                ('ultimo_movimento_id', models.BigIntegerField(verbose_name='Último Movimento')),
+                ('embalagem', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='snapshots_stock', to='pharmacy.embalagem', verbose_name='Embalagem')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Stock',
+                'verbose_name_plural': 'Snapshots de Stock',
+                'ordering': ['data_hora'],
+                'indexes': [models.Index(fields=['embalagem', 'data_hora'], name='snapshotstock_embalagem_data')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimentoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada'), ('consumo', 'Consumo'), ('ajuste', 'Ajuste'), ('abate', 'Abate')], max_length=10, verbose_name='Tipo')),
+                ('quantidade', models.IntegerField(verbose_name='Quantidade')),
+                ('data_hora', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Data e Hora')),
+                ('observacoes', models.CharField(blank=True, max_length=200, verbose_name='Observações')),
+                ('consumo', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='pharmacy.consumo', verbose_name='Consumo')),
+                ('embalagem', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='movimentos', to='pharmacy.embalagem', verbose_name='Embalagem')),
+                ('utilizador', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimentos_stock', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+            ],
+            options={
+                'verbose_name': 'Movimento de Stock',
+                'verbose_name_plural': 'Movimentos de Stock',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['embalagem', 'id'], name='movimento_embalagem_id')],
+            },
+        ),
+        migrations.RunPython(registar_saldo_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-18 10:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0008_movimentostock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticaoUtilizador',
+            fields=[
+                ('utilizador', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='particao', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Utilizador')),
+                ('base_de_dados', models.CharField(max_length=100, verbose_name='Base de Dados')),
+                ('actualizado_em', models.DateTimeField(auto_now=True, verbose_name='Actualizado em')),
+            ],
+            options={
+                'verbose_name': 'Partição do Utilizador',
+                'verbose_name_plural': 'Partições dos Utilizadores',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pharmacy', '0009_particaoutilizador'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='embalagem',
+            name='utilizador',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='embalagens', to=settings.AUTH_USER_MODEL, verbose_name='Utilizador'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0010_embalagem_utilizador_sem_indice'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='alertsnapshot',
+            name='ids_a_expirar',
+        ),
+        migrations.RemoveField(
+            model_name='alertsnapshot',
+            name='ids_expiradas',
+        ),
+    ]
@@ -10,7 +10,7 @@ Data: 3 de Fevereiro de 2026
 
 from django.db import models
 from django.contrib.auth.models import User
-from datetime import date
+from django.utils import timezone
 
 
 class Medicamento(models.Model):
@@ -71,6 +71,13 @@ class Medicamento(models.Model):
         verbose_name_plural = 'Medicamentos'
         # Ordenar alfabeticamente por nome comercial
         ordering = ['nome_comercial']
+        # Índice para o catálogo: filtra por utilizador e ordena por nome
+        indexes = [
+            models.Index(
+                fields=['utilizador', 'nome_comercial'],
+                name='medicamento_utilizador_nome',
+            ),
+        ]
     
     def __str__(self):
         """
@@ -99,6 +106,20 @@ class Embalagem(models.Model):
         verbose_name='Medicamento'
     )
     
+    # Dono da embalagem - cópia (desnormalizada) de medicamento.utilizador
+    # Permite filtrar o stock por utilizador sem JOIN ao Medicamento.
+    # É preenchido automaticamente no save() e não aparece nos formulários.
+    # Sem índice próprio: o índice (utilizador, data_validade) também
+    # serve as procuras só por utilizador.
+    utilizador = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='embalagens',
+        editable=False,
+        db_index=False,
+        verbose_name='Utilizador'
+    )
+    
     # Quantidade que vinha originalmente na embalagem
     quantidade_inicial = models.PositiveIntegerField(
         verbose_name='Quantidade Inicial'
@@ -140,6 +161,21 @@ class Embalagem(models.Model):
         verbose_name_plural = 'Embalagens'
         # FEFO: First Expired, First Out - ordenar por validade (mais antigas primeiro)
         ordering = ['data_validade']
+        # Índice parcial para as consultas de validade (stock, alertas, sino):
+        # só embalagens com stock entram no índice, já ordenadas por validade
+        indexes = [
+            models.Index(
+                fields=['medicamento', 'data_validade'],
+                name='embalagem_med_validade_stock',
+                condition=models.Q(quantidade_actual__gt=0),
+            ),
+            # Stock do utilizador por validade: serve a listagem paginada
+            # (data_validade, id) e também os alertas (filtro de stock > 0)
+            models.Index(
+                fields=['utilizador', 'data_validade'],
+                name='embalagem_utilizador_validade',
+            ),
+        ]
     
     def __str__(self):
         """
@@ -149,6 +185,15 @@ class Embalagem(models.Model):
         lote_info = f" - Lote: {self.lote}" if self.lote else ""
         return f"{self.medicamento.nome_comercial} - Validade: {self.data_validade}{lote_info} ({self.quantidade_actual} {self.unidade})"
     
+    def save(self, *args, **kwargs):
+        """
+        Antes de guardar, copia o dono do medicamento para a embalagem.
+        Assim o campo 'utilizador' fica sempre sincronizado, mesmo que a
+        embalagem mude de medicamento.
+        """
+        self.utilizador_id = self.medicamento.utilizador_id
+        super().save(*args, **kwargs)
+    
     @property
     def esta_expirada(self):
         """
@@ -158,7 +203,7 @@ class Embalagem(models.Model):
         @property permite usar isto como se fosse um atributo:
         embalagem.esta_expirada em vez de embalagem.esta_expirada()
         """
-        return date.today() > self.data_validade
+        return timezone.localdate() > self.data_validade
     
     @property
     def dias_para_expirar(self):
@@ -166,7 +211,7 @@ class Embalagem(models.Model):
         Calcula quantos dias faltam para a validade.
         Retorna um número negativo se já expirou.
         """
-        delta = self.data_validade - date.today()
+        delta = self.data_validade - timezone.localdate()
         return delta.days
 
 
@@ -209,6 +254,13 @@ class Consumo(models.Model):
         verbose_name_plural = 'Consumos'
         # Ordenar por data, mais recentes primeiro
         ordering = ['-data_hora']
+        # Histórico de consumos de uma embalagem, mais recentes primeiro
+        indexes = [
+            models.Index(
+                fields=['embalagem', '-data_hora'],
+                name='consumo_embalagem_data',
+            ),
+        ]
     
     def __str__(self):
         """
@@ -218,6 +270,76 @@ class Consumo(models.Model):
         return f"{self.quantidade} {self.embalagem.unidade} de {self.embalagem.medicamento.nome_comercial} em {self.data_hora.strftime('%d/%m/%Y')}"
 
 
+class ConsumoDiario(models.Model):
+    """
+    Total consumido de um medicamento num dia (hora local), por utilizador.
+    
+    É um resumo ("rollup") da tabela Consumo, actualizado em cada registo
+    (ver signals.py e historico.py). Os gráficos, relatórios e previsões
+    lêem daqui em vez de percorrer todos os consumos com dois JOINs.
+    """
+    
+    # Dono - o mesmo do medicamento (evita o JOIN ao filtrar por utilizador)
+    utilizador = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='consumos_diarios',
+        verbose_name='Utilizador'
+    )
+    
+    medicamento = models.ForeignKey(
+        Medicamento,
+        on_delete=models.CASCADE,
+        related_name='consumos_diarios',
+        verbose_name='Medicamento'
+    )
+    
+    # Dia do consumo, na hora local (TIME_ZONE)
+    dia = models.DateField(
+        verbose_name='Dia'
+    )
+    
+    # Soma das quantidades consumidas nesse dia
+    quantidade = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Quantidade'
+    )
+    
+    # Número de registos de consumo que deram origem ao total
+    numero_consumos = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Número de Consumos'
+    )
+    
+    class Meta:
+        """Configurações do modelo"""
+        verbose_name = 'Consumo Diário'
+        verbose_name_plural = 'Consumos Diários'
+        ordering = ['dia']
+        constraints = [
+            # Uma linha por (utilizador, medicamento, dia); o índice único
+            # serve também o histórico de um medicamento
+            models.UniqueConstraint(
+                fields=['utilizador', 'medicamento', 'dia'],
+                name='consumodiario_chave',
+            ),
+        ]
+        # Histórico de todos os medicamentos do utilizador num intervalo
+        indexes = [
+            models.Index(
+                fields=['utilizador', 'dia'],
+                name='consumodiario_utilizador_dia',
+            ),
+        ]
+    
+    def __str__(self):
+        """
+        Define como o total aparece em texto.
+        Exemplo: "Ben-u-ron em 03/02/2026: 4"
+        """
+        return f"{self.medicamento.nome_comercial} em {self.dia.strftime('%d/%m/%Y')}: {self.quantidade}"
+
+
 class Preferencias(models.Model):
     """
     Armazena as preferências/configurações de cada utilizador.
@@ -250,4 +372,295 @@ class Preferencias(models.Model):
         """
         Define como as preferências aparecem em texto.
         """
-        return f"Preferências de {self.utilizador.username}"
\ No newline at end of file
+        return f"Preferências de {self.utilizador.username}"
+
+
+class AlertSnapshot(models.Model):
+    """
+    Estado de validade pré-calculado do stock de um utilizador:
+    quantas embalagens (com stock) estão expiradas ou a expirar.
+
+    Em vez de cada página fazer as consultas por intervalo de datas,
+    o sino e a página de alertas lêem esta linha. É recalculada pelo
+    comando "manage.py refresh_expiry_state" (à meia-noite) e quando o
+    stock muda, que a marca como desactualizada (ver alertas.py).
+    """
+    
+    # Um resumo por utilizador
+    utilizador = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='alert_snapshot',
+        verbose_name='Utilizador'
+    )
+    
+    # Dia para o qual as contagens foram calculadas ("hoje" no cálculo)
+    data_referencia = models.DateField(
+        verbose_name='Data de Referência'
+    )
+    
+    # Dias de alerta usados no cálculo (das preferências)
+    dias_alerta = models.PositiveIntegerField(
+        verbose_name='Dias de Alerta'
+    )
+    
+    expiradas = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Expiradas'
+    )
+    
+    a_expirar = models.PositiveIntegerField(
+        default=0,
+        verbose_name='A Expirar'
+    )
+    
+    # Primeiro dia em que, só pela passagem do tempo, alguma embalagem muda
+    # de grupo (expira ou entra no período de alerta). Até lá, mudar de dia
+    # não altera as contagens. Vazio se nenhuma embalagem vier a mudar.
+    proxima_mudanca = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='Próxima Mudança'
+    )
+    
+    # Marcado quando o stock ou as preferências mudam
+    desactualizado = models.BooleanField(
+        default=False,
+        verbose_name='Desactualizado'
+    )
+    
+    actualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Actualizado em'
+    )
+    
+    class Meta:
+        """Configurações do modelo"""
+        verbose_name = 'Resumo de Alertas'
+        verbose_name_plural = 'Resumos de Alertas'
+        # O comando da meia-noite procura os resumos a recalcular por estes campos
+        indexes = [
+            models.Index(
+                fields=['proxima_mudanca'],
+                name='alertsnapshot_proxima',
+            ),
+            models.Index(
+                fields=['utilizador'],
+                name='alertsnapshot_desactualizado',
+                condition=models.Q(desactualizado=True),
+            ),
+        ]
+    
+    def __str__(self):
+        """
+        Define como o resumo aparece em texto.
+        """
+        return f"Alertas de {self.utilizador.username} em {self.data_referencia}"
+    
+    @property
+    def total(self):
+        """Número de embalagens que aparecem no sino (expiradas + a expirar)."""
+        return self.expiradas + self.a_expirar
+
+
+class MovimentoStock(models.Model):
+    """
+    Registo (só de acrescentar) de cada movimento de stock de uma embalagem:
+    entradas, consumos, ajustes e abates.
+    
+    A quantidade_actual da Embalagem é uma projecção deste registo: a soma
+    dos movimentos de uma embalagem tem de dar a sua quantidade actual
+    (ver movimentos.py e o comando verify_stock_ledger). Os movimentos
+    nunca são alterados nem apagados; uma correcção é um novo ajuste.
+    """
+    
+    ENTRADA = 'entrada'
+    CONSUMO = 'consumo'
+    AJUSTE = 'ajuste'
+    ABATE = 'abate'
+    
+    TIPOS = [
+        (ENTRADA, 'Entrada'),
+        (CONSUMO, 'Consumo'),
+        (AJUSTE, 'Ajuste'),
+        (ABATE, 'Abate'),
+    ]
+    
+    # Dono - o mesmo da embalagem
+    utilizador = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='movimentos_stock',
+        verbose_name='Utilizador'
+    )
+    
+    # Sem restrição na base de dados: o registo fica depois de a
+    # embalagem ser eliminada (o último movimento é o abate)
+    embalagem = models.ForeignKey(
+        Embalagem,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='movimentos',
+        verbose_name='Embalagem'
+    )
+    
+    tipo = models.CharField(
+        max_length=10,
+        choices=TIPOS,
+        verbose_name='Tipo'
+    )
+    
+    # Variação do stock: positiva nas entradas, negativa nos consumos e
+    # abates, com qualquer sinal nos ajustes
+    quantidade = models.IntegerField(
+        verbose_name='Quantidade'
+    )
+    
+    # Consumo que originou o movimento (só nos consumos)
+    consumo = models.ForeignKey(
+        Consumo,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Consumo'
+    )
+    
+    # Quando o movimento foi registado (não a data indicada no consumo)
+    data_hora = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Data e Hora'
+    )
+    
+    observacoes = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='Observações'
+    )
+    
+    class Meta:
+        """Configurações do modelo"""
+        verbose_name = 'Movimento de Stock'
+        verbose_name_plural = 'Movimentos de Stock'
+        ordering = ['id']
+        # Movimentos de uma embalagem depois de um snapshot (reconstrução);
+        # substitui o índice simples da chave estrangeira
+        indexes = [
+            models.Index(
+                fields=['embalagem', 'id'],
+                name='movimento_embalagem_id',
+            ),
+        ]
+    
+    def __str__(self):
+        """
+        Define como o movimento aparece em texto.
+        Exemplo: "Consumo de -2 (embalagem 7) em 03/02/2026"
+        """
+        return f"{self.get_tipo_display()} de {self.quantidade:+d} (embalagem {self.embalagem_id}) em {self.data_hora.strftime('%d/%m/%Y')}"
+    
+    def save(self, *args, **kwargs):
+        """Só se podem criar movimentos, nunca alterá-los."""
+        if not self._state.adding:
+            raise ValueError('Os movimentos de stock não podem ser alterados.')
+        super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        raise ValueError('Os movimentos de stock não podem ser apagados.')
+
+
+class SnapshotStock(models.Model):
+    """
+    Stock de uma embalagem num instante, calculado a partir do registo de
+    movimentos (comando snapshot_stock).
+    
+    Para saber o stock numa data passada basta partir do último snapshot
+    anterior a essa data e somar os movimentos registados depois dele,
+    em vez de somar o registo inteiro desde o início.
+    """
+    
+    embalagem = models.ForeignKey(
+        Embalagem,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='snapshots_stock',
+        verbose_name='Embalagem'
+    )
+    
+    # Instante do snapshot
+    data_hora = models.DateTimeField(
+        verbose_name='Data e Hora'
+    )
+    
+    # Soma dos movimentos da embalagem com id até ultimo_movimento_id
+    quantidade = models.IntegerField(
+        verbose_name='Quantidade'
+    )
+    
+    # Último movimento (de todo o registo) incluído no snapshot
+    ultimo_movimento_id = models.BigIntegerField(
+        verbose_name='Último Movimento'
+    )
+    
+    class Meta:
+        """Configurações do modelo"""
+        verbose_name = 'Snapshot de Stock'
+        verbose_name_plural = 'Snapshots de Stock'
+        ordering = ['data_hora']
+        # Último snapshot de uma embalagem antes de uma data
+        indexes = [
+            models.Index(
+                fields=['embalagem', 'data_hora'],
+                name='snapshotstock_embalagem_data',
+            ),
+        ]
+    
+    def __str__(self):
+        """
+        Define como o snapshot aparece em texto.
+        Exemplo: "Embalagem 7 em 03/02/2026: 18"
+        """
+        return f"Embalagem {self.embalagem_id} em {self.data_hora.strftime('%d/%m/%Y')}: {self.quantidade}"
+
+
+class ParticaoUtilizador(models.Model):
+    """
+    Base de dados (partição) onde estão os dados de um utilizador, quando
+    o modo de partições está activo (PHARMACY_PARTICOES, ver particoes.py).
+    
+    Fica sempre na base de dados 'default', junto dos utilizadores. Um
+    utilizador sem linha aqui tem os dados na 'default'.
+    """
+    
+    utilizador = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='particao',
+        verbose_name='Utilizador'
+    )
+    
+    # Alias da base de dados em settings.DATABASES
+    base_de_dados = models.CharField(
+        max_length=100,
+        verbose_name='Base de Dados'
+    )
+    
+    actualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Actualizado em'
+    )
+    
+    class Meta:
+        """Configurações do modelo"""
+        verbose_name = 'Partição do Utilizador'
+        verbose_name_plural = 'Partições dos Utilizadores'
+    
+    def __str__(self):
+        """
+        Define como a partição aparece em texto.
+        Exemplo: "ana em particao_1"
+        """
+        return f"{self.utilizador.username} em {self.base_de_dados}"
\ No newline at end of file
@@ -0,0 +1,205 @@
+'''
+DomusShelf - Registo de Movimentos de Stock
+===========================================
+
+A quantidade_actual de cada embalagem é alterada no próprio registo
+(consumos, edições), o que não deixa rasto: não se sabe porque mudou
+nem quanto havia numa data passada.
+
+Cada alteração de stock escreve também um MovimentoStock, na mesma
+transacção que a altera:
+- entrada: embalagem criada ou importada (+quantidade);
+- consumo: toma registada (-quantidade, com o Consumo associado);
+- ajuste: correcção da quantidade (edição da quantidade inicial, admin);
+- abate: stock retirado sem ser consumido (embalagem eliminada).
+
+O registo só cresce. A quantidade_actual passa a ser uma projecção dele
+(a soma dos movimentos), que pode ser verificada a qualquer momento
+(comando "manage.py verify_stock_ledger").
+
+Snapshots: o comando "manage.py snapshot_stock", corrido periodicamente,
+grava o stock de cada embalagem que teve movimentos desde o último. O
+stock numa data passada é o último snapshot antes dessa data mais os
+movimentos registados depois dele (um intervalo no índice
+(embalagem, id) e poucos movimentos a somar).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Embalagem, MovimentoStock, SnapshotStock
+
+
+# Número de embalagens tratadas de cada vez pelos comandos
+TAMANHO_LOTE = 2000
+
+
+# ==================== ESCRITA ====================
+
+def registar_movimento(embalagem, tipo, quantidade, consumo=None, observacoes=''):
+    """
+    Acrescenta um movimento ao registo. Deve ser chamada dentro da
+    transacção que altera a quantidade_actual da embalagem.
+    """
+    return MovimentoStock.objects.create(
+        utilizador_id=embalagem.utilizador_id,
+        embalagem_id=embalagem.pk,
+        tipo=tipo,
+        quantidade=quantidade,
+        consumo=consumo,
+        observacoes=observacoes,
+    )
+
+
+def registar_entradas(embalagens, observacoes=''):
+    """
+    Uma entrada por embalagem acabada de criar (com a sua quantidade
+    actual), num só INSERT. Usada pela importação em massa.
+    """
+    agora = timezone.now()
+    MovimentoStock.objects.bulk_create([
+        MovimentoStock(
+            utilizador_id=embalagem.utilizador_id,
+            embalagem_id=embalagem.pk,
+            tipo=MovimentoStock.ENTRADA,
+            quantidade=embalagem.quantidade_actual,
+            observacoes=observacoes,
+            data_hora=agora,
+        )
+        for embalagem in embalagens
+        if embalagem.quantidade_actual
+    ], batch_size=1000)
+
+
+# ==================== LEITURA ====================
+
+def saldo_do_registo():
+    """Expressão com a soma dos movimentos de cada embalagem (para annotate)."""
+    soma = MovimentoStock.objects.filter(
+        embalagem_id=OuterRef('pk')
+    ).values('embalagem_id').annotate(total=Sum('quantidade')).values('total')
+    return Coalesce(Subquery(soma), 0)
+
+
+def stock_em(embalagens_ids, instante):
+    """
+    Stock de cada embalagem no instante indicado, reconstruído a partir do
+    registo. Devolve um dicionário embalagem_id -> quantidade (só as que
+    já existiam nesse instante).
+
+    Para cada embalagem parte do último snapshot até 'instante' e soma
+    os movimentos posteriores a esse snapshot.
+    """
+    embalagens_ids = list(embalagens_ids)
+    base = {}
+    snapshots = SnapshotStock.objects.filter(
+        embalagem_id__in=embalagens_ids,
+        data_hora__lte=instante,
+    ).order_by('embalagem_id', '-data_hora').values_list(
+        'embalagem_id', 'quantidade', 'ultimo_movimento_id'
+    )
+    for embalagem_id, quantidade, ultimo_id in snapshots:
+        # Ordenado por data descendente: o primeiro de cada embalagem é o mais recente
+        base.setdefault(embalagem_id, (quantidade, ultimo_id))
+
+    stock = {embalagem_id: quantidade for embalagem_id, (quantidade, _) in base.items()}
+
+    # Movimentos posteriores ao snapshot de cada embalagem. Os snapshots de
+    # uma mesma execução têm o mesmo ultimo_movimento_id, por isso há
+    # poucos grupos; cada um é um intervalo no índice (embalagem, id).
+    grupos = {}
+    for embalagem_id in set(embalagens_ids):
+        ultimo_id = base.get(embalagem_id, (0, 0))[1]
+        grupos.setdefault(ultimo_id, []).append(embalagem_id)
+
+    filtro = Q()
+    for ultimo_id, ids in grupos.items():
+        filtro |= Q(embalagem_id__in=ids, id__gt=ultimo_id)
+
+    if grupos:
+        movimentos = MovimentoStock.objects.filter(
+            filtro, data_hora__lte=instante
+        ).values('embalagem_id').annotate(
+            total=Sum('quantidade')
+        ).values_list('embalagem_id', 'total').order_by()
+
+        for embalagem_id, total in movimentos:
+            stock[embalagem_id] = stock.get(embalagem_id, 0) + total
+
+    return stock
+
+
+def historico_embalagem(embalagem_id):
+    """Movimentos de uma embalagem, pela ordem em que foram registados."""
+    return MovimentoStock.objects.filter(embalagem_id=embalagem_id).order_by('id')
+
+
+# ==================== SNAPSHOTS E VERIFICAÇÃO ====================
+
+def criar_snapshots(agora=None, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Grava um snapshot de cada embalagem com movimentos desde o snapshot
+    anterior. O novo valor é o do snapshot anterior mais esses movimentos,
+    por isso cada execução só lê o que foi registado desde a última.
+
+    Todos os snapshots de uma execução incluem os movimentos até ao
+    mesmo id (o último no início), guardado em ultimo_movimento_id.
+    Devolve o número de snapshots criados.
+    """
+    ultimo_id = MovimentoStock.objects.aggregate(ultimo=Max('id'))['ultimo']
+    if ultimo_id is None:
+        return 0
+    # Depois de ler o último id: os movimentos incluídos são todos anteriores
+    agora = agora or timezone.now()
+    anterior_id = SnapshotStock.objects.aggregate(ultimo=Max('ultimo_movimento_id'))['ultimo'] or 0
+
+    novos = MovimentoStock.objects.filter(id__gt=anterior_id, id__lte=ultimo_id)
+    embalagens_ids = sorted(set(novos.values_list('embalagem_id', flat=True).order_by()))
+
+    criados = 0
+    for inicio in range(0, len(embalagens_ids), tamanho_lote):
+        lote = embalagens_ids[inicio:inicio + tamanho_lote]
+
+        base = {}
+        for embalagem_id, quantidade in SnapshotStock.objects.filter(
+            embalagem_id__in=lote
+        ).order_by('embalagem_id', '-data_hora').values_list('embalagem_id', 'quantidade'):
+            base.setdefault(embalagem_id, quantidade)
+
+        totais = novos.filter(embalagem_id__in=lote).values('embalagem_id').annotate(
+            total=Sum('quantidade')
+        ).values_list('embalagem_id', 'total').order_by()
+
+        SnapshotStock.objects.bulk_create([
+            SnapshotStock(
+                embalagem_id=embalagem_id,
+                data_hora=agora,
+                quantidade=base.get(embalagem_id, 0) + total,
+                ultimo_movimento_id=ultimo_id,
+            )
+            for embalagem_id, total in totais
+        ], batch_size=1000)
+
+        criados += len(lote)
+        if progresso:
+            progresso(criados)
+
+    return criados
+
+
+def verificar(queryset=None):
+    """
+    Compara a quantidade_actual das embalagens com a soma dos seus
+    movimentos. Devolve a lista (embalagem_id, quantidade_actual, saldo)
+    das que não coincidem (vazia se o registo estiver certo).
+    """
+    queryset = Embalagem.objects.all() if queryset is None else queryset
+    return list(queryset.annotate(
+        saldo=saldo_do_registo()
+    ).exclude(
+        quantidade_actual=F('saldo')
+    ).order_by('id').values_list('id', 'quantidade_actual', 'saldo'))
@@ -0,0 +1,214 @@
+'''
+DomusShelf - Paginação por Cursor (Keyset)
+==========================================
+
+A paginação tradicional (OFFSET) obriga a base de dados a ler e descartar
+todas as linhas das páginas anteriores, por isso fica mais lenta à medida
+que se avança. Aqui usamos paginação por cursor ("keyset"): cada página
+começa logo a seguir à última linha da anterior, usando a própria
+ordenação, por exemplo:
+
+    WHERE (data_validade, id) > (:ultima_validade, :ultimo_id)
+    ORDER BY data_validade, id
+    LIMIT :tamanho + 1
+
+Com um índice sobre as colunas de ordenação, o custo de cada página é o
+mesmo, quer o utilizador tenha 50 ou 50 000 embalagens. O cursor da
+página seguinte é um token opaco (JSON em base64) com os valores da
+última linha, estável mesmo que entretanto sejam criadas novas linhas.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+
+
+# Valores por defeito (podem ser alterados em settings.py)
+TAMANHO_PAGINA = getattr(settings, 'PHARMACY_TAMANHO_PAGINA', 50)
+TAMANHO_PAGINA_MAXIMO = getattr(settings, 'PHARMACY_TAMANHO_PAGINA_MAXIMO', 200)
+
+
+class CursorInvalido(ValueError):
+    """O token de paginação recebido não é válido para esta listagem."""
+
+
+class PaginaKeyset:
+    """
+    Uma página de resultados.
+
+    Atributos:
+        objectos: lista com os objectos desta página
+        proximo_cursor: token para pedir a página seguinte (ou None)
+        primeira: True se esta é a primeira página
+        url_seguinte / url_primeira: preenchidos por pagina_do_pedido()
+    """
+
+    def __init__(self, objectos, proximo_cursor, primeira):
+        self.objectos = objectos
+        self.proximo_cursor = proximo_cursor
+        self.primeira = primeira
+        self.url_seguinte = None
+        self.url_primeira = None
+
+    @property
+    def tem_seguinte(self):
+        return self.proximo_cursor is not None
+
+    def __iter__(self):
+        return iter(self.objectos)
+
+    def __len__(self):
+        return len(self.objectos)
+
+    def __bool__(self):
+        return bool(self.objectos)
+
+
+def codificar_cursor(valores):
+    """Transforma os valores da última linha num token seguro para URLs."""
+    texto = json.dumps(valores, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def _campo(queryset, nome):
+    """O campo do modelo, ou o output_field de uma anotação (ex: relevância)."""
+    if nome in queryset.query.annotations:
+        return queryset.query.annotations[nome].output_field
+    return queryset.model._meta.get_field(nome)
+
+
+def descodificar_cursor(token, queryset, campos):
+    """
+    Lê um token e converte cada valor para o tipo do campo do modelo
+    (por exemplo, a data de validade volta a ser um objecto date).
+    Os campos podem ser anotações do queryset.
+    """
+    try:
+        texto = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        valores = json.loads(texto)
+        if not isinstance(valores, list) or len(valores) != len(campos):
+            raise CursorInvalido(token)
+        return [
+            _campo(queryset, campo).to_python(valor)
+            for campo, valor in zip(campos, valores)
+        ]
+    except (ValueError, TypeError, ValidationError) as erro:
+        raise CursorInvalido(token) from erro
+
+
+def _filtro_depois_de(campos, valores):
+    """
+    Constrói o filtro "(a, b, c) > (va, vb, vc)" em forma de Q:
+        a > va OR (a = va AND b > vb) OR (a = va AND b = vb AND c > vc)
+    """
+    filtro = Q()
+    for i, campo in enumerate(campos):
+        iguais = {campos[j]: valores[j] for j in range(i)}
+        filtro |= Q(**iguais, **{f'{campo}__gt': valores[i]})
+    return filtro
+
+
+def _consulta(queryset, campos, cursor, tamanho):
+    """O queryset da página: depois do cursor, ordenado, com uma linha a mais."""
+    if cursor:
+        valores = descodificar_cursor(cursor, queryset, campos)
+        queryset = queryset.filter(_filtro_depois_de(campos, valores))
+    return queryset.order_by(*campos)[:tamanho + 1]
+
+
+def paginar_keyset(queryset, campos, cursor=None, tamanho=TAMANHO_PAGINA):
+    """
+    Devolve uma PaginaKeyset do queryset, ordenado pelos 'campos' (ascendente).
+
+    O último campo deve ser único (normalmente 'id') para que a ordem seja
+    total e nenhuma linha se repita ou perca entre páginas. Num queryset
+    .values(), os campos de ordenação têm de fazer parte dos valores.
+    Pede-se uma linha a mais para saber se existe página seguinte.
+    """
+    linhas = list(_consulta(queryset, campos, cursor, tamanho))
+    return _pagina(linhas, campos, cursor, tamanho)
+
+
+async def apaginar_keyset(queryset, campos, cursor=None, tamanho=TAMANHO_PAGINA):
+    """Versão async de paginar_keyset (para as views async)."""
+    linhas = [linha async for linha in _consulta(queryset, campos, cursor, tamanho)]
+    return _pagina(linhas, campos, cursor, tamanho)
+
+
+def _pagina(linhas, campos, cursor, tamanho):
+    """Corta a linha a mais e calcula o cursor da página seguinte."""
+    proximo_cursor = None
+    if len(linhas) > tamanho:
+        linhas = linhas[:tamanho]
+        ultima = linhas[-1]
+        # Funciona com objectos do modelo e com dicionários (querysets .values())
+        if isinstance(ultima, dict):
+            valores = [ultima[campo] for campo in campos]
+        else:
+            valores = [getattr(ultima, campo) for campo in campos]
+        proximo_cursor = codificar_cursor(valores)
+
+    return PaginaKeyset(linhas, proximo_cursor, primeira=not cursor)
+
+
+def obter_tamanho_pagina(request):
+    """Lê o parâmetro ?tamanho= do pedido, limitado ao máximo configurado."""
+    try:
+        tamanho = int(request.GET.get('tamanho', TAMANHO_PAGINA))
+    except ValueError:
+        return TAMANHO_PAGINA
+    return max(1, min(tamanho, TAMANHO_PAGINA_MAXIMO))
+
+
+def pagina_do_pedido(request, queryset, campos, parametro='cursor'):
+    """
+    Versão para views: lê o cursor (?cursor=, ou outro 'parametro') e o
+    tamanho do pedido, pagina o queryset e preenche os URLs de navegação,
+    mantendo os restantes parâmetros do URL.
+    Um cursor inválido devolve 404, como o Paginator do Django.
+    """
+    try:
+        pagina = paginar_keyset(
+            queryset,
+            campos,
+            cursor=request.GET.get(parametro),
+            tamanho=obter_tamanho_pagina(request),
+        )
+    except CursorInvalido:
+        raise Http404('Página inválida.')
+    return _preencher_urls(request, pagina, parametro)
+
+
+async def apagina_do_pedido(request, queryset, campos, parametro='cursor'):
+    """Versão async de pagina_do_pedido (para as views async)."""
+    try:
+        pagina = await apaginar_keyset(
+            queryset,
+            campos,
+            cursor=request.GET.get(parametro),
+            tamanho=obter_tamanho_pagina(request),
+        )
+    except CursorInvalido:
+        raise Http404('Página inválida.')
+    return _preencher_urls(request, pagina, parametro)
+
+
+def _preencher_urls(request, pagina, parametro):
+    """URLs da página seguinte e da primeira, com os restantes parâmetros do pedido."""
+    parametros = request.GET.copy()
+    if pagina.tem_seguinte:
+        parametros[parametro] = pagina.proximo_cursor
+        pagina.url_seguinte = '?' + parametros.urlencode()
+    if not pagina.primeira:
+        parametros.pop(parametro, None)
+        pagina.url_primeira = '?' + parametros.urlencode()
+
+    return pagina
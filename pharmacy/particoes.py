@@ -0,0 +1,434 @@
+'''
+DomusShelf - Partições por Agregado (Várias Bases de Dados)
+===========================================================
+
+Por defeito, todos os utilizadores partilham a mesma base de dados e
+cada query filtra por utilizador. Com PHARMACY_PARTICOES (uma lista de
+aliases de DATABASES), os dados de cada utilizador (medicamentos,
+embalagens, consumos, preferências, movimentos, totais e resumos)
+passam a viver numa dessas bases de dados. Cada ficheiro SQLite tem o
+seu próprio lock de escrita, por isso as escritas de agregados em
+partições diferentes não esperam umas pelas outras.
+
+Onde estão os dados de cada utilizador:
+- A tabela ParticaoUtilizador (na 'default', como os utilizadores)
+  diz a partição de cada um. Sem linha, os dados estão na 'default':
+  ligar o modo de partições não muda nada até correr o rebalanceamento.
+- Utilizadores novos vão logo para a partição escolhida por hashing de
+  rendez-vous do seu id: é estável, e acrescentar uma partição só muda
+  o destino de ~1/N dos utilizadores.
+- "manage.py rebalance_partitions" move para a partição certa os
+  utilizadores que não estão nela (os que já existiam, ou depois de
+  acrescentar partições).
+
+Como as queries chegam à partição certa (ParticaoRouter, routers.py):
+- num pedido, a do utilizador autenticado (ParticaoMiddleware);
+- num objecto já lido, a base de dados de onde veio;
+- fora de pedidos (comandos, admin), a fixada com usar_particao().
+As transacções das operações de stock são abertas na mesma base de
+dados: transaction.atomic(using=particao_actual()).
+
+Para as chaves estrangeiras, cada partição tem uma cópia mínima da
+linha do utilizador (sem palavra-passe). Os ids de cada partição
+começam num intervalo próprio (ESPACO_IDS), por isso um id identifica
+uma única linha em todas as bases de dados (o admin procura-a assim).
+
+A ordem de PHARMACY_PARTICOES define esses intervalos: só se podem
+acrescentar partições no fim da lista.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+# Ids reservados a cada base de dados (a 'default' fica com o primeiro intervalo)
+ESPACO_IDS = 2 ** 40
+
+# Linhas copiadas de cada vez ao mover um utilizador
+TAMANHO_LOTE = 1000
+
+# Partição fixada (comandos, admin) e pedido em curso (ParticaoMiddleware)
+_fixada = ContextVar('pharmacy_particao_fixada', default=None)
+_pedido = ContextVar('pharmacy_particao_pedido', default=None)
+
+# Partições já lidas no pedido em curso ({utilizador_id: alias})
+_lidas = ContextVar('pharmacy_particao_lidas', default=None)
+
+
+class MudancaIncompleta(Exception):
+    """
+    A cópia dos dados de um utilizador para outra base de dados não tem
+    as mesmas linhas que a origem: a mudança é desfeita e a origem fica
+    como estava.
+    """
+
+
+def particoes():
+    """Aliases das partições configuradas (lista vazia = modo desligado)."""
+    return list(getattr(settings, 'PHARMACY_PARTICOES', None) or [])
+
+
+def particoes_activas():
+    return bool(particoes())
+
+
+def bases_dos_dados():
+    """
+    Bases de dados que podem ter dados de utilizadores: a 'default'
+    (utilizadores ainda não movidos) e as partições.
+    """
+    return [DEFAULT_DB_ALIAS] + [alias for alias in particoes() if alias != DEFAULT_DB_ALIAS]
+
+
+def e_particionado(modelo):
+    """Os dados deste modelo vivem na partição do utilizador?"""
+    return modelo._meta.app_label == 'pharmacy' and modelo._meta.model_name != 'particaoutilizador'
+
+
+def modelos_particionados():
+    return [modelo for modelo in apps.get_app_config('pharmacy').get_models() if e_particionado(modelo)]
+
+
+def particao_por_hash(utilizador_id, aliases=None):
+    """
+    Partição de um utilizador por hashing de rendez-vous: a de maior
+    sha256(alias:id). Não depende da ordem das partições.
+    """
+    aliases = aliases or particoes()
+    return max(aliases, key=lambda alias: hashlib.sha256(f'{alias}:{utilizador_id}'.encode()).digest())
+
+
+# ==================== PARTIÇÃO EM USO ====================
+
+def _localizacao(utilizador_id):
+    """Partição registada na tabela. Lida sempre da 'default'."""
+    from .models import ParticaoUtilizador
+    return ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).filter(
+        utilizador_id=utilizador_id
+    ).values_list('base_de_dados', flat=True).first() or DEFAULT_DB_ALIAS
+
+
+def particao_do_utilizador(utilizador_id):
+    """
+    Base de dados com os dados do utilizador ('default' com o modo
+    desligado). Lida da tabela (uma query pela chave única), uma vez por
+    pedido: não fica em cache entre pedidos, porque a cache de cada
+    processo não saberia que o rebalance_partitions (noutro processo)
+    mudou o utilizador de sítio, e os pedidos continuariam a ler e a
+    escrever na partição antiga, já apagada.
+    """
+    if not particoes_activas() or utilizador_id is None:
+        return DEFAULT_DB_ALIAS
+    lidas = _lidas.get()
+    if lidas is not None and utilizador_id in lidas:
+        return lidas[utilizador_id]
+    alias = _localizacao(utilizador_id)
+    if lidas is not None:
+        lidas[utilizador_id] = alias
+    return alias
+
+
+@contextmanager
+def usar_particao(alias):
+    """Dentro do bloco, os dados dos utilizadores são lidos e escritos em 'alias'."""
+    token = _fixada.set(alias)
+    try:
+        yield alias
+    finally:
+        _fixada.reset(token)
+
+
+@contextmanager
+def pedido_em_curso(request):
+    """Usado pelo ParticaoMiddleware: a partição passa a ser a de request.user."""
+    token = _pedido.set(request)
+    token_lidas = _lidas.set({})
+    try:
+        yield
+    finally:
+        _lidas.reset(token_lidas)
+        _pedido.reset(token)
+
+
+def particao_actual():
+    """
+    Base de dados dos dados do utilizador no contexto actual: a fixada
+    com usar_particao(), a do utilizador do pedido, ou a 'default'.
+    """
+    alias = _fixada.get()
+    if alias is not None:
+        return alias
+    request = _pedido.get()
+    if request is not None and request.user.is_authenticated:
+        return particao_do_utilizador(request.user.pk)
+    return DEFAULT_DB_ALIAS
+
+
+def agrupar_por_particao(utilizadores_ids):
+    """{alias: [ids]} dos utilizadores, pela ordem dada (uma query)."""
+    from .models import ParticaoUtilizador
+    utilizadores_ids = list(utilizadores_ids)
+    localizacoes = {}
+    if particoes_activas():
+        localizacoes = dict(ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).filter(
+            utilizador_id__in=utilizadores_ids
+        ).values_list('utilizador_id', 'base_de_dados'))
+    grupos = {}
+    for utilizador_id in utilizadores_ids:
+        grupos.setdefault(localizacoes.get(utilizador_id, DEFAULT_DB_ALIAS), []).append(utilizador_id)
+    return grupos
+
+
+def em_cada_base():
+    """
+    Para os comandos que tratam todos os utilizadores: percorre as bases
+    de dados com dados, com cada uma fixada durante a sua iteração.
+    """
+    for alias in bases_dos_dados():
+        with usar_particao(alias):
+            yield alias
+
+
+# ==================== UTILIZADORES E PARTIÇÕES ====================
+
+def preparar_sequencias(alias):
+    """
+    Faz os ids das tabelas particionadas de 'alias' começarem no seu
+    intervalo (posição na lista x ESPACO_IDS). Idempotente.
+    """
+    posicao = bases_dos_dados().index(alias)
+    if not posicao:
+        return
+    inicio = posicao * ESPACO_IDS
+    with connections[alias].cursor() as cursor:
+        for modelo in modelos_particionados():
+            tabela = modelo._meta.db_table
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [tabela])
+            linha = cursor.fetchone()
+            if linha is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [tabela, inicio])
+            elif linha[0] < inicio:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [inicio, tabela])
+
+
+def replicar_utilizador(user, alias):
+    """Cópia mínima da linha do utilizador na partição (para as chaves estrangeiras)."""
+    if alias == DEFAULT_DB_ALIAS:
+        return
+    User.objects.using(alias).bulk_create(
+        [User(pk=user.pk, username=user.username, password='!', is_active=user.is_active)],
+        update_conflicts=True,
+        unique_fields=['id'],
+        update_fields=['username', 'is_active'],
+    )
+
+
+def colocar_utilizador(user):
+    """Utilizador novo: regista a sua partição (por hash) antes de ter dados."""
+    from .models import ParticaoUtilizador
+    alias = particao_por_hash(user.pk)
+    if alias == DEFAULT_DB_ALIAS:
+        return alias
+    replicar_utilizador(user, alias)
+    ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        utilizador_id=user.pk, defaults={'base_de_dados': alias}
+    )
+    return alias
+
+
+def _copiar(queryset, destino, chaves=None):
+    """
+    Copia as linhas do queryset para 'destino', aos blocos e com ids
+    novos (os do intervalo do destino). 'chaves' troca as chaves
+    estrangeiras: {campo: {id antigo: id novo}}. Devolve {id antigo: id novo}.
+    """
+    modelo = queryset.model
+    chaves = chaves or {}
+    novos_ids = {}
+
+    def gravar(lote, antigos):
+        modelo.objects.using(destino).bulk_create(lote)
+        novos_ids.update(zip(antigos, (objecto.pk for objecto in lote)))
+
+    lote, antigos = [], []
+    for objecto in queryset.order_by('pk').iterator(chunk_size=TAMANHO_LOTE):
+        antigos.append(objecto.pk)
+        objecto.pk = None
+        for campo, mapa in chaves.items():
+            # Referências a linhas já apagadas (movimentos de embalagens
+            # eliminadas) ficam como estavam: esses ids não voltam a ser usados
+            valor = getattr(objecto, campo)
+            setattr(objecto, campo, mapa.get(valor, valor))
+        lote.append(objecto)
+        if len(lote) == TAMANHO_LOTE:
+            gravar(lote, antigos)
+            lote, antigos = [], []
+    if lote:
+        gravar(lote, antigos)
+    return novos_ids
+
+
+def dados_do_utilizador(utilizador_id, alias):
+    """
+    {modelo: queryset} dos dados do utilizador em 'alias' que são
+    copiados numa mudança, pela ordem da cópia.
+    """
+    from .models import Consumo, ConsumoDiario, Embalagem, Medicamento, MovimentoStock, Preferencias
+    return {
+        Preferencias: Preferencias.objects.using(alias).filter(utilizador_id=utilizador_id),
+        Medicamento: Medicamento.objects.using(alias).filter(utilizador_id=utilizador_id),
+        Embalagem: Embalagem.objects.using(alias).filter(utilizador_id=utilizador_id),
+        Consumo: Consumo.objects.using(alias).filter(embalagem__utilizador_id=utilizador_id),
+        ConsumoDiario: ConsumoDiario.objects.using(alias).filter(utilizador_id=utilizador_id),
+        MovimentoStock: MovimentoStock.objects.using(alias).filter(utilizador_id=utilizador_id),
+    }
+
+
+def contar_dados(utilizador_id, alias):
+    """{nome do modelo: linhas} dos dados do utilizador em 'alias'."""
+    return {
+        modelo.__name__: queryset.count()
+        for modelo, queryset in dados_do_utilizador(utilizador_id, alias).items()
+    }
+
+
+def copiar_dados(utilizador_id, origem, destino):
+    """
+    Copia os dados do utilizador de 'origem' para 'destino' (na
+    transacção em curso em 'destino'). Devolve o número de linhas.
+
+    Todas as linhas recebem ids novos: manter os antigos levaria a
+    sequência do destino para o intervalo de outra base de dados. Os
+    movimentos são copiados pela ordem original (os snapshots de stock
+    dependem dela). Não são copiados os snapshots de stock (o próximo
+    snapshot_stock volta a criá-los) nem o resumo dos alertas (é
+    recalculado no primeiro pedido).
+    """
+    from .models import Consumo, ConsumoDiario, Embalagem, Medicamento, MovimentoStock, Preferencias
+    dados = dados_do_utilizador(utilizador_id, origem)
+
+    preferencias = _copiar(dados[Preferencias], destino)
+    medicamentos = _copiar(dados[Medicamento], destino)
+    embalagens = _copiar(dados[Embalagem], destino, {'medicamento_id': medicamentos})
+    consumos = _copiar(dados[Consumo], destino, {'embalagem_id': embalagens})
+    diarios = _copiar(dados[ConsumoDiario], destino, {'medicamento_id': medicamentos})
+    movimentos = _copiar(
+        dados[MovimentoStock], destino, {'embalagem_id': embalagens, 'consumo_id': consumos},
+    )
+    return sum(map(len, (preferencias, medicamentos, embalagens, consumos, diarios, movimentos)))
+
+
+def apagar_dados(utilizador_id, alias):
+    """
+    Apaga os dados do utilizador em 'alias' (sem mexer nos totais diários
+    pelos signals: também são apagados).
+    """
+    from .historico import suspender_actualizacao
+    from .models import (
+        AlertSnapshot, Consumo, ConsumoDiario, Embalagem, Medicamento, MovimentoStock, Preferencias,
+        SnapshotStock,
+    )
+    with usar_particao(alias), suspender_actualizacao(), transaction.atomic(using=alias):
+        embalagens = Embalagem.objects.using(alias).filter(utilizador_id=utilizador_id)
+        SnapshotStock.objects.using(alias).filter(embalagem_id__in=embalagens.values('pk')).delete()
+        MovimentoStock.objects.using(alias).filter(utilizador_id=utilizador_id).delete()
+        Consumo.objects.using(alias).filter(embalagem__utilizador_id=utilizador_id).delete()
+        ConsumoDiario.objects.using(alias).filter(utilizador_id=utilizador_id).delete()
+        AlertSnapshot.objects.using(alias).filter(utilizador_id=utilizador_id).delete()
+        embalagens.delete()
+        Medicamento.objects.using(alias).filter(utilizador_id=utilizador_id).delete()
+        Preferencias.objects.using(alias).filter(utilizador_id=utilizador_id).delete()
+        if alias != DEFAULT_DB_ALIAS:
+            # Sem o Collector: as cascatas do User incluem tabelas que só
+            # existem na 'default' (os dados da partição já foram apagados)
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {User._meta.db_table} WHERE id = %s', [utilizador_id])
+
+
+def bloquear_escritas(alias):
+    """
+    Pede já o lock de escrita de 'alias' na transacção em curso, mesmo
+    com BEGIN DEFERRED: até ao fim da transacção, as escritas dos outros
+    processos nesse ficheiro esperam (busy_timeout) ou falham com
+    "database is locked". As leituras continuam.
+    """
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'UPDATE {User._meta.db_table} SET id = id WHERE 0')
+
+
+def mover_utilizador(utilizador_id, destino):
+    """
+    Move os dados de um utilizador para a base de dados 'destino':
+    copia-os, confirma que a cópia tem as mesmas linhas, muda a partição
+    registada e só então os apaga da origem. Se for interrompida, pode
+    ser repetida (começa por limpar o destino). Devolve as linhas copiadas.
+
+    Da cópia ao apagar, a origem fica numa transacção com o lock de
+    escrita (bloquear_escritas): uma escrita do utilizador durante a
+    mudança espera por ela ou falha, em vez de ir para dados que já
+    foram copiados e vão ser apagados. Com o mesmo lock, as escritas dos
+    outros utilizadores da origem também esperam: correr com pouco
+    movimento (ex: de madrugada). Se as linhas não baterem certo, levanta
+    MudancaIncompleta e nada muda.
+    """
+    from .caches import incrementar_versao, invalidar_alertas
+    from .models import ParticaoUtilizador
+    origem = _localizacao(utilizador_id)
+    if origem == destino:
+        return 0
+
+    user = User.objects.using(DEFAULT_DB_ALIAS).get(pk=utilizador_id)
+    apagar_dados(utilizador_id, destino)
+    replicar_utilizador(user, destino)
+
+    with transaction.atomic(using=origem):
+        bloquear_escritas(origem)
+        with transaction.atomic(using=destino):
+            copiadas = copiar_dados(utilizador_id, origem, destino)
+            na_origem = contar_dados(utilizador_id, origem)
+            no_destino = contar_dados(utilizador_id, destino)
+            if na_origem != no_destino:
+                raise MudancaIncompleta(
+                    f'Utilizador {utilizador_id}: {na_origem} em {origem}, {no_destino} em {destino}.'
+                )
+
+        if destino == DEFAULT_DB_ALIAS:
+            ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).filter(utilizador_id=utilizador_id).delete()
+        else:
+            ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                utilizador_id=utilizador_id, defaults={'base_de_dados': destino}
+            )
+        apagar_dados(utilizador_id, origem)
+
+    # Nova versão dos dados: ETags, cópia de leitura e sino deixam de usar o que tinham
+    incrementar_versao(utilizador_id)
+    invalidar_alertas(utilizador_id)
+    return copiadas
+
+
+def planear(destino_de=None):
+    """
+    Lista (utilizador_id, origem, destino) dos utilizadores que não estão
+    na base de dados onde deviam estar (por defeito, a do hash).
+    """
+    destino_de = destino_de or particao_por_hash
+    from .models import ParticaoUtilizador
+    localizacoes = dict(ParticaoUtilizador.objects.using(DEFAULT_DB_ALIAS).values_list(
+        'utilizador_id', 'base_de_dados'
+    ))
+    plano = []
+    for utilizador_id in User.objects.using(DEFAULT_DB_ALIAS).order_by('pk').values_list('pk', flat=True):
+        origem = localizacoes.get(utilizador_id, DEFAULT_DB_ALIAS)
+        destino = destino_de(utilizador_id)
+        if origem != destino:
+            plano.append((utilizador_id, origem, destino))
+    return plano
@@ -0,0 +1,276 @@
+'''
+DomusShelf - Pesquisa de Texto (SQLite FTS5)
+============================================
+
+Pesquisar com icontains ("LIKE '%termo%'") obriga a base de dados a ler
+o catálogo inteiro em cada tecla que o utilizador carrega. Aqui usamos
+índices de texto completo do SQLite (FTS5):
+
+    pharmacy_medicamento_fts  (nome_comercial, principio_activo)
+    pharmacy_embalagem_fts    (lote)
+
+São tabelas virtuais de "conteúdo externo": o texto fica só nas tabelas
+normais e o índice guarda apenas os termos, apontando para o id (rowid).
+Mantêm-se actualizadas por triggers na própria base de dados, por isso
+funcionam também com bulk_create, .update() e a importação em massa
+(que não disparam os signals do Django).
+
+Tokenização:
+    unicode61 remove_diacritics 2 — ignora maiúsculas e acentos
+    ("ácido" encontra "acido"), adequado ao português.
+    prefix '2 3' — índices de prefixo para a pesquisa enquanto se escreve.
+
+Cada palavra pesquisada é tratada como prefixo ("parac" encontra
+"Paracetamol") e todas têm de aparecer. Os resultados são ordenados por
+relevância (BM25), dando mais peso ao nome comercial.
+
+Noutras bases de dados (ou num SQLite sem FTS5) as funções recorrem a
+icontains: continuam a funcionar, mas sem o índice e sem ignorar acentos.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import re
+import sqlite3
+from functools import lru_cache
+
+from django.db import connection, connections, router
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Medicamento
+
+
+# Número de sugestões devolvidas à pesquisa enquanto se escreve
+LIMITE_SUGESTOES = 10
+
+# Pesos do BM25 por coluna (nome_comercial, principio_activo)
+PESOS_MEDICAMENTO = (10.0, 5.0)
+
+TOKENIZADOR = "unicode61 remove_diacritics 2"
+
+# Para cada índice: tabela de origem e colunas indexadas
+INDICES_FTS = {
+    'pharmacy_medicamento_fts': ('pharmacy_medicamento', ('nome_comercial', 'principio_activo')),
+    'pharmacy_embalagem_fts': ('pharmacy_embalagem', ('lote',)),
+}
+
+
+# ==================== INSTALAÇÃO ====================
+
+def _sql_indice(indice, tabela, colunas):
+    """Comandos SQL que criam a tabela virtual e os triggers de um índice."""
+    lista = ', '.join(colunas)
+    novos = ', '.join(f'new.{coluna}' for coluna in colunas)
+    antigos = ', '.join(f'old.{coluna}' for coluna in colunas)
+
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {indice} USING fts5("
+        f"{lista}, content='{tabela}', content_rowid='id', "
+        f"tokenize='{TOKENIZADOR}', prefix='2 3')",
+
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {indice}(rowid, {lista}) VALUES (new.id, {novos}); END",
+
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"INSERT INTO {indice}({indice}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); END",
+
+        # Só quando mudam as colunas indexadas (não em cada consumo, que
+        # actualiza a quantidade_actual da embalagem)
+        f"CREATE TRIGGER IF NOT EXISTS {indice}_au AFTER UPDATE OF {lista} ON {tabela} BEGIN "
+        f"INSERT INTO {indice}({indice}, rowid, {lista}) VALUES ('delete', old.id, {antigos}); "
+        f"INSERT INTO {indice}(rowid, {lista}) VALUES (new.id, {novos}); END",
+    ]
+
+
+@lru_cache(maxsize=None)
+def _sqlite_tem_fts5():
+    """A biblioteca SQLite deste processo foi compilada com FTS5? (verificado uma vez)"""
+    with sqlite3.connect(':memory:') as ligacao:
+        return bool(ligacao.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')").fetchone()[0])
+
+
+def _suporta_fts(ligacao):
+    """A base de dados é SQLite com o módulo FTS5 (pode ter os índices)?"""
+    return ligacao.vendor == 'sqlite' and _sqlite_tem_fts5()
+
+
+# Bases de dados ((alias, ficheiro)) onde os índices já foram encontrados
+_com_indices = set()
+
+
+def fts_disponivel(ligacao=None):
+    """
+    True se a base de dados é SQLite, tem o módulo FTS5 e tem os índices
+    instalados. Com partições, cada uma é verificada na sua ligação: uma
+    partição migrada sem FTS5 usa o icontains. Uma base de dados com os
+    índices fica memorizada; sem eles, é verificada de cada vez (o
+    próximo migrate pode instalá-los).
+    """
+    ligacao = ligacao or connection
+    if not _suporta_fts(ligacao):
+        return False
+    chave = (ligacao.alias, str(ligacao.settings_dict['NAME']))
+    if chave in _com_indices:
+        return True
+    with ligacao.cursor() as cursor:
+        existentes = set(ligacao.introspection.table_names(cursor))
+    if existentes.issuperset(INDICES_FTS):
+        _com_indices.add(chave)
+        return True
+    return False
+
+
+def _fts_do_queryset(queryset):
+    """fts_disponivel() na base de dados de onde o queryset vai ler."""
+    return fts_disponivel(connections[queryset.db])
+
+
+def instalar_fts(ligacao=None):
+    """
+    Cria os índices e os triggers que faltarem e reconstrói os índices
+    acabados de criar. Pode ser chamada várias vezes.
+
+    Chamada pela migração 0005 e depois de cada migrate: quando uma
+    migração altera uma destas tabelas, o SQLite recria-a e os triggers
+    perdem-se (os índices continuam válidos, porque os ids se mantêm).
+    """
+    ligacao = ligacao or connection
+    if not _suporta_fts(ligacao):
+        return
+
+    with ligacao.cursor() as cursor:
+        existentes = set(ligacao.introspection.table_names(cursor))
+        for indice, (tabela, colunas) in INDICES_FTS.items():
+            if tabela not in existentes:
+                continue
+            for sql in _sql_indice(indice, tabela, colunas):
+                cursor.execute(sql)
+            if indice not in existentes:
+                cursor.execute(f"INSERT INTO {indice}({indice}) VALUES ('rebuild')")
+
+
+def remover_fts(ligacao=None):
+    """Remove os índices e os triggers (reverter a migração)."""
+    ligacao = ligacao or connection
+    if ligacao.vendor != 'sqlite':
+        return
+
+    _com_indices.discard((ligacao.alias, str(ligacao.settings_dict['NAME'])))
+    with ligacao.cursor() as cursor:
+        for indice in INDICES_FTS:
+            for sufixo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {indice}_{sufixo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {indice}')
+
+
+# ==================== CONSULTAS ====================
+
+def termos(texto):
+    """Separa o texto pesquisado em palavras (letras e algarismos)."""
+    return re.findall(r'\w+', texto or '')
+
+
+def expressao_fts(texto):
+    """
+    Converte o texto do utilizador numa expressão MATCH do FTS5:
+    cada palavra entre aspas (para não ser lida como operador) e como
+    prefixo. Ex: 'ácido acet' -> '"ácido"* "acet"*'
+    """
+    return ' '.join(f'"{termo}"*' for termo in termos(texto))
+
+
+def _filtro_icontains(campos, texto):
+    """Alternativa sem FTS5: todas as palavras têm de aparecer num dos campos."""
+    filtro = Q()
+    for termo in termos(texto):
+        filtro &= Q(*[Q(**{f'{campo}__icontains': termo}) for campo in campos], _connector=Q.OR)
+    return filtro
+
+
+def _ids_fts(indice, expressao):
+    """Subquery com os ids que correspondem à expressão (para pk__in)."""
+    return RawSQL(f'SELECT rowid FROM {indice} WHERE {indice} MATCH %s', [expressao])
+
+
+def filtrar_medicamentos(queryset, texto):
+    """
+    Restringe um queryset de Medicamento aos que correspondem ao texto
+    (por nome comercial ou princípio activo). Mantém a ordenação do queryset.
+    """
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return queryset.none()
+    if not _fts_do_queryset(queryset):
+        return queryset.filter(_filtro_icontains(('nome_comercial', 'principio_activo'), texto))
+    return queryset.filter(pk__in=_ids_fts('pharmacy_medicamento_fts', expressao))
+
+
+def anotar_relevancia(queryset, texto):
+    """
+    Acrescenta a um queryset de Medicamento a anotação 'relevancia': o
+    BM25 do texto pesquisado, em que os valores mais baixos são os mais
+    relevantes (ordenar de forma ascendente). Sem FTS5 é 0 para todos.
+    """
+    expressao = expressao_fts(texto)
+    if not expressao or not _fts_do_queryset(queryset):
+        return queryset.annotate(relevancia=Value(0.0, output_field=FloatField()))
+    return queryset.annotate(relevancia=RawSQL(
+        'SELECT bm25(pharmacy_medicamento_fts, %s, %s) FROM pharmacy_medicamento_fts '
+        'WHERE pharmacy_medicamento_fts MATCH %s AND rowid = pharmacy_medicamento.id',
+        [*PESOS_MEDICAMENTO, expressao],
+        output_field=FloatField(),
+    ))
+
+
+def filtrar_embalagens(queryset, texto):
+    """
+    Restringe um queryset de Embalagem às que correspondem ao texto,
+    pelo lote ou pelo nome / princípio activo do medicamento.
+    """
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return queryset.none()
+    if not _fts_do_queryset(queryset):
+        return queryset.filter(_filtro_icontains(
+            ('lote', 'medicamento__nome_comercial', 'medicamento__principio_activo'), texto
+        ))
+    return queryset.filter(
+        Q(pk__in=_ids_fts('pharmacy_embalagem_fts', expressao))
+        | Q(medicamento_id__in=_ids_fts('pharmacy_medicamento_fts', expressao))
+    )
+
+
+def pesquisar_medicamentos(user, texto, limite=LIMITE_SUGESTOES):
+    """
+    Medicamentos do utilizador que correspondem ao texto, dos mais
+    relevantes para os menos (BM25). Devolve uma lista de dicionários
+    com id, nome_comercial, principio_activo e forma_farmaceutica.
+    """
+    campos = ('id', 'nome_comercial', 'principio_activo', 'forma_farmaceutica')
+    expressao = expressao_fts(texto)
+    if not expressao:
+        return []
+
+    # A base de dados (partição do utilizador) vem do router
+    ligacao = connections[router.db_for_read(Medicamento, instance=user)]
+    if not fts_disponivel(ligacao):
+        return list(
+            filtrar_medicamentos(Medicamento.objects.using(ligacao.alias).filter(utilizador=user), texto)
+            .order_by('nome_comercial', 'id').values(*campos)[:limite]
+        )
+
+    # O filtro por utilizador entra na própria query do índice, para que o
+    # LIMIT se aplique só aos medicamentos deste utilizador
+    sql = (
+        'SELECT m.id, m.nome_comercial, m.principio_activo, m.forma_farmaceutica '
+        'FROM pharmacy_medicamento_fts AS f '
+        'JOIN pharmacy_medicamento AS m ON m.id = f.rowid '
+        'WHERE pharmacy_medicamento_fts MATCH %s AND m.utilizador_id = %s '
+        'ORDER BY bm25(pharmacy_medicamento_fts, %s, %s), m.nome_comercial '
+        'LIMIT %s'
+    )
+    with ligacao.cursor() as cursor:
+        cursor.execute(sql, [expressao, user.pk, *PESOS_MEDICAMENTO, limite])
+        return [dict(zip(campos, linha)) for linha in cursor.fetchall()]
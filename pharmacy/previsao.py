@@ -0,0 +1,233 @@
+'''
+DomusShelf - Previsão de Fim de Stock
+=====================================
+
+Estima, para cada medicamento, quando acaba o stock ao ritmo a que tem
+sido consumido, e que embalagens vão expirar antes de serem gastas.
+
+Taxa de consumo (unidades por dia), a partir dos totais diários de
+consumo (ConsumoDiario, ver historico.py) dos últimos JANELA_DIAS dias:
+- média móvel dos últimos DIAS_MEDIA_MOVEL dias;
+- média exponencial (EWMA), que dá mais peso aos dias recentes e por
+  isso reage mais depressa a mudanças de ritmo. É a usada na previsão.
+Num medicamento com menos histórico do que a janela, as médias contam
+só os dias desde o primeiro consumo (para não o diluir em zeros).
+
+Previsão, com as embalagens com stock e dentro da validade gastas por
+ordem FEFO a essa taxa:
+- a embalagem é consumida até à sua validade; o que sobrar nesse dia
+  é desperdício (a embalagem fica "em risco");
+- o stock acaba quando se gastar o stock utilizável (total - desperdício).
+
+Tudo é calculado em lote para muitos utilizadores de uma vez: uma query
+para os totais diários, outra para as embalagens, e as
+contas em NumPy sobre matrizes (uma linha por medicamento, uma coluna
+por dia), sem ciclos em Python por medicamento.
+
+Usado pelo comando "manage.py forecast_depletion" e pela API.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .historico import totais_por_dia
+from .models import Embalagem
+
+
+# Dias de histórico considerados
+JANELA_DIAS = 90
+
+# Dias da média móvel simples
+DIAS_MEDIA_MOVEL = 28
+
+# "Span" da média exponencial: alpha = 2 / (span + 1)
+SPAN_EWMA = 14
+
+# Número de utilizadores por lote no cálculo em massa
+TAMANHO_LOTE = 2000
+
+# Margem para erros de arredondamento nas contas em vírgula flutuante
+EPSILON = 1e-6
+
+
+class PrevisaoMedicamento:
+    """
+    Previsão de um medicamento.
+
+    Atributos:
+        taxa_media / taxa_ewma: unidades consumidas por dia
+        stock: unidades em embalagens com stock e dentro da validade
+        stock_utilizavel: o que se consegue gastar antes das validades
+        data_fim: dia em que o stock acaba (None se não há consumo)
+        embalagens_em_risco: lista de (embalagem_id, data_validade,
+            unidades que vão sobrar) das que expiram antes de gastas
+    """
+
+    def __init__(self, medicamento_id, utilizador_id):
+        self.medicamento_id = medicamento_id
+        self.utilizador_id = utilizador_id
+        self.taxa_media = 0.0
+        self.taxa_ewma = 0.0
+        self.stock = 0
+        self.stock_utilizavel = 0.0
+        self.data_fim = None
+        self.embalagens_em_risco = []
+
+    def como_dict(self):
+        """Representação simples (para JSON)."""
+        return {
+            'medicamento_id': self.medicamento_id,
+            'taxa_media': round(self.taxa_media, 3),
+            'taxa_ewma': round(self.taxa_ewma, 3),
+            'stock': self.stock,
+            'stock_utilizavel': round(self.stock_utilizavel, 1),
+            'data_fim': self.data_fim,
+            'embalagens_em_risco': [
+                {'embalagem_id': pk, 'data_validade': validade, 'sobra': round(sobra, 1)}
+                for pk, validade, sobra in self.embalagens_em_risco
+            ],
+        }
+
+
+def _taxas(matriz, janela):
+    """
+    Taxas de consumo por linha (medicamento) de uma matriz medicamentos x dias
+    (a última coluna é o dia mais recente). Devolve (media_movel, ewma).
+    """
+    tem_consumo = matriz > 0
+    # Dias observados: desde o primeiro consumo até hoje (0 se nunca houve)
+    primeiro = np.where(tem_consumo.any(axis=1), tem_consumo.argmax(axis=1), janela)
+    observados = janela - primeiro
+
+    dias_media = np.minimum(observados, DIAS_MEDIA_MOVEL)
+    soma_recente = matriz[:, -DIAS_MEDIA_MOVEL:].sum(axis=1)
+    media = np.divide(soma_recente, dias_media, out=np.zeros(len(matriz)), where=dias_media > 0)
+
+    # EWMA: peso alpha * (1 - alpha)^k para o dia k antes de hoje,
+    # normalizado pela soma dos pesos dos dias observados
+    alpha = 2 / (SPAN_EWMA + 1)
+    pesos = alpha * (1 - alpha) ** np.arange(janela)[::-1]
+    normalizacao = 1 - (1 - alpha) ** observados
+    ewma = np.divide(matriz @ pesos, normalizacao, out=np.zeros(len(matriz)), where=observados > 0)
+
+    return media, ewma
+
+
+def _minimo_acumulado_por_grupo(valores, linhas, posicoes, n_grupos):
+    """
+    Mínimo acumulado de 'valores' dentro de cada grupo (medicamento).
+    Os valores são colocados numa matriz grupos x posição (o resto fica
+    a +infinito) para usar np.minimum.accumulate ao longo de cada linha.
+    """
+    matriz = np.full((n_grupos, posicoes.max() + 1), np.inf)
+    matriz[linhas, posicoes] = valores
+    return np.minimum.accumulate(matriz, axis=1)[linhas, posicoes]
+
+
+def prever(utilizadores_ids, hoje=None, janela=JANELA_DIAS):
+    """
+    Calcula a previsão de todos os medicamentos (com stock ou com consumos
+    recentes) de um lote de utilizadores. Devolve um dicionário
+    medicamento_id -> PrevisaoMedicamento.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = hoje - timedelta(days=janela - 1)
+    utilizadores_ids = list(utilizadores_ids)
+
+    consumos = list(totais_por_dia(utilizadores_ids, inicio, hoje))
+    embalagens = list(Embalagem.objects.filter(
+        utilizador_id__in=utilizadores_ids,
+        quantidade_actual__gt=0,
+        data_validade__gte=hoje,
+    ).order_by(
+        'medicamento_id', 'data_validade', 'id'
+    ).values_list('medicamento_id', 'utilizador_id', 'id', 'data_validade', 'quantidade_actual'))
+
+    # Índice de linha de cada medicamento nas matrizes
+    previsoes = {}
+    for medicamento_id, utilizador_id, *_ in consumos + embalagens:
+        if medicamento_id not in previsoes:
+            previsoes[medicamento_id] = PrevisaoMedicamento(medicamento_id, utilizador_id)
+    if not previsoes:
+        return {}
+    linha_de = {medicamento_id: i for i, medicamento_id in enumerate(previsoes)}
+
+    # 1. Matriz medicamentos x dias com as quantidades consumidas
+    matriz = np.zeros((len(previsoes), janela))
+    if consumos:
+        linhas = np.fromiter((linha_de[c[0]] for c in consumos), dtype=np.int64, count=len(consumos))
+        colunas = np.fromiter(((c[2] - inicio).days for c in consumos), dtype=np.int64, count=len(consumos))
+        totais = np.fromiter((c[3] for c in consumos), dtype=np.float64, count=len(consumos))
+        np.add.at(matriz, (linhas, colunas), totais)
+
+    media, ewma = _taxas(matriz, janela)
+
+    # 2. Embalagens por ordem FEFO dentro de cada medicamento
+    stock_utilizavel = np.zeros(len(previsoes))
+    stock = np.zeros(len(previsoes))
+    if embalagens:
+        n = len(embalagens)
+        linhas = np.fromiter((linha_de[e[0]] for e in embalagens), dtype=np.int64, count=n)
+        dias_validade = np.fromiter(((e[3] - hoje).days + 1 for e in embalagens), dtype=np.float64, count=n)
+        quantidades = np.fromiter((e[4] for e in embalagens), dtype=np.float64, count=n)
+
+        # Posição de cada embalagem dentro do seu medicamento e stock
+        # acumulado até ela (inclusive), reiniciado em cada medicamento
+        inicio_grupo = np.r_[True, linhas[1:] != linhas[:-1]]
+        indices = np.arange(n)
+        primeira = np.maximum.accumulate(np.where(inicio_grupo, indices, 0))
+        posicoes = indices - primeira
+        acumulado = np.cumsum(quantidades)
+        acumulado -= (acumulado - quantidades)[primeira]
+
+        # Unidades gastas até ao fim de cada embalagem (C): a anterior mais
+        # esta, mas nunca mais do que o consumo até à sua validade (G):
+        #     C[i] = min(C[i-1] + q[i], G[i])
+        # o que equivale a C[i] = acumulado[i] + min(0, mínimo até i de G - acumulado)
+        gasto_ate_validade = ewma[linhas] * dias_validade
+        folga = _minimo_acumulado_por_grupo(
+            gasto_ate_validade - acumulado, linhas, posicoes, len(previsoes)
+        )
+        gasto = acumulado + np.minimum(folga, 0)
+        gasto_antes = np.where(inicio_grupo, 0, np.r_[0, gasto[:-1]])
+        sobra = quantidades - (gasto - gasto_antes)
+        # Sem consumo não há previsão: nenhuma embalagem fica "em risco"
+        sobra[ewma[linhas] <= 0] = 0
+
+        np.add.at(stock, linhas, quantidades)
+        np.add.at(stock_utilizavel, linhas, quantidades - sobra)
+
+        for i in np.flatnonzero(sobra > EPSILON):
+            medicamento_id, _, embalagem_id, data_validade, _ = embalagens[i]
+            previsoes[medicamento_id].embalagens_em_risco.append(
+                (embalagem_id, data_validade, float(sobra[i]))
+            )
+
+    # 3. Dias até acabar o stock utilizável, à taxa EWMA
+    dias_restantes = np.divide(
+        stock_utilizavel, ewma, out=np.full(len(previsoes), np.nan), where=ewma > 0
+    )
+
+    for i, previsao in enumerate(previsoes.values()):
+        previsao.taxa_media = float(media[i])
+        previsao.taxa_ewma = float(ewma[i])
+        previsao.stock = int(stock[i])
+        previsao.stock_utilizavel = float(stock_utilizavel[i])
+        if not np.isnan(dias_restantes[i]):
+            previsao.data_fim = hoje + timedelta(days=int(dias_restantes[i] + EPSILON))
+
+    return previsoes
+
+
+def prever_utilizador(user, hoje=None):
+    """Previsões dos medicamentos de um utilizador, por data de fim de stock."""
+    previsoes = prever([user.pk], hoje=hoje)
+    return sorted(
+        previsoes.values(),
+        key=lambda previsao: (previsao.data_fim is None, previsao.data_fim, previsao.medicamento_id),
+    )
@@ -0,0 +1,86 @@
+'''
+DomusShelf - Router de Bases de Dados
+=====================================
+
+ParticaoRouter: com PHARMACY_PARTICOES, os dados de cada utilizador
+vão para a sua partição (ver particoes.py). Vem primeiro na lista
+DATABASE_ROUTERS; com o modo desligado não decide nada.
+
+LeituraEscritaRouter: escritas sempre na 'default'; leituras na cópia
+só de leitura quando o pedido em curso o permite (ver leitura.py).
+Sem a base de dados "leitura" configurada, tudo fica na 'default'.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+
+from .leitura import ALIAS_LEITURA, alias_para_leitura, registar_escrita
+from .particoes import (
+    bases_dos_dados, e_particionado, particao_actual, particao_do_utilizador, particoes_activas,
+)
+
+
+class ParticaoRouter:
+
+    def _base(self, model, instance=None):
+        if not particoes_activas() or not e_particionado(model):
+            return None
+        if instance is not None:
+            # Objecto já lido (ou a criar para um utilizador): fica onde estão os seus dados
+            if e_particionado(type(instance)):
+                if instance._state.db:
+                    return instance._state.db
+                utilizador_id = getattr(instance, 'utilizador_id', None)
+                if utilizador_id is not None:
+                    return particao_do_utilizador(utilizador_id)
+            elif isinstance(instance, User):
+                # Relações a partir do utilizador (user.medicamentos.all())
+                return particao_do_utilizador(instance.pk)
+        return particao_actual()
+
+    def db_for_read(self, model, **hints):
+        return self._base(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._base(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Cada partição tem a sua cópia da linha do utilizador
+        if particoes_activas():
+            bases = set(bases_dos_dados()) | {ALIAS_LEITURA}
+            if obj1._state.db in bases and obj2._state.db in bases:
+                return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A tabela das partições só existe na 'default', ao lado dos utilizadores
+        if app_label == 'pharmacy' and model_name == 'particaoutilizador':
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class LeituraEscritaRouter:
+
+    def db_for_read(self, model, **hints):
+        return alias_para_leitura()
+
+    def db_for_write(self, model, **hints):
+        registar_escrita()
+        # Explícito: sem isto, guardar um objecto lido da cópia iria para a cópia
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # As duas bases de dados têm os mesmos dados
+        bases = {DEFAULT_DB_ALIAS, ALIAS_LEITURA}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A cópia é o mesmo ficheiro (ou uma cópia dele): nunca é migrada
+        if db == ALIAS_LEITURA:
+            return False
+        return None
@@ -0,0 +1,378 @@
+'''
+DomusShelf - Serviços da Aplicação Pharmacy
+===========================================
+
+Este ficheiro reúne a lógica de negócio partilhada por várias views,
+pelo context processor e pelo admin. Manter estas consultas num único
+sítio evita que cada página repita (e faça divergir) os mesmos cálculos.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import CharField, Count, DateField, F, Func, Max, Q, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+from .models import Medicamento, Embalagem, Consumo, Preferencias, MovimentoStock
+from .movimentos import registar_movimento
+from .particoes import particao_actual
+
+
+class StockInsuficiente(Exception):
+    """
+    A embalagem não tem stock suficiente para o consumo pedido.
+    Acontece quando outro pedido consumiu entretanto a mesma embalagem.
+    """
+
+
+# Valor usado quando o utilizador ainda não configurou as preferências
+DIAS_ALERTA_POR_DEFEITO = 30
+
+
+def expressao_dias_alerta(user):
+    """
+    Os dias de alerta do utilizador como expressão SQL (subquery às
+    preferências, com o valor por defeito), para entrarem noutra query.
+    """
+    return Coalesce(
+        Subquery(Preferencias.objects.filter(utilizador=user).values('dias_alerta_antes')[:1]),
+        Value(DIAS_ALERTA_POR_DEFEITO),
+    )
+
+
+class SomarDias(Func):
+    """DATE(data, 'N days') do SQLite: a data mais N dias, N vindo de outra expressão."""
+
+    function = 'DATE'
+    output_field = DateField()
+
+    def __init__(self, data, dias, **extra):
+        super().__init__(data, Concat(dias, Value(' days'), output_field=CharField()), **extra)
+
+
+class StockSummary:
+    """
+    Resumo do estado da farmácia de um utilizador.
+
+    Todas as contagens (medicamentos, embalagens activas, expiradas e a
+    expirar) e os dias de alerta das preferências são obtidos numa única
+    query com agregação condicional (Count com filter=Q(...)) e uma
+    subquery às preferências, em vez de uma query por número.
+
+    Uso:
+        resumo = StockSummary.para_utilizador(request.user)
+        resumo.expiradas, resumo.a_expirar, resumo.total_alertas
+    """
+
+    def __init__(self, user, dias_alerta=None, hoje=None):
+        self.user = user
+        self.hoje = hoje or timezone.localdate()
+        self.definir_dias_alerta(dias_alerta)
+
+        self.total_medicamentos = 0
+        self.total_embalagens = 0
+        self.expiradas = 0
+        self.a_expirar = 0
+
+    def definir_dias_alerta(self, dias_alerta):
+        self.dias_alerta = dias_alerta
+        self.data_limite = None if dias_alerta is None else self.hoje + timedelta(days=dias_alerta)
+
+    @classmethod
+    def para_utilizador(cls, user, hoje=None):
+        """Constrói o resumo completo de um utilizador (uma query)."""
+        resumo = cls(user, hoje=hoje)
+        resumo.calcular()
+        return resumo
+
+    @classmethod
+    async def apara_utilizador(cls, user, hoje=None):
+        """Versão async de para_utilizador (a mesma query)."""
+        resumo = cls(user, hoje=hoje)
+        await resumo.acalcular()
+        return resumo
+
+    def calcular(self):
+        """
+        Executa a query agregada e preenche os atributos do resumo.
+
+        Partimos do Medicamento com um LEFT JOIN às embalagens, para que o
+        número de medicamentos e as contagens de stock saiam juntos.
+        (É a única consulta de stock que precisa do JOIN, porque também
+        conta medicamentos sem embalagens.) Sem dias de alerta definidos,
+        o fim do período de alerta é calculado na própria query.
+        """
+        return self._preencher(self._medicamentos().aggregate(**self._agregacoes()))
+
+    async def acalcular(self):
+        """Versão async de calcular."""
+        return self._preencher(await self._medicamentos().aaggregate(**self._agregacoes()))
+
+    def _medicamentos(self):
+        return Medicamento.objects.filter(utilizador=self.user)
+
+    def _agregacoes(self):
+        com_stock = Q(embalagens__quantidade_actual__gt=0)
+        agregacoes = {}
+        if self.dias_alerta is None:
+            dias = expressao_dias_alerta(self.user)
+            data_limite = SomarDias(Value(self.hoje), dias)
+            # Sem medicamentos não há linhas e o MAX é NULL: o Coalesce
+            # volta a ler a subquery (uma agregação sem GROUP BY devolve
+            # sempre uma linha)
+            agregacoes['dias_alerta'] = Coalesce(Max(dias), dias)
+        else:
+            data_limite = self.data_limite
+        return dict(
+            agregacoes,
+            total_medicamentos=Count('id', distinct=True),
+            total_embalagens=Count('embalagens', filter=com_stock),
+            expiradas=Count(
+                'embalagens',
+                filter=com_stock & Q(embalagens__data_validade__lt=self.hoje),
+            ),
+            a_expirar=Count(
+                'embalagens',
+                filter=com_stock & Q(
+                    embalagens__data_validade__gte=self.hoje,
+                    embalagens__data_validade__lte=data_limite,
+                ),
+            ),
+        )
+
+    def _preencher(self, totais):
+        if 'dias_alerta' in totais:
+            self.definir_dias_alerta(totais['dias_alerta'])
+        self.total_medicamentos = totais['total_medicamentos']
+        self.total_embalagens = totais['total_embalagens']
+        self.expiradas = totais['expiradas']
+        self.a_expirar = totais['a_expirar']
+        return self
+
+    @property
+    def total_alertas(self):
+        """Número de embalagens que aparecem no sino (expiradas + a expirar)."""
+        return self.expiradas + self.a_expirar
+
+    def embalagens_com_stock(self):
+        """Queryset base: embalagens do utilizador que ainda têm stock."""
+        return Embalagem.objects.filter(
+            utilizador=self.user,
+            quantidade_actual__gt=0
+        )
+
+    def embalagens_expiradas(self):
+        """Embalagens com stock cuja validade já passou (FEFO)."""
+        return self.embalagens_com_stock().filter(
+            data_validade__lt=self.hoje
+        ).select_related('medicamento').order_by('data_validade')
+
+    def embalagens_a_expirar(self):
+        """Embalagens com stock que expiram dentro do período de alerta (FEFO)."""
+        return self.embalagens_com_stock().filter(
+            data_validade__gte=self.hoje,
+            data_validade__lte=self.data_limite
+        ).select_related('medicamento').order_by('data_validade')
+
+    def calcular_alertas(self):
+        """
+        Calcula apenas as contagens de alertas (expiradas e a expirar),
+        sem o resto do resumo. É a versão mais leve, usada pelo sino.
+        Continua a ser uma única query com agregação condicional.
+        """
+        totais = self.embalagens_com_stock().filter(
+            data_validade__lte=self.data_limite
+        ).aggregate(
+            expiradas=Count('id', filter=Q(data_validade__lt=self.hoje)),
+            a_expirar=Count('id', filter=Q(data_validade__gte=self.hoje)),
+        )
+
+        self.expiradas = totais['expiradas']
+        self.a_expirar = totais['a_expirar']
+        return self
+
+
+def registar_consumo(embalagem, quantidade, observacoes='', data_hora=None):
+    """
+    Regista um consumo e desconta o stock da embalagem, de forma atómica.
+
+    Em vez de ler a quantidade, subtrair em Python e gravar a embalagem
+    inteira (o que perde actualizações quando dois pedidos chegam ao
+    mesmo tempo), o desconto é um único UPDATE condicional:
+
+        UPDATE ... SET quantidade_actual = quantidade_actual - n
+        WHERE id = ... AND quantidade_actual >= n
+
+    Se nenhuma linha for alterada, não havia stock e é lançado
+    StockInsuficiente. O Consumo (e o respectivo movimento de stock) é
+    guardado na mesma transacção, por isso ou fica tudo registado, ou nada.
+    """
+    with transaction.atomic(using=particao_actual()):
+        actualizadas = Embalagem.objects.filter(
+            pk=embalagem.pk,
+            quantidade_actual__gte=quantidade
+        ).update(quantidade_actual=F('quantidade_actual') - quantidade)
+
+        if not actualizadas:
+            disponivel = Embalagem.objects.filter(
+                pk=embalagem.pk
+            ).values_list('quantidade_actual', flat=True).first() or 0
+            raise StockInsuficiente(
+                f'Quantidade indisponível. Esta embalagem tem apenas '
+                f'{disponivel} {embalagem.unidade} disponíveis.'
+            )
+
+        consumo = Consumo.objects.create(
+            embalagem=embalagem,
+            quantidade=quantidade,
+            observacoes=observacoes,
+            data_hora=data_hora or timezone.now(),
+        )
+        registar_movimento(embalagem, MovimentoStock.CONSUMO, -quantidade, consumo=consumo)
+
+    return consumo
+
+
+def consumir_por_medicamento(medicamento, quantidade, observacoes='', data_hora=None, hoje=None):
+    """
+    Consome uma quantidade de um medicamento repartindo-a pelas embalagens
+    segundo o princípio FEFO (First Expired, First Out).
+
+    1. Uma única query ordenada (data_validade, id) devolve apenas as
+       embalagens necessárias: um Window(Sum) calcula o stock acumulado e
+       só entram as embalagens cujo acumulado anterior ainda não cobre
+       a quantidade pedida. Embalagens expiradas ou vazias ficam de fora.
+    2. Um percurso pela soma acumulada decide quanto tirar de cada uma.
+    3. Cada desconto é um UPDATE condicional (como em registar_consumo),
+       e é criado um Consumo por embalagem usada.
+
+    Tudo corre numa transacção: se alguma embalagem tiver sido consumida
+    entretanto por outro pedido, nada fica registado e é lançado
+    StockInsuficiente. Devolve a lista de consumos criados.
+    """
+    hoje = hoje or timezone.localdate()
+    data_hora = data_hora or timezone.now()
+
+    with transaction.atomic(using=particao_actual()):
+        stock_acumulado = Window(
+            Sum('quantidade_actual'),
+            order_by=[F('data_validade').asc(), F('id').asc()],
+        )
+        candidatas = Embalagem.objects.filter(
+            medicamento=medicamento,
+            quantidade_actual__gt=0,
+            data_validade__gte=hoje,
+        ).annotate(
+            acumulado_anterior=stock_acumulado - F('quantidade_actual')
+        ).filter(
+            acumulado_anterior__lt=quantidade
+        ).only(
+            'id', 'utilizador_id', 'medicamento_id', 'quantidade_actual', 'unidade'
+        ).order_by('data_validade', 'id')
+
+        alocacao = []
+        em_falta = quantidade
+        for embalagem in candidatas:
+            parte = min(embalagem.quantidade_actual, em_falta)
+            alocacao.append((embalagem, parte))
+            em_falta -= parte
+
+        if em_falta > 0:
+            raise StockInsuficiente(
+                f'Quantidade indisponível. Existem apenas {quantidade - em_falta} '
+                f'unidades de {medicamento.nome_comercial} dentro da validade.'
+            )
+
+        consumos = []
+        for embalagem, parte in alocacao:
+            actualizadas = Embalagem.objects.filter(
+                pk=embalagem.pk,
+                quantidade_actual__gte=parte
+            ).update(quantidade_actual=F('quantidade_actual') - parte)
+
+            if not actualizadas:
+                # Outro pedido mexeu nesta embalagem: desfaz tudo (rollback)
+                raise StockInsuficiente(
+                    'O stock foi alterado por outro registo. Tente novamente.'
+                )
+
+            consumo = Consumo.objects.create(
+                embalagem=embalagem,
+                quantidade=parte,
+                observacoes=observacoes,
+                data_hora=data_hora,
+            )
+            registar_movimento(embalagem, MovimentoStock.CONSUMO, -parte, consumo=consumo)
+            consumos.append(consumo)
+
+    return consumos
+
+
+def criar_embalagem(embalagem):
+    """
+    Grava uma embalagem nova, cheia (quantidade actual = inicial), e a
+    entrada correspondente no registo de movimentos.
+    """
+    with transaction.atomic(using=particao_actual()):
+        embalagem.quantidade_actual = embalagem.quantidade_inicial
+        embalagem.save()
+        registar_movimento(embalagem, MovimentoStock.ENTRADA, embalagem.quantidade_actual)
+    return embalagem
+
+
+def editar_embalagem(embalagem):
+    """
+    Grava as alterações de uma embalagem vinda do formulário de edição.
+
+    A quantidade actual não vem do formulário: é lida da base de dados
+    (pode ter havido consumos entretanto). Se a quantidade inicial mudou,
+    a actual muda na mesma medida (sem ficar negativa) e fica registado
+    um ajuste com a diferença.
+    """
+    with transaction.atomic(using=particao_actual()):
+        inicial, actual = Embalagem.objects.select_for_update().filter(
+            pk=embalagem.pk
+        ).values_list('quantidade_inicial', 'quantidade_actual').get()
+
+        ajuste = max(embalagem.quantidade_inicial - inicial, -actual)
+        embalagem.quantidade_actual = actual + ajuste
+        embalagem.save()
+
+        if ajuste:
+            registar_movimento(
+                embalagem, MovimentoStock.AJUSTE, ajuste,
+                observacoes=f'Quantidade inicial alterada de {inicial} para {embalagem.quantidade_inicial}.',
+            )
+    return embalagem
+
+
+def abater_embalagens(embalagens, observacoes=''):
+    """
+    Retira todo o stock que resta nas embalagens (queryset), sem consumo:
+    um movimento de abate por embalagem com stock e quantidade_actual = 0.
+    Chamada antes de eliminar embalagens (ou o medicamento), para que o
+    registo de movimentos das embalagens eliminadas feche a zero.
+    """
+    with transaction.atomic(using=particao_actual()):
+        com_stock = list(embalagens.filter(
+            quantidade_actual__gt=0
+        ).select_for_update().only('id', 'utilizador_id', 'quantidade_actual'))
+
+        MovimentoStock.objects.bulk_create([
+            MovimentoStock(
+                utilizador_id=embalagem.utilizador_id,
+                embalagem_id=embalagem.pk,
+                tipo=MovimentoStock.ABATE,
+                quantidade=-embalagem.quantidade_actual,
+                observacoes=observacoes,
+            )
+            for embalagem in com_stock
+        ])
+        Embalagem.objects.filter(
+            pk__in=[embalagem.pk for embalagem in com_stock]
+        ).update(quantidade_actual=0)
+    return len(com_stock)
@@ -0,0 +1,254 @@
+'''
+DomusShelf - Benchmark WSGI vs ASGI
+===================================
+
+Compara o débito (pedidos por segundo) e a latência das páginas de
+consulta (dashboard, catálogo, stock e alertas) servidas de três modos:
+
+    wsgi:        WSGIHandler com uma thread por pedido em curso
+                 (como um gunicorn com threads), views síncronas
+    asgi:        ASGIHandler num ciclo de eventos (como o uvicorn), com
+                 as views síncronas (cada pedido passa por uma thread)
+    asgi_async:  ASGIHandler com as views async de views_async.py
+
+Os handlers são chamados directamente, sem servidor nem rede, com os
+pedidos que um servidor lhes passaria (environ WSGI / scope ASGI), para
+medir só o Django e a aplicação. Cada cliente em paralelo entra com a
+sessão de um agregado sintético diferente.
+
+Cada modo corre num processo à parte ("manage.py benchmark_asgi" chama-se
+a si próprio), porque a escolha das views é feita ao carregar os URLs
+(PHARMACY_VIEWS_ASSINCRONAS). Todos usam a mesma base de dados nova,
+num ficheiro temporário com o perfil de produção (ver concorrencia.py).
+
+Nota: no Django 4.2 o ORM async ainda corre as queries numa thread
+(sync_to_async), por isso o ganho das views async vem de não ocupar uma
+thread durante todo o pedido, e não de queries em paralelo.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.test import Client
+
+from .benchmarks import AQUECIMENTO, percentil
+from .concorrencia import _trocar_bases, base_de_dados_temporaria
+from .sintetico import gerar
+
+
+MODOS = ('wsgi', 'asgi', 'asgi_async')
+
+# Páginas pedidas por cada cliente, à vez
+URLS = [
+    '/',
+    '/medicamentos/',
+    '/medicamentos/stock/',
+    '/medicamentos/alertas/',
+]
+
+
+def _cookie(sessao):
+    return f'{settings.SESSION_COOKIE_NAME}={sessao}'
+
+
+def _pedido_wsgi(handler, url, sessao):
+    """Faz um pedido GET ao WSGIHandler e devolve o código de estado."""
+    estado = []
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': url,
+        'QUERY_STRING': '',
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': _cookie(sessao),
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    resposta = handler(environ, lambda status, cabecalhos: estado.append(status))
+    try:
+        b''.join(resposta)
+    finally:
+        # Dispara o request_finished (fecha as ligações, como um servidor)
+        resposta.close()
+    return int(estado[0].split()[0])
+
+
+async def _pedido_asgi(handler, url, sessao):
+    """Faz um pedido GET ao ASGIHandler e devolve o código de estado."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': url,
+        'raw_path': url.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'cookie', _cookie(sessao).encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    estado = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(mensagem):
+        if mensagem['type'] == 'http.response.start':
+            estado.append(mensagem['status'])
+
+    await handler(scope, receive, send)
+    return estado[0]
+
+
+def _medir_wsgi(sessoes, duracao):
+    """Uma thread por cliente, a fazer pedidos até acabar o tempo."""
+    handler = WSGIHandler()
+    partida = threading.Barrier(len(sessoes))
+    tempos = []
+    erros = []
+
+    def cliente(sessao):
+        try:
+            for url in URLS[:AQUECIMENTO]:
+                _pedido_wsgi(handler, url, sessao)
+            partida.wait()
+            fim = time.perf_counter() + duracao
+            posicao = 0
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                if _pedido_wsgi(handler, URLS[posicao % len(URLS)], sessao) == 200:
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                else:
+                    erros.append(1)
+                posicao += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=cliente, args=(sessao,)) for sessao in sessoes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return tempos, len(erros)
+
+
+async def _medir_asgi(sessoes, duracao):
+    """Uma corrotina por cliente, todas no mesmo ciclo de eventos."""
+    handler = ASGIHandler()
+    tempos = []
+    erros = []
+
+    for url in URLS[:AQUECIMENTO]:
+        await asyncio.gather(*(_pedido_asgi(handler, url, sessao) for sessao in sessoes))
+
+    async def cliente(sessao, fim):
+        posicao = 0
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            if await _pedido_asgi(handler, URLS[posicao % len(URLS)], sessao) == 200:
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            else:
+                erros.append(1)
+            posicao += 1
+
+    fim = time.perf_counter() + duracao
+    await asyncio.gather(*(cliente(sessao, fim) for sessao in sessoes))
+    return tempos, len(erros)
+
+
+def medir_modo(modo, configuracao, sessoes, concorrencias, duracao):
+    """
+    Corre no processo filho: mede o modo com cada número de clientes em
+    paralelo, na base de dados 'configuracao'. Devolve a lista de resultados.
+    """
+    _trocar_bases({'default': configuracao})
+    resultados = []
+    for quantos in concorrencias:
+        if modo == 'wsgi':
+            tempos, erros = _medir_wsgi(sessoes[:quantos], duracao)
+        else:
+            tempos, erros = asyncio.run(_medir_asgi(sessoes[:quantos], duracao))
+        resultados.append({
+            'modo': modo,
+            'concorrencia': quantos,
+            'pedidos_s': round(len(tempos) / duracao, 1),
+            'p50_ms': round(percentil(tempos, 50), 1) if tempos else None,
+            'p95_ms': round(percentil(tempos, 95), 1) if tempos else None,
+            'erros': erros,
+        })
+    connections.close_all()
+    return resultados
+
+
+def _correr_filho(modo, tarefa):
+    """Corre 'manage.py benchmark_asgi --filho' com o modo dado e devolve os resultados."""
+    ambiente = dict(os.environ, DOMUSSHELF_VIEWS_ASSINCRONAS='1' if modo == 'asgi_async' else '0')
+    processo = subprocess.run(
+        [sys.executable, '-m', 'django', 'benchmark_asgi', '--filho'],
+        input=json.dumps(dict(tarefa, modo=modo)),
+        capture_output=True,
+        text=True,
+        cwd=settings.BASE_DIR,
+        env=ambiente,
+    )
+    if processo.returncode:
+        raise RuntimeError(f'O modo {modo} falhou:\n{processo.stderr}')
+    return json.loads(processo.stdout)
+
+
+def executar(concorrencias, modos=MODOS, duracao=5.0, semente=0, progresso=None, **parametros):
+    """
+    Gera os dados sintéticos (um agregado por cliente) e mede cada modo
+    com cada número de clientes (lista). 'parametros' são passados a
+    sintetico.gerar. Devolve a lista de resultados.
+    """
+    resultados = []
+    concorrencias = sorted(concorrencias)
+    with tempfile.TemporaryDirectory(prefix='domusshelf-') as pasta:
+        with base_de_dados_temporaria('producao', pasta) as configuracao:
+            sessoes = []
+            for user in User.objects.filter(pk__in=gerar(concorrencias[-1], semente=semente, **parametros)):
+                cliente = Client()
+                cliente.force_login(user)
+                sessoes.append(cliente.cookies[settings.SESSION_COOKIE_NAME].value)
+            connections.close_all()
+
+            tarefa = {
+                'configuracao': {chave: str(valor) if chave == 'NAME' else valor
+                                 for chave, valor in configuracao.items()},
+                'sessoes': sessoes,
+                'concorrencias': concorrencias,
+                'duracao': duracao,
+            }
+            for modo in modos:
+                for resultado in _correr_filho(modo, tarefa):
+                    resultados.append(resultado)
+                    if progresso:
+                        progresso(resultado)
+    return resultados
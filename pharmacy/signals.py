@@ -0,0 +1,292 @@
+'''
+DomusShelf - Signals
+====================
+
+Signals são "avisos" que o Django emite quando algo acontece a um modelo
+(por exemplo, depois de guardar ou apagar). Aqui usamo-los para invalidar
+os dados em cache de um utilizador sempre que o seu stock muda, e para
+manter os totais diários de consumo (ConsumoDiario, ver historico.py).
+Com partições, também colocam os utilizadores novos na sua partição e
+mantêm lá a cópia da linha do utilizador (ver particoes.py). E publicam
+as alterações ao stock para as ligações em tempo real (ver eventos.py).
+
+Os receivers são ligados em PharmacyConfig.ready() (apps.py).
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .alertas import marcar_desactualizado
+from .caches import incrementar_versao, invalidar_alertas
+from .eventos import avisar_alteracao, publicar
+from .historico import actualizacao_suspensa, aplicar_consumo, mover_embalagem, retirar_embalagem
+from .models import Medicamento, Embalagem, Consumo, ConsumoDiario, MovimentoStock, Preferencias
+from .particoes import (
+    apagar_dados, colocar_utilizador, particao_actual, particao_do_utilizador, particoes_activas,
+    replicar_utilizador,
+)
+
+
+def invalidar_utilizador(utilizador_id, using=None):
+    """
+    Invalida tudo o que está em cache para um utilizador, marca o seu
+    resumo de alertas como desactualizado e muda o carimbo de versão
+    dos seus dados.
+    Também é chamada directamente por operações em massa (bulk_create,
+    update) que não disparam signals.
+
+    A marca no resumo vai na transacção de quem escreve; a cache e o
+    carimbo só mudam depois do commit. Antes disso, um pedido ainda lê
+    os dados antigos e voltaria a guardá-los na cache (até à meia-noite)
+    ou a associá-los ao carimbo novo (ETags com o corpo antigo).
+    """
+    if utilizador_id is None:
+        return
+    marcar_desactualizado(utilizador_id)
+
+    def depois_do_commit():
+        invalidar_alertas(utilizador_id)
+        incrementar_versao(utilizador_id)
+
+    transaction.on_commit(depois_do_commit, using=using or particao_actual())
+    avisar_alteracao(utilizador_id, using=using)
+
+
+@receiver(pre_save, sender=Medicamento)
+def guardar_dono_anterior(sender, instance, **kwargs):
+    """
+    Antes de editar um medicamento, guarda o dono que tinha, para saber
+    depois se mudou. Criar um medicamento não faz a query.
+    """
+    if instance.pk is None or instance._state.adding:
+        return
+    instance._dono_anterior = Medicamento.objects.filter(
+        pk=instance.pk
+    ).values_list('utilizador_id', flat=True).first()
+
+
+def _modelo_da_origem(origin):
+    """
+    O modelo de onde partiu um delete (o 'origin' dos signals de delete:
+    uma instância ou um queryset), ou None fora de um delete.
+    """
+    if origin is None:
+        return None
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _apagado_em_cascata(origin):
+    """
+    True se um consumo está a ser apagado por arrastamento (da embalagem,
+    do medicamento ou do utilizador): o trabalho é feito uma vez, por quem
+    originou o delete, e não por cada consumo.
+    """
+    modelo = _modelo_da_origem(origin)
+    return modelo is not None and modelo is not Consumo
+
+
+@receiver(post_save, sender=Medicamento)
+def sincronizar_dono_embalagens(sender, instance, created, using, **kwargs):
+    """
+    Mantém Embalagem.utilizador igual ao dono do medicamento, quando o
+    medicamento muda de utilizador (ex: pelo admin). Os dois donos são
+    invalidados: o anterior perdeu embalagens (sino, resumo de alertas,
+    ETags) e o novo ganhou-as.
+    """
+    anterior = getattr(instance, '_dono_anterior', None)
+    if created or anterior is None or anterior == instance.utilizador_id:
+        return
+    Embalagem.objects.filter(
+        medicamento=instance
+    ).update(utilizador_id=instance.utilizador_id)
+    # Os totais diários também guardam o dono
+    ConsumoDiario.objects.filter(
+        medicamento=instance
+    ).update(utilizador_id=instance.utilizador_id)
+    invalidar_utilizador(anterior, using=using)
+    invalidar_utilizador(instance.utilizador_id, using=using)
+
+
+@receiver([post_save, post_delete], sender=Medicamento)
+def medicamento_alterado(sender, instance, using, **kwargs):
+    """O catálogo mudou (nome, princípio activo, etc.)."""
+    invalidar_utilizador(instance.utilizador_id, using=using)
+
+
+@receiver([post_save, post_delete], sender=Embalagem)
+def embalagem_alterada(sender, instance, using, **kwargs):
+    """Uma embalagem foi criada, editada ou apagada."""
+    invalidar_utilizador(instance.utilizador_id, using=using)
+
+
+def publicar_embalagens_adicionadas(embalagens, using=None):
+    """
+    Publica o evento 'embalagem_adicionada' de cada embalagem. Chamada
+    directamente pela importação em massa (bulk_create não dispara signals).
+    """
+    for embalagem in embalagens:
+        publicar(embalagem.utilizador_id, 'embalagem_adicionada', {
+            'embalagem': embalagem.pk,
+            'medicamento': embalagem.medicamento_id,
+            'quantidade': embalagem.quantidade_actual,
+            'unidade': embalagem.unidade,
+            'data_validade': str(embalagem.data_validade),
+        }, using=using)
+
+
+@receiver(post_save, sender=Embalagem)
+def publicar_embalagem_adicionada(sender, instance, created, using, **kwargs):
+    """Evento em tempo real: uma embalagem nova entrou no stock."""
+    if created:
+        publicar_embalagens_adicionadas([instance], using=using)
+
+
+@receiver(post_delete, sender=Embalagem)
+def publicar_embalagem_removida(sender, instance, using, **kwargs):
+    """Evento em tempo real: uma embalagem foi eliminada."""
+    publicar(instance.utilizador_id, 'embalagem_removida', {
+        'embalagem': instance.pk,
+        'medicamento': instance.medicamento_id,
+    }, using=using)
+
+
+@receiver(pre_delete, sender=Embalagem)
+def retirar_consumos_da_embalagem(sender, instance, origin=None, **kwargs):
+    """
+    A embalagem vai ser apagada, com os seus consumos: retira-os dos
+    totais diários de uma vez. Quando é o medicamento ou o utilizador que
+    é apagado, os totais deles também são apagados: nada a fazer.
+    """
+    if actualizacao_suspensa() or _modelo_da_origem(origin) is not Embalagem:
+        return
+    retirar_embalagem(instance)
+
+
+@receiver(post_save, sender=MovimentoStock)
+def publicar_movimento(sender, instance, created, using, **kwargs):
+    """
+    Evento em tempo real: o stock de uma embalagem mudou (consumo, ajuste
+    ou abate). A entrada de uma embalagem nova já vai no seu próprio evento.
+    """
+    if not created or instance.tipo == MovimentoStock.ENTRADA:
+        return
+    publicar(instance.utilizador_id, 'stock', {
+        'embalagem': instance.embalagem_id,
+        'tipo': instance.tipo,
+        'quantidade': instance.quantidade,
+    }, using=using)
+
+
+@receiver(pre_save, sender=Embalagem)
+def guardar_medicamento_anterior(sender, instance, **kwargs):
+    """
+    Antes de editar uma embalagem, guarda o medicamento (e dono) que tinha,
+    para saber depois se os seus consumos mudam de medicamento.
+    """
+    if instance.pk is None or instance._state.adding:
+        return
+    instance._medicamento_anterior = Embalagem.objects.filter(
+        pk=instance.pk
+    ).values_list('utilizador_id', 'medicamento_id').first()
+
+
+@receiver(post_save, sender=Embalagem)
+def embalagem_mudou_de_medicamento(sender, instance, created, using, **kwargs):
+    """Passa os totais diários dos consumos da embalagem para o novo medicamento."""
+    anterior = getattr(instance, '_medicamento_anterior', None)
+    actual = (instance.utilizador_id, instance.medicamento_id)
+    if created or anterior is None or anterior == actual:
+        return
+    mover_embalagem(instance.pk, anterior, actual)
+    invalidar_utilizador(anterior[0], using=using)
+
+
+@receiver([post_save, post_delete], sender=Consumo)
+def consumo_alterado(sender, instance, using, origin=None, **kwargs):
+    """
+    Um consumo mudou o stock de uma embalagem. Nos apagados em cascata,
+    quem é apagado (embalagem, medicamento) já invalida o utilizador.
+    """
+    if actualizacao_suspensa() or _apagado_em_cascata(origin):
+        return
+    invalidar_utilizador(instance.embalagem.utilizador_id, using=using)
+
+
+@receiver(pre_save, sender=Consumo)
+def guardar_consumo_anterior(sender, instance, **kwargs):
+    """
+    Antes de editar um consumo (ex: no admin), guarda os valores antigos,
+    para os retirar dos totais diários. Criar um consumo não faz a query.
+    """
+    if instance.pk is None or instance._state.adding:
+        return
+    instance._consumo_anterior = Consumo.objects.filter(
+        pk=instance.pk
+    ).values_list(
+        'embalagem__utilizador_id', 'embalagem__medicamento_id', 'data_hora', 'quantidade'
+    ).first()
+
+
+@receiver(post_save, sender=Consumo)
+def somar_consumo_diario(sender, instance, created, **kwargs):
+    """Soma o consumo ao total do seu dia (e retira os valores antigos, se editado)."""
+    if actualizacao_suspensa():
+        return
+    anterior = getattr(instance, '_consumo_anterior', None)
+    if not created and anterior is not None:
+        aplicar_consumo(*anterior, sinal=-1)
+    embalagem = instance.embalagem
+    aplicar_consumo(
+        embalagem.utilizador_id, embalagem.medicamento_id, instance.data_hora, instance.quantidade
+    )
+
+
+@receiver(post_delete, sender=Consumo)
+def subtrair_consumo_diario(sender, instance, origin=None, **kwargs):
+    """
+    Retira um consumo apagado do total do seu dia. Os apagados em cascata
+    já foram retirados todos de uma vez (retirar_consumos_da_embalagem).
+    """
+    if actualizacao_suspensa() or _apagado_em_cascata(origin):
+        return
+    embalagem = instance.embalagem
+    aplicar_consumo(
+        embalagem.utilizador_id, embalagem.medicamento_id, instance.data_hora, instance.quantidade,
+        sinal=-1,
+    )
+
+
+@receiver([post_save, post_delete], sender=Preferencias)
+def preferencias_alteradas(sender, instance, using, **kwargs):
+    """Os dias de alerta mudaram, logo o número de alertas também."""
+    invalidar_utilizador(instance.utilizador_id, using=using)
+
+
+@receiver(post_save, sender=User)
+def utilizador_guardado(sender, instance, created, using, update_fields=None, **kwargs):
+    """
+    Utilizador novo: escolhe a sua partição. Alterado: actualiza a cópia
+    da linha na partição (só o nome e o estado são copiados).
+    """
+    if not particoes_activas() or using != DEFAULT_DB_ALIAS:
+        return
+    if created:
+        colocar_utilizador(instance)
+    elif update_fields is None or {'username', 'is_active'} & set(update_fields):
+        replicar_utilizador(instance, particao_do_utilizador(instance.pk))
+
+
+@receiver(pre_delete, sender=User)
+def utilizador_apagado(sender, instance, using, **kwargs):
+    """Os dados na partição não são apagados em cascata pela 'default'."""
+    if not particoes_activas() or using != DEFAULT_DB_ALIAS:
+        return
+    particao = particao_do_utilizador(instance.pk)
+    if particao != DEFAULT_DB_ALIAS:
+        apagar_dados(instance.pk, particao)
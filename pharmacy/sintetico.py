@@ -0,0 +1,193 @@
+'''
+DomusShelf - Dados Sintéticos
+=============================
+
+Gera agregados familiares fictícios, com catálogo, stock e histórico de
+consumos realistas, para medir o desempenho com volumes de dados
+controlados (comandos "manage.py seed_synthetic" e "run_benchmarks").
+
+Parâmetros: número de utilizadores, medicamentos por utilizador,
+embalagens por medicamento e consumos por embalagem. Com a mesma
+semente, os dados gerados são sempre os mesmos.
+
+Validades distribuídas como numa farmácia doméstica real:
+- ~10% já expiradas (até 6 meses);
+- ~15% a expirar nos próximos 30 dias;
+- as restantes entre 1 mês e 3 anos.
+
+Os consumos ficam nos últimos JANELA_CONSUMOS_DIAS dias e a quantidade
+actual de cada embalagem é a inicial menos o consumido. Tudo é gravado
+com bulk_create (com os movimentos de stock e os totais diários), por
+isso os dados ficam coerentes para o verify_stock_ledger.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .historico import reconstruir
+from .models import Medicamento, Embalagem, Consumo, MovimentoStock
+
+
+# Utilizadores gravados por transacção
+TAMANHO_LOTE = 50
+
+# Dias de histórico de consumos gerado
+JANELA_CONSUMOS_DIAS = 90
+
+# (nome comercial, princípio activo, forma farmacêutica, unidade, tamanhos de embalagem)
+CATALOGO = [
+    ('Ben-u-ron', 'Paracetamol', 'Comprimido', 'comprimidos', (20, 30)),
+    ('Brufen', 'Ibuprofeno', 'Comprimido', 'comprimidos', (20, 60)),
+    ('Aspirina', 'Ácido acetilsalicílico', 'Comprimido', 'comprimidos', (20,)),
+    ('Nolotil', 'Metamizol magnésico', 'Cápsula', 'cápsulas', (20,)),
+    ('Voltaren', 'Diclofenac', 'Gel', 'g', (60, 100)),
+    ('Zyrtec', 'Cetirizina', 'Comprimido', 'comprimidos', (10, 20)),
+    ('Aerius', 'Desloratadina', 'Xarope', 'ml', (120, 150)),
+    ('Omeprazol Generis', 'Omeprazol', 'Cápsula', 'cápsulas', (14, 28, 56)),
+    ('Imodium', 'Loperamida', 'Cápsula', 'cápsulas', (10, 20)),
+    ('Fenistil', 'Dimetindeno', 'Gel', 'g', (30, 50)),
+    ('Strepsils', 'Amilmetacresol', 'Pastilha', 'pastilhas', (24, 36)),
+    ('Bisolvon', 'Bromexina', 'Xarope', 'ml', (200,)),
+    ('Daflon', 'Diosmina', 'Comprimido', 'comprimidos', (30, 60)),
+    ('Lasix', 'Furosemida', 'Comprimido', 'comprimidos', (20, 60)),
+    ('Lipitor', 'Atorvastatina', 'Comprimido', 'comprimidos', (28, 56)),
+    ('Euthyrox', 'Levotiroxina', 'Comprimido', 'comprimidos', (50, 100)),
+    ('Concor', 'Bisoprolol', 'Comprimido', 'comprimidos', (28, 56)),
+    ('Xanax', 'Alprazolam', 'Comprimido', 'comprimidos', (20, 60)),
+    ('Vibrocil', 'Fenilefrina', 'Spray nasal', 'doses', (100,)),
+    ('Betadine', 'Iodopovidona', 'Solução', 'ml', (125, 500)),
+]
+
+POR_NOME = {linha[0]: linha for linha in CATALOGO}
+
+
+def _validade(aleatorio, hoje):
+    """Data de validade com a distribuição descrita no cabeçalho."""
+    sorteio = aleatorio.random()
+    if sorteio < 0.10:
+        return hoje - timedelta(days=aleatorio.randint(1, 180))
+    if sorteio < 0.25:
+        return hoje + timedelta(days=aleatorio.randint(0, 30))
+    return hoje + timedelta(days=aleatorio.randint(31, 3 * 365))
+
+
+def gerar(utilizadores, medicamentos_por_utilizador=8, embalagens_por_medicamento=2,
+          consumos_por_embalagem=10, semente=0, prefixo='sintetico', palavra_passe=None,
+          tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Cria 'utilizadores' utilizadores (prefixo_000001, ...) com os seus
+    medicamentos, embalagens, consumos e movimentos de stock, e recalcula
+    os totais diários. Devolve a lista de ids dos utilizadores criados.
+
+    Sem palavra_passe, os utilizadores não podem entrar pela página de
+    login (os benchmarks usam force_login).
+    """
+    agora = timezone.now()
+    hoje = timezone.localdate()
+    senha = '!'
+    if palavra_passe:
+        # Calculada uma vez: o hash é caro e é o mesmo para todos
+        modelo = User()
+        modelo.set_password(palavra_passe)
+        senha = modelo.password
+
+    inicio = User.objects.filter(username__startswith=f'{prefixo}_').count()
+    criados = []
+
+    for posicao in range(0, utilizadores, tamanho_lote):
+        quantos = min(tamanho_lote, utilizadores - posicao)
+        with transaction.atomic():
+            lote = User.objects.bulk_create([
+                User(username=f'{prefixo}_{inicio + posicao + n + 1:06d}', password=senha)
+                for n in range(quantos)
+            ])
+
+            # Cada utilizador tem o seu próprio gerador (semente, número), para
+            # que os dados não dependam do tamanho do lote
+            aleatorios = {
+                user.pk: random.Random(f'{semente}-{inicio + posicao + n}')
+                for n, user in enumerate(lote)
+            }
+
+            medicamentos = Medicamento.objects.bulk_create([
+                Medicamento(
+                    utilizador_id=user.pk,
+                    nome_comercial=nome,
+                    principio_activo=principio,
+                    forma_farmaceutica=forma,
+                )
+                for user in lote
+                for nome, principio, forma, _, _ in aleatorios[user.pk].sample(
+                    CATALOGO, min(medicamentos_por_utilizador, len(CATALOGO))
+                )
+            ])
+
+            embalagens = []
+            for medicamento in medicamentos:
+                aleatorio = aleatorios[medicamento.utilizador_id]
+                _, _, _, unidade, tamanhos = POR_NOME[medicamento.nome_comercial]
+                for _ in range(embalagens_por_medicamento):
+                    inicial = aleatorio.choice(tamanhos)
+                    embalagens.append(Embalagem(
+                        medicamento_id=medicamento.pk,
+                        utilizador_id=medicamento.utilizador_id,
+                        quantidade_inicial=inicial,
+                        quantidade_actual=inicial,
+                        unidade=unidade,
+                        data_validade=_validade(aleatorio, hoje),
+                        lote=f'L{aleatorio.randint(1000, 99999)}',
+                    ))
+            Embalagem.objects.bulk_create(embalagens)
+
+            # Consumos: tomas de 1 ou 2 unidades nos últimos dias, enquanto houver stock
+            consumos = []
+            for embalagem in embalagens:
+                aleatorio = aleatorios[embalagem.utilizador_id]
+                for _ in range(consumos_por_embalagem):
+                    quantidade = min(aleatorio.choice((1, 1, 1, 2)), embalagem.quantidade_actual)
+                    if not quantidade:
+                        break
+                    embalagem.quantidade_actual -= quantidade
+                    consumos.append(Consumo(
+                        embalagem=embalagem,
+                        quantidade=quantidade,
+                        data_hora=agora - timedelta(minutes=aleatorio.randint(0, JANELA_CONSUMOS_DIAS * 24 * 60)),
+                    ))
+            Consumo.objects.bulk_create(consumos, batch_size=1000)
+            Embalagem.objects.bulk_update(embalagens, ['quantidade_actual'], batch_size=1000)
+
+            MovimentoStock.objects.bulk_create([
+                MovimentoStock(
+                    utilizador_id=embalagem.utilizador_id,
+                    embalagem_id=embalagem.pk,
+                    tipo=MovimentoStock.ENTRADA,
+                    quantidade=embalagem.quantidade_inicial,
+                    data_hora=agora,
+                )
+                for embalagem in embalagens
+            ] + [
+                MovimentoStock(
+                    utilizador_id=consumo.embalagem.utilizador_id,
+                    embalagem_id=consumo.embalagem_id,
+                    tipo=MovimentoStock.CONSUMO,
+                    quantidade=-consumo.quantidade,
+                    consumo_id=consumo.pk,
+                    data_hora=agora,
+                )
+                for consumo in consumos
+            ], batch_size=1000)
+
+        criados.extend(user.pk for user in lote)
+        if progresso:
+            progresso(len(criados))
+
+    # bulk_create não dispara os signals: totais diários de uma vez no fim
+    reconstruir(desde=hoje - timedelta(days=JANELA_CONSUMOS_DIAS))
+    return criados
@@ -0,0 +1,133 @@
+'''
+DomusShelf - Motor SQLite para Produção
+=======================================
+
+O motor sqlite3 do Django abre cada ligação com as opções por defeito
+do SQLite: diário de rollback (quem escreve bloqueia quem lê) e
+transacções DEFERRED, que só pedem o lock de escrita na primeira
+escrita. Quando dois pedidos lêem e depois escrevem ao mesmo tempo
+(registo de consumo, nova embalagem), um deles falha logo com
+"database is locked", sem esperar pelo busy_timeout.
+
+Este motor (ENGINE 'pharmacy.sqlite') é o sqlite3 do Django com:
+- PRAGMAs aplicados a cada nova ligação (PRAGMAS_POR_DEFEITO): WAL
+  (leitores e um escritor em paralelo), synchronous=NORMAL (seguro em
+  WAL, sem fsync em cada commit), busy_timeout, mmap e cache maiores;
+- transacções (transaction.atomic) começadas com BEGIN IMMEDIATE: o
+  lock de escrita é pedido logo no início, à espera do busy_timeout,
+  e as transacções de escrita ficam em fila em vez de falharem;
+- se mesmo assim o BEGIN falhar por a base estar bloqueada, é repetido
+  com espera exponencial (e alguma aleatoriedade) antes de desistir.
+
+No Django 5.1 o modo da transacção passou a ser a opção
+"transaction_mode" do sqlite3; aqui é lida com o mesmo nome, para que a
+configuração continue válida quando o projecto for actualizado.
+
+Numa ligação só de leitura (NAME "file:...?mode=ro" ou com immutable=1,
+como a base de dados "leitura") os PRAGMAs que escrevem no ficheiro
+(journal_mode, synchronous) não são aplicados: num ficheiro que ainda
+não esteja em WAL, mudar o journal_mode falharia com "attempt to write a
+readonly database".
+
+Opções (DATABASES['default']['OPTIONS']), todas facultativas:
+    'pragmas': {'cache_size': -64000, ...}  (juntam-se às por defeito)
+    'transaction_mode': 'IMMEDIATE' | 'DEFERRED' | 'EXCLUSIVE'
+    'tentativas': número de BEGIN antes de desistir
+    'espera_inicial': segundos antes da primeira repetição
+As restantes (ex: 'timeout') seguem para sqlite3.connect, como no
+motor do Django.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import random
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.db.backends.sqlite3 import base as sqlite3_base
+from django.db.utils import OperationalError
+
+
+PRAGMAS_POR_DEFEITO = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,          # ms à espera de um lock antes de falhar
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,          # negativo = KiB (20 MB por ligação)
+    'temp_store': 'MEMORY',
+}
+
+# Só aplicados às ligações que podem escrever
+PRAGMAS_ESCRITA = ('journal_mode', 'synchronous')
+
+MODOS_TRANSACCAO = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+# Repetição do BEGIN quando a base de dados está bloqueada
+TENTATIVAS = 5
+ESPERA_INICIAL = 0.05
+ESPERA_MAXIMA = 2.0
+
+
+def base_bloqueada(erro):
+    """True se o erro do SQLite é "database is locked" / "database is busy"."""
+    mensagem = str(erro).lower()
+    return 'database is locked' in mensagem or 'database is busy' in mensagem
+
+
+def so_de_leitura(nome):
+    """True se o NAME é um URI aberto só para leitura (mode=ro ou immutable=1)."""
+    nome = str(nome)
+    if not nome.startswith('file:'):
+        return False
+    parametros = parse_qs(urlsplit(nome).query)
+    return parametros.get('mode') == ['ro'] or parametros.get('immutable') == ['1']
+
+
+class DatabaseWrapper(sqlite3_base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        opcoes = self.settings_dict['OPTIONS']
+        self.pragmas = {**PRAGMAS_POR_DEFEITO, **opcoes.get('pragmas', {})}
+        if so_de_leitura(self.settings_dict['NAME']):
+            for nome in PRAGMAS_ESCRITA:
+                self.pragmas.pop(nome, None)
+        self.modo_transaccao = opcoes.get('transaction_mode', 'IMMEDIATE').upper()
+        if self.modo_transaccao not in MODOS_TRANSACCAO:
+            raise ValueError(
+                f'transaction_mode inválido: {self.modo_transaccao!r} '
+                f'(usar {", ".join(MODOS_TRANSACCAO)}).'
+            )
+        self.tentativas = max(1, opcoes.get('tentativas', TENTATIVAS))
+        self.espera_inicial = opcoes.get('espera_inicial', ESPERA_INICIAL)
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # Opções deste motor, que o sqlite3.connect não conhece
+        for opcao in ('pragmas', 'transaction_mode', 'tentativas', 'espera_inicial'):
+            kwargs.pop(opcao, None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for nome, valor in self.pragmas.items():
+            conn.execute(f'PRAGMA {nome} = {valor}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        """
+        Começa a transacção de um atomic() no modo configurado, repetindo
+        com espera crescente enquanto a base de dados estiver bloqueada.
+        """
+        comando = f'BEGIN {self.modo_transaccao}'
+        espera = self.espera_inicial
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                self.cursor().execute(comando)
+                return
+            except OperationalError as erro:
+                if not base_bloqueada(erro) or tentativa == self.tentativas:
+                    raise
+            time.sleep(espera * random.uniform(0.5, 1.5))
+            espera = min(espera * 2, ESPERA_MAXIMA)
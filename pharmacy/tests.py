@@ -1,3 +1,1766 @@
-from django.test import TestCase
+'''
+DomusShelf - Testes da Aplicação Pharmacy
+=========================================
 
-# Create your tests here.
+Para correr: python manage.py test pharmacy
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import asyncio
+import gzip
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import zoneinfo
+from contextlib import closing
+from unittest.mock import patch
+from datetime import date, datetime, timedelta
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.db.utils import load_backend
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+from django.utils import timezone
+
+from . import estaticos, eventos
+from .alertas import calcular_snapshots, obter_snapshot
+from .aquecimento import aquecer_templates, motor, nomes_dos_templates
+from .caches import (
+    chave_alertas, incrementar_versao, obter_resumo_alertas, segundos_ate_meia_noite, versao_dados,
+)
+from .benchmarks import CENARIOS, executar
+from .checks import verificar_bibliotecas_locais, verificar_cache_partilhada
+from .historico import compactar, reconstruir
+from .importacao import ImportadorStock, ler_linhas
+from .instrumentacao import impressao_digital, medir
+from .leitura import ALIAS_LEITURA, actualizar_copia, ler_da_copia
+from .management.commands.check_query_plans import Command as ComandoPlanos
+from .middleware import EstaticosMiddleware, ParticaoMiddleware
+from .models import (
+    Medicamento, Embalagem, Consumo, ConsumoDiario, AlertSnapshot, MovimentoStock, ParticaoUtilizador,
+    Preferencias,
+)
+from .movimentos import criar_snapshots, stock_em, verificar
+from .paginacao import codificar_cursor, obter_tamanho_pagina
+from .pesquisa import (
+    filtrar_embalagens, filtrar_medicamentos, fts_disponivel, instalar_fts, pesquisar_medicamentos, remover_fts,
+)
+from .previsao import prever_utilizador
+from .particoes import (
+    ESPACO_IDS, MudancaIncompleta, copiar_dados, mover_utilizador, particao_actual, particao_por_hash,
+    usar_particao,
+)
+from .routers import LeituraEscritaRouter, ParticaoRouter
+from .services import StockInsuficiente, StockSummary, consumir_por_medicamento, registar_consumo
+from .sintetico import gerar
+
+
+def criar_embalagem(user, quantidade=10, dias=90, nome='Ben-u-ron', medicamento=None):
+    """Cria uma embalagem (e, se não for indicado, o medicamento) para os testes."""
+    if medicamento is None:
+        medicamento = Medicamento.objects.create(utilizador=user, nome_comercial=nome)
+    return Embalagem.objects.create(
+        medicamento=medicamento,
+        quantidade_inicial=quantidade,
+        quantidade_actual=quantidade,
+        data_validade=date.today() + timedelta(days=dias),
+    )
+
+
+def caches_de_producao(teste):
+    """O CACHES de settings_producao, com as caches numa pasta temporária."""
+    pasta = tempfile.mkdtemp()
+    teste.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+    with patch.dict(os.environ, {'DOMUSSHELF_SECRET_KEY': 'teste', 'DOMUSSHELF_CACHE': pasta}):
+        producao = importlib.reload(importlib.import_module('domusshelf_project.settings_producao'))
+    return producao.CACHES
+
+
+class OrcamentoQueriesMixin:
+    """
+    Orçamentos de queries por view: um pedido não pode fazer mais queries
+    do que o orçamento, nem repetir a mesma query (sinal de N+1).
+
+    O pedido é feito primeiro uma vez sem contar (GET), para encher as
+    caches (sino, resumo de alertas): mede-se o caso normal, não o primeiro.
+    """
+
+    def assertOrcamentoQueries(self, url, maximo, dados=None, repetidas=()):
+        self.client.get(url)
+        with medir() as metricas:
+            if dados is None:
+                resposta = self.client.get(url)
+            else:
+                resposta = self.client.post(url, dados)
+
+        detalhe = '\n'.join(f'{vezes}x {sql}' for sql, vezes in metricas.impressoes.items())
+        self.assertLessEqual(
+            metricas.queries, maximo,
+            f'{url}: {metricas.queries} queries (orçamento: {maximo})\n{detalhe}',
+        )
+        inesperadas = [
+            (sql, vezes) for sql, vezes in metricas.repetidas
+            if not any(sql.startswith(inicio) for inicio in repetidas)
+        ]
+        self.assertEqual(inesperadas, [], f'{url}: queries repetidas (N+1?)')
+        return resposta
+
+
+class StockSummaryTests(TestCase):
+    """Resumo do dashboard: todas as contagens e os dias de alerta numa query."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        ben = criar_embalagem(self.user, dias=-3).medicamento       # expirada
+        criar_embalagem(self.user, dias=10, medicamento=ben)        # a expirar
+        criar_embalagem(self.user, dias=200, nome='Brufen')         # longe da validade
+        criar_embalagem(self.user, quantidade=0, dias=5, nome='Aspirina')  # vazia: não conta
+        Medicamento.objects.create(utilizador=self.user, nome_comercial='Sem embalagens')
+        criar_embalagem(User.objects.create_user('rui'), dias=-1)   # de outro utilizador
+
+    def test_contagens_numa_query(self):
+        with self.assertNumQueries(1):
+            resumo = StockSummary.para_utilizador(self.user)
+        self.assertEqual(
+            (resumo.total_medicamentos, resumo.total_embalagens, resumo.expiradas, resumo.a_expirar),
+            (4, 3, 1, 1),
+        )
+        self.assertEqual(resumo.dias_alerta, 30)
+        self.assertEqual(resumo.data_limite, resumo.hoje + timedelta(days=30))
+
+    def test_dias_alerta_das_preferencias(self):
+        Preferencias.objects.create(utilizador=self.user, dias_alerta_antes=5)
+        with self.assertNumQueries(1):
+            resumo = StockSummary.para_utilizador(self.user)
+        self.assertEqual((resumo.dias_alerta, resumo.expiradas, resumo.a_expirar), (5, 1, 0))
+
+        # Sem medicamentos, os dias de alerta continuam a vir das preferências
+        sem_dados = User.objects.create_user('eva')
+        Preferencias.objects.create(utilizador=sem_dados, dias_alerta_antes=12)
+        resumo = StockSummary.para_utilizador(sem_dados)
+        self.assertEqual((resumo.dias_alerta, resumo.total_medicamentos, resumo.a_expirar), (12, 0, 0))
+
+    def test_versao_async(self):
+        resumo = async_to_sync(StockSummary.apara_utilizador)(self.user)
+        self.assertEqual((resumo.expiradas, resumo.a_expirar, resumo.dias_alerta), (1, 1, 30))
+
+
+class CacheSinoTests(TestCase):
+    """Resumo do sino em cache: invalidado pelos signals, expira à meia-noite local."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=5, dias=10)
+        self.client.force_login(self.user)
+
+    def test_consumo_invalida_a_contagem(self):
+        self.assertEqual(self.client.get('/').context['alertas_count'], 1)
+        self.assertIsNotNone(cache.get(chave_alertas(self.user.pk)))
+        # Lido da cache: sem queries ao resumo
+        with self.assertNumQueries(0):
+            self.assertEqual(obter_resumo_alertas(self.user)['total'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registar_consumo(self.embalagem, 5)
+        self.assertIsNone(cache.get(chave_alertas(self.user.pk)))
+        self.assertEqual(self.client.get('/').context['alertas_count'], 0)
+
+    def test_sino_lido_antes_do_commit_nao_fica_na_cache(self):
+        resumo = obter_resumo_alertas(self.user)
+        versao = versao_dados(self.user.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registar_consumo(self.embalagem, 5)
+            # Antes do commit, os outros pedidos ainda vêem os dados
+            # antigos: o resumo e o carimbo antigos continuam válidos
+            self.assertEqual(obter_resumo_alertas(self.user)['total'], 1)
+            self.assertEqual(versao_dados(self.user.pk), versao)
+            # Um pedido noutra ligação lê o resumo antigo e guarda-o
+            cache.set(chave_alertas(self.user.pk), resumo)
+
+        self.assertNotEqual(versao_dados(self.user.pk), versao)
+        self.assertEqual(obter_resumo_alertas(self.user)['total'], 0)
+
+    def test_validade_ate_a_meia_noite_local(self):
+        lisboa = zoneinfo.ZoneInfo('Europe/Lisbon')
+        with patch('pharmacy.caches.timezone.localtime', return_value=datetime(2026, 10, 18, 23, 59, 30, tzinfo=lisboa)):
+            self.assertEqual(segundos_ate_meia_noite(), 30)
+            with patch.object(cache, 'set', wraps=cache.set) as gravar:
+                obter_resumo_alertas(self.user)
+            self.assertEqual(gravar.call_args.args[2], 30)
+
+        # Na noite da mudança para a hora de Inverno, o dia local tem 25 horas
+        with patch('pharmacy.caches.timezone.localtime', return_value=datetime(2026, 10, 25, 0, 30, tzinfo=lisboa)):
+            self.assertEqual(segundos_ate_meia_noite(), 24 * 3600 + 1800)
+
+
+class PlanosQueriesTests(TestCase):
+    """manage.py check_query_plans sobre a base de dados de testes."""
+
+    def test_nenhuma_view_le_uma_tabela_inteira(self):
+        user = User.objects.create_user('ana')
+        criar_embalagem(user, dias=-3)
+        criar_embalagem(user, dias=10, nome='Brufen')
+        Preferencias.objects.create(utilizador=user, dias_alerta_antes=15)
+
+        saida, erros = io.StringIO(), io.StringIO()
+        call_command('check_query_plans', utilizador='ana', stdout=saida, stderr=erros)
+        self.assertEqual(erros.getvalue(), '')
+        self.assertIn('embalagem_editar', saida.getvalue())
+        self.assertIn('Nenhuma leitura completa', saida.getvalue())
+
+    def test_scan_completo_falha(self):
+        def sem_indice(request):
+            return list(Medicamento.objects.filter(principio_activo='Paracetamol'))
+
+        with patch.object(ComandoPlanos, 'views_a_verificar', return_value=[('sem_indice', sem_indice, {})]):
+            with self.assertRaisesMessage(CommandError, '1 leitura(s) completa(s)'):
+                call_command('check_query_plans', stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class DonoEmbalagensTests(TestCase):
+    """Embalagem.utilizador: igual ao dono do medicamento, preenchido pela migração 0003."""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana')
+        self.rui = User.objects.create_user('rui')
+        self.embalagem = criar_embalagem(self.ana, dias=10)
+        self.medicamento = self.embalagem.medicamento
+        registar_consumo(self.embalagem, 2)
+
+    def test_mudanca_de_dono_invalida_os_dois(self):
+        obter_resumo_alertas(self.ana)
+        obter_resumo_alertas(self.rui)
+        versoes = {user.pk: versao_dados(user.pk) for user in (self.ana, self.rui)}
+
+        self.medicamento.utilizador = self.rui
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medicamento.save()
+
+        self.embalagem.refresh_from_db()
+        self.assertEqual(self.embalagem.utilizador, self.rui)
+        self.assertEqual(set(ConsumoDiario.objects.values_list('utilizador', flat=True)), {self.rui.pk})
+        for user in (self.ana, self.rui):
+            self.assertIsNone(cache.get(chave_alertas(user.pk)))
+            self.assertNotEqual(versao_dados(user.pk), versoes[user.pk])
+        self.assertEqual(obter_resumo_alertas(self.ana)['total'], 0)
+        self.assertEqual(obter_resumo_alertas(self.rui)['total'], 1)
+
+    def test_editar_sem_mudar_de_dono_nao_mexe_nas_embalagens(self):
+        self.medicamento.nome_comercial = 'Ben-u-ron 1g'
+        with self.assertNumQueries(3):
+            # pre_save (dono anterior), UPDATE do medicamento e o resumo marcado desactualizado
+            self.medicamento.save()
+
+    def test_backfill_da_migracao_0003(self):
+        migracao = importlib.import_module('pharmacy.migrations.0003_embalagem_utilizador')
+        for dias in range(5):
+            criar_embalagem(self.ana, dias=dias, medicamento=self.medicamento)
+        outra = criar_embalagem(self.rui)
+        # Como antes da migração: o dono ainda não está na embalagem
+        Embalagem.objects.update(utilizador=self.rui)
+
+        with patch.object(migracao, 'TAMANHO_LOTE', 2):
+            migracao.preencher_utilizador(django_apps, connection.schema_editor())
+
+        self.assertEqual(Embalagem.objects.filter(utilizador=self.ana).count(), 6)
+        self.assertEqual(Embalagem.objects.get(utilizador=self.rui), outra)
+
+
+class PaginacaoTests(TestCase):
+    """Paginação por cursor (keyset) das listagens."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        medicamento = Medicamento.objects.create(utilizador=self.user, nome_comercial='Ben-u-ron')
+        # Validades repetidas: o id desempata e nenhuma linha se perde entre páginas
+        self.embalagens = [
+            criar_embalagem(self.user, dias=10 + i // 2, medicamento=medicamento)
+            for i in range(5)
+        ]
+        self.client.force_login(self.user)
+
+    def test_percorrer_as_paginas_pelo_cursor(self):
+        vistas = []
+        url = '/medicamentos/stock/?tamanho=2'
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            pagina = resposta.context['embalagens']
+            self.assertLessEqual(len(pagina), 2)
+            vistas += [embalagem.pk for embalagem in pagina]
+            # Os links são só a query string, relativos à própria listagem
+            url = pagina.url_seguinte and '/medicamentos/stock/' + pagina.url_seguinte
+
+        self.assertEqual(vistas, [embalagem.pk for embalagem in self.embalagens])
+        self.assertIsNotNone(pagina.url_primeira)
+
+    def test_cursor_invalido_devolve_404(self):
+        for cursor in ('nao-e-um-cursor', codificar_cursor(['2026-01-01'])):
+            resposta = self.client.get('/medicamentos/stock/', {'cursor': cursor})
+            self.assertEqual(resposta.status_code, 404)
+
+    def test_tamanho_limitado_ao_maximo(self):
+        with patch('pharmacy.paginacao.TAMANHO_PAGINA_MAXIMO', 3):
+            resposta = self.client.get('/medicamentos/stock/', {'tamanho': 1000})
+        pagina = resposta.context['embalagens']
+        self.assertEqual(len(pagina), 3)
+        self.assertTrue(pagina.tem_seguinte)
+
+        for tamanho in ('0', 'abc'):
+            pedido = RequestFactory().get('/', {'tamanho': tamanho})
+            self.assertGreaterEqual(obter_tamanho_pagina(pedido), 1)
+
+    def test_indices_da_embalagem_por_utilizador(self):
+        # 0004 continua na cadeia: as bases de dados migradas já a aplicaram
+        grafo = MigrationLoader(None, ignore_no_migrations=True).graph
+        self.assertEqual(
+            [pai.key for pai in grafo.node_map[('pharmacy', '0005_pesquisa_fts')].parents],
+            [('pharmacy', '0004_embalagem_indice_paginacao')],
+        )
+
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, Embalagem._meta.db_table)
+        colunas = [indice['columns'] for indice in indices.values() if indice['index']]
+        self.assertIn(['utilizador_id', 'data_validade'], colunas)
+        # As procuras só por utilizador usam o índice composto
+        self.assertNotIn(['utilizador_id'], colunas)
+
+
+class ConsumoTests(TestCase):
+    """Registo de consumos e desconto de stock."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=5)
+        self.client.force_login(self.user)
+
+    def test_consumo_desconta_stock(self):
+        registar_consumo(self.embalagem, 2)
+        self.embalagem.refresh_from_db()
+        self.assertEqual(self.embalagem.quantidade_actual, 3)
+        self.assertEqual(Consumo.objects.count(), 1)
+
+    def test_consumo_sem_stock_nao_grava_nada(self):
+        with self.assertRaises(StockInsuficiente):
+            registar_consumo(self.embalagem, 6)
+        self.embalagem.refresh_from_db()
+        self.assertEqual(self.embalagem.quantidade_actual, 5)
+        self.assertFalse(Consumo.objects.exists())
+
+    def test_conflito_aparece_como_erro_do_formulario(self):
+        def esvaziar_e_consumir(*args, **kwargs):
+            # Outro pedido esvazia a embalagem depois de o formulário a validar
+            Embalagem.objects.filter(pk=self.embalagem.pk).update(quantidade_actual=0)
+            return registar_consumo(*args, **kwargs)
+
+        with patch('pharmacy.views.registar_consumo', side_effect=esvaziar_e_consumir):
+            resposta = self.client.post('/medicamentos/consumo/novo/', {
+                'embalagem': self.embalagem.pk,
+                'quantidade': 1,
+            })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(
+            resposta.context['form'].non_field_errors(),
+            ['Quantidade indisponível. Esta embalagem tem apenas 0 unidades disponíveis.'],
+        )
+        self.assertFalse(Consumo.objects.exists())
+
+
+class ConsumoFefoTests(TestCase):
+    """Consumo por medicamento repartido pelas embalagens (FEFO)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.tardia = criar_embalagem(self.user, quantidade=10, dias=200)
+        self.medicamento = self.tardia.medicamento
+        self.cedo = criar_embalagem(self.user, quantidade=3, dias=10, medicamento=self.medicamento)
+        self.expirada = criar_embalagem(self.user, quantidade=5, dias=-1, medicamento=self.medicamento)
+
+    def test_reparte_pelas_embalagens_que_expiram_primeiro(self):
+        consumos = consumir_por_medicamento(self.medicamento, 5)
+
+        self.assertEqual(
+            [(c.embalagem_id, c.quantidade) for c in consumos],
+            [(self.cedo.pk, 3), (self.tardia.pk, 2)],
+        )
+        for embalagem, esperado in ((self.cedo, 0), (self.tardia, 8), (self.expirada, 5)):
+            embalagem.refresh_from_db()
+            self.assertEqual(embalagem.quantidade_actual, esperado)
+
+    def test_ignora_expiradas_e_recusa_se_nao_houver_stock(self):
+        with self.assertRaises(StockInsuficiente):
+            consumir_por_medicamento(self.medicamento, 14)
+        self.assertFalse(Consumo.objects.exists())
+        self.tardia.refresh_from_db()
+        self.assertEqual(self.tardia.quantidade_actual, 10)
+
+    def test_view_regista_consumo(self):
+        self.client.force_login(self.user)
+        resposta = self.client.post('/medicamentos/consumo/medicamento/', {
+            'medicamento': self.medicamento.pk,
+            'quantidade': 4,
+        })
+        self.assertRedirects(resposta, '/medicamentos/stock/')
+        self.assertEqual(Consumo.objects.count(), 2)
+
+
+class ImportacaoTests(TestCase):
+    """Importação em massa (CSV / JSON Lines)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana')
+        self.existente = Medicamento.objects.create(
+            utilizador=self.user, nome_comercial='Ben-u-ron', principio_activo='Paracetamol'
+        )
+
+    def importar(self, texto, formato='csv', lote=2):
+        return ImportadorStock(self.user, tamanho_lote=lote).importar(
+            ler_linhas(io.StringIO(texto), formato)
+        )
+
+    def test_csv_reaproveita_medicamentos_e_cria_embalagens(self):
+        resultado = self.importar(
+            'nome_comercial,principio_activo,quantidade_inicial,data_validade\n'
+            'BEN-U-RON,paracetamol,20,2030-01-31\n'
+            'Brufen,Ibuprofeno,10,31/12/2030\n'
+            'Brufen,Ibuprofeno,5,2031-06-30\n'
+        )
+        self.assertEqual(resultado.total_erros, 0)
+        self.assertEqual(resultado.medicamentos_criados, 1)
+        self.assertEqual(resultado.embalagens_criadas, 3)
+        self.assertEqual(self.existente.embalagens.count(), 1)
+        self.assertEqual(Embalagem.objects.filter(utilizador=self.user).count(), 3)
+        # Cada embalagem importada tem a sua entrada no registo de movimentos
+        self.assertEqual(MovimentoStock.objects.filter(tipo='entrada').count(), 3)
+        self.assertEqual(verificar(), [])
+
+    def test_linhas_invalidas_nao_criam_nada(self):
+        resultado = self.importar(
+            '{"nome_comercial": "Aspirina", "quantidade_inicial": "muitos", "data_validade": "2030-01-01"}\n'
+            '{"principio_activo": "Sem nome"}\n',
+            formato='jsonl',
+        )
+        self.assertEqual(resultado.total_erros, 2)
+        self.assertFalse(Medicamento.objects.filter(nome_comercial='Aspirina').exists())
+        self.assertFalse(Embalagem.objects.exists())
+
+    def test_json_invalido_numa_linha_nao_para_a_importacao(self):
+        resultado = self.importar(
+            '{"nome_comercial": "Aspirina", "quantidade_inicial": "10", "data_validade": "2030-01-01"}\n'
+            '{"nome_comercial": "Brufen", \n'
+            '{"nome_comercial": "Brufen", "quantidade_inicial": "5", "data_validade": "2030-01-01"}\n',
+            formato='jsonl',
+        )
+        self.assertEqual(resultado.linhas, 3)
+        self.assertEqual(resultado.total_erros, 1)
+        self.assertEqual(resultado.erros[0][0], 2)
+        self.assertTrue(resultado.erros[0][1].startswith('JSON inválido'))
+        self.assertEqual(resultado.embalagens_criadas, 2)
+
+    def test_lote_que_falha_nao_deixa_os_anteriores_na_cache(self):
+        versao = versao_dados(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True), \
+                patch('pharmacy.importacao.registar_entradas', side_effect=[None, OperationalError]):
+            with self.assertRaises(OperationalError):
+                self.importar(
+                    'nome_comercial,quantidade_inicial,data_validade\n'
+                    'Aspirina,10,2030-01-31\n'
+                    'Brufen,5,2030-01-31\n',
+                    lote=1,
+                )
+        # O primeiro lote ficou gravado e a versão dos dados mudou
+        self.assertTrue(Embalagem.objects.filter(medicamento__nome_comercial='Aspirina').exists())
+        self.assertFalse(Embalagem.objects.filter(medicamento__nome_comercial='Brufen').exists())
+        self.assertNotEqual(versao_dados(self.user.pk), versao)
+
+
+class ExportacaoTests(TestCase):
+    """Exportação em CSV / JSON Lines (view exportar e comando export_stock)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.perto = criar_embalagem(self.user, dias=10)
+        self.longe = criar_embalagem(self.user, dias=400, nome='Brufen')
+        self.alheia = criar_embalagem(User.objects.create_user('rui'), dias=10, nome='Aspirina')
+        self.client.force_login(self.user)
+
+    def exportar(self, tipo, **parametros):
+        resposta = self.client.get(f'/medicamentos/exportar/{tipo}/', parametros)
+        self.assertEqual(resposta.status_code, 200)
+        return b''.join(resposta.streaming_content).decode()
+
+    def test_csv_so_com_os_dados_do_utilizador(self):
+        linhas = self.exportar('embalagens').splitlines()
+        self.assertEqual(linhas[0].split(',')[:3], ['id', 'medicamento_id', 'medicamento'])
+        self.assertEqual(
+            [linha.split(',')[0] for linha in linhas[1:]],
+            [str(self.perto.pk), str(self.longe.pk)],
+        )
+
+    def test_filtros_de_data_e_medicamento(self):
+        limite = (date.today() + timedelta(days=30)).isoformat()
+        linhas = self.exportar('embalagens', formato='jsonl', ate=limite).splitlines()
+        self.assertEqual([json.loads(linha)['id'] for linha in linhas], [self.perto.pk])
+
+        linhas = self.exportar('embalagens', formato='jsonl', medicamento=self.longe.medicamento_id).splitlines()
+        self.assertEqual([json.loads(linha)['medicamento'] for linha in linhas], ['Brufen'])
+
+        # O medicamento de outro utilizador não devolve nada
+        self.assertEqual(self.exportar('embalagens', formato='jsonl', medicamento=self.alheia.medicamento_id), '')
+
+    def test_consumos_filtrados_pelo_dia(self):
+        registar_consumo(self.perto, 2)
+        registar_consumo(self.alheia, 1)
+        hoje = timezone.localdate().isoformat()
+        linhas = self.exportar('consumos', formato='jsonl', desde=hoje, ate=hoje).splitlines()
+        self.assertEqual([json.loads(linha)['quantidade'] for linha in linhas], [2])
+        ontem = (timezone.localdate() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.exportar('consumos', formato='jsonl', ate=ontem), '')
+
+    def test_tipo_ou_filtro_invalido(self):
+        self.assertEqual(self.client.get('/medicamentos/exportar/utilizadores/').status_code, 404)
+        self.assertEqual(self.client.get('/medicamentos/exportar/embalagens/', {'desde': 'ontem'}).status_code, 400)
+
+    def test_comando_export_stock(self):
+        saida = io.StringIO()
+        call_command('export_stock', 'medicamentos', formato='jsonl', utilizador='ana', stdout=saida)
+        nomes = [json.loads(linha)['nome_comercial'] for linha in saida.getvalue().splitlines()]
+        self.assertEqual(nomes, ['Ben-u-ron', 'Brufen'])
+
+        # Sem --utilizador: todos, com o cabeçalho CSV uma só vez
+        saida = io.StringIO()
+        call_command('export_stock', 'medicamentos', stdout=saida)
+        linhas = saida.getvalue().splitlines()
+        self.assertEqual(len(linhas), 4)
+        self.assertEqual(sum(linha.startswith('id,') for linha in linhas), 1)
+
+
+class ApiTests(TestCase):
+    """API JSON: autenticação e pedidos condicionais (ETag)."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=5)
+        self.client.force_login(self.user)
+
+    def test_sem_sessao_devolve_401(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/embalagens/').status_code, 401)
+
+    def test_etag_devolve_304_ate_os_dados_mudarem(self):
+        resposta = self.client.get('/api/embalagens/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.json()['resultados']), 1)
+        etag = resposta['ETag']
+
+        resposta = self.client.get('/api/embalagens/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            registar_consumo(self.embalagem, 1)
+        resposta = self.client.get('/api/embalagens/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['resultados'][0]['quantidade_actual'], 4)
+
+    def test_mudanca_de_dono_muda_o_etag_do_dono_anterior(self):
+        etag = self.client.get('/api/embalagens/')['ETag']
+
+        medicamento = self.embalagem.medicamento
+        medicamento.utilizador = User.objects.create_user('rui')
+        with self.captureOnCommitCallbacks(execute=True):
+            medicamento.save()
+
+        resposta = self.client.get('/api/embalagens/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['resultados'], [])
+
+    def test_deploy_exige_cache_partilhada(self):
+        self.assertEqual([erro.id for erro in verificar_cache_partilhada(None)], ['pharmacy.E001'])
+        partilhada = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=partilhada):
+            self.assertEqual(verificar_cache_partilhada(None), [])
+
+
+class PesquisaTests(TestCase):
+    """Pesquisa de texto (FTS5): prefixos, acentos e sincronização."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        Medicamento.objects.create(utilizador=self.user, nome_comercial='Ácido Fólico')
+        # bulk_create não dispara signals: o índice é mantido por triggers
+        Medicamento.objects.bulk_create([
+            Medicamento(utilizador=self.user, nome_comercial='Ben-u-ron', principio_activo='Paracetamol'),
+        ])
+
+    def nomes(self, texto):
+        return [linha['nome_comercial'] for linha in pesquisar_medicamentos(self.user, texto)]
+
+    def test_prefixo_e_acentos(self):
+        self.assertEqual(self.nomes('parac'), ['Ben-u-ron'])
+        self.assertEqual(self.nomes('acido FOL'), ['Ácido Fólico'])
+        self.assertEqual(self.nomes('"*'), [])
+
+    def test_indice_acompanha_alteracoes(self):
+        medicamento = Medicamento.objects.get(nome_comercial='Ben-u-ron')
+        medicamento.nome_comercial = 'Panadol'
+        medicamento.save()
+        self.assertEqual(self.nomes('ben'), [])
+        self.assertEqual(self.nomes('pana'), ['Panadol'])
+
+        embalagem = criar_embalagem(self.user, medicamento=medicamento)
+        Embalagem.objects.filter(pk=embalagem.pk).update(lote='L2026-A')
+        self.assertEqual(list(filtrar_embalagens(Embalagem.objects.all(), 'l2026')), [embalagem])
+
+        medicamento.delete()
+        self.assertEqual(self.nomes('pana'), [])
+
+    def test_lista_ordenada_por_relevancia(self):
+        Medicamento.objects.create(utilizador=self.user, nome_comercial='Paracetamol Generis')
+        self.client.force_login(self.user)
+
+        nomes = []
+        url = '/medicamentos/?q=paracetamol&tamanho=1'
+        while url:
+            pagina = self.client.get(url).context['medicamentos']
+            nomes += [medicamento.nome_comercial for medicamento in pagina]
+            url = pagina.url_seguinte and '/medicamentos/' + pagina.url_seguinte
+        # O nome comercial pesa mais do que o princípio activo (não a ordem alfabética)
+        self.assertEqual(nomes, ['Paracetamol Generis', 'Ben-u-ron'])
+
+
+class AlertSnapshotTests(TestCase):
+    """Resumo de alertas pré-calculado e comando refresh_expiry_state."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.expirada = criar_embalagem(self.user, dias=-5)
+        self.a_expirar = criar_embalagem(self.user, dias=3, medicamento=self.expirada.medicamento)
+        self.longe = criar_embalagem(self.user, dias=100, medicamento=self.expirada.medicamento)
+        self.hoje = date.today()
+
+    def test_grupos_e_proxima_mudanca(self):
+        snapshot = obter_snapshot(self.user, hoje=self.hoje)
+        self.assertEqual((snapshot.expiradas, snapshot.a_expirar), (1, 1))
+        # A embalagem a expirar passa a expirada no dia a seguir à validade
+        self.assertEqual(snapshot.proxima_mudanca, self.hoje + timedelta(days=4))
+
+    def test_alteracao_de_stock_marca_desactualizado(self):
+        obter_snapshot(self.user, hoje=self.hoje)
+        registar_consumo(self.a_expirar, 10)
+        self.assertTrue(AlertSnapshot.objects.get(utilizador=self.user).desactualizado)
+
+        snapshot = obter_snapshot(self.user, hoje=self.hoje)
+        self.assertEqual(snapshot.a_expirar, 0)
+        self.assertFalse(snapshot.desactualizado)
+
+    def test_comando_so_recalcula_quando_muda_o_dia_certo(self):
+        call_command('refresh_expiry_state', data=self.hoje, stdout=io.StringIO())
+
+        call_command('refresh_expiry_state', data=self.hoje + timedelta(days=1), stdout=io.StringIO())
+        snapshot = AlertSnapshot.objects.get(utilizador=self.user)
+        self.assertEqual(snapshot.data_referencia, self.hoje + timedelta(days=1))
+        self.assertEqual(snapshot.expiradas, 1)
+
+        call_command('refresh_expiry_state', data=self.hoje + timedelta(days=4), stdout=io.StringIO())
+        snapshot.refresh_from_db()
+        self.assertEqual((snapshot.expiradas, snapshot.a_expirar), (2, 0))
+        self.assertEqual(snapshot.proxima_mudanca, self.hoje + timedelta(days=70))
+
+    def test_leituras_e_gravacao_na_mesma_transaccao(self):
+        with CaptureQueriesContext(connection) as consultas:
+            calcular_snapshots([self.user.pk], hoje=self.hoje)
+        sql = [consulta['sql'] for consulta in consultas.captured_queries]
+        # Dentro do TestCase, o atomic() é um savepoint à volta de tudo
+        self.assertTrue(sql[0].startswith('SAVEPOINT'))
+        self.assertTrue(sql[-1].startswith('RELEASE SAVEPOINT'))
+        self.assertEqual(sum('pharmacy_embalagem' in linha for linha in sql), 2)
+
+    def test_listas_lidas_pela_janela_de_validade(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/medicamentos/alertas/')
+        self.assertEqual([e.pk for e in resposta.context['expiradas']], [self.expirada.pk])
+        self.assertEqual([e.pk for e in resposta.context['a_expirar']], [self.a_expirar.pk])
+        self.assertFalse(any(
+            '"pharmacy_embalagem"."id" IN' in consulta['sql'] for consulta in consultas.captured_queries
+        ))
+
+        resposta = self.client.get('/api/alertas/')
+        self.assertEqual(
+            [(linha['id'], linha['estado']) for linha in resposta.json()['resultados']],
+            [(self.expirada.pk, 'expirada'), (self.a_expirar.pk, 'a_expirar')],
+        )
+
+
+class PrevisaoTests(TestCase):
+    """Previsão de fim de stock a partir do histórico de consumos."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.hoje = timezone.localdate()
+        # Duas embalagens de 10: uma expira daqui a 3 dias, a outra daqui a 100
+        self.curta = criar_embalagem(self.user, quantidade=10, dias=3)
+        self.longa = criar_embalagem(self.user, quantidade=10, dias=100, medicamento=self.curta.medicamento)
+        # 2 unidades por dia nos últimos 20 dias (de uma embalagem já gasta)
+        antiga = criar_embalagem(self.user, quantidade=0, dias=-1, medicamento=self.curta.medicamento)
+        agora = timezone.now()
+        Consumo.objects.bulk_create([
+            Consumo(embalagem=antiga, quantidade=2, data_hora=agora - timedelta(days=dia))
+            for dia in range(20)
+        ])
+        # bulk_create não dispara signals: os totais diários vêm do backfill
+        reconstruir()
+
+    def test_taxa_data_fim_e_embalagens_em_risco(self):
+        previsao, = prever_utilizador(self.user, hoje=self.hoje)
+        self.assertAlmostEqual(previsao.taxa_media, 2.0)
+        self.assertAlmostEqual(previsao.taxa_ewma, 2.0)
+        self.assertEqual(previsao.stock, 20)
+
+        # Até à validade (4 dias, contando hoje) só se gastam 8 da primeira
+        self.assertEqual(len(previsao.embalagens_em_risco), 1)
+        embalagem_id, _, sobra = previsao.embalagens_em_risco[0]
+        self.assertEqual(embalagem_id, self.curta.pk)
+        self.assertAlmostEqual(sobra, 2.0)
+        self.assertEqual(previsao.data_fim, self.hoje + timedelta(days=9))
+
+    def test_sem_consumos_nao_ha_previsao(self):
+        Consumo.objects.all().delete()
+        previsao, = prever_utilizador(self.user, hoje=self.hoje)
+        self.assertIsNone(previsao.data_fim)
+        self.assertEqual(previsao.embalagens_em_risco, [])
+
+
+class ConsumoDiarioTests(TestCase):
+    """Totais diários de consumo: actualização incremental, backfill e compactação."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=50)
+        self.medicamento = self.embalagem.medicamento
+        self.hoje = timezone.localdate()
+
+    def totais(self):
+        return list(ConsumoDiario.objects.order_by('dia').values_list('medicamento_id', 'dia', 'quantidade', 'numero_consumos'))
+
+    def test_registar_editar_e_apagar_consumos(self):
+        primeiro = registar_consumo(self.embalagem, 2)
+        registar_consumo(self.embalagem, 3)
+        self.assertEqual(self.totais(), [(self.medicamento.pk, self.hoje, 5, 2)])
+
+        # Mudar o consumo para ontem passa-o para o total desse dia
+        primeiro.data_hora -= timedelta(days=1)
+        primeiro.save()
+        self.assertEqual(self.totais(), [
+            (self.medicamento.pk, self.hoje - timedelta(days=1), 2, 1),
+            (self.medicamento.pk, self.hoje, 3, 1),
+        ])
+
+        primeiro.delete()
+        self.assertEqual(self.totais(), [(self.medicamento.pk, self.hoje, 3, 1)])
+
+    def test_embalagem_muda_de_medicamento(self):
+        registar_consumo(self.embalagem, 4)
+        outro = Medicamento.objects.create(utilizador=self.user, nome_comercial='Panadol')
+        self.embalagem.medicamento = outro
+        self.embalagem.save()
+        self.assertEqual(self.totais(), [(outro.pk, self.hoje, 4, 1)])
+
+    def test_backfill_e_compactacao_mantem_os_totais(self):
+        agora = timezone.now()
+        Consumo.objects.bulk_create([
+            Consumo(embalagem=self.embalagem, quantidade=1, data_hora=agora - timedelta(days=dia))
+            for dia in (0, 0, 40, 41)
+        ])
+        self.assertEqual(reconstruir(tamanho_lote=3), 4)
+        esperado = [
+            (self.medicamento.pk, self.hoje - timedelta(days=41), 1, 1),
+            (self.medicamento.pk, self.hoje - timedelta(days=40), 1, 1),
+            (self.medicamento.pk, self.hoje, 2, 2),
+        ]
+        self.assertEqual(self.totais(), esperado)
+
+        self.assertEqual(compactar(self.hoje - timedelta(days=30)), 2)
+        self.assertEqual(Consumo.objects.count(), 2)
+        self.assertEqual(self.totais(), esperado)
+
+        # Um novo backfill não toca nos dias já compactados
+        reconstruir()
+        self.assertEqual(self.totais(), esperado)
+
+    def test_apagar_embalagem_retira_os_consumos_de_uma_vez(self):
+        outra = criar_embalagem(self.user, quantidade=50, medicamento=self.medicamento)
+        registar_consumo(self.embalagem, 1)
+        for _ in range(5):
+            registar_consumo(outra, 2)
+        self.assertEqual(self.totais(), [(self.medicamento.pk, self.hoje, 11, 6)])
+
+        # As queries não dependem do número de consumos da embalagem
+        with CaptureQueriesContext(connection) as com_um:
+            self.embalagem.delete()
+        self.assertEqual(self.totais(), [(self.medicamento.pk, self.hoje, 10, 5)])
+        with CaptureQueriesContext(connection) as com_cinco:
+            outra.delete()
+        self.assertEqual(len(com_cinco), len(com_um))
+        self.assertEqual(self.totais(), [])
+
+    def test_apagar_medicamento_apaga_os_totais(self):
+        registar_consumo(self.embalagem, 3)
+        self.medicamento.delete()
+        self.assertEqual(self.totais(), [])
+
+
+class MovimentoStockTests(TestCase):
+    """Registo de movimentos de stock, snapshots e reconstrução."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.medicamento = Medicamento.objects.create(utilizador=self.user, nome_comercial='Ben-u-ron')
+        self.client.force_login(self.user)
+
+    def dados_embalagem(self, quantidade):
+        return {
+            'medicamento': self.medicamento.pk,
+            'quantidade_inicial': quantidade,
+            'unidade': 'comprimidos',
+            'data_validade': date.today() + timedelta(days=90),
+        }
+
+    def movimentos(self, embalagem_id):
+        return list(MovimentoStock.objects.filter(
+            embalagem_id=embalagem_id
+        ).order_by('id').values_list('tipo', 'quantidade'))
+
+    def test_operacoes_de_stock_ficam_registadas(self):
+        self.client.post('/medicamentos/stock/nova/', self.dados_embalagem(20))
+        embalagem = Embalagem.objects.get()
+        registar_consumo(embalagem, 3)
+        consumir_por_medicamento(self.medicamento, 2)
+
+        # Reduzir a quantidade inicial reduz a actual na mesma medida
+        self.client.post(f'/medicamentos/stock/{embalagem.pk}/editar/', self.dados_embalagem(18))
+        embalagem.refresh_from_db()
+        self.assertEqual((embalagem.quantidade_inicial, embalagem.quantidade_actual), (18, 13))
+        self.assertEqual(verificar(), [])
+
+        self.client.post(f'/medicamentos/stock/{embalagem.pk}/eliminar/')
+        self.assertEqual(self.movimentos(embalagem.pk), [
+            ('entrada', 20), ('consumo', -3), ('consumo', -2), ('ajuste', -2), ('abate', -13),
+        ])
+
+    def test_movimentos_nao_podem_ser_alterados(self):
+        embalagem = criar_embalagem(self.user, medicamento=self.medicamento)
+        registar_consumo(embalagem, 1)
+        movimento = MovimentoStock.objects.get()
+        with self.assertRaises(ValueError):
+            movimento.save()
+        with self.assertRaises(ValueError):
+            movimento.delete()
+
+    def test_verificacao_detecta_alteracoes_por_fora(self):
+        self.client.post('/medicamentos/stock/nova/', self.dados_embalagem(10))
+        embalagem = Embalagem.objects.get()
+        Embalagem.objects.filter(pk=embalagem.pk).update(quantidade_actual=7)
+        self.assertEqual(verificar(), [(embalagem.pk, 7, 10)])
+
+        with self.assertRaises(CommandError):
+            call_command('verify_stock_ledger', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_stock_numa_data_passada(self):
+        self.client.post('/medicamentos/stock/nova/', self.dados_embalagem(10))
+        embalagem = Embalagem.objects.get()
+        registar_consumo(embalagem, 2)
+        antes = timezone.now()
+        self.assertEqual(criar_snapshots(), 1)
+        # Sem movimentos novos não há snapshots novos
+        self.assertEqual(criar_snapshots(), 0)
+
+        # Movimentos e snapshot seguintes "mais tarde" (o registo guarda a
+        # hora de cada movimento; aqui é alterada só para o teste)
+        registar_consumo(embalagem, 3)
+        MovimentoStock.objects.filter(quantidade=-3).update(data_hora=antes + timedelta(hours=1))
+        criar_snapshots(agora=antes + timedelta(hours=2))
+        registar_consumo(embalagem, 1)
+        MovimentoStock.objects.filter(quantidade=-1).update(data_hora=antes + timedelta(hours=3))
+
+        self.assertEqual(stock_em([embalagem.pk], antes - timedelta(days=1)), {})
+        self.assertEqual(stock_em([embalagem.pk], antes), {embalagem.pk: 8})
+        self.assertEqual(stock_em([embalagem.pk], antes + timedelta(hours=1)), {embalagem.pk: 5})
+        self.assertEqual(stock_em([embalagem.pk], antes + timedelta(hours=2)), {embalagem.pk: 5})
+        self.assertEqual(stock_em([embalagem.pk], antes + timedelta(hours=3)), {embalagem.pk: 4})
+
+
+class InstrumentacaoTests(OrcamentoQueriesMixin, TestCase):
+    """Métricas por pedido e orçamentos de queries das views principais."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='teste12345')
+        # Várias embalagens de medicamentos diferentes, para apanhar N+1
+        self.embalagens = [
+            criar_embalagem(self.user, dias=dias, nome=nome)
+            for dias, nome in ((-3, 'Ben-u-ron'), (10, 'Brufen'), (200, 'Aspirina'))
+        ]
+        self.medicamento = self.embalagens[0].medicamento
+        self.client.force_login(self.user)
+
+    def test_impressao_digital_ignora_os_valores(self):
+        self.assertEqual(
+            impressao_digital("SELECT * FROM t WHERE id = 7 AND nome = 'a''b' AND x IN (%s, %s, %s)"),
+            impressao_digital("SELECT * FROM t WHERE id = 12 AND nome = 'c' AND x IN (%s, %s)"),
+        )
+
+    def test_cabecalho_server_timing_e_registo_json(self):
+        with self.assertLogs('pharmacy.pedidos', 'INFO') as registos:
+            resposta = self.client.get('/medicamentos/stock/')
+        self.assertIn('sql;dur=', resposta['Server-Timing'])
+
+        registo = json.loads(registos.records[-1].getMessage())
+        self.assertEqual(registo['view'], 'pharmacy:embalagem_lista')
+        self.assertGreater(registo['queries'], 0)
+        self.assertGreater(registo['templates_ms'], 0)
+
+    def test_orcamentos_das_listagens(self):
+        self.assertOrcamentoQueries('/', 4)
+        self.assertOrcamentoQueries('/medicamentos/', 3)
+        self.assertOrcamentoQueries('/medicamentos/stock/', 3)
+        self.assertOrcamentoQueries('/medicamentos/alertas/', 5)
+
+    def test_orcamentos_dos_formularios(self):
+        # Os POST incluem a transacção: stock, consumo, totais diários,
+        # resumo de alertas e registo de movimentos
+        embalagem = self.embalagens[1]
+        self.assertOrcamentoQueries('/medicamentos/novo/', 2)
+        self.assertOrcamentoQueries(f'/medicamentos/{self.medicamento.pk}/editar/', 3)
+        self.assertOrcamentoQueries('/medicamentos/stock/nova/', 3)
+        self.assertOrcamentoQueries(f'/medicamentos/stock/{embalagem.pk}/editar/', 4)
+        self.assertOrcamentoQueries('/medicamentos/consumo/novo/', 3)
+        self.assertOrcamentoQueries('/medicamentos/consumo/medicamento/', 3)
+        self.assertOrcamentoQueries('/medicamentos/stock/nova/', 9, dados={
+            'medicamento': self.medicamento.pk,
+            'quantidade_inicial': 10,
+            'unidade': 'comprimidos',
+            'data_validade': date.today() + timedelta(days=30),
+        })
+        self.assertOrcamentoQueries('/medicamentos/consumo/novo/', 14, dados={
+            'embalagem': embalagem.pk,
+            'quantidade': 1,
+        })
+        self.assertOrcamentoQueries('/medicamentos/consumo/medicamento/', 11, dados={
+            'medicamento': embalagem.medicamento_id,
+            'quantidade': 1,
+        })
+
+
+class SinteticoTests(TestCase):
+    """Gerador de dados sintéticos e benchmarks."""
+
+    def test_dados_gerados_sao_coerentes_e_reprodutiveis(self):
+        ids = gerar(3, medicamentos_por_utilizador=4, embalagens_por_medicamento=2, consumos_por_embalagem=5, tamanho_lote=2)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(Medicamento.objects.count(), 12)
+        self.assertEqual(Embalagem.objects.count(), 24)
+        self.assertEqual(verificar(), [])
+        self.assertEqual(
+            ConsumoDiario.objects.aggregate(total=Sum('quantidade'))['total'],
+            Consumo.objects.aggregate(total=Sum('quantidade'))['total'],
+        )
+
+        validades = list(Embalagem.objects.order_by('id').values_list('data_validade', flat=True))
+        Embalagem.objects.all().delete()
+        gerar(3, medicamentos_por_utilizador=4, embalagens_por_medicamento=2, consumos_por_embalagem=5, prefixo='outro')
+        self.assertEqual(list(Embalagem.objects.order_by('id').values_list('data_validade', flat=True)), validades)
+
+    def test_benchmarks_medem_todos_os_cenarios(self):
+        resultados = executar([1, 2], repeticoes=2, medicamentos_por_utilizador=2, consumos_por_embalagem=2)
+        self.assertEqual(len(resultados), 2 * len(CENARIOS))
+        for resultado in resultados:
+            self.assertGreater(resultado['queries'], 0)
+            self.assertGreaterEqual(resultado['p95_ms'], resultado['p50_ms'])
+
+
+class LeituraEscritaTests(TestCase):
+    """Router: leituras das views marcadas na cópia, escritas e o resto na 'default'."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ana', password='x')
+        self.router = LeituraEscritaRouter()
+        # Só a configuração: os testes não chegam a ligar-se à cópia
+        connections.settings[ALIAS_LEITURA] = dict(connection.settings_dict)
+        self.addCleanup(connections.settings.pop, ALIAS_LEITURA)
+
+    def encaminhar(self, corpo, metodo='get'):
+        """Corre 'corpo' dentro de uma view @ler_da_copia e devolve o que ele devolver."""
+        pedido = getattr(RequestFactory(), metodo)('/')
+        pedido.user = self.user
+        return ler_da_copia(lambda request: corpo())(pedido)
+
+    def test_views_marcadas_lem_da_copia(self):
+        self.assertEqual(self.encaminhar(lambda: self.router.db_for_read(Embalagem)), ALIAS_LEITURA)
+        self.assertEqual(self.encaminhar(lambda: self.router.db_for_read(Embalagem), 'post'), 'default')
+        self.assertEqual(self.router.db_for_read(Embalagem), 'default')
+
+    def test_depois_de_escrever_le_da_default(self):
+        def corpo():
+            antes = self.router.db_for_read(Embalagem)
+            self.assertEqual(self.router.db_for_write(Embalagem), 'default')
+            return antes, self.router.db_for_read(Embalagem)
+        self.assertEqual(self.encaminhar(corpo), (ALIAS_LEITURA, 'default'))
+
+    def test_dentro_de_transaccao_le_da_default(self):
+        def corpo():
+            with transaction.atomic():
+                return self.router.db_for_read(Embalagem)
+        self.assertEqual(self.encaminhar(corpo), 'default')
+
+    @override_settings(PHARMACY_LEITURA_ATRASO_MAXIMO=60)
+    def test_dados_alterados_ha_pouco_lem_da_default(self):
+        incrementar_versao(self.user.pk)
+        self.assertEqual(self.encaminhar(lambda: self.router.db_for_read(Embalagem)), 'default')
+
+    def test_perfil_de_producao_partilha_o_carimbo_entre_processos(self):
+        with override_settings(CACHES=caches_de_producao(self)):
+            self.assertEqual(verificar_cache_partilhada(None), [])
+            # Cada processo tem a sua instância da cache: a escrita num vê-se no outro
+            processo_a, processo_b = caches.create_connection('default'), caches.create_connection('default')
+            with patch('pharmacy.caches.cache', processo_a):
+                incrementar_versao(self.user.pk)
+                versao = versao_dados(self.user.pk)
+            with patch('pharmacy.caches.cache', processo_b):
+                self.assertEqual(versao_dados(self.user.pk), versao)
+
+
+class CopiaLeituraTests(TransactionTestCase):
+    """Cópia só de leitura feita com a API de backup (fora de transacções)."""
+
+    def test_copia_com_api_de_backup(self):
+        Medicamento.objects.create(utilizador=User.objects.create_user('ana'), nome_comercial='Brufen')
+        with tempfile.TemporaryDirectory() as pasta:
+            destino = os.path.join(pasta, 'copia.sqlite3')
+            self.assertGreater(actualizar_copia(destino), 0)
+            with closing(sqlite3.connect(f'file:{destino}?mode=ro&immutable=1', uri=True)) as copia:
+                nomes = copia.execute('SELECT nome_comercial FROM pharmacy_medicamento').fetchall()
+            self.assertEqual(nomes, [('Brufen',)])
+            self.assertFalse(os.path.exists(f'{destino}.tmp'))
+
+    def test_recusa_dentro_de_transaccao(self):
+        with transaction.atomic(), self.assertRaises(RuntimeError):
+            actualizar_copia(os.path.join(tempfile.gettempdir(), 'nunca.sqlite3'))
+
+
+class ParticaoTests(TestCase):
+    """Partições por utilizador: escolha da partição e decisões do router."""
+
+    def setUp(self):
+        cache.clear()
+        self.ana = User.objects.create_user('ana')
+        self.rui = User.objects.create_user('rui')
+        ParticaoUtilizador.objects.create(utilizador=self.ana, base_de_dados='particao_1')
+        self.router = ParticaoRouter()
+
+    def test_hash_estavel_e_poucas_mudancas_ao_acrescentar(self):
+        ids = range(1, 3001)
+        antes = {i: particao_por_hash(i, ['a', 'b']) for i in ids}
+        self.assertEqual(antes, {i: particao_por_hash(i, ['b', 'a']) for i in ids})
+        depois = {i: particao_por_hash(i, ['a', 'b', 'c']) for i in ids}
+        mudaram = [i for i in ids if antes[i] != depois[i]]
+        # Só mudam os que passam para a partição nova (~1/3)
+        self.assertTrue(all(depois[i] == 'c' for i in mudaram))
+        self.assertAlmostEqual(len(mudaram) / len(ids), 1 / 3, delta=0.05)
+
+    def test_desligado_nao_decide(self):
+        self.assertIsNone(self.router.db_for_read(Medicamento, instance=self.ana))
+        self.assertIsNone(self.router.db_for_write(Embalagem))
+        self.assertEqual(particao_actual(), 'default')
+        with self.assertRaises(MiddlewareNotUsed):
+            ParticaoMiddleware(lambda request: None)
+
+    @override_settings(PHARMACY_PARTICOES=['particao_1'])
+    def test_dados_na_particao_do_utilizador(self):
+        self.assertEqual(self.router.db_for_read(Medicamento, instance=self.ana), 'particao_1')
+        self.assertEqual(self.router.db_for_read(Medicamento, instance=self.rui), 'default')
+        self.assertEqual(self.router.db_for_write(Medicamento, instance=Medicamento(utilizador=self.ana)), 'particao_1')
+        # Um objecto lido fica na base de dados de onde veio
+        lido = Medicamento(utilizador=self.rui)
+        lido._state.db = 'particao_1'
+        self.assertEqual(self.router.db_for_write(Medicamento, instance=lido), 'particao_1')
+        # Utilizadores e a própria tabela das partições não são particionados
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_read(ParticaoUtilizador))
+
+    @override_settings(PHARMACY_PARTICOES=['particao_1'])
+    def test_particao_do_pedido_e_fixada(self):
+        pedido = RequestFactory().get('/')
+        pedido.user = self.ana
+        middleware = ParticaoMiddleware(lambda request: self.router.db_for_read(Embalagem))
+        self.assertEqual(middleware(pedido), 'particao_1')
+        self.assertEqual(self.router.db_for_read(Embalagem), 'default')
+        with usar_particao('particao_1'):
+            self.assertEqual(self.router.db_for_read(Consumo), 'particao_1')
+            self.assertEqual(particao_actual(), 'particao_1')
+
+    @override_settings(PHARMACY_PARTICOES=['particao_1'])
+    def test_mudanca_de_particao_vista_no_pedido_seguinte(self):
+        pedido = RequestFactory().get('/')
+        pedido.user = self.rui
+
+        def duas_queries(request):
+            return self.router.db_for_read(Embalagem), self.router.db_for_write(Consumo)
+
+        middleware = ParticaoMiddleware(duas_queries)
+        # Uma query por pedido, qualquer que seja o número de decisões do router
+        with self.assertNumQueries(1):
+            self.assertEqual(middleware(pedido), ('default', 'default'))
+
+        # O rebalance_partitions (outro processo) muda o utilizador de sítio
+        ParticaoUtilizador.objects.create(utilizador=self.rui, base_de_dados='particao_1')
+        self.assertEqual(middleware(pedido), ('particao_1', 'particao_1'))
+
+    @override_settings(PHARMACY_PARTICOES=['particao_1'])
+    def test_tabela_das_particoes_so_na_default(self):
+        self.assertTrue(self.router.allow_migrate('default', 'pharmacy', 'particaoutilizador'))
+        self.assertFalse(self.router.allow_migrate('particao_1', 'pharmacy', 'particaoutilizador'))
+        self.assertIsNone(self.router.allow_migrate('particao_1', 'pharmacy', 'medicamento'))
+
+
+class MoverUtilizadorTests(TransactionTestCase):
+    """Mudança dos dados de um utilizador entre a 'default' e uma partição."""
+
+    def setUp(self):
+        cache.clear()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        connections.settings['particao_1'] = dict(
+            connection.settings_dict, NAME=os.path.join(pasta.name, 'particao_1.sqlite3'),
+        )
+        self.addCleanup(connections.settings.pop, 'particao_1')
+        self.addCleanup(self.fechar_particao)
+        with override_settings(PHARMACY_PARTICOES=['particao_1']):
+            call_command('migrate', database='particao_1', verbosity=0)
+
+    def fechar_particao(self):
+        connections['particao_1'].close()
+        del connections['particao_1']
+
+    def test_ida_e_volta(self):
+        user = User.objects.create_user('ana')
+        medicamento = Medicamento.objects.create(utilizador=user, nome_comercial='Brufen')
+        embalagem = Embalagem.objects.create(
+            medicamento=medicamento, quantidade_inicial=20, quantidade_actual=20,
+            unidade='comprimidos', data_validade=timezone.localdate() + timedelta(days=90),
+        )
+        MovimentoStock.objects.create(
+            utilizador=user, embalagem=embalagem, tipo=MovimentoStock.ENTRADA, quantidade=20,
+        )
+        registar_consumo(embalagem, 3)
+
+        with override_settings(PHARMACY_PARTICOES=['particao_1']):
+            mover_utilizador(user.pk, 'particao_1')
+            self.assertFalse(Medicamento.objects.using('default').exists())
+            with usar_particao('particao_1'):
+                movida = Embalagem.objects.get()
+                self.assertGreater(movida.pk, ESPACO_IDS)
+                self.assertEqual(movida.quantidade_actual, 17)
+                self.assertEqual(verificar(), [])
+                self.assertEqual(ConsumoDiario.objects.get().quantidade, 3)
+
+            mover_utilizador(user.pk, 'default')
+            self.assertFalse(Medicamento.objects.using('particao_1').exists())
+            self.assertFalse(User.objects.using('particao_1').exists())
+            self.assertEqual(Embalagem.objects.using('default').get().quantidade_actual, 17)
+            self.assertFalse(ParticaoUtilizador.objects.exists())
+
+    def test_escritas_na_origem_esperam_pela_mudanca(self):
+        user = User.objects.create_user('ana')
+        criar_embalagem(user)
+        ficheiro = connections.settings['particao_1']['NAME']
+        erros = []
+
+        def copiar_e_escrever(*args):
+            copiadas = copiar_dados(*args)
+            # Outro processo a escrever na origem a meio da mudança
+            with closing(sqlite3.connect(ficheiro, timeout=0)) as outra:
+                try:
+                    outra.execute("UPDATE pharmacy_embalagem SET quantidade_actual = 0")
+                except sqlite3.OperationalError as erro:
+                    erros.append(str(erro))
+            return copiadas
+
+        with override_settings(PHARMACY_PARTICOES=['particao_1']):
+            mover_utilizador(user.pk, 'particao_1')
+            with patch('pharmacy.particoes.copiar_dados', side_effect=copiar_e_escrever):
+                mover_utilizador(user.pk, 'default')
+
+        self.assertEqual(erros, ['database is locked'])
+        self.assertEqual(Embalagem.objects.using('default').get().quantidade_actual, 10)
+
+    def test_pesquisa_na_particao_sem_indices_fts(self):
+        user = User.objects.create_user('ana')
+        criar_embalagem(user, nome='Brufen')
+        with override_settings(PHARMACY_PARTICOES=['particao_1']):
+            mover_utilizador(user.pk, 'particao_1')
+            remover_fts(connections['particao_1'])
+            self.assertTrue(fts_disponivel(connections['default']))
+            self.assertFalse(fts_disponivel(connections['particao_1']))
+
+            with usar_particao('particao_1'):
+                self.assertEqual(filtrar_medicamentos(Medicamento.objects.all(), 'bru').count(), 1)
+                self.assertEqual(filtrar_embalagens(Embalagem.objects.all(), 'bru').count(), 1)
+            self.assertEqual([m['nome_comercial'] for m in pesquisar_medicamentos(user, 'bru')], ['Brufen'])
+
+            instalar_fts(connections['particao_1'])
+            self.assertTrue(fts_disponivel(connections['particao_1']))
+
+    def test_copia_incompleta_nao_apaga_a_origem(self):
+        user = User.objects.create_user('ana')
+        criar_embalagem(user)
+
+        def copiar_e_perder(utilizador_id, origem, destino):
+            copiadas = copiar_dados(utilizador_id, origem, destino)
+            Consumo.objects.using(destino).filter(embalagem__utilizador_id=utilizador_id).delete()
+            return copiadas
+
+        with override_settings(PHARMACY_PARTICOES=['particao_1']):
+            registar_consumo(Embalagem.objects.get(), 2)
+            with patch('pharmacy.particoes.copiar_dados', side_effect=copiar_e_perder):
+                with self.assertRaises(MudancaIncompleta):
+                    mover_utilizador(user.pk, 'particao_1')
+
+            self.assertEqual(Consumo.objects.using('default').count(), 1)
+            self.assertFalse(Embalagem.objects.using('particao_1').exists())
+            self.assertFalse(ParticaoUtilizador.objects.exists())
+
+
+class ViewsAssincronasTests(TestCase):
+    """Views async (PHARMACY_VIEWS_ASSINCRONAS) servidas pelo caminho ASGI."""
+
+    @classmethod
+    def recarregar_urls(cls):
+        # A escolha das views é feita ao importar os URLs
+        clear_url_caches()
+        for modulo in ('pharmacy.urls', 'domusshelf_project.urls'):
+            importlib.reload(sys.modules[modulo])
+
+    @classmethod
+    def setUpClass(cls):
+        # As limpezas correm pela ordem inversa: a definição é reposta antes
+        cls.addClassCleanup(cls.recarregar_urls)
+        cls.enterClassContext(override_settings(PHARMACY_VIEWS_ASSINCRONAS=True))
+        cls.recarregar_urls()
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.expirada = criar_embalagem(self.user, dias=-3, nome='Ben-u-ron')
+        self.a_expirar = criar_embalagem(self.user, dias=10, nome='Brufen')
+        criar_embalagem(self.user, dias=200, nome='Aspirina')
+        self.async_client.force_login(self.user)
+
+    def test_urls_usam_as_views_async(self):
+        for url in ('/', '/medicamentos/', '/medicamentos/stock/', '/medicamentos/alertas/'):
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_dashboard(self):
+        resposta = await self.async_client.get('/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['total_embalagens'], 3)
+        self.assertEqual(resposta.context['expiradas'], 1)
+        self.assertEqual(resposta.context['a_expirar'], 1)
+        # O sino vem do resumo lido antes de renderizar
+        self.assertEqual(resposta.context['alertas_count'], 2)
+
+    async def test_listagens_nao_usam_a_cache_sincrona_no_ciclo(self):
+        # Em produção a cache é em ficheiros: cada get() síncrono no ciclo
+        # de eventos bloqueia-o à espera do disco
+        no_ciclo = []
+        originais = {nome: getattr(LocMemCache, nome) for nome in ('get', 'add', 'set')}
+
+        def espiar(nome):
+            def metodo(cache_, chave, *args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    pass
+                else:
+                    no_ciclo.append((nome, chave))
+                return originais[nome](cache_, chave, *args, **kwargs)
+            return metodo
+
+        # Com a cópia de leitura, o @ler_da_copia também lê o carimbo
+        with patch.multiple(LocMemCache, **{nome: espiar(nome) for nome in originais}), \
+                patch('pharmacy.leitura.copia_configurada', return_value=True), \
+                override_settings(PHARMACY_LEITURA_ATRASO_MAXIMO=3600):
+            for url in ('/medicamentos/', '/medicamentos/stock/'):
+                resposta = await self.async_client.get(url)
+                self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(no_ciclo, [])
+
+    async def test_listagens_paginadas(self):
+        resposta = await self.async_client.get('/medicamentos/stock/', {'tamanho': 2})
+        pagina = resposta.context['embalagens']
+        self.assertEqual([e.pk for e in pagina], [self.expirada.pk, self.a_expirar.pk])
+        self.assertTrue(pagina.tem_seguinte)
+
+        resposta = await self.async_client.get('/medicamentos/stock/' + pagina.url_seguinte)
+        self.assertEqual(len(resposta.context['embalagens']), 1)
+
+        resposta = await self.async_client.get('/medicamentos/', {'q': 'brufen'})
+        self.assertEqual([m.nome_comercial for m in resposta.context['medicamentos']], ['Brufen'])
+
+        resposta = await self.async_client.get('/medicamentos/stock/', {'cursor': 'x'})
+        self.assertEqual(resposta.status_code, 404)
+
+    async def test_primeira_pesquisa_no_ciclo_de_eventos(self):
+        # Sem o resultado memorizado, a verificação dos índices FTS5 corre
+        # (numa thread) dentro da vista async
+        with patch('pharmacy.pesquisa._com_indices', set()):
+            resposta = await self.async_client.get('/medicamentos/', {'q': 'brufen'})
+        self.assertEqual([m.nome_comercial for m in resposta.context['medicamentos']], ['Brufen'])
+
+    async def test_alertas(self):
+        resposta = await self.async_client.get('/medicamentos/alertas/')
+        self.assertEqual([e.pk for e in resposta.context['expiradas']], [self.expirada.pk])
+        self.assertEqual([e.pk for e in resposta.context['a_expirar']], [self.a_expirar.pk])
+
+    async def test_sem_sessao_vai_para_o_login(self):
+        resposta = await AsyncClient().get('/medicamentos/stock/')
+        self.assertRedirects(resposta, '/accounts/login/?next=/medicamentos/stock/', fetch_redirect_response=False)
+
+    async def test_instrumentacao_no_caminho_async(self):
+        with self.assertLogs('pharmacy.pedidos', 'INFO') as registos:
+            resposta = await self.async_client.get('/')
+        self.assertIn('sql;dur=', resposta['Server-Timing'])
+        self.assertGreater(json.loads(registos.records[-1].getMessage())['queries'], 0)
+
+
+class EventosTests(TestCase):
+    """Ligação de eventos em tempo real (Server-Sent Events)."""
+
+    def setUp(self):
+        cache.clear()
+        # Um canal novo por teste: os ids dos utilizadores repetem-se entre testes
+        canal_original = eventos.canal
+        eventos.canal = eventos.Canal()
+        self.addCleanup(setattr, eventos, 'canal', canal_original)
+
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=10, dias=10)
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def consumir(self, quantidade=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            registar_consumo(self.embalagem, quantidade)
+
+    def test_wsgi_responde_com_o_estado_actual(self):
+        resposta = self.client.get('/medicamentos/eventos/')
+        self.assertEqual(resposta['Content-Type'], 'text/event-stream')
+        conteudo = resposta.content.decode()
+        self.assertIn('retry: 30000', conteudo)
+        self.assertIn('event: alertas\ndata: {"expiradas": 0, "a_expirar": 1, "total": 1}', conteudo)
+
+    def test_retoma_com_last_event_id(self):
+        self.consumir()
+        self.consumir(2)
+        primeiro, segundo = eventos.canal.desde(self.user.pk, f'{eventos.canal.instancia}-0')[0]
+        self.assertEqual(primeiro.dados['quantidade'], -1)
+
+        conteudo = self.client.get(
+            '/medicamentos/eventos/', HTTP_LAST_EVENT_ID=f'{eventos.canal.instancia}-{primeiro.numero}'
+        ).content.decode()
+        self.assertIn(f'id: {eventos.canal.instancia}-{segundo.numero}\nevent: stock', conteudo)
+        self.assertNotIn(f'-{primeiro.numero}\n', conteudo)
+        self.assertNotIn('reiniciar', conteudo)
+
+        # Um id de outro processo (ou já esquecido): o cliente recomeça
+        conteudo = self.client.get('/medicamentos/eventos/', HTTP_LAST_EVENT_ID='outro-1').content.decode()
+        self.assertIn('event: reiniciar', conteudo)
+
+    def test_importacao_publica_as_embalagens(self):
+        csv = (
+            'nome_comercial,quantidade_inicial,data_validade\n'
+            'Brufen,10,2030-01-31\n'
+            'Brufen,5,2030-06-30\n'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ImportadorStock(self.user, tamanho_lote=1).importar(ler_linhas(io.StringIO(csv), 'csv'))
+        publicados = eventos.canal.desde(self.user.pk, f'{eventos.canal.instancia}-0')[0]
+        self.assertEqual([evento.tipo for evento in publicados], ['embalagem_adicionada'] * 2)
+        self.assertEqual([evento.dados['quantidade'] for evento in publicados], [10, 5])
+
+    def test_pagina_volta_a_pedir_o_sino_ao_reiniciar(self):
+        conteudo = self.client.get('/medicamentos/').content.decode()
+        self.assertIn("addEventListener('reiniciar'", conteudo)
+        self.assertIn('fetch("/api/resumo/"', conteudo)
+
+    def test_rollback_nao_publica(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(StockInsuficiente):
+                registar_consumo(self.embalagem, 100)
+        self.assertEqual(eventos.canal.desde(self.user.pk, f'{eventos.canal.instancia}-0')[0], [])
+
+    async def test_ligacao_longa_recebe_eventos(self):
+        resposta = await self.async_client.get('/medicamentos/eventos/')
+        mensagens = aiter(resposta.streaming_content)
+        try:
+            self.assertEqual(await anext(mensagens), b'retry: 3000\n\n')
+            self.assertIn(b'event: alertas', await anext(mensagens))
+
+            with patch.object(eventos, 'BATIMENTO_SEGUNDOS', 0.01):
+                self.assertEqual(await anext(mensagens), b': batimento\n\n')
+
+            # Esvaziar a embalagem tira-a dos alertas: stock e depois o sino
+            await sync_to_async(self.consumir)(10)
+            self.assertIn(b'event: stock', await anext(mensagens))
+            self.assertIn(b'"total": 0', await anext(mensagens))
+        finally:
+            await mensagens.aclose()
+
+
+class CacheLinhasTests(TestCase):
+    """Linhas do stock e do catálogo em cache, pelo carimbo de versão dos dados."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana', password='teste12345')
+        self.embalagem = criar_embalagem(self.user, quantidade=10, dias=10)
+        self.client.force_login(self.user)
+
+    def test_linhas_reutilizadas_ate_os_dados_mudarem(self):
+        self.assertContains(self.client.get('/medicamentos/stock/'), 'L-TESTE', count=0)
+
+        # Sem signals (update directo), o carimbo não muda: a cache serve as linhas antigas
+        Embalagem.objects.filter(pk=self.embalagem.pk).update(lote='L-TESTE')
+        self.assertContains(self.client.get('/medicamentos/stock/'), 'L-TESTE', count=0)
+
+        incrementar_versao(self.user.pk)
+        self.assertContains(self.client.get('/medicamentos/stock/'), 'L-TESTE', count=2)
+
+    def test_signals_e_pagina_mudam_a_chave(self):
+        self.assertContains(self.client.get('/medicamentos/stock/'), '10 / 10')
+        with self.captureOnCommitCallbacks(execute=True):
+            registar_consumo(self.embalagem, 3)
+        self.assertContains(self.client.get('/medicamentos/stock/'), '7 / 10', count=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            criar_embalagem(self.user, nome='Brufen')
+        self.assertContains(self.client.get('/medicamentos/'), 'Brufen', count=2)
+        resposta = self.client.get('/medicamentos/', {'tamanho': 1})
+        self.assertContains(resposta, 'Ben-u-ron', count=2)
+        self.assertNotContains(resposta, 'Brufen')
+
+    def test_perfil_de_producao_guarda_as_linhas_numa_cache_partilhada(self):
+        producao = caches_de_producao(self)
+        with override_settings(CACHES=producao):
+            self.assertContains(self.client.get('/medicamentos/stock/'), '10 / 10')
+            # As linhas ficam à parte dos carimbos de versão
+            self.assertTrue(os.listdir(producao['template_fragments']['LOCATION']))
+            with self.captureOnCommitCallbacks(execute=True):
+                registar_consumo(self.embalagem, 3)
+            self.assertContains(self.client.get('/medicamentos/stock/'), '7 / 10', count=2)
+
+        locais = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={**producao, 'template_fragments': locais}):
+            self.assertEqual(
+                [erro.msg for erro in verificar_cache_partilhada(None)],
+                ["A cache 'template_fragments' (django.core.cache.backends.locmem.LocMemCache) "
+                 "não é partilhada entre processos."],
+            )
+
+
+class TemplatesTests(TestCase):
+    """Aquecimento dos templates e "manage.py check_templates"."""
+
+    def test_aquecer_compila_todos(self):
+        nomes = nomes_dos_templates()
+        for nome in ('base.html', 'registration/login.html', 'pharmacy/dashboard.html', 'pharmacy/paginacao.html'):
+            self.assertIn(nome, nomes)
+        self.assertEqual(aquecer_templates(), len(nomes))
+
+    def test_check_templates_renderiza_todos_com_contexto(self):
+        saida = io.StringIO()
+        call_command('check_templates', repeticoes=1, stdout=saida)
+        linhas = saida.getvalue().splitlines()
+        for nome in nomes_dos_templates():
+            self.assertTrue(any(linha.startswith(nome + ' ') for linha in linhas), nome)
+        self.assertNotIn('sem contexto de exemplo', saida.getvalue())
+        self.assertIn('sem erros', linhas[-1])
+
+
+ESTATICO_NO_TEMPLATE = re.compile(r"""{%\s*static\s+['"]([^'"]+)['"]""")
+ENDERECO_EXTERNO = re.compile(r"""(?:href|src)\s*=\s*['"](?:https?:)?//""")
+
+CSS_ICONES_EXEMPLO = """@font-face { font-family: "bootstrap-icons"; src: url("./fonts/bootstrap-icons.woff2?dd6703") format("woff2"); }
+.bi::before { display: inline-block; }
+.bi-bell::before { content: "\\f18a"; }
+.bi-bicycle::before { content: "\\f18b"; }
+.bi-capsule::before { content: "\\f7d7"; }
+/*# sourceMappingURL=bootstrap-icons.css.map */
+"""
+
+
+class EstaticosTests(SimpleTestCase):
+    """Bibliotecas de front-end sem CDN: ícones usados, collectstatic e EstaticosMiddleware."""
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+
+    def test_css_dos_icones_so_com_os_usados(self):
+        usados = estaticos.icones_usados()
+        self.assertTrue({'bell', 'capsule', 'box-seam', 'chevron-double-left'} <= usados)
+        self.assertNotIn('bicycle', usados)
+
+        css, pontos = estaticos.recortar_css_icones(CSS_ICONES_EXEMPLO, usados)
+        self.assertEqual(pontos, {0xf18a, 0xf7d7})
+        self.assertIn('.bi-bell::before', css)
+        self.assertNotIn('bicycle', css)
+        self.assertIn('@font-face', css)
+
+    def test_gerar_a_partir_dos_originais(self):
+        origem = os.path.join(self.pasta, 'vendor')
+        destino = os.path.join(self.pasta, 'static', 'vendor')
+        with self.assertRaises(FileNotFoundError):
+            estaticos.gerar(origem, destino)
+
+        for nome, _ in estaticos.FICHEIROS_EXTERNOS:
+            caminho = os.path.join(origem, nome)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            with open(caminho, 'w', encoding='utf-8') as ficheiro:
+                ficheiro.write(CSS_ICONES_EXEMPLO if nome == estaticos.CSS_ICONES else 'x = 1;\n//# sourceMappingURL=x.map\n')
+        resultado = estaticos.gerar(origem, destino)
+
+        self.assertEqual(resultado['guardados'], 2)
+        with open(os.path.join(destino, estaticos.CSS_ICONES), encoding='utf-8') as ficheiro:
+            css = ficheiro.read()
+        self.assertIn('bootstrap-icons.woff2")', css)
+        self.assertNotIn('sourceMappingURL', css)
+        self.assertNotIn('bicycle', css)
+        for nome in estaticos.ficheiros_gerados():
+            self.assertTrue(os.path.isfile(os.path.join(destino, nome)), nome)
+        with open(os.path.join(destino, estaticos.CSS_INTER), encoding='utf-8') as ficheiro:
+            self.assertIn("url('./inter-latin-700-normal.woff2')", ficheiro.read())
+
+    def test_collectstatic_comprime_e_middleware_serve(self):
+        origem = os.path.join(self.pasta, 'static')
+        raiz = os.path.join(self.pasta, 'staticfiles')
+        os.makedirs(os.path.join(origem, 'css'))
+        with open(os.path.join(origem, 'css', 'app.css'), 'w', encoding='utf-8') as ficheiro:
+            ficheiro.write('body { color: #8b0000; }\n' * 100)
+
+        armazenamento = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'pharmacy.estaticos.ArmazenamentoEstaticos'},
+        }
+        with override_settings(STORAGES=armazenamento, STATICFILES_DIRS=[origem], STATIC_ROOT=raiz,
+                               PHARMACY_SERVIR_ESTATICOS=True):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            com_hash = staticfiles_storage.hashed_files['css/app.css']
+            self.assertTrue(os.path.isfile(os.path.join(raiz, com_hash + '.gz')))
+            middleware = EstaticosMiddleware(lambda request: HttpResponse('view'))
+
+        fabrica = RequestFactory()
+        response = middleware(fabrica.get(f'/static/{com_hash}', HTTP_ACCEPT_ENCODING='gzip, br;q=0'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn(b'#8b0000', gzip.decompress(b''.join(response.streaming_content)))
+        response.close()
+
+        response = middleware(fabrica.get('/static/css/app.css'))
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        modificado = response['Last-Modified']
+        response.close()
+        response = middleware(fabrica.get('/static/css/app.css', HTTP_IF_MODIFIED_SINCE=modificado))
+        self.assertEqual(response.status_code, 304)
+
+        # Fora do índice (ou do STATIC_URL), segue para as views
+        self.assertEqual(middleware(fabrica.get('/static/../settings.py')).content, b'view')
+        self.assertEqual(middleware(fabrica.get('/medicamentos/')).content, b'view')
+
+    def test_templates_so_usam_estaticos_que_existem(self):
+        # Sem o ficheiro, o manifesto de produção não tem a entrada e a
+        # página dá erro; um endereço externo precisa de Internet
+        for nome in nomes_dos_templates():
+            _, origem = motor().find_template(nome)
+            fonte = origem.loader.get_contents(origem)
+            self.assertIsNone(ENDERECO_EXTERNO.search(fonte), nome)
+            for ficheiro in ESTATICO_NO_TEMPLATE.findall(fonte):
+                self.assertIsNotNone(finders.find(ficheiro), f'{nome}: {ficheiro}')
+
+    def test_bibliotecas_locais_ou_nos_cdns(self):
+        self.addCleanup(estaticos.urls_bibliotecas.cache_clear)
+        with override_settings(BASE_DIR=self.pasta):
+            estaticos.urls_bibliotecas.cache_clear()
+            self.assertEqual(
+                estaticos.urls_bibliotecas()['bootstrap_css'],
+                'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+            )
+            self.assertEqual(estaticos.urls_bibliotecas()['inter_css'], estaticos.CSS_INTER_CDN)
+            self.assertEqual(len(verificar_bibliotecas_locais(None)), 1)
+
+            for nome in estaticos.ficheiros_gerados():
+                caminho = estaticos.pasta_gerados() / nome
+                caminho.parent.mkdir(parents=True, exist_ok=True)
+                caminho.write_text('', encoding='utf-8')
+            estaticos.urls_bibliotecas.cache_clear()
+            urls = estaticos.urls_bibliotecas()
+            self.assertEqual(verificar_bibliotecas_locais(None), [])
+
+        self.assertEqual(urls['bootstrap_css'], '/static/vendor/bootstrap/bootstrap.min.css')
+        self.assertEqual(urls['flatpickr_pt_js'], '/static/vendor/flatpickr/l10n/pt.js')
+        self.assertEqual(urls['inter_css'], '/static/vendor/inter/inter.css')
+        self.assertFalse(any(url.startswith('http') for url in urls.values()))
+
+        estaticos.urls_bibliotecas.cache_clear()
+        html = self.client.get('/accounts/login/').content.decode()
+        self.assertIn(estaticos.urls_bibliotecas()['bootstrap_css'], html)
+
+
+class SqliteProducaoTests(SimpleTestCase):
+    """Motor pharmacy.sqlite: PRAGMAs em cada ligação e BEGIN IMMEDIATE."""
+
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.caminho = os.path.join(pasta.name, 'producao.sqlite3')
+
+    def ligar(self, nome=None, **opcoes):
+        """Ligação com o motor de produção a um ficheiro temporário."""
+        configuracao = dict(connection.settings_dict, NAME=nome or self.caminho, OPTIONS=opcoes)
+        ligacao = load_backend('pharmacy.sqlite').DatabaseWrapper(configuracao, alias='producao')
+        self.addCleanup(ligacao.close)
+        ligacao.ensure_connection()
+        return ligacao
+
+    def outro_escritor(self):
+        """Ligação directa que fica com o lock de escrita."""
+        outra = sqlite3.connect(self.caminho, timeout=0, isolation_level=None, check_same_thread=False)
+        self.addCleanup(outra.close)
+        outra.execute('BEGIN IMMEDIATE')
+        return outra
+
+    def test_pragmas_aplicados(self):
+        ligacao = self.ligar(pragmas={'cache_size': -1000})
+        with ligacao.cursor() as cursor:
+            valores = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size'):
+                cursor.execute(f'PRAGMA {pragma}')
+                valores[pragma] = cursor.fetchone()[0]
+        self.assertEqual(valores, {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -1000,
+        })
+
+    def test_ligacao_so_de_leitura_nao_muda_o_journal_mode(self):
+        # Um ficheiro que ainda não está em WAL (primeiro arranque)
+        with closing(sqlite3.connect(self.caminho)) as criar:
+            criar.execute('CREATE TABLE t (x)')
+            criar.commit()
+
+        ligacao = self.ligar(nome=f'file:{self.caminho}?mode=ro')
+        with ligacao.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'delete')
+
+    def test_transaccao_fica_logo_com_o_lock_de_escrita(self):
+        ligacao = self.ligar()
+        ligacao.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        # Sem nenhuma escrita, outro escritor já não consegue começar
+        with self.assertRaises(sqlite3.OperationalError):
+            self.outro_escritor()
+        ligacao.rollback()
+        ligacao.set_autocommit(True)
+        self.outro_escritor().execute('ROLLBACK')
+
+    def test_repete_o_begin_enquanto_bloqueada(self):
+        ligacao = self.ligar(pragmas={'busy_timeout': 0}, tentativas=10, espera_inicial=0.02)
+        outra = self.outro_escritor()
+        threading.Timer(0.1, outra.execute, args=('ROLLBACK',)).start()
+        ligacao.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        self.assertFalse(ligacao.get_autocommit())
+        ligacao.rollback()
+
+    def test_desiste_depois_das_tentativas(self):
+        ligacao = self.ligar(pragmas={'busy_timeout': 0}, tentativas=2, espera_inicial=0.01)
+        self.outro_escritor()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            ligacao.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+
+class ConsumoConcorrenteTests(TransactionTestCase):
+    """
+    Teste de stress: muitas threads a consumir da mesma embalagem.
+    O stock final tem de bater certo com os consumos registados.
+    """
+
+    THREADS = 8
+    TENTATIVAS_POR_THREAD = 10
+    STOCK_INICIAL = 50
+
+    def test_consumos_concorrentes_nao_perdem_actualizacoes(self):
+        user = User.objects.create_user('rui')
+        embalagem = criar_embalagem(user, quantidade=self.STOCK_INICIAL)
+        sucessos = []
+        recusados = []
+
+        def consumir():
+            try:
+                for _ in range(self.TENTATIVAS_POR_THREAD):
+                    # A BD de testes em memória devolve "locked" em vez de
+                    # esperar; nesse caso tentamos de novo o mesmo consumo
+                    while True:
+                        try:
+                            registar_consumo(embalagem, 1)
+                            sucessos.append(1)
+                        except StockInsuficiente:
+                            recusados.append(1)
+                        except OperationalError:
+                            continue
+                        break
+            finally:
+                close_old_connections()
+                connection.close()
+
+        threads = [threading.Thread(target=consumir) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        embalagem.refresh_from_db()
+        pedidos = self.THREADS * self.TENTATIVAS_POR_THREAD
+        self.assertEqual(len(sucessos), self.STOCK_INICIAL)
+        self.assertEqual(len(recusados), pedidos - self.STOCK_INICIAL)
+        self.assertEqual(embalagem.quantidade_actual, 0)
+        self.assertEqual(Consumo.objects.filter(embalagem=embalagem).count(), self.STOCK_INICIAL)
@@ -8,8 +8,15 @@
 # - view é a função ou classe que processa o pedido
 # - name é um identificador único usado nos templates para gerar URLs
 
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+# Páginas de consulta: as views async (servidores ASGI) ou as síncronas
+if settings.PHARMACY_VIEWS_ASSINCRONAS:
+    from . import views_async as consulta
+else:
+    consulta = views
 
 # O app_name cria um "namespace" para evitar conflitos de nomes.
 app_name = 'pharmacy'
@@ -18,7 +25,7 @@ urlpatterns = [
     # ==================== MEDICAMENTOS ====================
     # Lista de medicamentos do utilizador
     # URL completa será: /medicamentos/
-    path('', views.medicamento_lista, name='medicamento_lista'),
+    path('', consulta.medicamento_lista, name='medicamento_lista'),
     
     # Formulário para criar novo medicamento
     # URL completa será: /medicamentos/novo/
@@ -35,7 +42,7 @@ urlpatterns = [
     # ==================== EMBALAGENS ====================
     # Lista de embalagens (stock) ordenada por validade
     # URL completa será: /embalagens/
-    path('stock/', views.embalagem_lista, name='embalagem_lista'),
+    path('stock/', consulta.embalagem_lista, name='embalagem_lista'),
     
     # Formulário para adicionar nova embalagem ao stock
     # URL completa será: /embalagens/nova/
@@ -52,10 +59,23 @@ urlpatterns = [
     # Formulário para adicionar mbalagem existente
     path('consumo/novo/', views.consumo_criar, name='consumo_criar'),
 
+    # Registar toma por medicamento (repartida pelas embalagens, FEFO)
+    path('consumo/medicamento/', views.consumo_medicamento_criar, name='consumo_medicamento_criar'),
+
+    # Importar medicamentos e embalagens de um ficheiro CSV / JSON Lines
+    path('importar/', views.importar_stock, name='importar_stock'),
+
+    # Exportar dados (medicamentos, embalagens ou consumos) em CSV / JSON Lines
+    # Ex: /medicamentos/exportar/consumos/?formato=csv&desde=2025-01-01
+    path('exportar/<str:tipo>/', views.exportar, name='exportar'),
+
     # Lista de alertas de embalagens expiradas ou a expirar
-    path('alertas/', views.alertas_lista, name='alertas_lista'),
+    path('alertas/', consulta.alertas_lista, name='alertas_lista'),
     
     # Formulário para editar preferências do utilizador
     path('preferencias/', views.preferencias_editar, name='preferencias_editar'),
+
+    # Eventos em tempo real (Server-Sent Events): stock e sino, sem recarregar
+    path('eventos/', views_async.eventos, name='eventos'),
     
 ]
\ No newline at end of file
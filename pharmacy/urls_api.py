@@ -0,0 +1,37 @@
+# pharmacy/urls_api.py
+# ====================
+# URLs da API JSON (só de leitura) usada pelos clientes móveis e quiosques.
+# Incluídas em domusshelf_project/urls.py com o prefixo /api/.
+
+from django.urls import path
+from . import api
+
+app_name = 'pharmacy_api'
+
+urlpatterns = [
+    # Números do dashboard
+    # URL completa será: /api/resumo/
+    path('resumo/', api.resumo, name='resumo'),
+
+    # Catálogo de medicamentos e detalhe (com as embalagens em stock)
+    path('medicamentos/', api.medicamento_lista, name='medicamento_lista'),
+    path('medicamentos/<int:pk>/', api.medicamento_detalhe, name='medicamento_detalhe'),
+
+    # Pesquisa enquanto se escreve (nome comercial / princípio activo)
+    # Ex: /api/pesquisa/?q=parac
+    path('pesquisa/', api.pesquisa, name='pesquisa'),
+
+    # Stock (embalagens) ordenado por validade
+    path('embalagens/', api.embalagem_lista, name='embalagem_lista'),
+    path('embalagens/<int:pk>/', api.embalagem_detalhe, name='embalagem_detalhe'),
+
+    # Embalagens expiradas ou a expirar
+    path('alertas/', api.alertas, name='alertas'),
+
+    # Consumo por dia de cada medicamento (gráficos e relatórios)
+    # Ex: /api/historico/?desde=2026-01-01&ate=2026-03-31&medicamento=5
+    path('historico/', api.historico, name='historico'),
+
+    # Previsão de fim de stock a partir do histórico de consumos
+    path('previsao/', api.previsao, name='previsao'),
+]
@@ -12,13 +12,31 @@ Autor: Miguel Ângelo Ascensão Real
 Data: 3 de Fevereiro de 2026
 '''
 
-from datetime import timezone
+import io
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 
-from .models import Medicamento, Embalagem, Consumo, Preferencias
-from .forms import MedicamentoForm, EmbalagemForm, ConsumoForm, PreferenciasForm
+from .models import Medicamento, Embalagem, Preferencias
+from .forms import (
+    MedicamentoForm, EmbalagemForm, ConsumoForm, ConsumoMedicamentoForm, ExportacaoForm,
+    ImportacaoForm, PreferenciasForm,
+)
+from .alertas import filtro_a_expirar, filtro_expiradas, obter_snapshot
+from .caches import versao_dados
+from .exportacao import EXPORTACOES, gerar_linhas, obter_queryset
+from .importacao import ImportadorStock, ler_linhas
+from .leitura import ler_da_copia
+from .paginacao import pagina_do_pedido
+from .particoes import particao_actual
+from .pesquisa import anotar_relevancia, filtrar_medicamentos
+from .services import (
+    StockSummary, StockInsuficiente, registar_consumo, consumir_por_medicamento,
+    criar_embalagem, editar_embalagem, abater_embalagens,
+)
 
 
 # ==============================================================================
@@ -26,51 +44,23 @@ from .forms import MedicamentoForm, EmbalagemForm, ConsumoForm, PreferenciasForm
 # ==============================================================================
 
 @login_required
+@ler_da_copia
 def dashboard(request):
     """
     Página inicial da aplicação.
     Mostra estatísticas e uma visão geral do estado da farmácia.
+
+    Todas as contagens vêm do StockSummary, que as calcula numa única
+    query agregada (em vez de uma query por cada número do dashboard).
     """
-    from datetime import date, timedelta
-    
-    hoje = date.today()
-    
-    # Obter preferências do utilizador
-    try:
-        prefs = Preferencias.objects.get(utilizador=request.user)
-        dias_alerta = prefs.dias_alerta_antes
-    except Preferencias.DoesNotExist:
-        dias_alerta = 30
-    
-    data_limite = hoje + timedelta(days=dias_alerta)
-    
-    # Estatísticas
-    total_medicamentos = Medicamento.objects.filter(
-        utilizador=request.user
-    ).count()
-    
-    embalagens_user = Embalagem.objects.filter(
-        medicamento__utilizador=request.user,
-        quantidade_actual__gt=0
-    )
-    
-    total_embalagens = embalagens_user.count()
-    
-    expiradas = embalagens_user.filter(
-        data_validade__lt=hoje
-    ).count()
-    
-    a_expirar = embalagens_user.filter(
-        data_validade__gte=hoje,
-        data_validade__lte=data_limite
-    ).count()
+    resumo = StockSummary.para_utilizador(request.user)
     
     context = {
-        'total_medicamentos': total_medicamentos,
-        'total_embalagens': total_embalagens,
-        'expiradas': expiradas,
-        'a_expirar': a_expirar,
-        'dias_alerta': dias_alerta,
+        'total_medicamentos': resumo.total_medicamentos,
+        'total_embalagens': resumo.total_embalagens,
+        'expiradas': resumo.expiradas,
+        'a_expirar': resumo.a_expirar,
+        'dias_alerta': resumo.dias_alerta,
     }
     return render(request, 'pharmacy/dashboard.html', context)
 
@@ -80,6 +70,7 @@ def dashboard(request):
 # ==============================================================================
 
 @login_required
+@ler_da_copia
 def medicamento_lista(request):
     """
     Lista todos os medicamentos do utilizador autenticado.
@@ -88,14 +79,28 @@ def medicamento_lista(request):
     os seus próprios medicamentos, não os de outros utilizadores.
     """
     # O request.user contém o utilizador autenticado (graças ao @login_required)
-    # O .order_by ordena alfabeticamente pelo nome comercial
-    medicamentos = Medicamento.objects.filter(
-        utilizador=request.user
-    ).order_by('nome_comercial')
+    # A página é ordenada alfabeticamente por (nome_comercial, id) e paginada
+    # por cursor: cada página começa logo a seguir ao último nome mostrado
+    medicamentos = Medicamento.objects.filter(utilizador=request.user)
+    campos = ('nome_comercial', 'id')
+    
+    # Chave da cache das linhas no template, lida antes da query
+    versao = versao_dados(request.user.pk)
+    
+    # Pesquisa opcional (?q=), pelo índice de texto completo: os
+    # resultados vêm dos mais relevantes para os menos (BM25)
+    pesquisa = request.GET.get('q', '').strip()
+    if pesquisa:
+        medicamentos = anotar_relevancia(filtrar_medicamentos(medicamentos, pesquisa), pesquisa)
+        campos = ('relevancia', 'id')
+    
+    medicamentos = pagina_do_pedido(request, medicamentos, campos=campos)
     
     # Passamos a lista de medicamentos para o template através do 'context'
     context = {
         'medicamentos': medicamentos,
+        'pesquisa': pesquisa,
+        'versao_dados': versao,
     }
     return render(request, 'pharmacy/medicamento_lista.html', context)
 
@@ -192,8 +197,11 @@ def medicamento_eliminar(request, pk):
     )
     
     if request.method == 'POST':
-        # O utilizador confirmou a eliminação
-        medicamento.delete()
+        # O utilizador confirmou a eliminação. O stock que restava nas
+        # embalagens fica registado como abate antes de serem apagadas.
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(medicamento.embalagens.all(), observacoes='Medicamento eliminado.')
+            medicamento.delete()
         return redirect('pharmacy:medicamento_lista')
     
     # Pedido GET: mostrar página de confirmação
@@ -206,6 +214,7 @@ def medicamento_eliminar(request, pk):
 # ==============================================================================
 
 @login_required
+@ler_da_copia
 def embalagem_lista(request):
     """
     Lista todas as embalagens do utilizador, ordenadas por data de validade.
@@ -214,24 +223,33 @@ def embalagem_lista(request):
     embalagens que expiram mais cedo aparecem primeiro, incentivando
     o utilizador a consumir primeiro o que está prestes a expirar.
     
-    Filtramos por medicamento__utilizador porque a Embalagem não tem
-    relação directa com User — a relação é através do Medicamento.
+    Filtramos pelo campo 'utilizador' da própria Embalagem (uma cópia do
+    dono do medicamento), o que evita um JOIN à tabela de medicamentos.
     """
-    from datetime import date
-    
-    # Buscar embalagens cujo medicamento pertence ao utilizador actual
-    # O duplo underscore (medicamento__utilizador) atravessa a relação ForeignKey
-    embalagens = Embalagem.objects.filter(
-        medicamento__utilizador=request.user
-    ).select_related('medicamento').order_by('data_validade')
+    # Lido antes da query: se os dados mudarem entretanto, a cache das
+    # linhas fica com o carimbo antigo e não é reutilizada
+    versao = versao_dados(request.user.pk)
+    
+    # Buscar embalagens que pertencem ao utilizador actual, uma página de
+    # cada vez, ordenadas por (data_validade, id) com paginação por cursor
+    embalagens = pagina_do_pedido(
+        request,
+        Embalagem.objects.filter(
+            utilizador=request.user
+        ).select_related('medicamento'),
+        campos=('data_validade', 'id'),
+    )
     
     # select_related('medicamento') é uma optimização: carrega os dados do
     # medicamento na mesma query, evitando queries adicionais quando acedemos
     # a embalagem.medicamento no template (problema N+1)
     
+    # hoje e versao_dados são a chave da cache das linhas no template:
+    # mudam à meia-noite e sempre que os dados do utilizador mudam
     context = {
         'embalagens': embalagens,
-        'hoje': date.today(),  # Passamos a data de hoje para comparações no template
+        'hoje': timezone.localdate(),
+        'versao_dados': versao,
     }
     return render(request, 'pharmacy/embalagem_lista.html', context)
 
@@ -248,11 +266,9 @@ def embalagem_criar(request):
         form = EmbalagemForm(request.POST, user=request.user)
         
         if form.is_valid():
-            embalagem = form.save(commit=False)
-            # Definir quantidade_actual igual à quantidade_inicial
-            # (embalagem nova, ainda não foi consumida)
-            embalagem.quantidade_actual = embalagem.quantidade_inicial
-            embalagem.save()
+            # Embalagem nova, ainda não foi consumida: quantidade_actual igual
+            # à quantidade_inicial, e uma entrada no registo de movimentos
+            criar_embalagem(form.save(commit=False))
             return redirect('pharmacy:embalagem_lista')
     else:
         form = EmbalagemForm(user=request.user)
@@ -269,20 +285,20 @@ def embalagem_editar(request, pk):
     """
     Edita uma embalagem existente.
     
-    Segurança: Verificamos que a embalagem pertence a um medicamento
-    do utilizador actual (através da relação medicamento__utilizador).
+    Segurança: Verificamos que a embalagem pertence ao utilizador actual.
     """
     embalagem = get_object_or_404(
         Embalagem,
         pk=pk,
-        medicamento__utilizador=request.user
+        utilizador=request.user
     )
     
     if request.method == 'POST':
         form = EmbalagemForm(request.POST, instance=embalagem, user=request.user)
         
         if form.is_valid():
-            form.save()
+            # Se a quantidade inicial mudou, a actual é ajustada (e registada)
+            editar_embalagem(form.save(commit=False))
             return redirect('pharmacy:embalagem_lista')
     else:
         form = EmbalagemForm(instance=embalagem, user=request.user)
@@ -306,11 +322,13 @@ def embalagem_eliminar(request, pk):
     embalagem = get_object_or_404(
         Embalagem,
         pk=pk,
-        medicamento__utilizador=request.user
+        utilizador=request.user
     )
     
     if request.method == 'POST':
-        embalagem.delete()
+        with transaction.atomic(using=particao_actual()):
+            abater_embalagens(Embalagem.objects.filter(pk=embalagem.pk), observacoes='Embalagem eliminada.')
+            embalagem.delete()
         return redirect('pharmacy:embalagem_lista')
     
     context = {
@@ -323,67 +341,180 @@ def consumo_criar(request):
     """
     View para registar um novo consumo/toma.
     Ao guardar, desconta automaticamente a quantidade da embalagem.
+    
+    O desconto é feito por registar_consumo() com um UPDATE condicional,
+    dentro de uma transacção. Se outro pedido tiver consumido a embalagem
+    entretanto, o erro aparece no formulário em vez de o stock ficar errado.
     """
     if request.method == 'POST':
         form = ConsumoForm(request.POST, user=request.user)
         if form.is_valid():
-            consumo = form.save(commit=False)
-            consumo.data_hora = timezone.now()  # Define a data/hora actual
-
-            # Desconta a quantidade da embalagem
-            embalagem = consumo.embalagem
-            embalagem.quantidade_actual -= consumo.quantidade
-            embalagem.save()
-            
-            # Agora guarda o consumo
-            consumo.save()
-            
-            return redirect('pharmacy:embalagem_lista')
+            try:
+                registar_consumo(
+                    embalagem=form.cleaned_data['embalagem'],
+                    quantidade=form.cleaned_data['quantidade'],
+                    observacoes=form.cleaned_data['observacoes'],
+                )
+            except StockInsuficiente as erro:
+                form.add_error(None, str(erro))
+            else:
+                return redirect('pharmacy:embalagem_lista')
     else:
         form = ConsumoForm(user=request.user)
     
     return render(request, 'pharmacy/consumo_form.html', {'form': form})
 
 @login_required
-def alertas_lista(request):
+def consumo_medicamento_criar(request):
     """
-    Página que lista todas as embalagens expiradas ou a expirar em breve.
-    Separadas em duas secções: expiradas e a expirar.
+    View para registar um consumo escolhendo o medicamento (e não a embalagem).
+    
+    A quantidade é repartida pelas embalagens dentro da validade segundo o
+    princípio FEFO, por consumir_por_medicamento(). É criado um consumo por
+    cada embalagem de onde se retirou stock.
     """
-    from datetime import date, timedelta
+    if request.method == 'POST':
+        form = ConsumoMedicamentoForm(request.POST, user=request.user)
+        if form.is_valid():
+            try:
+                consumos = consumir_por_medicamento(
+                    medicamento=form.cleaned_data['medicamento'],
+                    quantidade=form.cleaned_data['quantidade'],
+                    observacoes=form.cleaned_data['observacoes'],
+                )
+            except StockInsuficiente as erro:
+                form.add_error(None, str(erro))
+            else:
+                messages.success(
+                    request,
+                    f'Toma registada ({len(consumos)} embalagem(ns) utilizada(s)).'
+                )
+                return redirect('pharmacy:embalagem_lista')
+    else:
+        form = ConsumoMedicamentoForm(user=request.user)
     
-    hoje = date.today()
+    return render(request, 'pharmacy/consumo_medicamento_form.html', {'form': form})
+
+@login_required
+def importar_stock(request):
+    """
+    Página para importar medicamentos e embalagens a partir de um ficheiro.
     
-    # Obter preferências do utilizador
-    try:
-        prefs = Preferencias.objects.get(utilizador=request.user)
-        dias_alerta = prefs.dias_alerta_antes
-    except Preferencias.DoesNotExist:
-        dias_alerta = 30
+    O ficheiro é lido em streaming e gravado em lotes (ver importacao.py),
+    por isso ficheiros grandes não são carregados todos em memória.
+    """
+    if request.method == 'POST':
+        form = ImportacaoForm(request.POST, request.FILES)
+        if form.is_valid():
+            ficheiro = io.TextIOWrapper(
+                form.cleaned_data['ficheiro'].file,
+                encoding='utf-8-sig',
+                newline='',
+            )
+            try:
+                resultado = ImportadorStock(request.user).importar(
+                    ler_linhas(ficheiro, form.cleaned_data['formato'])
+                )
+            except (ValueError, UnicodeDecodeError) as erro:
+                form.add_error('ficheiro', f'Ficheiro inválido: {erro}')
+            else:
+                messages.success(
+                    request,
+                    f'Importação concluída: {resultado.medicamentos_criados} medicamentos '
+                    f'e {resultado.embalagens_criadas} embalagens criados.'
+                )
+                for numero, mensagem in resultado.erros[:10]:
+                    messages.warning(request, f'Linha {numero}: {mensagem}')
+                if resultado.total_erros > 10:
+                    messages.warning(
+                        request,
+                        f'... e mais {resultado.total_erros - 10} linha(s) com erros.'
+                    )
+                return redirect('pharmacy:medicamento_lista')
+    else:
+        form = ImportacaoForm()
     
-    data_limite = hoje + timedelta(days=dias_alerta)
+    return render(request, 'pharmacy/importar_form.html', {'form': form})
+
+@login_required
+@ler_da_copia
+def exportar(request, tipo):
+    """
+    Exporta medicamentos, embalagens ou consumos do utilizador em CSV ou
+    JSON Lines, com filtros opcionais no URL:
+        ?formato=csv|jsonl&desde=2025-01-01&ate=2025-12-31&medicamento=5
     
-    # Embalagens do utilizador com stock
-    embalagens_user = Embalagem.objects.filter(
-        medicamento__utilizador=request.user,
-        quantidade_actual__gt=0
-    ).select_related('medicamento')
+    A resposta é um StreamingHttpResponse: as linhas são lidas da base de
+    dados aos blocos e enviadas à medida que são geradas, por isso mesmo
+    anos de histórico nunca ficam todos em memória.
+    """
+    if tipo not in EXPORTACOES:
+        raise Http404('Exportação desconhecida.')
+    
+    form = ExportacaoForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain; charset=utf-8')
+    
+    formato = form.cleaned_data['formato'] or 'csv'
+    queryset = obter_queryset(
+        tipo,
+        user=request.user,
+        desde=form.cleaned_data['desde'],
+        ate=form.cleaned_data['ate'],
+        medicamento=form.cleaned_data['medicamento'],
+    )
+    # As linhas só são lidas depois de a view terminar: fixar já a base de
+    # dados escolhida pelo router (a cópia só de leitura, se for o caso)
+    queryset = queryset.using(queryset.db)
     
-    # Separar em expiradas e a expirar
-    expiradas = embalagens_user.filter(
-        data_validade__lt=hoje
-    ).order_by('data_validade')
+    tipos_conteudo = {
+        'csv': 'text/csv; charset=utf-8',
+        'jsonl': 'application/x-ndjson; charset=utf-8',
+    }
+    resposta = StreamingHttpResponse(
+        gerar_linhas(tipo, formato, queryset),
+        content_type=tipos_conteudo[formato],
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="domusshelf-{tipo}.{formato}"'
+    return resposta
+
+@login_required
+@ler_da_copia
+def alertas_lista(request):
+    """
+    Página que lista todas as embalagens expiradas ou a expirar em breve.
+    Separadas em duas secções: expiradas e a expirar.
+
+    Os totais e a janela de datas de cada secção vêm do resumo
+    pré-calculado (AlertSnapshot, ver alertas.py), o mesmo que alimenta o
+    sino, para que os números batam certo. As embalagens lêem-se pelo
+    índice (utilizador, data_validade), dentro dessa janela.
     
-    a_expirar = embalagens_user.filter(
-        data_validade__gte=hoje,
-        data_validade__lte=data_limite
-    ).order_by('data_validade')
+    Cada secção é paginada por cursor de forma independente
+    (?cursor_expiradas= e ?cursor_a_expirar=).
+    """
+    snapshot = obter_snapshot(request.user)
+    embalagens = Embalagem.objects.filter(
+        utilizador=request.user
+    ).select_related('medicamento')
     
     context = {
-        'expiradas': expiradas,
-        'a_expirar': a_expirar,
-        'dias_alerta': dias_alerta,
-        'hoje': hoje,
+        'expiradas': pagina_do_pedido(
+            request,
+            embalagens.filter(filtro_expiradas(snapshot)),
+            campos=('data_validade', 'id'),
+            parametro='cursor_expiradas',
+        ),
+        'a_expirar': pagina_do_pedido(
+            request,
+            embalagens.filter(filtro_a_expirar(snapshot)),
+            campos=('data_validade', 'id'),
+            parametro='cursor_a_expirar',
+        ),
+        'total_expiradas': snapshot.expiradas,
+        'total_a_expirar': snapshot.a_expirar,
+        'dias_alerta': snapshot.dias_alerta,
+        'hoje': snapshot.data_referencia,
     }
     return render(request, 'pharmacy/alertas_lista.html', context)
 
@@ -424,7 +555,6 @@ def preferencias_editar(request):
     })
 
 from django.contrib.auth.forms import UserCreationForm
-from django.contrib import messages
 
 def registo(request):
     """
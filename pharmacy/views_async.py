@@ -0,0 +1,227 @@
+'''
+DomusShelf - Views Async (só de leitura)
+========================================
+
+Versões async das páginas de consulta mais pedidas: dashboard, catálogo
+de medicamentos, stock e alertas. Fazem o mesmo que as de views.py e
+usam os mesmos templates, mas com o ORM async do Django (aaggregate,
+afirst, async for), para que num servidor ASGI (uvicorn, daphne) o
+pedido não ocupe uma thread enquanto espera pela base de dados.
+
+Usadas em vez das de views.py quando PHARMACY_VIEWS_ASSINCRONAS é True
+(por defeito, quando a aplicação corre por asgi.py). Em WSGI o Django
+teria de as correr num ciclo de eventos à parte, por isso aí ficam as
+síncronas.
+
+A excepção é a ligação de eventos em tempo real (eventos, ver
+eventos.py), que é sempre async: em ASGI fica aberta, em WSGI responde
+com o que há e o browser volta a pedir mais tarde.
+
+Regras destas views:
+- request.user é lido numa thread (obter_utilizador): no Django 4.2 o
+  AuthenticationMiddleware e o @login_required ainda não são async;
+- tudo o que vai à base de dados acontece antes de renderizar, incluindo
+  o resumo do sino (request.resumo_alertas, lido pelo context processor
+  alertas_count): durante a renderização não há queries;
+- a cache é lida com a API async (aget, aadd). As listagens guardam as
+  linhas com {% cache %}, que usa a API síncrona: são renderizadas numa
+  thread (em produção a cache é em ficheiros);
+- consultas independentes correm em paralelo com asyncio.gather.
+
+Autor: Miguel Ângelo Ascensão Real
+Data: 18 de Outubro de 2026
+'''
+
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+
+from .alertas import filtro_a_expirar, filtro_expiradas, obter_snapshot
+from .caches import aobter_resumo_alertas, aversao_dados
+from .eventos import fluxo
+from .leitura import ler_da_copia
+from .models import Medicamento, Embalagem
+from .paginacao import apagina_do_pedido
+from .particoes import particao_actual
+from .pesquisa import anotar_relevancia, filtrar_medicamentos
+from .services import StockSummary
+
+
+async def obter_utilizador(request):
+    """Lê o utilizador da sessão numa thread e fixa-o em request.user."""
+    user = await sync_to_async(get_user)(request)
+    request.user = user
+    return user
+
+
+def login_obrigatorio(view):
+    """O @login_required das views async: sem sessão, vai para o login."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await obter_utilizador(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+# ==============================================================================
+# DASHBOARD
+# ==============================================================================
+
+@login_obrigatorio
+@ler_da_copia
+async def dashboard(request):
+    """
+    Página inicial (ver views.dashboard). A query agregada do resumo e a
+    leitura do resumo do sino são independentes: correm ao mesmo tempo.
+    """
+    resumo, request.resumo_alertas = await asyncio.gather(
+        StockSummary.apara_utilizador(request.user),
+        aobter_resumo_alertas(request.user),
+    )
+
+    context = {
+        'total_medicamentos': resumo.total_medicamentos,
+        'total_embalagens': resumo.total_embalagens,
+        'expiradas': resumo.expiradas,
+        'a_expirar': resumo.a_expirar,
+        'dias_alerta': resumo.dias_alerta,
+    }
+    return render(request, 'pharmacy/dashboard.html', context)
+
+
+# ==============================================================================
+# LISTAGENS
+# ==============================================================================
+
+@login_obrigatorio
+@ler_da_copia
+async def medicamento_lista(request):
+    """Catálogo de medicamentos, paginado por cursor (ver views.medicamento_lista)."""
+    versao = await aversao_dados(request.user.pk)
+    medicamentos = Medicamento.objects.filter(utilizador=request.user)
+    campos = ('nome_comercial', 'id')
+
+    pesquisa = request.GET.get('q', '').strip()
+    if pesquisa:
+        # Numa thread: a primeira pesquisa em cada base de dados verifica
+        # se tem os índices FTS5 (uma query)
+        medicamentos = await sync_to_async(
+            lambda: anotar_relevancia(filtrar_medicamentos(medicamentos, pesquisa), pesquisa)
+        )()
+        campos = ('relevancia', 'id')
+
+    medicamentos, request.resumo_alertas = await asyncio.gather(
+        apagina_do_pedido(request, medicamentos, campos=campos),
+        aobter_resumo_alertas(request.user),
+    )
+
+    context = {
+        'medicamentos': medicamentos,
+        'pesquisa': pesquisa,
+        'versao_dados': versao,
+    }
+    return await sync_to_async(render)(request, 'pharmacy/medicamento_lista.html', context)
+
+
+@login_obrigatorio
+@ler_da_copia
+async def embalagem_lista(request):
+    """Stock por ordem de validade (FEFO), paginado por cursor (ver views.embalagem_lista)."""
+    versao = await aversao_dados(request.user.pk)
+    embalagens, request.resumo_alertas = await asyncio.gather(
+        apagina_do_pedido(
+            request,
+            Embalagem.objects.filter(
+                utilizador=request.user
+            ).select_related('medicamento'),
+            campos=('data_validade', 'id'),
+        ),
+        aobter_resumo_alertas(request.user),
+    )
+
+    context = {
+        'embalagens': embalagens,
+        'hoje': timezone.localdate(),
+        'versao_dados': versao,
+    }
+    return await sync_to_async(render)(request, 'pharmacy/embalagem_lista.html', context)
+
+
+@login_obrigatorio
+@ler_da_copia
+async def alertas_lista(request):
+    """
+    Embalagens expiradas e a expirar (ver views.alertas_lista). Depois de
+    ler o AlertSnapshot (pode ter de o recalcular, por isso numa thread),
+    as duas secções e o resumo do sino são lidos ao mesmo tempo.
+    """
+    snapshot = await sync_to_async(obter_snapshot)(request.user)
+    embalagens = Embalagem.objects.filter(
+        utilizador=request.user
+    ).select_related('medicamento')
+
+    expiradas, a_expirar, request.resumo_alertas = await asyncio.gather(
+        apagina_do_pedido(
+            request,
+            embalagens.filter(filtro_expiradas(snapshot)),
+            campos=('data_validade', 'id'),
+            parametro='cursor_expiradas',
+        ),
+        apagina_do_pedido(
+            request,
+            embalagens.filter(filtro_a_expirar(snapshot)),
+            campos=('data_validade', 'id'),
+            parametro='cursor_a_expirar',
+        ),
+        aobter_resumo_alertas(request.user),
+    )
+
+    context = {
+        'expiradas': expiradas,
+        'a_expirar': a_expirar,
+        'total_expiradas': snapshot.expiradas,
+        'total_a_expirar': snapshot.a_expirar,
+        'dias_alerta': snapshot.dias_alerta,
+        'hoje': snapshot.data_referencia,
+    }
+    return render(request, 'pharmacy/alertas_lista.html', context)
+
+
+# ==============================================================================
+# EVENTOS EM TEMPO REAL
+# ==============================================================================
+
+@login_obrigatorio
+async def eventos(request):
+    """
+    Ligação Server-Sent Events com as alterações ao stock e ao sino do
+    utilizador (ver eventos.py). O browser retoma onde ficou com o
+    cabeçalho Last-Event-ID, que o EventSource manda sozinho ao voltar
+    a ligar.
+    """
+    particao = await sync_to_async(particao_actual)()
+    ultimo_id = request.headers.get('Last-Event-ID', '').strip()
+
+    if isinstance(request, ASGIRequest):
+        resposta = StreamingHttpResponse(
+            fluxo(request.user, ultimo_id, particao),
+            content_type='text/event-stream',
+        )
+        # Sem buffer nos proxies (nginx), para os eventos chegarem logo
+        resposta['X-Accel-Buffering'] = 'no'
+    else:
+        # WSGI: sem ligações longas (cada uma ocuparia uma thread)
+        mensagens = [mensagem async for mensagem in fluxo(request.user, ultimo_id, particao, continuo=False)]
+        resposta = HttpResponse(''.join(mensagens), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    return resposta